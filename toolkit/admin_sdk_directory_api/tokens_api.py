@@ -20,19 +20,69 @@ Example requests and responses for the Admin SDK Tokens APIs can be reviewed
 in the API_NOTES file.
 """
 
+import atexit
 from operator import itemgetter  # for sorting
 
 from apiclient import errors as apiclient_errors
-from apiclient.discovery import build
 from utils import admin_api_tool_errors
+from utils import compiled_methods
 from utils import file_manager
 from utils import http_utils
 from utils import log_utils
+from utils import token_cache
 from utils import token_report_utils
 
 
 FILE_MANAGER = file_manager.FILE_MANAGER
 
+# Service builder; apiclient.discovery is imported when first called.
+build = http_utils.BuildService
+
+# If set (by EnableTokenCache()) a token_cache.TokenCache read by
+# GetTokensForUser() and GetToken() before issuing a request.
+TOKEN_CACHE = None
+
+
+def EnableTokenCache(max_age_minutes):
+  """Answer token lookups from the cache filled by domain token gathers.
+
+  Token lists requested live are added to the cache, saved when the command
+  exits (or by DisableTokenCache()).  A cache enabled by an earlier command
+  of this process (e.g. in toolkitd) for another working directory or
+  max_age is saved and replaced.
+
+  Args:
+    max_age_minutes: Int age in minutes beyond which cached token lists are
+                     requested again.
+
+  Returns:
+    The token_cache.TokenCache.
+  """
+  global TOKEN_CACHE  # pylint: disable=global-statement
+  if TOKEN_CACHE is None or not TOKEN_CACHE.IsFor(max_age_minutes):
+    DisableTokenCache()
+    TOKEN_CACHE = token_cache.TokenCache(max_age_minutes)
+  return TOKEN_CACHE
+
+
+def DisableTokenCache():
+  """Save the token cache (if enabled) and request tokens live again.
+
+  Called by --live commands and by toolkitd after each command so the next
+  command reads the gathers and revocations made since.
+
+  Returns:
+    String full path of the cache file or None if unchanged.
+  """
+  global TOKEN_CACHE  # pylint: disable=global-statement
+  if TOKEN_CACHE is None:
+    return None
+  saved_cache, TOKEN_CACHE = TOKEN_CACHE, None
+  return saved_cache.Save()
+
+
+atexit.register(DisableTokenCache)
+
 
 class TokensApiWrapper(object):
   """Expose the methods of 3-legged OAuth management."""
@@ -46,6 +96,14 @@ class TokensApiWrapper(object):
     self._service = build(serviceName='admin', version='directory_v1',
                           http=http)
     self._tokens = self._service.tokens()
+    # Token requests are issued once or more per domain user so build them
+    # with compiled methods; the arguments come from our own code (trusted).
+    self._delete_token = compiled_methods.CompileMethod(
+        self._tokens, 'delete', ['userKey', 'clientId'], trusted=True)
+    self._get_token = compiled_methods.CompileMethod(
+        self._tokens, 'get', ['userKey', 'clientId'], trusted=True)
+    self._list_tokens = compiled_methods.CompileMethod(
+        self._tokens, 'list', ['userKey'], trusted=True)
 
   def _IssueTokensRequestForUser(self, request):
     """Create and issue a tokens request authorized by the user.
@@ -91,8 +149,12 @@ class TokensApiWrapper(object):
       A dictionary (called a json document in references) with a member 'items'
       which is a list of tokens.
     """
-    return self._IssueTokensRequestForUser(
-        self._tokens.delete(clientId=client_id, userKey=user_mail))
+    result = self._IssueTokensRequestForUser(
+        self._delete_token(user_mail, client_id))
+    token_cache.RecordRevocation(user_mail, client_id)
+    if TOKEN_CACHE:
+      TOKEN_CACHE.Revoke(user_mail, client_id)
+    return result
 
   def GetToken(self, user_mail, client_id):
     """Retrieves 1 token for a user and client.
@@ -105,8 +167,12 @@ class TokensApiWrapper(object):
       A dictionary (called a json document in references) with a member 'items'
       which is a list of tokens.
     """
+    if TOKEN_CACHE:
+      token = TOKEN_CACHE.GetToken(user_mail, client_id)
+      if token is not None:
+        return token
     return self._IssueTokensRequestForUser(
-        self._tokens.get(clientId=client_id, userKey=user_mail))
+        self._get_token(user_mail, client_id))
 
   def ListTokens(self, user_mail):
     """Retrieves a list of tokens for a user.
@@ -118,7 +184,7 @@ class TokensApiWrapper(object):
       A dictionary (called a json document in references) with a member 'items'
       which is a list of tokens.
     """
-    return self._IssueTokensRequestForUser(self._tokens.list(userKey=user_mail))
+    return self._IssueTokensRequestForUser(self._list_tokens(user_mail))
 
   @staticmethod
   def _PrintOneLine(client_id, display_text=None, scopes=None):
@@ -175,13 +241,18 @@ class TokensApiWrapper(object):
     Returns:
       A list of tokens authorized by user_mail.
     """
+    if TOKEN_CACHE:
+      token_list = TOKEN_CACHE.GetTokens(user_mail)
+      if token_list is not None:
+        return sorted(token_list, key=itemgetter('clientId'))
     token_doc = self.ListTokens(user_mail=user_mail)
     if not token_doc:
       raise admin_api_tool_errors.AdminAPIToolTokenRequestError(
           'ERROR: Unexpected response: no document returned.')
-    if 'items' in token_doc:
-      return sorted(token_doc['items'], key=itemgetter('clientId'))
-    return []
+    token_list = sorted(token_doc.get('items', []), key=itemgetter('clientId'))
+    if TOKEN_CACHE:
+      TOKEN_CACHE.Put(user_mail, token_list)
+    return token_list
 
   def PrintTokensForUser(self, user_mail, long_list=False):
     """Simple print of token document for a given customer/user.
@@ -190,7 +261,17 @@ class TokensApiWrapper(object):
       user_mail: email address for the user e.g. xxx@yyy.com.
       long_list: boolean, if True then print more output columns.
     """
-    token_list = self.GetTokensForUser(user_mail)
+    TokensApiWrapper.PrintTokenList(self.GetTokensForUser(user_mail),
+                                    long_list=long_list)
+
+  @staticmethod
+  def PrintTokenList(token_list, long_list=False):
+    """Print the tokens of a user (e.g. from GetTokensForUser()).
+
+    Args:
+      token_list: List of token documents.
+      long_list: boolean, if True then print more output columns.
+    """
     if token_list:
       TokensApiWrapper._PrintOneLine(client_id='Client ID',
                                      display_text='Display Text')
@@ -207,7 +288,18 @@ class TokensApiWrapper(object):
       client_id: domain authorized (e.g. xxx.apps.googleusercontent.com).
       long_list: boolean, if True then print more output columns.
     """
-    token_doc = self.GetToken(user_mail=user_mail, client_id=client_id)
+    TokensApiWrapper.PrintToken(
+        self.GetToken(user_mail=user_mail, client_id=client_id),
+        long_list=long_list)
+
+  @staticmethod
+  def PrintToken(token_doc, long_list=False):
+    """Print the token of a user for a client (e.g. from GetToken()).
+
+    Args:
+      token_doc: Token document or {} if there is no token.
+      long_list: boolean, if True then print more output columns.
+    """
     if token_doc:
       TokensApiWrapper._PrintOneLine(client_id='Client ID',
                                      display_text='Display Text')
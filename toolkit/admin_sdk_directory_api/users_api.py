@@ -18,15 +18,16 @@ Relies on the google-api-python-client and its embedded oauth2client.
 See the README for more details on google-api-python-client.
 """
 
+import atexit
 import pprint
 import textwrap
 import time
 
 from apiclient import errors as apiclient_errors
-from apiclient.discovery import build
 from utils import admin_api_tool_errors
 from utils import http_utils
 from utils import log_utils
+from utils import user_cache
 
 
 _MISSING_FIELD_STUB = '%s field not found in user data.'
@@ -69,6 +70,51 @@ def GetFieldFromUser(user, field_name, sub_field_name=None):
   return field_value
 
 
+# Service builder; apiclient.discovery is imported when first called.
+build = http_utils.BuildService
+
+# If set (e.g. by the toolkitd daemon) a users_index.UsersIndex consulted by
+# IsDomainUser() before issuing a users.get() request.
+USERS_INDEX = None
+
+# If set (by EnableUserCache()) a user_cache.UserCache of the user documents
+# retrieved by GetDomainUser().
+USER_CACHE = None
+
+
+def EnableUserCache():
+  """Cache user documents in memory and in the working directory.
+
+  Used by commands that look up the same users repeatedly (e.g. ls_user.py).
+  The cache file is saved when the command exits (or by DisableUserCache()).
+  A cache enabled by an earlier command of this process for another working
+  directory is saved and replaced.
+  """
+  global USER_CACHE  # pylint: disable=global-statement
+  if USER_CACHE is None or not USER_CACHE.IsForWorkDirectory():
+    DisableUserCache()
+    USER_CACHE = user_cache.UserCache()
+
+
+def DisableUserCache():
+  """Save the user cache (if enabled) and stop using it.
+
+  Called by toolkitd after each command so the next command revalidates the
+  cached documents instead of serving them for the life of the daemon.
+
+  Returns:
+    String full path of the cache file or None if unchanged.
+  """
+  global USER_CACHE  # pylint: disable=global-statement
+  if USER_CACHE is None:
+    return None
+  saved_cache, USER_CACHE = USER_CACHE, None
+  return saved_cache.Save()
+
+
+atexit.register(DisableUserCache)
+
+
 class UsersApiWrapper(object):
   """Demonstrates a few needed functions of user provisioning."""
 
@@ -115,6 +161,21 @@ class UsersApiWrapper(object):
             GetFieldFromUser(user, 'id'),
             GetFieldFromUser(user, 'name', sub_field_name='fullName'))
 
+  @staticmethod
+  def _ShowBasicUserFieldsWithOrgUnit(user):
+    """Select the 3 basic fields, organizational unit and state of a user.
+
+    Args:
+      user: user json object returned from the users API list().
+
+    Returns:
+      Tuple reflecting the user: (email, user_id, full_name, orgUnitPath,
+      suspended).
+    """
+    return UsersApiWrapper._ShowBasicUserFields(user) + (
+        GetFieldFromUser(user, 'orgUnitPath'),
+        GetFieldFromUser(user, 'suspended'))
+
   @staticmethod
   def _ProcessCustomerId(user):
     """Select 'customerId from returned user json.
@@ -197,22 +258,28 @@ class UsersApiWrapper(object):
         print '    %s: %s' % (field, formatted_text)
 
   def _ProcessUserListPage(self, apps_domain, max_page, next_page_token=None,
-                           query_filter=None):
+                           query_filter=None, customer=None):
     """Helper that handles exceptions retrieving pages of users.
 
     Args:
-      apps_domain: Users apps domain e.g. mybiz.com.
+      apps_domain: Users apps domain e.g. mybiz.com.  May be None with a
+                   customer to list the users of all the customer domains.
       max_page: Used to optimize paging (1-500).
       next_page_token: Used for ongoing paging of users.
       query_filter: Optinally allow filtering based on many fields.
                     Obvious ones include orgName and orgUnitPath.
+      customer: If not None, the customer_id of the users to list.
 
     Returns:
       List of users retrieved (one page).
     """
-    request = self._users.list(domain=apps_domain, maxResults=max_page,
-                               pageToken=next_page_token,
-                               query=query_filter)
+    list_args = {'maxResults': max_page, 'pageToken': next_page_token,
+                 'query': query_filter}
+    if apps_domain:
+      list_args['domain'] = apps_domain
+    if customer:
+      list_args['customer'] = customer
+    request = self._users.list(**list_args)
     backoff = http_utils.Backoff()
     while backoff.Loop():
       try:
@@ -223,13 +290,13 @@ class UsersApiWrapper(object):
           raise admin_api_tool_errors.AdminAPIToolUserError(
               '%s\nPlease check your domain spelling (%s).' % (
                   http_utils.ParseHttpResult(e.uri, e.resp, e.content),
-                  apps_domain))
+                  apps_domain or customer))
         log_utils.LogInfo(
             'Possible quota problem retrieving users (%d).' % e.resp.status)
         backoff.Fail()
 
   def _ProcessDomainUsers(self, apps_domain, process_fn, max_results=None,
-                          max_page=100, query_filter=None):
+                          max_page=100, query_filter=None, customer=None):
     """Helper to allow multiple, different print functions.
 
     Args:
@@ -239,6 +306,7 @@ class UsersApiWrapper(object):
       max_page: Used to optimize paging (1-500).
       query_filter: Optinally allow filtering based on many fields.
                     Obvious ones include orgName and orgUnitPath.
+      customer: If not None, the customer_id of the users to list.
 
     Returns:
       Tuple of (result list, count of users retrieved). The result list is
@@ -255,7 +323,8 @@ class UsersApiWrapper(object):
 
     users_list = self._ProcessUserListPage(apps_domain=apps_domain,
                                            max_page=max_page,
-                                           query_filter=query_filter)
+                                           query_filter=query_filter,
+                                           customer=customer)
     while True:
       for user in users_list.get('users', []):
         result = process_fn(user)
@@ -270,7 +339,8 @@ class UsersApiWrapper(object):
       users_list = self._ProcessUserListPage(apps_domain=apps_domain,
                                              max_page=max_page,
                                              query_filter=query_filter,
-                                             next_page_token=next_page_token)
+                                             next_page_token=next_page_token,
+                                             customer=customer)
 
   def GetCustomerId(self, apps_domain):
     """Look up the customer_id for a specific apps_domain.
@@ -302,25 +372,33 @@ class UsersApiWrapper(object):
                              max_results=1)
 
   def GetDomainUsers(self, apps_domain, basic=True, max_results=None,
-                     max_page=500, query_filter=None):
+                     max_page=500, query_filter=None, customer=None,
+                     org_units=False):
     """List user details into a data structure.
 
     Used to serialize a large list of users to a (json) file.
 
     Args:
-      apps_domain: Users apps domain e.g. mybiz.com.
+      apps_domain: Users apps domain e.g. mybiz.com.  May be None with a
+                   customer to list the users of all the customer domains.
       basic: If True, return a 3-tuple of (email, user_id, full_name) for
              each user, else return the whole user dictionary for each.
       max_results: If not None, stop after this many users.
       max_page: Used to optimize paging (1-500).
       query_filter: Optinally allow filtering based on many fields.
                     Obvious ones include orgName and orgUnitPath.
+      customer: If not None, the customer_id of the users to list.
+      org_units: If True (and basic), add the orgUnitPath and suspended state
+                 to each tuple (e.g. to sample users by organizational unit
+                 or count the users of each organizational unit).
 
     Returns:
       List of tuples of user details [(email, id, full_name)...]
     """
-    log_utils.LogDebug('GetDomainUsers (%s).' % max_results)
-    if basic:
+    log_utils.LogDebug('GetDomainUsers (%s).', max_results)
+    if basic and org_units:
+      user_attribute_filter_fn = self._ShowBasicUserFieldsWithOrgUnit
+    elif basic:
       user_attribute_filter_fn = self._ShowBasicUserFields
     else:
       user_attribute_filter_fn = self._ShowAllUserFields
@@ -328,14 +406,44 @@ class UsersApiWrapper(object):
                                           max_results=max_results,
                                           max_page=max_page,
                                           query_filter=query_filter,
-                                          process_fn=user_attribute_filter_fn)
+                                          process_fn=user_attribute_filter_fn,
+                                          customer=customer)
     return results
 
+  def GetDomainUsersPage(self, apps_domain, basic=True, max_page=500,
+                         query_filter=None, page_token=None):
+    """Retrieve one page of users (e.g. to page partitions concurrently).
+
+    Args:
+      apps_domain: Users apps domain e.g. mybiz.com.
+      basic: If True, return a 3-tuple of (email, user_id, full_name) for
+             each user, else return the whole user dictionary for each.
+      max_page: Used to optimize paging (1-500).
+      query_filter: Optinally allow filtering based on many fields.
+                    Obvious ones include orgName and orgUnitPath.
+      page_token: None for the first page else the token of the next page.
+
+    Returns:
+      Tuple of (List of user details, String token of the next page or None
+      after the last page).
+    """
+    if basic:
+      user_attribute_filter_fn = self._ShowBasicUserFields
+    else:
+      user_attribute_filter_fn = self._ShowAllUserFields
+    users_list = self._ProcessUserListPage(apps_domain=apps_domain,
+                                           max_page=max_page,
+                                           query_filter=query_filter,
+                                           next_page_token=page_token)
+    return ([user_attribute_filter_fn(user)
+             for user in users_list.get('users', [])],
+            users_list.get('nextPageToken'))
+
   def PrintDomainUsers(self, apps_domain, max_results=None, max_page=500):
     """Powerful demonstration of ease of user provisioning API.
 
-    If the customer is interested in multiple domains, this might
-    be rewritten to use customer=customer_id instead of domain=xxx.
+    For the users of all the domains of a customer, GetDomainUsers()
+    accepts customer=customer_id.
 
     Args:
       apps_domain: Users apps domain e.g. mybiz.com.
@@ -355,23 +463,41 @@ class UsersApiWrapper(object):
 
     A common reason to call this is to retrieve the user_id from an email name.
 
+    With USER_CACHE set, a user retrieved by this command is returned without
+    a request and a user cached by a previous command is revalidated with
+    If-None-Match (a 304 response means the cached document is current).
+
     Args:
       user_mail: username to check.
 
     Returns:
       The user document (available fields listed in _PrintOneUser()).
     """
-    log_utils.LogDebug('GetDomainUser (%s).' % user_mail)
+    log_utils.LogDebug('GetDomainUser (%s).', user_mail)
+    cached_user, fresh = (USER_CACHE.Get(user_mail) if USER_CACHE
+                          else (None, False))
+    if fresh:
+      return cached_user
     request = self._users.get(userKey=user_mail)
+    if cached_user and cached_user.get('etag'):
+      request.headers['If-None-Match'] = cached_user['etag']
     backoff = http_utils.Backoff()
     while backoff.Loop():
       try:
-        return request.execute()
+        user = request.execute()
+        if USER_CACHE and user:
+          USER_CACHE.Put(user)
+        return user
       except apiclient_errors.HttpError as e:  # Missing user raises HttpError.
+        if cached_user and e.resp.status == 304:  # Not modified.
+          USER_CACHE.Put(cached_user)
+          return cached_user
         if e.resp.status not in http_utils.RETRY_RESPONSE_CODES:
           error_text = http_utils.ParseHttpResult(e.uri, e.resp, e.content)
           if error_text.startswith('ERROR: status=404'):
             # User not found is reflected by 404 - resource not found.
+            if cached_user:
+              USER_CACHE.Invalidate(user_mail)
             return None
           raise admin_api_tool_errors.AdminAPIToolUserError(
               'User %s not found: %s' % (user_mail, error_text))
@@ -389,7 +515,9 @@ class UsersApiWrapper(object):
     Returns:
       True if user exists else False.
     """
-    log_utils.LogDebug('IsDomainuser (%s).' % user_mail)
+    log_utils.LogDebug('IsDomainuser (%s).', user_mail)
+    if USERS_INDEX and USERS_INDEX.Contains(user_mail):
+      return True
     return self.GetDomainUser(user_mail) is not None
 
   def PrintDomainUser(self, user_mail, long_list=False):
@@ -410,7 +538,7 @@ class UsersApiWrapper(object):
       print 'User %s not found.' % user_mail
 
   def AddDomainUser(self, first_name, last_name, user_mail, new_password,
-                    verify=False):
+                    verify=False, check_exists=True):
     """Adds user to the domain.
 
     Checks if the user already exists.  Users are created by default
@@ -422,9 +550,11 @@ class UsersApiWrapper(object):
       user_mail: user_mail to add.
       new_password: Password to set.
       verify: If True, verify user was created.
+      check_exists: If False, skip the check for an existing user (e.g. the
+                    caller checked a list of users).
     """
-    log_utils.LogDebug('AddDomainUser (%s).' % user_mail)
-    if self.IsDomainUser(user_mail):
+    log_utils.LogDebug('AddDomainUser (%s).', user_mail)
+    if check_exists and self.IsDomainUser(user_mail):
       raise admin_api_tool_errors.AdminAPIToolUserError(
           'User %s already exists.' % user_mail)
     body = {
@@ -436,6 +566,8 @@ class UsersApiWrapper(object):
     while backoff.Loop():
       try:
         self._users.insert(body=body).execute()
+        if USER_CACHE:
+          USER_CACHE.Invalidate(user_mail)
         if verify:
           time.sleep(2)  # Seems to be needed for Verify to work consistently.
           if not self.IsDomainUser(user_mail):
@@ -451,7 +583,7 @@ class UsersApiWrapper(object):
             'a short wait.' % (user_mail, e.resp.status))
         backoff.Fail()
 
-  def DeleteDomainUser(self, user_mail, verify=False):
+  def DeleteDomainUser(self, user_mail, verify=False, check_exists=True):
     """Deletes user from the domain.
 
     Checks if the user already exists before attempting delete.
@@ -459,12 +591,14 @@ class UsersApiWrapper(object):
     Args:
       user_mail: user_mail to add.
       verify: If True, verify user was deleted.
+      check_exists: If False, skip the check that the user exists (e.g. the
+                    caller checked a list of users).
 
     Raises:
       AdminAPIToolUserError: Unable to delete user.
     """
-    log_utils.LogDebug('DeleteDomainUser (%s).' % user_mail)
-    if not self.IsDomainUser(user_mail):
+    log_utils.LogDebug('DeleteDomainUser (%s).', user_mail)
+    if check_exists and not self.IsDomainUser(user_mail):
       raise admin_api_tool_errors.AdminAPIToolUserError(
           'ERROR: user (%s) not a domain member. You may need to check "Enable '
           'provisioning API" in your Domain Settings->User Settings.' % (
@@ -473,6 +607,8 @@ class UsersApiWrapper(object):
     while backoff.Loop():
       try:
         self._users.delete(userKey=user_mail).execute()
+        if USER_CACHE:
+          USER_CACHE.Invalidate(user_mail)
         if verify:
           time.sleep(2)  # Seems to be needed for Verify to work consistently.
           if self.IsDomainUser(user_mail):
@@ -0,0 +1,153 @@
+#!/usr/bin/python
+#
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compare the pure Python and NumPy report aggregations on synthetic data.
+
+Builds a synthetic domain (org units, suspended users and token stats) and
+times each aggregation of vector_aggregation.py with both backends, checking
+that they agree, e.g.:
+
+  ./benchmark_aggregation.py
+  ./benchmark_aggregation.py --users 100000 --runs 5
+"""
+
+import argparse
+import random
+import sys
+import time
+
+from utils import vector_aggregation
+
+
+def _ParseArgs(argv):
+  """Handle command line args unique to this script.
+
+  Args:
+    argv: holds all the command line args passed.
+
+  Returns:
+    argparser args object with attributes set based on arg settings.
+  """
+  argparser = argparse.ArgumentParser(
+      description='Measure report aggregation time.')
+  argparser.add_argument('--users', '-u', type=int, default=500000,
+                         help='Users of the synthetic domain.')
+  argparser.add_argument('--org_units', type=int, default=200,
+                         help='Org units of the synthetic domain.')
+  argparser.add_argument('--client_ids', type=int, default=300,
+                         help='Client ids granted tokens.')
+  argparser.add_argument('--scopes', type=int, default=60,
+                         help='Scopes granted to client ids.')
+  argparser.add_argument('--runs', '-n', type=int, default=3,
+                         help='Runs of each aggregation; the fastest is '
+                              'reported.')
+  argparser.add_argument('--seed', type=int, default=1,
+                         help='Seed of the synthetic data.')
+  return argparser.parse_args(argv)
+
+
+def MakeSyntheticDomain(args):
+  """Make the users rows and token users of a synthetic domain.
+
+  Users are spread over the org units (a few large ones), 5% are suspended
+  and each user grants 0 to 4 tokens of 1 to 3 scopes, popular client ids
+  first.
+
+  Args:
+    args: argparser args object with users, org_units, client_ids, scopes
+          and seed.
+
+  Returns:
+    Tuple of (list of (orgUnitPath, suspended) rows, list of (client_id,
+    scope, user_list) tuples).
+  """
+  random_generator = random.Random(args.seed)
+  org_units = ['/ou%d/sub%d' % (i % 20, i) for i in xrange(args.org_units)]
+  client_scopes = [
+      random_generator.sample(xrange(args.scopes),
+                              random_generator.randint(1, 3))
+      for _ in xrange(args.client_ids)]
+  user_rows = []
+  token_users = {}
+  for user_index in xrange(args.users):
+    user_email = u'user%d@example.com' % user_index
+    org_unit = org_units[
+        int(random_generator.paretovariate(1.2)) % args.org_units]
+    user_rows.append(
+        (org_unit, random_generator.random() < 0.05))
+    for _ in xrange(random_generator.randint(0, 4)):
+      client_index = int(random_generator.paretovariate(1.1)) % args.client_ids
+      for scope_index in client_scopes[client_index]:
+        token_users.setdefault(
+            ('client%d.example.com' % client_index, scope_index),
+            []).append(user_email)
+  return user_rows, [(client_id, scope, user_list) for (client_id, scope),
+                     user_list in token_users.iteritems()]
+
+
+def MeasureSeconds(aggregate_fn, runs):
+  """Run an aggregation and time it.
+
+  Args:
+    aggregate_fn: Function without arguments returning the aggregation.
+    runs: Int count of runs.
+
+  Returns:
+    Tuple of (Float seconds of the fastest run, result of the last run).
+  """
+  best_seconds = None
+  for _ in xrange(runs):
+    start = time.time()
+    result = aggregate_fn()
+    seconds = time.time() - start
+    if best_seconds is None or seconds < best_seconds:
+      best_seconds = seconds
+  return best_seconds, result
+
+
+def _Comparable(result):
+  """Helper to compare aggregations: Counters are compared as dicts."""
+  if isinstance(result, tuple):
+    return tuple(_Comparable(item) for item in result)
+  return getattr(result, 'data', result)
+
+
+def main(argv):
+  args = _ParseArgs(argv)
+  if not vector_aggregation.IsAvailable():
+    print 'NumPy is not installed: only pure Python aggregation is available.'
+    sys.exit(1)
+  user_rows, token_users = MakeSyntheticDomain(args)
+  print '%d users, %d user tokens.' % (
+      len(user_rows), sum(len(users) for _, _, users in token_users))
+  print '%-20s %12s %12s %8s' % ('Aggregation', 'Python s', 'NumPy s',
+                                 'Speedup')
+  for name, aggregate_fn, data in [
+      ('org_unit_users', vector_aggregation.CountOrgUnitUsers, user_rows),
+      ('scope_pairs', vector_aggregation.CountScopePairs, token_users)]:
+    python_seconds, python_result = MeasureSeconds(
+        lambda: aggregate_fn(data, use_numpy=False), args.runs)
+    numpy_seconds, numpy_result = MeasureSeconds(
+        lambda: aggregate_fn(data, use_numpy=True), args.runs)
+    if _Comparable(python_result) != _Comparable(numpy_result):
+      print '%s: the NumPy and Python results differ.' % name
+      sys.exit(1)
+    print '%-20s %12.3f %12.3f %7.1fx' % (name, python_seconds, numpy_seconds,
+                                         python_seconds / numpy_seconds)
+
+
+if __name__ == '__main__':
+  main(sys.argv[1:])
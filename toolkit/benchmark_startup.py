@@ -0,0 +1,98 @@
+#!/usr/bin/python
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measure the import time of each command to track startup cost.
+
+Each command module is imported in a fresh interpreter (so nothing is already
+cached in sys.modules) and the best of several runs is reported, e.g.:
+
+  ./benchmark_startup.py
+  ./benchmark_startup.py --command ls_user --runs 20
+"""
+
+import argparse
+import glob
+import os
+import subprocess
+import sys
+
+
+_CMDS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cmds')
+
+# Run in the child interpreter: time only the import of the command module.
+_CHILD_SCRIPT = """
+import sys
+import time
+sys.path.insert(0, %r)
+start = time.time()
+import %s
+print '%%.1f' %% ((time.time() - start) * 1000)
+"""
+
+
+def _ParseArgs(argv):
+  """Handle command line args unique to this script.
+
+  Args:
+    argv: holds all the command line args passed.
+
+  Returns:
+    argparser args object with attributes set based on arg settings.
+  """
+  argparser = argparse.ArgumentParser(
+      description='Measure import time of commands.')
+  argparser.add_argument('--command', '-c', action='append',
+                         help='Command to measure (e.g. ls_user). May be '
+                              'repeated. Defaults to all commands.')
+  argparser.add_argument('--runs', '-n', type=int, default=10,
+                         help='Imports per command; the fastest is reported.')
+  return argparser.parse_args(argv)
+
+
+def _GetCommandNames():
+  """List the command module names in the cmds directory."""
+  return sorted(
+      os.path.splitext(os.path.basename(path))[0]
+      for path in glob.glob(os.path.join(_CMDS_DIR, '*.py'))
+      if os.path.basename(path) not in ('__init__.py', 'setup_path.py'))
+
+
+def MeasureImportMs(command_name, runs):
+  """Import a command module in fresh interpreters and time the import.
+
+  Args:
+    command_name: String module name in cmds (e.g. 'ls_user').
+    runs: Int count of interpreters to start.
+
+  Returns:
+    Float of the fastest import time in milliseconds.
+  """
+  child_script = _CHILD_SCRIPT % (_CMDS_DIR, command_name)
+  return min(
+      float(subprocess.check_output([sys.executable, '-c', child_script]))
+      for _ in xrange(runs))
+
+
+def main(argv):
+  args = _ParseArgs(argv)
+  command_names = args.command or _GetCommandNames()
+  print '%-36s %10s' % ('Command', 'Import ms')
+  for command_name in command_names:
+    print '%-36s %10.1f' % (command_name,
+                            MeasureImportMs(command_name, args.runs))
+
+
+if __name__ == '__main__':
+  main(sys.argv[1:])
@@ -71,6 +71,7 @@ def main(argv):
   """A script to test Admin SDK Directory APIs."""
   flags = common_flags.ParseFlags(argv, 'Add a domain user.', AddFlags)
   http = auth_helper.GetAuthorizedHttp(flags)
+  users_api.EnableUserCache()
   api_wrapper = users_api.UsersApiWrapper(http)
   try:
     api_wrapper.AddDomainUser(flags.first_name, flags.last_name,
@@ -0,0 +1,97 @@
+#!/usr/bin/python
+#
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Add the users listed in a csv file to the domain.
+
+Faster than add_user.py for many users: existence is checked against a list
+of the domain users, inserts are issued concurrently and verified with one
+listing of the domain users.  The csv needs a header row with the columns:
+
+  email,first_name,last_name,password
+
+The result of each row is written to a csv in the working directory.
+
+APIs Used:
+  Admin SDK Directory API: user management
+"""
+
+import sys
+
+# setup_path required to allow imports from component dirs (e.g. utils)
+# and lib (where the OAuth and Google API Python Client modules reside).
+import setup_path  # pylint: disable=unused-import,g-bad-import-order
+
+from utils import admin_api_tool_errors
+from utils import bulk_user_provisioner
+from utils import common_flags
+from utils import file_manager
+from utils import log_utils
+
+
+_RESULTS_FILE_NAME = 'add_users_results.csv'
+FILE_MANAGER = file_manager.FILE_MANAGER
+
+
+def AddFlags(arg_parser):
+  """Handle command line flags unique to this script.
+
+  Args:
+    arg_parser: object from argparse.ArgumentParser() to accumulate flags.
+  """
+  common_flags.DefineAppsDomainFlagWithDefault(arg_parser)
+  common_flags.DefineForceFlagWithDefaultFalse(arg_parser)
+  common_flags.DefineVerboseFlagWithDefaultFalse(arg_parser)
+
+  arg_parser.add_argument(
+      '--input_file', '-i', required=True,
+      help='CSV file of users [REQUIRED].')
+  arg_parser.add_argument(
+      '--output_file', '-o', default=_RESULTS_FILE_NAME,
+      help='CSV file (in the working directory) for the result of each row.')
+  arg_parser.add_argument(
+      '--threads', type=int, default=4,
+      help='Number of concurrent requests.')
+  arg_parser.add_argument(
+      '--refresh_users', action='store_true', default=False,
+      help=('List the domain users to check existence instead of using the '
+            'saved users list (from ls_users.py --json).'))
+  arg_parser.add_argument(
+      '--skip_verify', action='store_true', default=False,
+      help='Do not list the domain users afterwards to verify the changes.')
+
+
+def main(argv):
+  """Add the users listed in a csv file."""
+  flags = common_flags.ParseFlags(argv,
+                                  'Add the users listed in a csv file.',
+                                  AddFlags)
+  if flags.threads < 1:
+    log_utils.LogError('--threads must be at least 1.')
+    sys.exit(1)
+  FILE_MANAGER.ExitIfCannotOverwriteFile(flags.output_file,
+                                         overwrite_ok=flags.force)
+  provisioner = bulk_user_provisioner.BulkUserProvisioner(flags)
+  try:
+    results = provisioner.Run()
+  except admin_api_tool_errors.AdminAPIToolError as e:
+    log_utils.LogError('Unable to process %s.' % flags.input_file, e)
+    sys.exit(1)
+  if bulk_user_provisioner.ReportResults(flags.output_file, results):
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+  main(sys.argv[1:])
@@ -0,0 +1,180 @@
+#!/usr/bin/python
+#
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Report tokens granted and revoked between two gather_domain_token_stats runs.
+
+Each completed gather_domain_token_stats (or merge_token_stats) run saves a
+timestamped snapshot of the tokens in the domain.  This command compares two
+snapshots (by default the two most recent) and reports the (user, client_id,
+scope) tokens that were newly granted or revoked in between.
+
+No APIs are used; only local files are read and written.
+"""
+
+import csv
+import sys
+
+# setup_path required to allow imports from component dirs (e.g. utils)
+# and lib (where the OAuth and Google API Python Client modules reside).
+import setup_path  # pylint: disable=unused-import,g-bad-import-order
+
+from utils import common_flags
+from utils import file_manager
+from utils import log_utils
+from utils import token_report_utils
+from utils import token_snapshots
+from utils.report_utils import BORDER
+from utils.report_utils import PrintReportLine
+
+
+_CHANGES_REPORT_FILE_NAME = 'token_changes.csv'
+
+
+FILE_MANAGER = file_manager.FILE_MANAGER
+
+
+def _ChooseSnapshots(flags):
+  """Choose the old and new snapshot timestamps to compare.
+
+  Args:
+    flags: Argparse flags object with old and new.
+
+  Returns:
+    Tuple of String timestamps: (old_timestamp, new_timestamp).
+  """
+  snapshot_list = token_snapshots.ListSnapshots()
+  new_timestamp = flags.new or (snapshot_list[-1] if snapshot_list else None)
+  if flags.old:
+    old_timestamp = flags.old
+  else:
+    older_list = [s for s in snapshot_list if s < new_timestamp]
+    old_timestamp = older_list[-1] if older_list else None
+  if not old_timestamp or not new_timestamp:
+    log_utils.LogError('At least 2 snapshots are required. Run '
+                       'gather_domain_token_stats.py to save a snapshot.')
+    sys.exit(1)
+  for timestamp in (old_timestamp, new_timestamp):
+    if timestamp not in snapshot_list:
+      log_utils.LogError('Unknown snapshot: %s (use --list to show them).' %
+                         timestamp)
+      sys.exit(1)
+  return old_timestamp, new_timestamp
+
+
+def PrintSnapshotList():
+  """Show the saved snapshots, oldest first."""
+  PrintReportLine(BORDER)
+  PrintReportLine('TOKEN SNAPSHOTS:')
+  PrintReportLine(BORDER)
+  for timestamp in token_snapshots.ListSnapshots():
+    PrintReportLine(timestamp, indent=True)
+
+
+def ReportTokenChanges(old_timestamp, new_timestamp, flags):
+  """Stream the changes between snapshots and print a compact report.
+
+  Args:
+    old_timestamp: String timestamp of the earlier snapshot.
+    new_timestamp: String timestamp of the later snapshot.
+    flags: Argparse flags object with csv, force, long_list and top_n.
+  """
+  csv_writer = None
+  csv_file = None
+  if flags.csv:
+    FILE_MANAGER.ExitIfCannotOverwriteFile(_CHANGES_REPORT_FILE_NAME,
+                                           overwrite_ok=flags.force)
+    csv_file, csv_filename_path = FILE_MANAGER.OpenFileForWrite(
+        _CHANGES_REPORT_FILE_NAME)
+    csv_writer = csv.writer(csv_file)
+    csv_writer.writerow(['CHANGE', 'USER', 'CLIENT_ID', 'SCOPE'])
+
+  PrintReportLine(BORDER)
+  PrintReportLine('TOKEN CHANGES FROM %s TO %s:' % (old_timestamp,
+                                                     new_timestamp))
+  PrintReportLine(BORDER)
+  summary = token_snapshots.TokenChangeSummary()
+  try:
+    for change, token_tuple in token_snapshots.DiffSnapshots(old_timestamp,
+                                                             new_timestamp):
+      summary.AddChange(change, token_tuple)
+      if flags.long_list:
+        user_email, client_id, scope = token_tuple
+        PrintReportLine('%s %s\t%s\t%s' % (
+            change, user_email, client_id,
+            token_report_utils.LookupScope(scope)), indent=True)
+      if csv_writer:
+        csv_writer.writerow((change,) + token_tuple)
+  finally:
+    if csv_file:
+      csv_file.close()
+
+  PrintReportLine('Granted: %d  Revoked: %d' % (summary.granted_count,
+                                                summary.revoked_count))
+  client_changes = summary.GetClientChanges()
+  if client_changes:
+    PrintReportLine('')
+    PrintReportLine('%s' % '\t'.join(['+USERS', '-USERS', 'CLIENT_ID']),
+                    indent=True)
+  if flags.top_n:
+    client_changes = client_changes[:flags.top_n]
+  for client_id, granted_users, revoked_users in client_changes:
+    PrintReportLine('%d\t%d\t%s' % (granted_users, revoked_users, client_id),
+                    indent=True)
+  if csv_writer:
+    print 'Wrote token changes report: %s.' % csv_filename_path
+
+
+def AddFlags(arg_parser):
+  """Handle command line flags unique to this script.
+
+  Args:
+    arg_parser: object from argparse.ArgumentParser() to accumulate flags.
+  """
+  common_flags.DefineAppsDomainFlagWithDefault(arg_parser)
+  common_flags.DefineForceFlagWithDefaultFalse(arg_parser)
+  common_flags.DefineVerboseFlagWithDefaultFalse(arg_parser)
+
+  arg_parser.add_argument('--list', action='store_true', default=False,
+                          help='List the saved snapshots and exit.')
+  arg_parser.add_argument('--old', default=None,
+                          help=('Timestamp of the earlier snapshot (default: '
+                                'the snapshot before --new).'))
+  arg_parser.add_argument('--new', default=None,
+                          help=('Timestamp of the later snapshot (default: '
+                                'the most recent snapshot).'))
+  arg_parser.add_argument('--csv', action='store_true', default=False,
+                          help='Output every change to a csv file.')
+  arg_parser.add_argument('--long_list', '-l', action='store_true',
+                          default=False,
+                          help='Show every changed (user, client_id, scope).')
+  arg_parser.add_argument('--top_n', type=int, default=0,
+                          help='Show top n changed client_ids.')
+
+
+def main(argv):
+  """Report token changes between two domain token snapshots."""
+  flags = common_flags.ParseFlags(argv,
+                                  'Report token changes between two runs.',
+                                  AddFlags, auth_flags=False)
+  if flags.list:
+    PrintSnapshotList()
+    return
+  old_timestamp, new_timestamp = _ChooseSnapshots(flags)
+  ReportTokenChanges(old_timestamp, new_timestamp, flags)
+
+
+if __name__ == '__main__':
+  main(sys.argv[1:])
@@ -26,6 +26,15 @@ Overall, enough data should be collected to show 3 primary stats:
   2. List the users most frequently authorizing token access.
   3. Show a map of users to client_ids (to allow for revocation).
 
+The token list of each user is also saved in the local token cache read by
+ls_tokens_for_user.py (not for --shard runs).
+
+With --sample N only N users drawn at random are checked.  Their tokens are
+saved to tokens_issued_sample.json with the design of the sample beside it
+(tokens_issued.json, read by the revocation and lookup commands, is left as
+it is) and report_domain_token_status.py --sampled estimates the counts of
+the whole domain (see sampling.py).
+
 Tool to show usage of Admin SDK Directory APIs.
 
 APIs Used:
@@ -34,6 +43,7 @@ APIs Used:
 """
 
 import sys
+import time
 
 # setup_path required to allow imports from component dirs (e.g. utils)
 # and lib (where the OAuth and Google API Python Client modules reside).
@@ -43,11 +53,19 @@ from admin_sdk_directory_api import tokens_api
 from utils import admin_api_tool_errors
 from utils import auth_helper
 from utils import common_flags
+from utils import file_manager
 from utils import log_utils
+from utils import rescan_utils
+from utils import sampling
+from utils import token_cache
 from utils import token_report_utils
+from utils import token_snapshots
 from utils import user_iterator
 
 
+FILE_MANAGER = file_manager.FILE_MANAGER
+
+
 def AddFlags(arg_parser):
   """Handle command line flags unique to this script.
 
@@ -55,7 +73,14 @@ def AddFlags(arg_parser):
     arg_parser: object from argparse.ArgumentParser() to accumulate flags.
   """
   common_flags.DefineAppsDomainFlagWithDefault(arg_parser)
+  common_flags.DefineCustomerListingFlagWithDefaultFalse(arg_parser)
+  common_flags.DefineListingThreadsFlagWithDefaultOne(arg_parser)
+  common_flags.DefineFetchThreadsFlagWithDefaultOne(arg_parser)
   common_flags.DefineForceFlagWithDefaultFalse(arg_parser)
+  common_flags.DefineKeepCheckpointsFlagWithDefaultZero(arg_parser)
+  common_flags.DefineKeepSnapshotsFlagWithDefault(arg_parser)
+  common_flags.DefineSampleFlagsWithDefaults(arg_parser)
+  common_flags.DefineShardFlagWithDefaultNone(arg_parser)
   common_flags.DefineVerboseFlagWithDefaultFalse(arg_parser)
 
   arg_parser.add_argument('--first_n', type=int, default=0,
@@ -63,6 +88,15 @@ def AddFlags(arg_parser):
                                 'domain.'))
   arg_parser.add_argument('--resume', '-r', action='store_true', default=False,
                           help='Resume an interrupted gather command.')
+  arg_parser.add_argument('--rescan_holders', action='store_true',
+                          default=False,
+                          help=('Update the last token report by re-checking '
+                                'only users who held tokens plus a rotating '
+                                'slice of the other users.'))
+  arg_parser.add_argument('--rescan_rotation', type=int, default=7,
+                          help=('With --rescan_holders, re-check all other '
+                                'users over this many runs (0 re-checks only '
+                                'token holders).'))
 
 
 def main(argv):
@@ -83,46 +117,173 @@ def main(argv):
   # This is simple to minimize memory footprint.  Later processing of this data
   # structure will report most frequent: issue domains, scopes and users.
   token_stats = {}
+  user_filter = None
+  token_holders = None
+  rescan_bucket = None
+  user_sampler = None
+
+  if flags.sample:
+    if flags.shard or flags.rescan_holders or flags.first_n:
+      log_utils.LogError('--sample cannot be used with --shard, '
+                         '--rescan_holders or --first_n.')
+      sys.exit(1)
+    user_sampler = sampling.UserSampler(flags.sample, seed=flags.sample_seed)
 
-  if not flags.resume:
+  if flags.rescan_holders:
+    if flags.shard:
+      log_utils.LogError('--rescan_holders cannot be used with --shard.')
+      sys.exit(1)
+    # Update the last report in place: the users re-checked replace their
+    # previous tokens and all other users keep theirs.
+    token_stats = token_report_utils.GetTokenStats()
+    token_holders = token_report_utils.GetTokenHolders(token_stats)
+    rescan_bucket = rescan_utils.GetRescanBucket(flags.rescan_rotation)
+    rescan_holders = rescan_utils.GetRescanHolders(token_holders,
+                                                   flags.resume)
+    user_filter = rescan_utils.MakeRescanFilter(
+        rescan_holders, flags.rescan_rotation, rescan_bucket)
+    if rescan_bucket is None:
+      print 'Re-checking %d token holders.' % len(rescan_holders)
+    else:
+      print 'Re-checking %d token holders and other users in slice %d/%d.' % (
+          len(rescan_holders), rescan_bucket + 1, flags.rescan_rotation)
+  elif not flags.resume:
+    if user_sampler:
+      # The design of the last sample must not describe the new one.
+      FILE_MANAGER.ExitIfCannotOverwriteFile(
+          token_report_utils.TOKENS_SAMPLE_FILE_NAME, overwrite_ok=flags.force)
+      token_report_utils.RemoveTokensSampleDesign()
     # Early check if file exists and not --force.
-    filename_path = token_report_utils.WriteTokensIssuedJson(token_stats,
-                                                             flags.force)
+    filename_path = token_report_utils.WriteTokensIssuedJson(
+        token_stats, flags.force, shard=flags.shard,
+        sample=bool(user_sampler))
   else:
-    token_stats = token_report_utils.GetTokenStats()
+    token_stats = token_report_utils.GetTokenStats(shard=flags.shard,
+                                                   sample=bool(user_sampler))
 
   http = auth_helper.GetAuthorizedHttp(flags)
   apps_security_api = tokens_api.TokensApiWrapper(http)
 
-  iterator_purpose = 'collection'  # Used to tag iterator progress data.
+  # Used to tag iterator progress data.
+  if flags.rescan_holders:
+    iterator_purpose = token_report_utils.TOKEN_RESCAN_PREFIX
+  elif user_sampler:
+    iterator_purpose = token_report_utils.TOKEN_SAMPLE_PREFIX
+  else:
+    iterator_purpose = token_report_utils.TOKEN_COLLECTION_PREFIX
 
   # The user list holds a tuple for each user of: email, id, full_name
   # (e.g. 'larry', '112351558298938768732', 'Larry Summon').
+  # Checkpoints are written from the changes of each user by a background
+  # thread; an interrupt (Ctrl-C) saves them before exiting.
+  tokens_checkpointer = token_report_utils.NewTokensIssuedCheckpointer(
+      token_stats, shard=flags.shard, keep_previous=flags.keep_checkpoints,
+      sample=bool(user_sampler))
+  tokens_checkpointer.CatchSignals()
+  cache_checkpointer = None
+  if not flags.shard:
+    # A whole new gather starts a new cache; other runs update it.
+    cache_checkpointer = token_cache.NewTokenCacheCheckpointer(
+        not (flags.resume or flags.rescan_holders or flags.first_n or
+             flags.sample))
+
+  def _NewTokensApi():
+    """Each fetch thread requests with its own http object."""
+    return tokens_api.TokensApiWrapper(auth_helper.GetAuthorizedHttp(flags))
+
+  def _FetchUserTokens(thread_tokens_api, user):
+    return (thread_tokens_api or apps_security_api).GetTokensForUser(user[1])
+
+  def _OnFetchError(unused_user, error):
+    if not isinstance(error,
+                      admin_api_tool_errors.AdminAPIToolTokenRequestError):
+      raise error
+    # This suggests an unexpected response from the apps security api.
+    # As much detail as possible is provided by the raiser.
+    sys.stdout.write('%80s\r' % '')  # Clear the previous entry.
+    sys.stdout.flush()
+    log_utils.LogError('Unable to get user tokens.', error)
+    sys.exit(1)
+
+  def _SinkUserTokens(user, token_list):
+    user_email = user[0]
+    removed_stat_keys = []
+    if token_holders is not None:
+      # Re-checked users replace their previous tokens.
+      removed_stat_keys = token_holders.pop(user_email, [])
+    # Save lists of users with tokens.
+    user_tokens = (user_email, removed_stat_keys,
+                   [token_report_utils.PackStatKey(token['clientId'], scope)
+                    for token in token_list for scope in token['scopes']])
+    token_report_utils.ApplyUserTokens(token_stats, user_tokens)
+    tokens_checkpointer.Add(user_tokens)
+    if cache_checkpointer:
+      cache_checkpointer.Add((user_email, time.time(), token_list))
+
+  def _SampleUsers(user_list):
+    sampled_users = user_sampler.Sample(user_list)
+    # Saved before any user is checked so the sampled stats always have it.
+    sampling.WriteSampleDesign(
+        token_report_utils.TOKENS_SAMPLE_DESIGN_FILE_NAME,
+        user_sampler.design)
+    return sampled_users
+
+  def _CheckpointResults():
+    tokens_checkpointer.Checkpoint()
+    if cache_checkpointer:
+      cache_checkpointer.Checkpoint()
+
   print 'Scanning domain users for %s' % iterator_purpose
-  for user in user_iterator.StartUserIterator(http, iterator_purpose, flags):
-    user_email, user_id, checkpoint = user
+  try:
     try:
-      token_list = apps_security_api.GetTokensForUser(user_id)
-    except admin_api_tool_errors.AdminAPIToolTokenRequestError as e:
-      # This suggests an unexpected response from the apps security api.
-      # As much detail as possible is provided by the raiser.
-      sys.stdout.write('%80s\r' % '')  # Clear the previous entry.
-      sys.stdout.flush()
-      log_utils.LogError('Unable to get user tokens.', e)
-      sys.exit(1)
-
-    for token in token_list:
-      # Save lists of users with tokens.
-      for scope in token['scopes']:
-        stat_key = token_report_utils.PackStatKey(token['clientId'], scope)
-        token_stats.setdefault(stat_key, [])
-        token_stats[stat_key].append(user_email)
-
-    if checkpoint:
-      # Save progress every n users.
-      filename_path = token_report_utils.WriteTokensIssuedJson(
-          token_stats, overwrite_ok=True)
+      # Users are recorded in order so --resume restarts after the last saved.
+      if not user_iterator.RunUserPipeline(
+          http, iterator_purpose, flags, _FetchUserTokens, _SinkUserTokens,
+          checkpoint_fn=_CheckpointResults,
+          stop_fn=tokens_checkpointer.IsInterrupted, error_fn=_OnFetchError,
+          thread_count=flags.fetch_threads,
+          thread_init_fn=_NewTokensApi if flags.fetch_threads > 1 else None,
+          user_filter=user_filter,
+          sample_fn=_SampleUsers if user_sampler else None):
+        tokens_checkpointer.ExitIfInterrupted()
+      filename_path = tokens_checkpointer.Close()
+      token_report_utils.WriteScopeCodes(token_stats, shard=flags.shard)
+    finally:
+      tokens_checkpointer.Close()
+      if cache_checkpointer:
+        cache_checkpointer.Close()
+  except admin_api_tool_errors.AdminAPIToolFileError as e:
+    # The progress file is not written after a failed checkpoint.
+    log_utils.LogError('Unable to save the results: use --resume to '
+                       'continue from the last saved user.', e)
+    sys.exit(1)
+  if flags.rescan_holders:
+    # Save the final stats even if no users were checked this run.
+    filename_path = token_report_utils.WriteTokensIssuedJson(
+        token_stats, overwrite_ok=True)
+    rescan_utils.AdvanceRescanBucket(flags.rescan_rotation, rescan_bucket)
   print 'Token report written: %s' % filename_path
+  if user_sampler:
+    # Reports estimate the domain counts from the sampled users; per-user
+    # lookups and snapshots (diffs) need every user so are left as they are.
+    print 'Sample design written: %s' % FILE_MANAGER.BuildFullPathToFileName(
+        token_report_utils.TOKENS_SAMPLE_DESIGN_FILE_NAME)
+    print ('Estimate the domain counts with: report_domain_token_status.py '
+           '--sampled')
+    return
+  if not flags.shard:
+    # Per-user lookups (ls_tokens_for_user.py --use_local_token_stats).
+    token_report_utils.WriteTokenStatsIndex(token_stats)
+  if not flags.shard and not flags.first_n:
+    # Only whole-domain runs are snapshotted (shards are once merged) so that
+    # diffs do not report users outside a partial run as revoked.
+    print 'Token snapshot written: %s' % token_snapshots.WriteSnapshot(
+        token_stats)
+    token_snapshots.PruneSnapshots(flags.keep_snapshots)
+  if flags.shard:
+    print ('When all %d shards are done, combine them with: '
+           'merge_token_stats.py --shard_count=%d' % (flags.shard[1],
+                                                      flags.shard[1]))
 
 
 if __name__ == '__main__':
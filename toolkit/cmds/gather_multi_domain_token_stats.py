@@ -0,0 +1,130 @@
+#!/usr/bin/python
+#
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Gather token information for several domains of a customer in one run.
+
+Each domain gets the users list and token stats files of a
+gather_domain_token_stats.py run in its own working directory, so
+report_domain_token_status.py -a <domain> reports on it.  The domains are
+scanned concurrently with one shared limit on the request rate.
+
+The domains are given with --apps_domains or found by listing the users of
+--customer_id (see ls_customer_id.py).  Credentials are those of
+--apps_domain (an admin of the customer).
+
+APIs Used:
+  Admin SDK Directory API: user management
+  Experimental Google Apps 3-legged OAuth Token Management API.
+"""
+
+import sys
+
+# setup_path required to allow imports from component dirs (e.g. utils)
+# and lib (where the OAuth and Google API Python Client modules reside).
+import setup_path  # pylint: disable=unused-import,g-bad-import-order
+
+from utils import admin_api_tool_errors
+from utils import common_flags
+from utils import log_utils
+from utils import multi_domain_scanner
+from utils import token_report_utils
+from utils import validators
+
+
+def AddFlags(arg_parser):
+  """Handle command line flags unique to this script.
+
+  Args:
+    arg_parser: object from argparse.ArgumentParser() to accumulate flags.
+  """
+  common_flags.DefineAppsDomainFlagWithDefault(arg_parser)
+  common_flags.DefineForceFlagWithDefaultFalse(arg_parser)
+  common_flags.DefineVerboseFlagWithDefaultFalse(arg_parser)
+
+  arg_parser.add_argument(
+      '--apps_domains', default=None,
+      type=validators.AppsDomainListValidatorType(),
+      help='Comma separated domains to scan (e.g. altostrat.com,example.com).')
+  arg_parser.add_argument(
+      '--customer_id', default=None,
+      help=('Scan the domains of the users of this customer (or, with '
+            '--apps_domains, list those domains with one users listing).'))
+  arg_parser.add_argument(
+      '--threads', type=int, default=4,
+      help='Number of domains scanned at once.')
+  arg_parser.add_argument(
+      '--max_qps', type=float, default=10,
+      help='Maximum API requests per second of all the domains together.')
+  arg_parser.add_argument(
+      '--first_n', type=int, default=0,
+      help='Gather tokens for the first n users in each domain.')
+  arg_parser.add_argument(
+      '--refresh_users', action='store_true', default=False,
+      help=('List the users of each domain instead of using a saved users '
+            'list (from ls_users.py --json or an earlier gather).'))
+  arg_parser.add_argument(
+      '--resume', '-r', action='store_true', default=False,
+      help=('Resume the domains an interrupted or failed run left unfinished '
+            '(domains already gathered are kept).'))
+
+
+def main(argv):
+  """Gather the token stats of several domains."""
+  flags = common_flags.ParseFlags(
+      argv, 'Gather token status for several domains of a customer.',
+      AddFlags)
+  if not flags.apps_domains and not flags.customer_id:
+    log_utils.LogError('Supply --apps_domains and/or --customer_id.')
+    sys.exit(1)
+  if flags.threads < 1:
+    log_utils.LogError('--threads must be at least 1.')
+    sys.exit(1)
+  if flags.resume and flags.first_n:
+    log_utils.LogError('Cannot supply --resume and --first_n at the same '
+                       'time.')
+    sys.exit(1)
+
+  scanner = multi_domain_scanner.MultiDomainScanner(flags)
+  try:
+    plans = scanner.PlanDomains()
+  except admin_api_tool_errors.AdminAPIToolUserError as e:
+    log_utils.LogError('Unable to list the users of customer %s.' %
+                       flags.customer_id, e)
+    sys.exit(1)
+  for _, domain_file_manager in plans:
+    # Early check if any token stats file exists and not --force (before any
+    # users list is saved).
+    domain_file_manager.ExitIfCannotOverwriteFile(
+        token_report_utils.TOKENS_ISSUED_FILE_NAME,
+        overwrite_ok=flags.force or flags.resume)
+  print 'Scanning %d domains.' % len(plans)
+
+  failed_count = 0
+  for apps_domain, user_count, filename_path, error in scanner.Run(plans):
+    if error:
+      failed_count += 1
+      print '%-40s FAILED (%s)' % (apps_domain, error)
+    else:
+      print '%-40s %6d users  %s' % (apps_domain, user_count, filename_path)
+  if failed_count:
+    log_utils.LogError('%d of %d domains failed. Use --resume to continue '
+                       'them from their last saved user.' % (failed_count,
+                                                             len(plans)))
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+  main(sys.argv[1:])
@@ -16,6 +16,14 @@
 
 """Show the oauth tokens active for a user in an Apps Domain.
 
+Tokens requested by gather_domain_token_stats.py (or by a previous lookup)
+less than --max_age minutes ago are shown from the local token cache without
+any API request; --live always requests them.
+
+With --use_local_token_stats, shows the client_ids and scopes of the user
+found by the last gather_domain_token_stats.py run (from its user index)
+without any API request.
+
 Tool to show usage of 3-legged oauth APIs.
 
 APIs Used:
@@ -34,6 +42,7 @@ from utils import admin_api_tool_errors
 from utils import auth_helper
 from utils import common_flags
 from utils import log_utils
+from utils import token_report_utils
 from utils import validators
 
 
@@ -44,6 +53,7 @@ def AddFlags(arg_parser):
     arg_parser: object from argparse.ArgumentParser() to accumulate flags.
   """
   common_flags.DefineAppsDomainFlagWithDefault(arg_parser)
+  common_flags.DefineTokenCacheFlagsWithDefaults(arg_parser)
   common_flags.DefineVerboseFlagWithDefaultFalse(arg_parser)
 
   arg_parser.add_argument(
@@ -53,13 +63,54 @@ def AddFlags(arg_parser):
       '--user_email', '-u', required=True,
       help='User email address [REQUIRED].',
       type=validators.EmailValidatorType())
+  arg_parser.add_argument(
+      '--use_local_token_stats', action='store_true', default=False,
+      help=('Show the tokens found by the last run of '
+            'gather_domain_token_stats instead of requesting them.'))
+
+
+def PrintLocalTokensForUser(user_email):
+  """Print the tokens of a user recorded in the local token stats.
+
+  Args:
+    user_email: String email of the user.
+  """
+  token_stats_index = token_report_utils.ReadTokenStatsIndex()
+  if not token_stats_index:
+    log_utils.LogError('No token data. You must run gather_domain_token_stats '
+                       'first.')
+    sys.exit(1)
+  user_tokens = token_stats_index.GetUserTokens(user_email.lower())
+  if not user_tokens:
+    print 'No tokens found for that user in the local token stats.'
+    return
+  previous_client_id = None
+  for client_id, scope in user_tokens:
+    if client_id != previous_client_id:
+      print client_id
+      previous_client_id = client_id
+    print '  %s' % token_report_utils.LookupScope(scope)
 
 
 def main(argv):
   """A script to test Apps Security APIs."""
   flags = common_flags.ParseFlags(argv, 'List token info about a domain user.',
                                   AddFlags)
+  if flags.use_local_token_stats:
+    PrintLocalTokensForUser(flags.user_email)
+    return
+  if flags.live:
+    # Not even from a cache enabled by an earlier command of this process.
+    tokens_api.DisableTokenCache()
+  else:
+    token_list = tokens_api.EnableTokenCache(flags.max_age).GetTokens(
+        flags.user_email)
+    if token_list is not None:
+      # Listed by a recent gather: no need to authorize.
+      tokens_api.TokensApiWrapper.PrintTokenList(token_list, flags.long_list)
+      return
   http = auth_helper.GetAuthorizedHttp(flags)
+  users_api.EnableUserCache()
   user_api = users_api.UsersApiWrapper(http)
   if not user_api.IsDomainUser(flags.user_email):
     print 'User %s not found.' % flags.user_email
@@ -19,6 +19,10 @@
 A 'clientId' (e.g. twitter.com) is the identifier of an application that
 requests access to some Apps Domain resources.
 
+Tokens requested by gather_domain_token_stats.py (or by a previous lookup)
+less than --max_age minutes ago are shown from the local token cache without
+any API request; --live always requests them.
+
 APIs Used:
   Experimental Google Apps 3-legged OAuth Token Management API.
 """
@@ -45,6 +49,7 @@ def AddFlags(arg_parser):
     arg_parser: object from argparse.ArgumentParser() to accumulate flags.
   """
   common_flags.DefineAppsDomainFlagWithDefault(arg_parser)
+  common_flags.DefineTokenCacheFlagsWithDefaults(arg_parser)
   common_flags.DefineVerboseFlagWithDefaultFalse(arg_parser)
 
   arg_parser.add_argument(
@@ -66,7 +71,18 @@ def main(argv):
   flags = common_flags.ParseFlags(argv,
                                   'List token info about a user and client.',
                                   AddFlags)
+  if flags.live:
+    # Not even from a cache enabled by an earlier command of this process.
+    tokens_api.DisableTokenCache()
+  else:
+    token_doc = tokens_api.EnableTokenCache(flags.max_age).GetToken(
+        flags.user_email, flags.client_id)
+    if token_doc is not None:
+      # Listed by a recent gather: no need to authorize.
+      tokens_api.TokensApiWrapper.PrintToken(token_doc, flags.long_list)
+      return
   http = auth_helper.GetAuthorizedHttp(flags)
+  users_api.EnableUserCache()
   user_api = users_api.UsersApiWrapper(http)
   if not user_api.IsDomainUser(flags.user_email):
     print 'User %s not found.' % flags.user_email
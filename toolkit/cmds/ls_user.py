@@ -68,6 +68,7 @@ def main(argv):
   if flags.plus_domains:
     user_api = people_api.PlusDomains(http)
   else:
+    users_api.EnableUserCache()
     user_api = users_api.UsersApiWrapper(http)
   try:
     user_api.PrintDomainUser(flags.user_email, flags.long_list)
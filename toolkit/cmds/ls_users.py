@@ -16,6 +16,14 @@
 
 """Show a list of users in an Apps Domain.
 
+With --customer_listing, saves the users list of every domain of the
+customer (see set_default_domain.py) from one listing instead.  Existing
+users lists are kept unless --force.
+
+With --json and --listing_threads, the domain is listed with concurrent
+email prefix queries (see utils/partitioned_listing.py): a large domain is
+listed in a fraction of the time of one paged listing.
+
 Tool to show usage of Admin SDK Directory APIs.
 
 APIs Used:
@@ -32,8 +40,10 @@ from admin_sdk_directory_api import users_api
 from utils import admin_api_tool_errors
 from utils import auth_helper
 from utils import common_flags
+from utils import customer_users
 from utils import file_manager
 from utils import log_utils
+from utils import partitioned_listing
 
 
 FILE_MANAGER = file_manager.FILE_MANAGER
@@ -46,6 +56,8 @@ def AddFlags(arg_parser):
     arg_parser: object from argparse.ArgumentParser() to accumulate flags.
   """
   common_flags.DefineAppsDomainFlagWithDefault(arg_parser)
+  common_flags.DefineCustomerListingFlagWithDefaultFalse(arg_parser)
+  common_flags.DefineListingThreadsFlagWithDefaultOne(arg_parser)
   common_flags.DefineForceFlagWithDefaultFalse(arg_parser)
   common_flags.DefineVerboseFlagWithDefaultFalse(arg_parser)
 
@@ -53,23 +65,62 @@ def AddFlags(arg_parser):
                           help='Output results to a json file.')
   arg_parser.add_argument('--first_n', type=int, default=0,
                           help='Show the first n users in the list.')
+  arg_parser.add_argument('--org_units', action='store_true', default=False,
+                          help=('With --json, also save the organizational '
+                                'unit and suspended state of each user (used '
+                                'by --sample runs and report_org_counts.py).'))
+
+
+def SaveCustomerUsersLists(flags):
+  """Save the users list of each domain of the customer from one listing.
+
+  Args:
+    flags: Argparse flags object with force.
+  """
+  http = auth_helper.GetAuthorizedHttp(flags)
+  api_wrapper = users_api.UsersApiWrapper(http)
+  try:
+    saved_paths = customer_users.SaveCustomerUsers(
+        api_wrapper, customer_users.GetDefaultCustomerId(),
+        overwrite_ok=flags.force)
+  except admin_api_tool_errors.AdminAPIToolUserError as e:
+    log_utils.LogError('Unable to enumerate the users of the customer.', e)
+    sys.exit(1)
+  for apps_domain in sorted(saved_paths):
+    print 'Users list of %s written to %s.' % (apps_domain,
+                                               saved_paths[apps_domain])
 
 
 def main(argv):
   """A script to test Admin SDK Directory APIs."""
   flags = common_flags.ParseFlags(argv, 'List domain users.', AddFlags)
+  if flags.customer_listing:
+    SaveCustomerUsersLists(flags)
+    return
   if flags.json:
     FILE_MANAGER.ExitIfCannotOverwriteFile(FILE_MANAGER.USERS_FILE_NAME,
                                            overwrite_ok=flags.force)
+  if flags.org_units and (not flags.json or flags.listing_threads > 1):
+    log_utils.LogError('--org_units requires --json and a single listing '
+                       'thread.')
+    sys.exit(1)
 
   http = auth_helper.GetAuthorizedHttp(flags)
   api_wrapper = users_api.UsersApiWrapper(http)
 
   max_results = flags.first_n if flags.first_n > 0 else None
   try:
-    if flags.json:
+    if flags.json and flags.listing_threads > 1:
+      previous_users_list = None
+      if FILE_MANAGER.FileExists(FILE_MANAGER.USERS_FILE_NAME):
+        previous_users_list = FILE_MANAGER.ReadJsonFile(
+            FILE_MANAGER.USERS_FILE_NAME)
+      user_list = partitioned_listing.ListDomainUsers(
+          flags, previous_users_list=previous_users_list)[:max_results]
+    elif flags.json:
       user_list = api_wrapper.GetDomainUsers(flags.apps_domain,
-                                             max_results=max_results)
+                                             max_results=max_results,
+                                             org_units=flags.org_units)
     else:
       api_wrapper.PrintDomainUsers(flags.apps_domain,
                                    max_results=max_results)
@@ -0,0 +1,129 @@
+#!/usr/bin/python
+#
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Combine the token stats gathered by sharded runs into one stats file.
+
+Very large domains may be scanned by N processes (or N machines sharing the
+working directory) by running gather_domain_token_stats with --shard=i/N.
+Each shard writes its own tokens_issued_shard<i>_of_<N>.json file.  This
+command merges those files into the tokens_issued.json file that is used by
+report_domain_token_status and the revocation commands.
+
+The shard files are read one at a time and their tokens are sorted within
+--memory_budget_mb (sorted runs spill to disk) so the merged stats are
+never held in memory.
+
+No APIs are used; only local files are read and written.
+"""
+
+import sys
+
+# setup_path required to allow imports from component dirs (e.g. utils)
+# and lib (where the OAuth and Google API Python Client modules reside).
+import setup_path  # pylint: disable=unused-import,g-bad-import-order
+
+from utils import common_flags
+from utils import file_manager
+from utils import log_utils
+from utils import shard_utils
+from utils import token_report_utils
+from utils import token_snapshots
+from utils import user_iterator
+
+
+FILE_MANAGER = file_manager.FILE_MANAGER
+
+
+def ExitIfShardsIncomplete(flags):
+  """Check that every shard finished collecting before merging.
+
+  A shard that is still running (or was interrupted) leaves a progress file
+  behind; merging it would silently produce partial stats.
+
+  Args:
+    flags: Argparse flags object with shard_count and allow_incomplete.
+  """
+  missing_shards = []
+  incomplete_shards = []
+  for shard in shard_utils.GetAllShards(flags.shard_count):
+    if not FILE_MANAGER.FileExists(shard_utils.GetShardFileName(
+        token_report_utils.TOKENS_ISSUED_FILE_NAME, shard)):
+      missing_shards.append(shard_utils.FormatShard(shard))
+    elif user_iterator.IsIterationInProgress(
+        token_report_utils.TOKEN_COLLECTION_PREFIX, shard=shard):
+      incomplete_shards.append(shard_utils.FormatShard(shard))
+  if missing_shards:
+    log_utils.LogError('Missing token stats for shard(s): %s.' %
+                       ', '.join(missing_shards))
+    sys.exit(1)
+  if incomplete_shards and not flags.allow_incomplete:
+    log_utils.LogError('Shard(s) %s have not finished gathering. Use --resume '
+                       'to finish them or --allow_incomplete to merge '
+                       'anyway.' % ', '.join(incomplete_shards))
+    sys.exit(1)
+
+
+def AddFlags(arg_parser):
+  """Handle command line flags unique to this script.
+
+  Args:
+    arg_parser: object from argparse.ArgumentParser() to accumulate flags.
+  """
+  common_flags.DefineAppsDomainFlagWithDefault(arg_parser)
+  common_flags.DefineForceFlagWithDefaultFalse(arg_parser)
+  common_flags.DefineKeepSnapshotsFlagWithDefault(arg_parser)
+  common_flags.DefineVerboseFlagWithDefaultFalse(arg_parser)
+
+  arg_parser.add_argument(
+      '--shard_count', '-n', type=int, required=True,
+      help='Number of shards (N in --shard=i/N) to merge [REQUIRED].')
+  arg_parser.add_argument(
+      '--allow_incomplete', action='store_true', default=False,
+      help='Merge even if some shards did not finish gathering.')
+  arg_parser.add_argument(
+      '--memory_budget_mb', type=int, default=256,
+      help=('Merge holding at most about this many MB of tokens in memory '
+            '(sorted runs spill to disk).'))
+
+
+def main(argv):
+  """Merge per-shard token stats files into tokens_issued.json."""
+  flags = common_flags.ParseFlags(argv, 'Merge sharded token stats files.',
+                                  AddFlags, auth_flags=False)
+  if flags.shard_count < 1:
+    log_utils.LogError('--shard_count must be at least 1.')
+    sys.exit(1)
+  if flags.memory_budget_mb < 1:
+    log_utils.LogError('--memory_budget_mb must be at least 1.')
+    sys.exit(1)
+  memory_budget_bytes = flags.memory_budget_mb * 1024 * 1024
+  FILE_MANAGER.ExitIfCannotOverwriteFile(
+      token_report_utils.TOKENS_ISSUED_FILE_NAME, overwrite_ok=flags.force)
+  ExitIfShardsIncomplete(flags)
+  with log_utils.Timer('merge_token_stats'):
+    filename_path = token_report_utils.WriteMergedShardTokenStats(
+        flags.shard_count, memory_budget_bytes)
+  print 'Merged %d shards into token report: %s' % (flags.shard_count,
+                                                    filename_path)
+  # The user index is rebuilt from the merged stats by the first lookup.
+  FILE_MANAGER.RemoveFile(token_report_utils.TOKENS_INDEX_FILE_NAME)
+  print 'Token snapshot written: %s' % token_snapshots.WriteShardSnapshot(
+      flags.shard_count, memory_budget_bytes)
+  token_snapshots.PruneSnapshots(flags.keep_snapshots)
+
+
+if __name__ == '__main__':
+  main(sys.argv[1:])
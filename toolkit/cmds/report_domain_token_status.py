@@ -22,6 +22,18 @@ This file is produced by running gather_domain_token_stats.
 
 This file produces output user reports that are useful in identifying users
 in anticipation of revoking tokens.
+
+With --memory_budget_mb the report is aggregated from the latest token
+snapshot (see token_snapshots.py) with sorts that spill to disk beyond the
+budget instead of loading the token stats file, for domains whose stats do
+not fit in memory.
+
+With --sampled the report is of the last gather_domain_token_stats.py
+--sample run (tokens_issued_sample.json): it shows the counts estimated for
+the whole domain with their --confidence intervals.
+
+Counts are computed on arrays when NumPy is installed (see
+vector_aggregation.py).
 """
 
 import sys
@@ -32,7 +44,13 @@ import setup_path  # pylint: disable=unused-import,g-bad-import-order
 
 from utils import common_flags
 from utils import file_manager
+from utils import log_utils
+from utils import report_utils
+from utils import scope_catalog
 from utils import token_report_utils
+from utils import token_snapshots
+from utils import user_iterator
+from utils import vector_aggregation
 from utils.report_utils import BORDER
 from utils.report_utils import PrintReportLine
 from utils.report_utils import SEPARATOR
@@ -44,17 +62,83 @@ _SCOPES_REPORT_FILE_NAME = 'top_scopes.csv'
 
 
 FILE_MANAGER = file_manager.FILE_MANAGER
+SCOPE_CATALOG = scope_catalog.SCOPE_CATALOG
+
+
+def _GetTokenList(summary, primary, flags):
+  """Helper to list the tokens of a primary key with their users or counts.
+
+  Args:
+    summary: TokenStats or SortedTokenStats object.
+    primary: String describing the client_id or scope (catalog code).
+    flags: Argparse flags object with show_users.
+
+  Returns:
+    List of 2-tuples (secondary_set, user_set if --show_users else count).
+  """
+  if flags.show_users:
+    return summary.GetTokenList(primary)
+  return summary.GetTokenCounts(primary)
+
+
+def _Len(user_set_or_count):
+  """Helper to count the users of a token listed by _GetTokenList()."""
+  if isinstance(user_set_or_count, int):
+    return user_set_or_count
+  return len(user_set_or_count)
+
+
+def _FormatCount(summary, primary, user_count):
+  """Helper to show the user count of a primary key (and its interval).
+
+  Args:
+    summary: TokenStats, SortedTokenStats or EstimatedTokenStats object.
+    primary: String describing the client_id or scope (catalog code).
+    user_count: Int (estimated) count of users of the primary key.
+
+  Returns:
+    String count, e.g. '12' or '~12 (7-19)' if estimated.
+  """
+  if isinstance(summary, token_report_utils.EstimatedTokenStats):
+    return '~%d (%d-%d)' % ((user_count,) + summary.GetInterval(primary))
+  return '%d' % user_count
+
+
+def _GetCsvRows(summary, ranked_counts, primary_fn):
+  """Helper to list the csv rows of a ranking: count, primary [, interval].
+
+  Args:
+    summary: TokenStats, SortedTokenStats or EstimatedTokenStats object.
+    ranked_counts: List of 2-tuples (primary, user count) to report.
+    primary_fn: Function returning the String shown for a primary key.
+
+  Returns:
+    List of csv rows.
+  """
+  if isinstance(summary, token_report_utils.EstimatedTokenStats):
+    return [(v, primary_fn(k)) + summary.GetInterval(k)
+            for k, v in ranked_counts]
+  return [(v, primary_fn(k)) for k, v in ranked_counts]
+
+
+def _GetCsvHeader(summary, primary_column):
+  """Helper to name the csv columns of _GetCsvRows()."""
+  if isinstance(summary, token_report_utils.EstimatedTokenStats):
+    return ['EST_NUM_USERS', primary_column, 'LOW_NUM_USERS',
+            'HIGH_NUM_USERS']
+  return ['NUM_USERS', primary_column]
 
 
 def ReportCommonClientIDs(client_id_summary, flags):
   """Report the domains that were most frequently issued tokens.
 
   Args:
-    client_id_summary: TokenStats object with client_id as primary.
+    client_id_summary: TokenStats (or SortedTokenStats or EstimatedTokenStats)
+                       object with client_id as primary.
     flags: Argparse flags object with console, long_list, show_users.
   """
   client_counter = client_id_summary.CalculateRankings()
-  csv_header = ['NUM_USERS', 'CLIENT_ID']
+  csv_header = _GetCsvHeader(client_id_summary, 'CLIENT_ID')
   if flags.console:
     PrintReportLine('\n%s' % BORDER)
     PrintReportLine('MOST COMMON CLIENT IDs:')
@@ -62,13 +146,14 @@ def ReportCommonClientIDs(client_id_summary, flags):
     PrintReportLine('%s' % '\t'.join(csv_header), indent=True)
     for client_id, user_count in (
         client_counter.FilterAndSortMostCommon(flags.top_n)):
-      PrintReportLine('%d:\t%s' % (user_count, client_id), indent=True)
+      PrintReportLine('%s:\t%s' % (
+          _FormatCount(client_id_summary, client_id, user_count), client_id),
+                      indent=True)
       if flags.long_list:
-        for token in client_id_summary.GetTokenList(client_id):
+        for token in _GetTokenList(client_id_summary, client_id, flags):
           scope_set, user_set = token
-          printable_scopes = [token_report_utils.LookupScope(s)
-                              for s in sorted(scope_set)]
-          PrintReportLine('%2d: %s' % (len(user_set), printable_scopes[0]),
+          printable_scopes = SCOPE_CATALOG.GetSortedLabels(scope_set)
+          PrintReportLine('%2d: %s' % (_Len(user_set), printable_scopes[0]),
                           indent=True, indent_level=2)
           for scope in printable_scopes[1:]:
             PrintReportLine(scope, indent=True, indent_level=3)
@@ -79,8 +164,9 @@ def ReportCommonClientIDs(client_id_summary, flags):
 
   if flags.csv:
     # Swap client_id and user_count for printing.
-    csv_rows = [
-        (v, k) for k, v in client_counter.FilterAndSortMostCommon(flags.top_n)]
+    csv_rows = _GetCsvRows(
+        client_id_summary, client_counter.FilterAndSortMostCommon(flags.top_n),
+        lambda client_id: client_id)
     filename_path = FILE_MANAGER.WriteCSVFile(_CLIENT_ID_REPORT_FILE_NAME,
                                               csv_rows, csv_header,
                                               overwrite_ok=flags.force)
@@ -91,25 +177,28 @@ def ReportCommonScopes(scope_summary, flags):
   """Report the scopes that were most frequently used issuing tokens.
 
   Args:
-    scope_summary: TokenStats object with scope as primary.
+    scope_summary: TokenStats (or SortedTokenStats or EstimatedTokenStats)
+                   object with scope (catalog code) as primary.
     flags: Argparse flags object with console, long_list, show_users.
   """
   scope_counter = scope_summary.CalculateRankings()
-  csv_header = ['NUM_USERS', 'SCOPE']
+  csv_header = _GetCsvHeader(scope_summary, 'SCOPE')
   if flags.console:
     PrintReportLine('\n%s' % BORDER)
     PrintReportLine('MOST COMMON SCOPES:')
     PrintReportLine(BORDER)
     PrintReportLine('%s' % '\t'.join(csv_header), indent=True)
-    for scope, user_count in scope_counter.FilterAndSortMostCommon(flags.top_n):
+    for scope_code, user_count in (
+        scope_counter.FilterAndSortMostCommon(flags.top_n)):
       PrintReportLine(
-          '%d:\t%s' % (user_count, token_report_utils.LookupScope(scope)),
+          '%s:\t%s' % (_FormatCount(scope_summary, scope_code, user_count),
+                        SCOPE_CATALOG.GetLabel(scope_code)),
           indent=True)
       if flags.long_list:
-        for token in scope_summary.GetTokenList(scope):
+        for token in _GetTokenList(scope_summary, scope_code, flags):
           client_id_set, user_set = token
           sorted_domains = sorted(client_id_set)
-          PrintReportLine('%2d: %s' % (len(user_set), sorted_domains[0]),
+          PrintReportLine('%2d: %s' % (_Len(user_set), sorted_domains[0]),
                           indent=True, indent_level=2)
           for client_id in sorted_domains[1:]:
             PrintReportLine(client_id, indent=True, indent_level=3)
@@ -120,14 +209,103 @@ def ReportCommonScopes(scope_summary, flags):
 
   if flags.csv:
     # Swap scope and user_count for printing.
-    csv_rows = [
-        (v, k) for k, v in scope_counter.FilterAndSortMostCommon(flags.top_n)]
+    csv_rows = _GetCsvRows(
+        scope_summary, scope_counter.FilterAndSortMostCommon(flags.top_n),
+        SCOPE_CATALOG.GetScope)
     filename_path = FILE_MANAGER.WriteCSVFile(_SCOPES_REPORT_FILE_NAME,
                                               csv_rows, csv_header,
                                               overwrite_ok=flags.force)
     print 'Wrote common scopes report: %s.' % filename_path
 
 
+def ReportCommonScopePairs(token_data, flags):
+  """Report the pairs of scopes most frequently granted by the same users.
+
+  Args:
+    token_data: Dictionary deserialized from a json file created by
+                gather_domain_token_stats().
+    flags: Argparse flags object with top_n.
+  """
+  pair_counter = report_utils.Counter()
+  for scope_pair, user_count in vector_aggregation.CountScopePairs(
+      token_report_utils.GetTokenUsers(token_data)).iteritems():
+    pair_counter.Increment(scope_pair, user_count)
+  PrintReportLine('\n%s' % BORDER)
+  PrintReportLine('MOST COMMON SCOPE PAIRS:')
+  PrintReportLine(BORDER)
+  PrintReportLine('NUM_USERS\tSCOPES', indent=True)
+  for (scope_code, other_scope_code), user_count in (
+      pair_counter.FilterAndSortMostCommon(flags.top_n)):
+    PrintReportLine(
+        '%d:\t%s' % (user_count, SCOPE_CATALOG.GetLabel(scope_code)),
+        indent=True)
+    PrintReportLine(SCOPE_CATALOG.GetLabel(other_scope_code), indent=True,
+                    indent_level=3)
+
+
+def _SummarizeLatestSnapshot(flags):
+  """Aggregate the latest token snapshot within the memory budget.
+
+  Args:
+    flags: Argparse flags object with memory_budget_mb, long_list and
+           show_users.
+
+  Returns:
+    Tuple of SortedTokenStats objects as token_report_utils.
+    SummarizeTokenTuples().
+  """
+  if flags.show_users:
+    log_utils.LogError('--show_users lists users held in memory: it cannot '
+                       'be used with --memory_budget_mb.')
+    sys.exit(1)
+  snapshots = token_snapshots.ListSnapshots()
+  if not snapshots:
+    log_utils.LogError('No token snapshot found: run '
+                       'gather_domain_token_stats.py for the whole domain '
+                       'first.')
+    sys.exit(1)
+  print 'Reporting token snapshot %s.' % snapshots[-1]
+  # Scopes get the codes saved with the token stats.
+  token_report_utils.ReadScopeCodes()
+  return token_report_utils.SummarizeTokenTuples(
+      lambda: token_snapshots.ReadSnapshot(snapshots[-1]),
+      flags.memory_budget_mb * 1024 * 1024, long_list=flags.long_list,
+      temp_dir=FILE_MANAGER.BuildFullPathToFileName('', create_dir=True))
+
+
+def _SummarizeSampledRun(flags):
+  """Estimate the domain counts from the token stats of a --sample run.
+
+  Args:
+    flags: Argparse flags object with confidence and show_users.
+
+  Returns:
+    Tuple of EstimatedTokenStats objects as token_report_utils.
+    SummarizeEstimatedTokenStats().
+  """
+  if flags.show_users:
+    log_utils.LogError('The token report is estimated from a sample: '
+                       '--show_users would list only the sampled users.')
+    sys.exit(1)
+  if user_iterator.IsIterationInProgress(
+      token_report_utils.TOKEN_SAMPLE_PREFIX):
+    # Users of the sample not yet checked would be counted as without tokens.
+    log_utils.LogError('The last --sample run did not finish: complete it '
+                       'with gather_domain_token_stats.py --sample --resume.')
+    sys.exit(1)
+  token_data = token_report_utils.GetTokenStats(sample=True)
+  design = token_report_utils.ReadTokensSampleDesign()
+  if not design:
+    log_utils.LogError('The sampled token stats have no sample design: run '
+                       'gather_domain_token_stats.py --sample again.')
+    sys.exit(1)
+  print ('Estimating from a sample of %d of %d users (%g%% confidence '
+         'intervals).' % (design.sample_count, design.population_count,
+                          flags.confidence * 100))
+  return token_report_utils.SummarizeEstimatedTokenStats(
+      token_data, design, flags.confidence)
+
+
 def AddFlags(arg_parser):
   """Handle command line flags unique to this script.
 
@@ -135,6 +313,7 @@ def AddFlags(arg_parser):
     arg_parser: object from argparse.ArgumentParser() to accumulate flags.
   """
   common_flags.DefineAppsDomainFlagWithDefault(arg_parser)
+  common_flags.DefineConfidenceFlagWithDefault(arg_parser)
   common_flags.DefineForceFlagWithDefaultFalse(arg_parser)
   common_flags.DefineVerboseFlagWithDefaultFalse(arg_parser)
 
@@ -145,6 +324,16 @@ def AddFlags(arg_parser):
   arg_parser.add_argument('--long_list', '-l', action='store_true',
                           default=False,
                           help='Show details of client_ids and scopes.')
+  arg_parser.add_argument('--memory_budget_mb', type=int, default=0,
+                          help=('Aggregate the latest token snapshot holding '
+                                'at most about this many MB of tokens in '
+                                'memory (sorted runs spill to disk).'))
+  arg_parser.add_argument('--sampled', action='store_true', default=False,
+                          help=('Estimate the domain counts from the last '
+                                'gather_domain_token_stats.py --sample run.'))
+  arg_parser.add_argument('--scope_pairs', action='store_true', default=False,
+                          help=('Also show the pairs of scopes most often '
+                                'granted by the same users.'))
   arg_parser.add_argument('--show_users', '-u', action='store_true',
                           default=False,
                           help='Show details of users (enables --long_list).')
@@ -156,13 +345,29 @@ def main(argv):
   """A script to test Apps Security APIs: summarizing oauth2 tokens."""
   flags = common_flags.ParseFlags(argv,
                                   'Create report of domain token info.',
-                                  AddFlags)
+                                  AddFlags, auth_flags=False)
   if flags.show_users:
     flags.long_list = True
-  client_id_summary, scope_summary = token_report_utils.SummarizeTokenStats(
-      token_report_utils.GetTokenStats())
+  if flags.scope_pairs and (flags.memory_budget_mb or flags.sampled):
+    log_utils.LogError('--scope_pairs needs the exact token stats: it cannot '
+                       'be used with --memory_budget_mb or --sampled.')
+    sys.exit(1)
+  if flags.memory_budget_mb and flags.sampled:
+    # Snapshots are only taken of exact runs.
+    log_utils.LogError('--memory_budget_mb cannot be used with --sampled.')
+    sys.exit(1)
+  if flags.memory_budget_mb:
+    client_id_summary, scope_summary = _SummarizeLatestSnapshot(flags)
+  elif flags.sampled:
+    client_id_summary, scope_summary = _SummarizeSampledRun(flags)
+  else:
+    token_data = token_report_utils.GetTokenStats()
+    client_id_summary, scope_summary = token_report_utils.SummarizeTokenStats(
+        token_data)
   ReportCommonClientIDs(client_id_summary, flags)
   ReportCommonScopes(scope_summary, flags)
+  if flags.scope_pairs:
+    ReportCommonScopePairs(token_data, flags)
 
 
 if __name__ == '__main__':
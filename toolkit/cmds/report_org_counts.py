@@ -16,8 +16,11 @@
 
 """Produce reports showing counts of user by org.
 
-Makes use of the report_users command. Produces multiple csv files
-that summarize domain user counts by organizational unit.
+Counts the active and suspended users of each organizational unit, by
+itself and with all its sub-units (subtree counts), in one pass over the
+users list saved by ls_users.py --json --org_units (see utils/org_units.py).
+Without such a list the domain users are listed first.  Produces multiple
+csv files that summarize domain user counts by organizational unit.
 """
 
 import sys
@@ -26,118 +29,92 @@ import sys
 # and lib (where the OAuth and Google API Python Client modules reside).
 import setup_path  # pylint: disable=unused-import,g-bad-import-order
 
+from admin_sdk_directory_api import users_api
 from utils import admin_api_tool_errors
-from utils import auth_helper  # pylint: disable=unused-import
-from utils import cmd_utils
+from utils import auth_helper
 from utils import common_flags
 from utils import file_manager
 from utils import log_utils
+from utils import org_units
 from utils import report_utils
+from utils import users_index
 
 
-_REPORT_USERS_ORGS_FILE_NAME = '_report_users_orgs.csv.tmp'
 _REPORT_ORGS_BY_ACTIVE_FILE_NAME = 'orgs_by_active.csv'
 _REPORT_ORGS_BY_OU_FILE_NAME = 'orgs_by_ou.csv'
 
 
-_REPORT_BY_ACTIVE_HEADER = ['ACTIVE', 'SUSPENDED', 'OU']
-_REPORT_BY_ORG_HEADER = ['OU', 'ACTIVE', 'SUSPENDED']
-_REPORT_FILTER_FIELDS = ['orgUnitPath', 'suspended']
+_REPORT_BY_ACTIVE_HEADER = ['ACTIVE', 'SUSPENDED', 'OU', 'SUBTREE_ACTIVE',
+                            'SUBTREE_SUSPENDED']
+_REPORT_BY_ORG_HEADER = ['OU', 'ACTIVE', 'SUSPENDED', 'SUBTREE_ACTIVE',
+                         'SUBTREE_SUSPENDED']
 
 
 FILE_MANAGER = file_manager.FILE_MANAGER
 
 
-def GenerateUserReport(flags):
-  """Run the command to create the report file.
+def GetUsersWithOrgUnits(flags):
+  """Read the saved users list with org units or list the domain users.
 
-  report_users error-exits if the file is found without --force.
-  Instead, re-process the existing file in that situation.
+  A users list saved without org units is left as it is; with --force (or
+  without a saved users list) the listed users are saved for later reports.
 
   Args:
-    flags: Argparse flags object with apps_domain, resume and first_n.
+    flags: Argparse flags object with apps_domain and force.
+
+  Returns:
+    List of user tuples (email, id, full_name, orgUnitPath, suspended).
   """
-  if FILE_MANAGER.FileExists(_REPORT_USERS_ORGS_FILE_NAME) and not flags.force:
-    print 'Showing counts from existing file.'
-    return
+  user_list = users_index.UsersIndex().GetUsers()
+  if org_units.HasOrgUnits(user_list) and not flags.force:
+    print 'Showing counts from the users list last modified on %s.' % (
+        FILE_MANAGER.FileTime(FILE_MANAGER.USERS_FILE_NAME))
+    return user_list
 
   print 'Generating new counts...'
-
-  arg_list = [
-      '--output_file=%s' % _REPORT_USERS_ORGS_FILE_NAME,
-      '--csv_fields=%s' % ','.join(_REPORT_FILTER_FIELDS),
-  ]
-  for flag_value, flag_string in [
-      (flags.apps_domain, '--apps_domain=%s' % flags.apps_domain),
-      (flags.force, '--force'),
-      (flags.verbose, '--verbose')]:
-    if flag_value:
-      arg_list.append(flag_string)
+  api_wrapper = users_api.UsersApiWrapper(auth_helper.GetAuthorizedHttp(flags))
   try:
-    cmd_utils.RunPyCmd('report_users.py', arg_list)
-  except admin_api_tool_errors.AdminAPIToolCmdError as e:
+    user_list = api_wrapper.GetDomainUsers(flags.apps_domain, org_units=True)
+  except admin_api_tool_errors.AdminAPIToolUserError as e:
     log_utils.LogError('Unable to generate org data.', e)
     sys.exit(1)
+  if flags.force or not FILE_MANAGER.FileExists(FILE_MANAGER.USERS_FILE_NAME):
+    FILE_MANAGER.WriteJsonFile(FILE_MANAGER.USERS_FILE_NAME, user_list,
+                               overwrite_ok=True)
+  return user_list
 
 
-def _ReadAndCountUsersOrgsCSV():
-  """Helper to read the users org report for summarizing.
-
-  Always expects to find a header row since that's how we write it.
-
-  Returns:
-    Tuple of 2 counters: (#active_users, #suspended_users)
-  """
-  csv_rows = FILE_MANAGER.ReadCsvFile(_REPORT_USERS_ORGS_FILE_NAME)
-  if csv_rows[0] != _REPORT_FILTER_FIELDS:
-    log_utils.LogError('Unexpected header in file %s. Try running with '
-                       '--force to generate a new file.' %
-                       FILE_MANAGER.BuildFullPathToFileName(
-                           _REPORT_USERS_ORGS_FILE_NAME))
-    sys.exit(1)
-
-  active_user_count = report_utils.Counter()
-  suspended_user_count = report_utils.Counter()
-  for org, suspended in csv_rows[1:]:
-    if suspended == 'True':
-      suspended_user_count.Increment(org)
-    else:
-      active_user_count.Increment(org)
-  return active_user_count, suspended_user_count
-
+def SummarizeUserOrgReport(user_list, root=org_units.ROOT_ORG_UNIT,
+                           depth=None):
+  """Count members in orgs and in their sub-orgs.
 
-def SummarizeUserOrgReport():
-  """Read the generated csv file and count members in orgs.
+  Args:
+    user_list: List of user tuples (email, id, full_name, orgUnitPath,
+               suspended).
+    root: String path of the org at the top of the reported orgs.
+    depth: If not None, Int count of org levels below root to report.
 
   Returns:
-    Tuple of 2 lists of tuples (OU, #active, #suspended):
-    -List of tuples ordered by #active_users descending
-    -List of tuples ordered by OU name alphabetically ascending.
+    Tuple of 2 lists of tuples:
+    -List of (#active, #suspended, OU, #subtree_active, #subtree_suspended)
+     ordered by #active_users descending.
+    -List of (OU, #active, #suspended, #subtree_active, #subtree_suspended)
+     ordered by OU name alphabetically ascending.
 
     For example, a simple result (a domain with 1 Org Unit) might be:
-    [(929, 0, '/')], [('/', 929, 0)]
+    [(929, 0, '/', 929, 0)], [('/', 929, 0, 929, 0)]
   """
-  # This is tricky because a domain may be entirely active users, suspended
-  # users or (most commonly) a mix of both. Therefore need to handle cases
-  # where an entire subdomain is suspended users carefully.
-  active_user_counter, suspended_user_counter = _ReadAndCountUsersOrgsCSV()
-  # A list of the most common organizations (subdomains) ordered by a count
-  # of subdomain members descending.
-  list_of_org_data_sorted_by_active_user_descending = []
-  for org, active_user_count in active_user_counter.FilterAndSortMostCommon():
-    suspended_user_count = suspended_user_counter.data.get(org, 0)
-    list_of_org_data_sorted_by_active_user_descending.append(
-        (active_user_count, suspended_user_count, org))
-
-  # A list of all organizations (subdomains) ordered by name.
-  org_unit_names = set(active_user_counter.data.keys() +
-                       suspended_user_counter.data.keys())
-  list_of_org_data_sorted_by_org_unit_name_alphabetically = []
-  for org in sorted(org_unit_names):
-    active_user_count = active_user_counter.data.get(org, 0)
-    suspended_user_count = suspended_user_counter.data.get(org, 0)
-    list_of_org_data_sorted_by_org_unit_name_alphabetically.append(
-        (org, active_user_count, suspended_user_count))
+  rollup = org_units.OrgUnitRollup()
+  rollup.AddUsers(user_list)
+  list_of_org_data_sorted_by_org_unit_name_alphabetically = rollup.GetRows(
+      root=root, depth=depth)
+  # Orgs without users of their own still show their subtree counts; most
+  # active users first (then by name).
+  list_of_org_data_sorted_by_active_user_descending = sorted(
+      [(active, suspended, org, subtree_active, subtree_suspended)
+       for org, active, suspended, subtree_active, subtree_suspended
+       in list_of_org_data_sorted_by_org_unit_name_alphabetically],
+      key=lambda org_data: (-org_data[0], org_data[2]))
   return (list_of_org_data_sorted_by_active_user_descending,
           list_of_org_data_sorted_by_org_unit_name_alphabetically)
 
@@ -146,19 +123,24 @@ def PrintOrgCounts(orgs_by_active, orgs_by_ou):
   """Print org groups with related counts of users.
 
   Args:
-    orgs_by_active: List of tuples (#active, #suspended, org) order by #active.
-    orgs_by_ou: List of tuples (org, #active, #suspended) ordered by ou.
+    orgs_by_active: List of tuples (#active, #suspended, org, #subtree_active,
+                    #subtree_suspended) order by #active.
+    orgs_by_ou: List of tuples (org, #active, #suspended, #subtree_active,
+                #subtree_suspended) ordered by ou.
   """
   print report_utils.BORDER
   # Order by #active descending.
   print ','.join(_REPORT_BY_ACTIVE_HEADER)
-  for active, suspended, org in orgs_by_active:
-    print '%d,%d,%s' % (active, suspended, org)
+  for active, suspended, org, subtree_active, subtree_suspended in (
+      orgs_by_active):
+    print '%d,%d,%s,%d,%d' % (active, suspended, org, subtree_active,
+                              subtree_suspended)
   print report_utils.BORDER
   # Order by OU ascending.
   print ','.join(_REPORT_BY_ORG_HEADER)
-  for org, active, suspended in orgs_by_ou:
-    print '%s,%d,%d' % (org, active, suspended)
+  for org, active, suspended, subtree_active, subtree_suspended in orgs_by_ou:
+    print '%s,%d,%d,%d,%d' % (org, active, suspended, subtree_active,
+                              subtree_suspended)
   print report_utils.BORDER
 
 
@@ -166,9 +148,9 @@ def WriteOrgCounts(orgs_by_active, orgs_by_ou, flags):
   """Write org counts to two csv files for later use.
 
   Args:
-    orgs_by_active: List of tuples (#active, #suspended, org) order by #active.
-    orgs_by_ou: List of tuples (org, #active, #suspended) ordered by ou.
-    flags: Argparse flags object with apps_domain, resume and first_n.
+    orgs_by_active: List of tuples as PrintOrgCounts().
+    orgs_by_ou: List of tuples as PrintOrgCounts().
+    flags: Argparse flags object with force.
   """
   try:
     filename_path = FILE_MANAGER.WriteCSVFile(_REPORT_ORGS_BY_ACTIVE_FILE_NAME,
@@ -200,10 +182,16 @@ def AddFlags(arg_parser):
 
   arg_parser.add_argument('--csv', action='store_true', default=False,
                           help='Output results to a csv file.')
+  arg_parser.add_argument('--depth', type=int, default=None,
+                          help=('Only report orgs at most this many levels '
+                                'below --root (0 reports only --root).'))
+  arg_parser.add_argument('--root', default=org_units.ROOT_ORG_UNIT,
+                          help=('Only report this org and its sub-orgs '
+                                '(e.g. /Sales).'))
 
 
 def main(argv):
-  """Run report_users, parse and print a summary of its results."""
+  """Count the users of each org and print a summary of the counts."""
   flags = common_flags.ParseFlags(argv, 'Create a report of org counts.',
                                   AddFlags)
   if flags.csv:
@@ -211,8 +199,11 @@ def main(argv):
                                            overwrite_ok=flags.force)
     FILE_MANAGER.ExitIfCannotOverwriteFile(_REPORT_ORGS_BY_OU_FILE_NAME,
                                            overwrite_ok=flags.force)
-  GenerateUserReport(flags)
-  orgs_by_active, orgs_by_ou = SummarizeUserOrgReport()
+  if flags.depth is not None and flags.depth < 0:
+    log_utils.LogError('--depth must be at least 0.')
+    sys.exit(1)
+  orgs_by_active, orgs_by_ou = SummarizeUserOrgReport(
+      GetUsersWithOrgUnits(flags), root=flags.root, depth=flags.depth)
   PrintOrgCounts(orgs_by_active, orgs_by_ou)
   if flags.csv:
     WriteOrgCounts(orgs_by_active, orgs_by_ou, flags)
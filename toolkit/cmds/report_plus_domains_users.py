@@ -21,6 +21,10 @@ that summarize plus domain user profile counts.
 
 Note that the presence of a user in the directory does not
 guarantee the presence of a plus domain profile.
+
+With --sample N only N users drawn at random are checked and the profile
+counts of the whole domain are estimated with their --confidence intervals
+(see sampling.py).
 """
 
 import sys
@@ -32,14 +36,19 @@ import setup_path  # pylint: disable=unused-import,g-bad-import-order
 from plus_domains_api import people_api
 from utils import admin_api_tool_errors
 from utils import auth_helper  # pylint: disable=unused-import
+from utils import checkpointer
 from utils import common_flags
 from utils import file_manager
 from utils import log_utils
 from utils import report_utils
+from utils import sampling
+from utils import shard_utils
 from utils import user_iterator
 
 
 _PROFILES_FOUND_FILE_NAME = 'plus_profiles_found.json'
+# Strata of a --sample run: its profiles found are only of sampled users.
+_PROFILES_SAMPLE_DESIGN_FILE_NAME = 'plus_profiles_found_sample_design.json'
 _REPORT_USERS_PROFILE_STATE_FILE_NAME = 'report_users_profile_state.csv'
 _REPORT_PROFILE_STATUS_HEADER = ['DOMAIN_USERS', 'ACTIVE_GOOGLE+_PROFILES',
                                  'MISSING_PROFILES']
@@ -48,25 +57,28 @@ _REPORT_PROFILE_STATUS_HEADER = ['DOMAIN_USERS', 'ACTIVE_GOOGLE+_PROFILES',
 FILE_MANAGER = file_manager.FILE_MANAGER
 
 
-def _GetProfileStatus(exit_on_fail=True):
+def _GetProfileStatus(exit_on_fail=True, shard=None):
   """Reads the snapshot of the profile stats from the Json file.
 
   Args:
     exit_on_fail: Alternately return the message instead of failing
                   if token file not found.  Used for ui reporting.
+    shard: If not None, a 2-tuple (shard_index, shard_count) to read the
+           profile status gathered by one shard of a --shard run.
 
   Returns:
     Profile stats in an object (a dictionary).  If cannot find the file
     return a message to show.
   """
-  if not FILE_MANAGER.FileExists(_PROFILES_FOUND_FILE_NAME):
+  file_name = shard_utils.GetShardFileName(_PROFILES_FOUND_FILE_NAME, shard)
+  if not FILE_MANAGER.FileExists(file_name):
     message = 'No profile data.  You cannot --resume.'
     log_utils.LogError(message)
     if exit_on_fail:
       sys.exit(1)
     else:
       return message
-  return FILE_MANAGER.ReadJsonFile(_PROFILES_FOUND_FILE_NAME)
+  return FILE_MANAGER.ReadJsonFile(file_name)
 
 
 def _WriteProfileStatus(profile_status, flags, overwrite_ok=False):
@@ -74,40 +86,59 @@ def _WriteProfileStatus(profile_status, flags, overwrite_ok=False):
 
   Args:
     profile_status: An object with the collected profile status.
-    flags: Argparse flags object with force.
+    flags: Argparse flags object with force, shard and keep_checkpoints.
     overwrite_ok: If True don't check if file exists - else fail if file exists.
 
   Returns:
     String reflecting the full path of the file created/written.
   """
-  filename_path = FILE_MANAGER.BuildFullPathToFileName(
-      _PROFILES_FOUND_FILE_NAME)
+  file_name = shard_utils.GetShardFileName(_PROFILES_FOUND_FILE_NAME,
+                                           flags.shard)
+  filename_path = FILE_MANAGER.BuildFullPathToFileName(file_name)
   overwrite_ok = True if overwrite_ok else flags.force
-  if FILE_MANAGER.FileExists(_PROFILES_FOUND_FILE_NAME) and not overwrite_ok:
+  if FILE_MANAGER.FileExists(file_name) and not overwrite_ok:
     log_utils.LogError('Output file (%s) already exists.\nUse --force to '
                        'overwrite, --resume collecting status for an '
                        'interrupted run or --use_local_profile_data to '
                        'profile data.' % filename_path)
     sys.exit(1)
-  filename_path = FILE_MANAGER.WriteJsonFile(_PROFILES_FOUND_FILE_NAME,
-                                             profile_status,
-                                             overwrite_ok=overwrite_ok)
+  filename_path = FILE_MANAGER.WriteJsonFile(
+      file_name, profile_status, overwrite_ok=overwrite_ok,
+      keep_previous=flags.keep_checkpoints)
   return filename_path
 
 
+def _ApplyProfileStatus(profile_status, user_status):
+  """Apply the profile status of a user (to a checkpoint).
+
+  Args:
+    profile_status: Dictionary of user email -> profile status to update.
+    user_status: 2-tuple (String user email, Boolean status).
+  """
+  user_email, status = user_status
+  profile_status[user_email] = status
+
+
 def _GatherProfileStatus(flags):
   """For each user, determine if they have a Google+ profile.
 
   Args:
-    flags: Argparse flags object with resume.
+    flags: Argparse flags object with resume, shard, keep_checkpoints,
+           fetch_threads, sample and sample_seed.
   """
   profile_status = {}
+  user_sampler = None
+  if flags.sample:
+    user_sampler = sampling.UserSampler(flags.sample, seed=flags.sample_seed)
 
   if not flags.resume:
     # Early check if file exists and not --force.
     filename_path = _WriteProfileStatus(profile_status, flags)
+    if not flags.shard:
+      # The new status is exact until a --sample run notes its design.
+      FILE_MANAGER.RemoveFile(_PROFILES_SAMPLE_DESIGN_FILE_NAME)
   else:
-    profile_status = _GetProfileStatus()
+    profile_status = _GetProfileStatus(shard=flags.shard)
 
   http = auth_helper.GetAuthorizedHttp(flags)
   user_api = people_api.PlusDomains(http)
@@ -116,46 +147,103 @@ def _GatherProfileStatus(flags):
 
   # The user list holds a tuple for each user of: email, id, full_name
   # (e.g. 'larry', '112351558298938768732', 'Larry Summon').
+  # The status of each user is only recorded: the statuses are gathered and
+  # written by a background thread; an interrupt (Ctrl-C) saves them before
+  # exiting.
+  status_checkpointer = checkpointer.Checkpointer(
+      shard_utils.GetShardFileName(_PROFILES_FOUND_FILE_NAME, flags.shard),
+      profile_status, _ApplyProfileStatus,
+      keep_previous=flags.keep_checkpoints)
+  status_checkpointer.CatchSignals()
+
+  def _NewPeopleApi():
+    """Each fetch thread requests with its own http object."""
+    return people_api.PlusDomains(auth_helper.GetAuthorizedHttp(flags))
+
+  def _FetchUserStatus(thread_user_api, user):
+    return (thread_user_api or user_api).IsDomainUser(user[0])
+
+  def _OnFetchError(unused_user, error):
+    if not isinstance(error,
+                      admin_api_tool_errors.AdminAPIToolPlusDomainsError):
+      raise error
+    # This suggests an unexpected response from the plus domains api.
+    # As much detail as possible is provided by the raiser.
+    sys.stdout.write('%80s\r' % '')  # Clear the previous entry.
+    sys.stdout.flush()
+    log_utils.LogError('Unable to get user profile.', error)
+    sys.exit(1)
+
+  def _SinkUserStatus(user, status):
+    status_checkpointer.Add((user[0], status))
+
   print 'Scanning domain users for %s' % iterator_purpose
-  for user in user_iterator.StartUserIterator(http, iterator_purpose, flags):
-    user_email, user_id, checkpoint = user  # pylint: disable=unused-variable
+  try:
     try:
-      profile_status[user_email] = user_api.IsDomainUser(user_email)
-    except admin_api_tool_errors.AdminAPIToolPlusDomainsError as e:
-      # This suggests an unexpected response from the plus domains api.
-      # As much detail as possible is provided by the raiser.
-      sys.stdout.write('%80s\r' % '')  # Clear the previous entry.
-      sys.stdout.flush()
-      log_utils.LogError('Unable to get user profile.', e)
-      sys.exit(1)
-
-    if checkpoint:
-      # Save progress every n users.
-      filename_path = _WriteProfileStatus(profile_status, flags,
-                                          overwrite_ok=True)
+      if not user_iterator.RunUserPipeline(
+          http, iterator_purpose, flags, _FetchUserStatus, _SinkUserStatus,
+          checkpoint_fn=status_checkpointer.Checkpoint,
+          stop_fn=status_checkpointer.IsInterrupted, error_fn=_OnFetchError,
+          thread_count=flags.fetch_threads,
+          thread_init_fn=_NewPeopleApi if flags.fetch_threads > 1 else None,
+          sample_fn=user_sampler.Sample if user_sampler else None):
+        status_checkpointer.ExitIfInterrupted()
+      filename_path = status_checkpointer.Close()
+    finally:
+      status_checkpointer.Close()
+  except admin_api_tool_errors.AdminAPIToolFileError as e:
+    # The progress file is not written after a failed checkpoint.
+    log_utils.LogError('Unable to save the results: use --resume to '
+                       'continue from the last saved user.', e)
+    sys.exit(1)
   print 'Domain Profile report written: %s' % filename_path
+  if user_sampler:
+    print 'Sample design written: %s' % sampling.WriteSampleDesign(
+        _PROFILES_SAMPLE_DESIGN_FILE_NAME, user_sampler.design)
 
 
-def _SummarizeProfileStatus():
+def _SummarizeProfileStatus(flags):
   """Read the generated profile dictionary file and count users and profiles.
 
+  When run with --shard, only the profiles gathered by that shard are read.
+  The profiles of a --sample run give estimated counts for the whole domain.
+
+  Args:
+    flags: Argparse flags object with shard and confidence.
+
   Returns:
-    Tuple of 3 items:
+    Tuple of 4 items:
     -Count of the domain users found/checked.
-    -Count of the profiles found.
+    -Count of the profiles found (or estimated).
+    -None or the (low, high) confidence interval of an estimated count.
     -The state dictionary with users and state for later written reports.
 
     An example result would be:
-      10, 8, {'john@altostrat.com': True, 'paul@altostrat.com': False}
+      10, 8, None, {'john@altostrat.com': True, 'paul@altostrat.com': False}
   """
-  domain_profile_status = _GetProfileStatus()
+  domain_profile_status = _GetProfileStatus(shard=flags.shard)
+  sample_design = None
+  if not flags.shard:
+    sample_design = sampling.ReadSampleDesign(
+        _PROFILES_SAMPLE_DESIGN_FILE_NAME)
+  if sample_design:
+    print ('Estimating from a sample of %d of %d users (%g%% confidence '
+           'interval).' % (sample_design.sample_count,
+                           sample_design.population_count,
+                           flags.confidence * 100))
+    estimate = sample_design.Estimate(
+        [user_email for user_email, status
+         in domain_profile_status.iteritems() if status], flags.confidence)
+    return (sample_design.population_count, estimate[0], estimate[1:],
+            domain_profile_status)
   directory_user_count = len(domain_profile_status.keys())
   user_profiles_count = domain_profile_status.values().count(True)
-  return directory_user_count, user_profiles_count, domain_profile_status
+  return (directory_user_count, user_profiles_count, None,
+          domain_profile_status)
 
 
 def _PrintProfileReport(user_count, profile_count, domain_profile_status,
-                        flags):
+                        flags, profile_interval=None):
   """Print profile summary data: counts and users.
 
   Args:
@@ -164,6 +252,8 @@ def _PrintProfileReport(user_count, profile_count, domain_profile_status,
     domain_profile_status: Dictionary of users and state (True|False) if their
                            Google+ profile is present.
     flags: Argparse flags object with show_users.
+    profile_interval: If not None, the (low, high) confidence interval of an
+                      estimated profile_count.
   """
   print report_utils.BORDER
   format_patterns = []
@@ -171,10 +261,18 @@ def _PrintProfileReport(user_count, profile_count, domain_profile_status,
     format_patterns.append('%%-%ds' % len(column))
   format_string = '  '.join(format_patterns)
   print format_string % tuple(_REPORT_PROFILE_STATUS_HEADER)
-  print format_string % (user_count, profile_count,
-                         (user_count - profile_count))
+  if profile_interval:
+    low, high = profile_interval
+    print format_string % (
+        user_count, '~%d (%d-%d)' % (profile_count, low, high),
+        '~%d (%d-%d)' % (user_count - profile_count, user_count - high,
+                         user_count - low))
+  else:
+    print format_string % (user_count, profile_count,
+                           (user_count - profile_count))
   if flags.show_users:
-    print '\nDomain user Google+ profile state:'
+    print '\n%s user Google+ profile state:' % (
+        'Sampled' if profile_interval else 'Domain')
     for sequence_number, user_email in enumerate(
         sorted(domain_profile_status.keys()), start=1):
       print '%6d. %s: %s' % (sequence_number, user_email,
@@ -212,7 +310,14 @@ def AddFlags(arg_parser):
     arg_parser: object from argparse.ArgumentParser() to accumulate flags.
   """
   common_flags.DefineAppsDomainFlagWithDefault(arg_parser)
+  common_flags.DefineConfidenceFlagWithDefault(arg_parser)
+  common_flags.DefineCustomerListingFlagWithDefaultFalse(arg_parser)
+  common_flags.DefineListingThreadsFlagWithDefaultOne(arg_parser)
+  common_flags.DefineFetchThreadsFlagWithDefaultOne(arg_parser)
   common_flags.DefineForceFlagWithDefaultFalse(arg_parser)
+  common_flags.DefineKeepCheckpointsFlagWithDefaultZero(arg_parser)
+  common_flags.DefineSampleFlagsWithDefaults(arg_parser)
+  common_flags.DefineShardFlagWithDefaultNone(arg_parser)
   common_flags.DefineVerboseFlagWithDefaultFalse(arg_parser)
 
   arg_parser.add_argument('--create_state_report_csv', action='store_true',
@@ -237,13 +342,20 @@ def main(argv):
   flags = common_flags.ParseFlags(argv,
                                   'Create report of domain Google+ user info.',
                                   AddFlags)
+  if flags.sample and (flags.shard or flags.first_n or
+                       flags.use_local_profile_data):
+    log_utils.LogError('--sample cannot be used with --shard, --first_n or '
+                       '--use_local_profile_data.')
+    sys.exit(1)
   if flags.create_state_report_csv:
     FILE_MANAGER.ExitIfCannotOverwriteFile(
         _REPORT_USERS_PROFILE_STATE_FILE_NAME, overwrite_ok=flags.force)
   if not flags.use_local_profile_data:
     _GatherProfileStatus(flags)
-  user_count, profile_count, domain_profile_status = _SummarizeProfileStatus()
-  _PrintProfileReport(user_count, profile_count, domain_profile_status, flags)
+  (user_count, profile_count, profile_interval,
+   domain_profile_status) = _SummarizeProfileStatus(flags)
+  _PrintProfileReport(user_count, profile_count, domain_profile_status, flags,
+                      profile_interval=profile_interval)
   if flags.create_state_report_csv:
     _WriteUserProfileState(domain_profile_status, flags)
 
@@ -33,6 +33,7 @@ from utils import admin_api_tool_errors
 from utils import auth_helper
 from utils import common_flags
 from utils import log_utils
+from utils import token_cache
 from utils import token_report_utils
 from utils import user_iterator
 from utils import validators
@@ -48,6 +49,10 @@ def AddFlags(arg_parser):
     arg_parser: object from argparse.ArgumentParser() to accumulate flags.
   """
   common_flags.DefineAppsDomainFlagWithDefault(arg_parser)
+  common_flags.DefineCustomerListingFlagWithDefaultFalse(arg_parser)
+  common_flags.DefineFetchThreadsFlagWithDefaultOne(arg_parser)
+  common_flags.DefineListingThreadsFlagWithDefaultOne(arg_parser)
+  common_flags.DefineShardFlagWithDefaultNone(arg_parser)
   common_flags.DefineVerboseFlagWithDefaultFalse(arg_parser)
 
   arg_parser.add_argument(
@@ -76,43 +81,65 @@ def main(argv):
                     % log_border)
 
   if flags.use_local_token_stats:
-    stats_user_list = token_report_utils.GetUsersInDomain(
-        token_report_utils.GetTokenStats(), flags.client_id)
+    stats_user_list = set(token_report_utils.GetUsersInDomain(
+        token_report_utils.GetTokenStats(), flags.client_id))
   else:
-    stats_user_list = []  # List of users with a token for an issue domain
+    stats_user_list = set()  # Users with a token for an issue domain
 
   http = auth_helper.GetAuthorizedHttp(flags)
   apps_security_api = tokens_api.TokensApiWrapper(http)
 
-  # The user list holds a tuple for each user of: email, id, full_name
-  # (e.g. 'larry@altostrat.com', '000000000098938768732', 'Larry Summon').
-  print 'Scanning domain users for %s...' % PREFIX
-  for user in user_iterator.StartUserIterator(http, PREFIX, flags):
-    user_email, _, _ = user
+  def _NewTokensApi():
+    """Each fetch thread revokes with its own http object."""
+    return tokens_api.TokensApiWrapper(auth_helper.GetAuthorizedHttp(flags))
+
+  def _RevokeUserToken(thread_tokens_api, user):
+    """Returns True if a revocation was attempted for the user."""
+    user_email = user[0]
     # Skip revocation attempts if tokens not found in the latest report.
     if flags.use_local_token_stats and user_email not in stats_user_list:
-      continue
-
-    try:
-      # NOTE: attempting to revoke a non-existent token causes no
-      #       discernible output (no failure message or fail status).
-      apps_security_api.DeleteToken(user_email, flags.client_id)
-    except admin_api_tool_errors.AdminAPIToolTokenRequestError as e:
-      # This suggests an unexpected response from the apps security api.
-      # As much detail as possible is provided by the raiser.
-      sys.stdout.write('%80s\r' % '')  # Clear the previous entry.
-      sys.stdout.flush()
-      log_utils.LogError(
-          'Unable to revoke token for user %s and client_id %s.'
-          % (user, flags.client_id), e)
-      sys.exit(1)
+      return False
+    # NOTE: attempting to revoke a non-existent token causes no
+    #       discernible output (no failure message or fail status).
+    (thread_tokens_api or apps_security_api).DeleteToken(user_email,
+                                                         flags.client_id)
+    return True
+
+  def _OnRevokeError(user, error):
+    if not isinstance(error,
+                      admin_api_tool_errors.AdminAPIToolTokenRequestError):
+      raise error
+    # This suggests an unexpected response from the apps security api.
+    # As much detail as possible is provided by the raiser.
+    sys.stdout.write('%80s\r' % '')  # Clear the previous entry.
+    sys.stdout.flush()
+    log_utils.LogError(
+        'Unable to revoke token for user %s and client_id %s.'
+        % (user[0], flags.client_id), error)
+    sys.exit(1)
+
+  def _LogRevocation(user, revoked):
     # If attempting to revoke tokens for the whole domain, do not print
     # confirmation because we're not sure which users actually had the tokens.
-    if flags.use_local_token_stats:
+    if revoked and flags.use_local_token_stats:
       log_utils.LogInfo(
           'Successfully revoked token for user %s for client_id %s.'
-          % (user_email, flags.client_id))
+          % (user[0], flags.client_id))
+
+  # The user list holds a tuple for each user of: email, id, full_name
+  # (e.g. 'larry@altostrat.com', '000000000098938768732', 'Larry Summon').
+  # Revocations are idempotent: users are logged as their revocation
+  # completes and a --resume may revoke again after the last saved user.
+  print 'Scanning domain users for %s...' % PREFIX
+  # The token cache learns of the revocations once the scan ends.
+  with token_cache.RevocationBatch():
+    user_iterator.RunUserPipeline(
+        http, PREFIX, flags, _RevokeUserToken, _LogRevocation,
+        error_fn=_OnRevokeError, thread_count=flags.fetch_threads,
+        thread_init_fn=_NewTokensApi if flags.fetch_threads > 1 else None,
+        ordered=False)
   log_utils.LogInfo('revoke_tokens_for_domain_clientid done.\n%s' % log_border)
+  log_utils.FlushLogFile()
   print 'Revocation details logged to: %s.' % log_utils.GetLogFileName()
   if not flags.use_local_token_stats:
     print 'NOTE: To save time, revocation is attempted for all domain users '
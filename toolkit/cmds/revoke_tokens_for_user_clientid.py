@@ -63,6 +63,7 @@ def main(argv):
                                   'Revoke token issued by a user for a client.',
                                   AddFlags)
   http = auth_helper.GetAuthorizedHttp(flags)
+  users_api.EnableUserCache()
   user_api = users_api.UsersApiWrapper(http)
   if not user_api.IsDomainUser(flags.user_email):
     print 'User %s not found.' % flags.user_email
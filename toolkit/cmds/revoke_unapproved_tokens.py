@@ -106,9 +106,20 @@ def AddFlags(arg_parser):
       '--scope_blacklist_file', '-s', default=None,
       help=blacklist_help % ('scope', _SCOPE_BLACKLIST_FILE_NAME),
       type=validators.NoWhitespaceValidatorType())
+  arg_parser.add_argument(
+      '--dry_run', action='store_true', default=False,
+      help=('Report the number of token revocation requests and estimated '
+            'time without revoking any tokens.'))
   arg_parser.add_argument(
       '--hide_timing', action='store_true', default=False,
       help='Stop logging the elapsed time of longer functions.')
+  arg_parser.add_argument(
+      '--resume', '-r', action='store_true', default=False,
+      help=('Skip tokens already revoked by an interrupted run (as recorded '
+            'in the revocation ledger) and retry failed ones.'))
+  arg_parser.add_argument(
+      '--revoke_threads', type=int, default=1,
+      help='Number of token revocation requests to issue concurrently.')
   arg_parser.add_argument(
       '--use_local_token_stats', action='store_true', default=False,
       help='Avoid regenerating token stats.')
@@ -149,6 +160,9 @@ def main(argv):
   flags = common_flags.ParseFlags(argv,
                                   'Revoke unapproved tokens across a domain.',
                                   AddFlags)
+  if flags.revoke_threads < 1:
+    log_utils.LogError('--revoke_threads must be at least 1.')
+    sys.exit(1)
   if not flags.client_blacklist_file and not flags.scope_blacklist_file:
     log_utils.LogError(
         'Either --client_blacklist_file or --scope_blacklist_file must '
@@ -175,7 +189,9 @@ def main(argv):
 
   token_revoker.RevokeUnapprovedTokens()
   log_utils.LogInfo('revoke_unapproved_tokens done.\n%s' % log_border)
-  print 'Revocation details logged to: %s.' % log_utils.GetLogFileName()
+  if not flags.dry_run:
+    log_utils.FlushLogFile()
+    print 'Revocation details logged to: %s.' % log_utils.GetLogFileName()
 
 
 if __name__ == '__main__':
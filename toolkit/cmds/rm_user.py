@@ -56,6 +56,7 @@ def main(argv):
   """A script to test Admin SDK Directory APIs: delete."""
   flags = common_flags.ParseFlags(argv, 'Remove a domain user.', AddFlags)
   http = auth_helper.GetAuthorizedHttp(flags)
+  users_api.EnableUserCache()
   api_wrapper = users_api.UsersApiWrapper(http)
   try:
     api_wrapper.DeleteDomainUser(flags.user_email)
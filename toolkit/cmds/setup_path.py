@@ -29,6 +29,7 @@ succeed in importing component modules:
 from utils import auth_helper
 ...
 """
+import imp
 import os
 import sys
 
@@ -40,24 +41,43 @@ sys.path.insert(0, APP_BASE_PATH)
 if os.path.isdir(os.path.join(APP_BASE_PATH, 'third_party')):
   sys.path.insert(0, os.path.join(APP_BASE_PATH, 'third_party'))
 
-# Attempt to import required packages to help avoid deployment confusion.
-try:
-  # pylint: disable=g-import-not-at-top, unused-import
-  import apiclient
-  from apiclient.discovery import build
-  import httplib2
-  import oauth2client
-  from oauth2client.tools import run
-  # pylint: enable=g-import-not-at-top, unused-import
-except ImportError as e:
-  module_package_map = {'apiclient': 'google-api-python-client',
-                        'apiclient.discovery': 'google-api-python-client',
-                        'oauth2client.tools': 'oauth2client'}
-  # The exception message will be of the form: 'No module named xxxxx'
-  failed_module = package_name = str(e).split()[-1]
-  if failed_module in module_package_map:
-    package_name = module_package_map[failed_module]
-  print ('Unable to find "%s". You are missing the ./third_party directory or '
-         'you need to install the "%s" package.'
-         % (failed_module, package_name))
-  sys.exit(1)
+# Check that required packages are present to help avoid deployment confusion.
+# The packages are only located here, not imported: importing them costs more
+# than the rest of startup and commands that never touch an API (e.g. reports
+# on already gathered files) should not pay for it.  Modules that use them
+# import them when needed.
+_REQUIRED_MODULES = ['apiclient', 'apiclient.discovery', 'httplib2',
+                     'oauth2client', 'oauth2client.tools']
+
+
+def _IsModuleAvailable(module_name):
+  """Locate a (dotted) module on sys.path without importing it.
+
+  Args:
+    module_name: String module name (e.g. 'apiclient.discovery').
+
+  Returns:
+    True if the module (and each parent package) can be found.
+  """
+  search_path = None
+  for part in module_name.split('.'):
+    try:
+      module_file, module_path, _ = imp.find_module(part, search_path)
+    except ImportError:
+      return False
+    if module_file:
+      module_file.close()
+    search_path = [module_path]
+  return True
+
+
+for _module_name in _REQUIRED_MODULES:
+  if not _IsModuleAvailable(_module_name):
+    _module_package_map = {'apiclient': 'google-api-python-client',
+                           'apiclient.discovery': 'google-api-python-client',
+                           'oauth2client.tools': 'oauth2client'}
+    print ('Unable to find "%s". You are missing the ./third_party directory '
+           'or you need to install the "%s" package.'
+           % (_module_name,
+              _module_package_map.get(_module_name, _module_name)))
+    sys.exit(1)
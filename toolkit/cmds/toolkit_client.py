@@ -0,0 +1,57 @@
+#!/usr/bin/python
+#
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Run a command in the toolkitd daemon, or directly if it is not running.
+
+Takes the command name followed by the usual flags of the command:
+
+  ./cmds/toolkit_client.py ls_user -u larry@altostrat.com
+  ./cmds/toolkit_client.py revoke_tokens_for_user_clientid \\
+      -u larry@altostrat.com -c twitter.com
+
+Output and exit status are those of the command either way.
+"""
+
+import os
+import sys
+
+# setup_path required to allow imports from component dirs (e.g. utils)
+# and lib (where the OAuth and Google API Python Client modules reside).
+import setup_path  # pylint: disable=unused-import,g-bad-import-order
+
+from utils import toolkit_daemon
+
+
+_USAGE = 'usage: toolkit_client.py <command> [command flags]'
+
+
+def main(argv):
+  """Pass a command to the daemon and reproduce its output and status."""
+  if not argv or argv[0].startswith('-'):
+    print _USAGE
+    sys.exit(2)
+  command_name = argv[0]
+  if command_name.endswith('.py'):
+    command_name = command_name[:-len('.py')]
+  if not os.path.isfile(os.path.join(os.path.dirname(__file__),
+                                     '%s.py' % command_name)):
+    print '%s\nUnknown command: %s' % (_USAGE, command_name)
+    sys.exit(2)
+  sys.exit(toolkit_daemon.RunCommand(command_name, argv[1:]))
+
+
+if __name__ == '__main__':
+  main(sys.argv[1:])
@@ -0,0 +1,79 @@
+#!/usr/bin/python
+#
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Run the toolkitd daemon to serve repeated per-user commands quickly.
+
+The daemon keeps credentials, http connections, API services and the users
+list loaded between commands.  Run commands through toolkit_client.py:
+
+  ./cmds/toolkitd.py &
+  ./cmds/toolkit_client.py ls_tokens_for_user -u larry@altostrat.com
+  ./cmds/toolkitd.py --stop
+
+APIs Used:
+  Admin SDK Directory API: user management
+  Admin SDK Directory API: 3LO token management
+"""
+
+import sys
+
+# setup_path required to allow imports from component dirs (e.g. utils)
+# and lib (where the OAuth and Google API Python Client modules reside).
+import setup_path  # pylint: disable=unused-import,g-bad-import-order
+
+from utils import common_flags
+from utils import log_utils
+from utils import toolkit_daemon
+
+
+def AddFlags(arg_parser):
+  """Handle command line flags unique to this script.
+
+  Args:
+    arg_parser: object from argparse.ArgumentParser() to accumulate flags.
+  """
+  common_flags.DefineAppsDomainFlagWithDefault(arg_parser)
+  common_flags.DefineVerboseFlagWithDefaultFalse(arg_parser)
+
+  arg_parser.add_argument(
+      '--stop', action='store_true', default=False,
+      help='Stop a running daemon.')
+
+
+def main(argv):
+  """Serve commands until stopped."""
+  flags = common_flags.ParseFlags(argv, 'Serve commands from a daemon.',
+                                  AddFlags)
+  socket_path = toolkit_daemon.GetSocketPath()
+  if flags.stop:
+    if not toolkit_daemon.StopDaemon(socket_path):
+      log_utils.LogError('toolkitd is not running.')
+      sys.exit(1)
+    log_utils.LogInfo('Stopping toolkitd.')
+    return
+  if toolkit_daemon.IsDaemonRunning(socket_path):
+    log_utils.LogError('toolkitd is already running (%s).' % socket_path)
+    sys.exit(1)
+  daemon = toolkit_daemon.ToolkitDaemon(socket_path, verbose=flags.verbose)
+  daemon.Warm(flags)
+  try:
+    daemon.Serve()
+  except KeyboardInterrupt:
+    log_utils.LogInfo('toolkitd interrupted.')
+
+
+if __name__ == '__main__':
+  main(sys.argv[1:])
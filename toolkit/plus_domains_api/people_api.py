@@ -23,12 +23,15 @@ import textwrap
 
 from admin_sdk_directory_api import users_api
 from apiclient import errors as apiclient_errors
-from apiclient.discovery import build
 from utils import admin_api_tool_errors
 from utils import http_utils
 from utils import log_utils
 
 
+# Service builder; apiclient.discovery is imported when first called.
+build = http_utils.BuildService
+
+
 class PlusDomains(object):
   """Demonstrates a few needed functions of user provisioning."""
 
@@ -142,7 +145,7 @@ class PlusDomains(object):
     Returns:
       The user document (available fields listed in _PrintOneUser()).
     """
-    log_utils.LogDebug('GetDomainUser --plus_domains (%s).' % user_mail)
+    log_utils.LogDebug('GetDomainUser --plus_domains (%s).', user_mail)
     request = self._users.get(userId=user_mail)
     backoff = http_utils.Backoff()
     while backoff.Loop():
@@ -176,7 +179,7 @@ class PlusDomains(object):
     Returns:
       True if user exists else False.
     """
-    log_utils.LogDebug('IsDomainuser --plus_domains (%s).' % user_mail)
+    log_utils.LogDebug('IsDomainuser --plus_domains (%s).', user_mail)
     return self.GetDomainUser(user_mail) is not None
 
   def PrintDomainUser(self, user_mail, long_list=False):
@@ -39,17 +39,19 @@ class MockExecutableRequestUser(object):
 class MockExecutableRequestUserList(object):
   """Request object that returns a user list."""
 
-  def __init__(self, domain, max_results, page_token, query=None):
+  def __init__(self, domain, max_results, page_token, query=None,
+               customer=None):
     self._domain = domain
     self._max_results = max_results
     self._page_token = int(page_token) if page_token is not None else None
     self._query = query
+    self._customer = customer
 
   def execute(self):  # pylint: disable=g-bad-name
     start_index = self._page_token if self._page_token is not None else 0
     return TEST_USERS_MANAGER.GetTestUsers(
         self._domain, max_page=self._max_results, start_index=start_index,
-        query=self._query)
+        query=self._query, customer=self._customer)
 
 
 class MockExecutableRequestUserInsert(object):
@@ -81,9 +83,11 @@ class MockExecutableRequestUserDelete(object):
 class MockUsersObject(object):
   """Simulates apiary directory 'users' interface."""
 
-  def list(self, domain, maxResults, pageToken,  # pylint: disable=invalid-name
-           query=None):  # pylint: disable=g-bad-name,invalid-name
-    return MockExecutableRequestUserList(domain, maxResults, pageToken, query)
+  def list(self, maxResults, pageToken,  # pylint: disable=invalid-name
+           domain=None, query=None,  # pylint: disable=g-bad-name
+           customer=None):
+    return MockExecutableRequestUserList(domain, maxResults, pageToken, query,
+                                         customer)
 
   def get(self, userKey):  # pylint: disable=g-bad-name
     return MockExecutableRequestUser(userKey)  # pylint: disable=g-bad-name
@@ -0,0 +1,119 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test block-compressed working files and their use through FileManager."""
+
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+import zlib
+
+# setup_path required to allow imports from component dirs (e.g. utils)
+# and lib (where the OAuth and Google API Python Client modules reside).
+import setup_path  # pylint: disable=unused-import,g-bad-import-order
+
+from utils import block_gzip
+from utils import file_manager
+
+
+_TEST_BLOCK_SIZE = 100
+
+
+class BlockGzipTest(unittest.TestCase):
+  """Tests writing and reading block-compressed files."""
+
+  def setUp(self):
+    self._temp_dir = tempfile.mkdtemp()
+    self._file_path = os.path.join(self._temp_dir, 'lines.txt.gz')
+    self._lines = ['line %04d of the test data\n' % i for i in range(200)]
+    self._data = ''.join(self._lines)
+    with block_gzip.BlockGzipWriter(self._file_path,
+                                    block_size=_TEST_BLOCK_SIZE) as f:
+      for line in self._lines:
+        f.write(line)
+
+  def tearDown(self):
+    shutil.rmtree(self._temp_dir)
+
+  def testReadAllReturnsWrittenData(self):
+    with block_gzip.OpenForRead(self._file_path) as f:
+      self.assertEqual(self._data, f.read())
+
+  def testFileIsReadableAsPlainGzip(self):
+    gzip_file = gzip.open(self._file_path, 'rb')
+    try:
+      self.assertEqual(self._data, gzip_file.read())
+    finally:
+      gzip_file.close()
+
+  def testLinesIterateAcrossBlockBoundaries(self):
+    with block_gzip.OpenForRead(self._file_path) as f:
+      self.assertEqual(self._lines, list(f))
+
+  def testDataIsWrittenInBlocks(self):
+    with open(self._file_path, 'rb') as f:
+      compressed_data = f.read()
+    block_sizes = []
+    while compressed_data:
+      decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+      block_sizes.append(len(decompressor.decompress(compressed_data)))
+      compressed_data = decompressor.unused_data
+    self.assertEqual([_TEST_BLOCK_SIZE] * (len(self._data) / _TEST_BLOCK_SIZE),
+                     block_sizes)
+
+
+class FileManagerCompressionTest(unittest.TestCase):
+  """Tests transparent compression of FileManager working files."""
+
+  def setUp(self):
+    self._file_manager = file_manager.FileManager()
+    self._temp_dir = tempfile.mkdtemp()
+    self._file_manager._work_directory = self._temp_dir
+    self._users = [['george@primarydomain.com', '000000000298938768732',
+                    'George Lasta']] * 1000
+
+  def tearDown(self):
+    shutil.rmtree(self._temp_dir)
+
+  def testCompressedJsonIsReadWithThePlainName(self):
+    self._file_manager.EnableCompression()
+    filename_path = self._file_manager.WriteJsonFile('users.json', self._users)
+    self.assertTrue(filename_path.endswith('users.json.gz'))
+    self.assertTrue(self._file_manager.FileExists('users.json'))
+    self.assertEqual(self._users, self._file_manager.ReadJsonFile('users.json'))
+    self.assertLess(os.path.getsize(filename_path), 1000)
+
+  def testWritingOneFormatRemovesTheStaleOther(self):
+    self._file_manager.WriteJsonFile('users.json', self._users[:1])
+    self._file_manager.EnableCompression()
+    self._file_manager.WriteJsonFile('users.json', self._users,
+                                     overwrite_ok=True)
+    self.assertEqual(['users.json.gz'],
+                     sorted(os.listdir(self._temp_dir)))
+    self._file_manager.RemoveFile('users.json')
+    self.assertEqual([], os.listdir(self._temp_dir))
+
+  def testCompressedCsvRoundTrip(self):
+    self._file_manager.EnableCompression()
+    self._file_manager.WriteCSVFile('report.csv', self._users,
+                                    header=['EMAIL', 'ID', 'NAME'])
+    csv_rows = self._file_manager.ReadCsvFile('report.csv')
+    self.assertEqual(['EMAIL', 'ID', 'NAME'], csv_rows[0])
+    self.assertEqual(self._users, csv_rows[1:])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,177 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test adding and removing the users of a csv with bulk requests."""
+
+import argparse
+import os
+import shutil
+from StringIO import StringIO
+import tempfile
+import unittest
+
+# setup_path required to allow imports from component dirs (e.g. utils)
+# and lib (where the OAuth and Google API Python Client modules reside).
+import setup_path  # pylint: disable=unused-import,g-bad-import-order
+
+from mock import call
+from mock import MagicMock
+from mock import patch
+from utils import admin_api_tool_errors
+from utils import bulk_user_provisioner
+from utils import file_manager
+from utils import users_index
+
+
+_ADD_USERS_CSV = """email,first_name,last_name,password
+larry@altostrat.com,Larry,Page,pw1
+george@altostrat.com,George,Lasta,pw2
+not-an-email,Bad,Row,pw3
+anna@altostrat.com,Anna,Lee,pw4
+Larry@altostrat.com,Larry,Again,pw5
+fail@altostrat.com,Will,Fail,pw6
+"""
+
+_RM_USERS_CSV = """email
+george@altostrat.com
+anna@altostrat.com
+nobody@altostrat.com
+"""
+
+
+def _User(email):
+  return [email, '1', 'Full Name']
+
+
+@patch('utils.log_utils.LogWarning')
+@patch('utils.log_utils.LogError')
+@patch('utils.log_utils.LogInfo')
+@patch('utils.auth_helper.GetAuthorizedHttp')
+class BulkUserProvisionerTest(unittest.TestCase):
+  """Tests rows are checked, processed concurrently and verified."""
+
+  def setUp(self):
+    self._file_manager = file_manager.FileManager()
+    self._temp_dir = tempfile.mkdtemp()
+    self._file_manager._work_directory = self._temp_dir
+    for module in [bulk_user_provisioner, users_index]:
+      patcher = patch.object(module, 'FILE_MANAGER', self._file_manager)
+      patcher.start()
+      self.addCleanup(patcher.stop)
+    patcher = patch.object(bulk_user_provisioner, '_VERIFY_WAIT_S', 0)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+    self._api = MagicMock()
+    # Created up front: two worker threads creating a child mock at once
+    # would each get their own and the calls of one would be lost.
+    self._api.AddDomainUser = MagicMock()
+    self._api.DeleteDomainUser = MagicMock()
+    patcher = patch('admin_sdk_directory_api.users_api.UsersApiWrapper',
+                    return_value=self._api)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def tearDown(self):
+    shutil.rmtree(self._temp_dir)
+
+  def _MakeFlags(self, csv_text, refresh_users=False):
+    input_file = os.path.join(self._temp_dir, 'input.csv')
+    with open(input_file, 'w') as f:
+      f.write(csv_text)
+    return argparse.Namespace(apps_domain='altostrat.com',
+                              input_file=input_file, threads=2,
+                              refresh_users=refresh_users, skip_verify=False)
+
+  def _GetResults(self, results):
+    return [(r[1], r[2], r[3]) for r in results]
+
+  def testAddUsersCheckedAgainstSavedUsersList(
+      self, mock_getauthorizedhttp_fn,  # pylint: disable=unused-argument
+      mock_loginfo_fn,  # pylint: disable=unused-argument
+      mock_logerror_fn,  # pylint: disable=unused-argument
+      mock_logwarning_fn):  # pylint: disable=unused-argument
+    self._file_manager.WriteJsonFile('users.json',
+                                     [_User('anna@altostrat.com')])
+
+    def _AddDomainUser(first_name, *unused_args, **unused_kwargs):
+      if first_name == 'Will':
+        raise admin_api_tool_errors.AdminAPIToolUserError('quota')
+    self._api.AddDomainUser.side_effect = _AddDomainUser
+    self._api.GetDomainUsers.return_value = [
+        _User('anna@altostrat.com'), _User('george@altostrat.com'),
+        _User('larry@altostrat.com')]
+
+    results = bulk_user_provisioner.BulkUserProvisioner(
+        self._MakeFlags(_ADD_USERS_CSV)).Run()
+    self.assertEqual(
+        [('larry@altostrat.com', 'added', 'yes'),
+         ('george@altostrat.com', 'added', 'yes'),
+         ('not-an-email', 'invalid', ''),
+         ('anna@altostrat.com', 'skipped', ''),
+         ('Larry@altostrat.com', 'skipped', ''),
+         ('fail@altostrat.com', 'failed', '')],
+        self._GetResults(results))
+    self.assertEqual([2, 3, 4, 5, 6, 7], [r[0] for r in results])
+    self.assertEqual(3, self._api.AddDomainUser.call_count)
+    self.assertIn(call('Larry', 'Page', 'larry@altostrat.com', 'pw1',
+                       check_exists=False),
+                  self._api.AddDomainUser.call_args_list)
+    self.assertFalse(self._api.IsDomainUser.called)
+    # One listing of the domain users to verify; the saved list for checks.
+    self.assertEqual(1, self._api.GetDomainUsers.call_count)
+
+  def testRemovedUsersVerifiedByRepeatedListing(
+      self, mock_getauthorizedhttp_fn,  # pylint: disable=unused-argument
+      mock_loginfo_fn,  # pylint: disable=unused-argument
+      mock_logerror_fn,  # pylint: disable=unused-argument
+      mock_logwarning_fn):
+    listed_before = [_User('anna@altostrat.com'), _User('george@altostrat.com')]
+    self._api.GetDomainUsers.side_effect = [
+        listed_before, listed_before, [_User('anna@altostrat.com')],
+        [_User('anna@altostrat.com')]]
+
+    results = bulk_user_provisioner.BulkUserProvisioner(
+        self._MakeFlags(_RM_USERS_CSV, refresh_users=True), remove=True).Run()
+    self.assertEqual(
+        [('george@altostrat.com', 'removed', 'yes'),
+         ('anna@altostrat.com', 'removed', 'no'),
+         ('nobody@altostrat.com', 'skipped', '')],
+        self._GetResults(results))
+    self._api.DeleteDomainUser.assert_has_calls(
+        [call('george@altostrat.com', check_exists=False),
+         call('anna@altostrat.com', check_exists=False)], any_order=True)
+    self.assertEqual(4, self._api.GetDomainUsers.call_count)
+    self.assertTrue(mock_logwarning_fn.called)
+
+    with patch('sys.stdout', new_callable=StringIO):
+      self.assertEqual(1, bulk_user_provisioner.ReportResults(
+          'rm_users_results.csv', results))
+    self.assertEqual(
+        [bulk_user_provisioner.RESULT_HEADER,
+         ['2', 'george@altostrat.com', 'removed', 'yes', '']],
+        self._file_manager.ReadCsvFile('rm_users_results.csv')[:2])
+
+  def testMissingColumnRaises(
+      self, mock_getauthorizedhttp_fn,  # pylint: disable=unused-argument
+      mock_loginfo_fn,  # pylint: disable=unused-argument
+      mock_logerror_fn,  # pylint: disable=unused-argument
+      mock_logwarning_fn):  # pylint: disable=unused-argument
+    provisioner = bulk_user_provisioner.BulkUserProvisioner(
+        self._MakeFlags('email,first_name\nlarry@altostrat.com,Larry\n'))
+    self.assertRaises(admin_api_tool_errors.AdminAPIToolFileError,
+                      provisioner.Run)
+
+
+if __name__ == '__main__':
+  unittest.main()
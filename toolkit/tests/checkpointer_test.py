@@ -0,0 +1,98 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test scan results are checkpointed from deltas in the background."""
+
+import os
+import shutil
+import signal
+import tempfile
+import unittest
+
+# setup_path required to allow imports from component dirs (e.g. utils)
+# and lib (where the OAuth and Google API Python Client modules reside).
+import setup_path  # pylint: disable=unused-import,g-bad-import-order
+
+from mock import patch
+from utils import checkpointer
+from utils import file_manager
+from utils import token_report_utils
+
+
+class CheckpointerTest(unittest.TestCase):
+  """Tests deltas are written at checkpoints and on interrupts."""
+
+  def setUp(self):
+    self._temp_dir = tempfile.mkdtemp()
+    self._file_manager = file_manager.FileManager()
+    self._file_manager._work_directory = self._temp_dir
+    patcher = patch.object(checkpointer, 'FILE_MANAGER', self._file_manager)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def tearDown(self):
+    shutil.rmtree(self._temp_dir)
+
+  def _NewTokensCheckpointer(self, token_stats, keep_previous=0):
+    return token_report_utils.NewTokensIssuedCheckpointer(
+        token_stats, keep_previous=keep_previous)
+
+  def _ReadTokenStats(self, file_name='tokens_issued.json'):
+    return self._file_manager.ReadJsonFile(file_name)
+
+  def testDeltasWrittenAtCheckpoints(self):
+    token_stats = {'scope1 twitter.com': ['anna@altostrat.com']}
+    tokens_checkpointer = self._NewTokensCheckpointer(token_stats,
+                                                      keep_previous=1)
+    # The results of the scan thread are not read by the checkpointer.
+    token_stats.clear()
+    tokens_checkpointer.Add(('larry@altostrat.com', [],
+                             ['scope1 twitter.com', 'scope2 twitter.com']))
+    tokens_checkpointer.Checkpoint()
+    tokens_checkpointer.Add(('anna@altostrat.com', ['scope1 twitter.com'],
+                             []))
+    filename_path = tokens_checkpointer.Close()
+    self.assertEqual(os.path.join(self._temp_dir, 'tokens_issued.json'),
+                     filename_path)
+    self.assertEqual({'scope1 twitter.com': ['larry@altostrat.com'],
+                      'scope2 twitter.com': ['larry@altostrat.com']},
+                     self._ReadTokenStats())
+    self.assertEqual(
+        {'scope1 twitter.com': ['anna@altostrat.com', 'larry@altostrat.com'],
+         'scope2 twitter.com': ['larry@altostrat.com']},
+        self._ReadTokenStats('tokens_issued.json.1'))
+
+  def testCheckpointWithoutDeltasWritesNothing(self):
+    tokens_checkpointer = self._NewTokensCheckpointer({})
+    tokens_checkpointer.Close()
+    self.assertEqual([], os.listdir(self._temp_dir))
+
+  @patch('utils.log_utils.LogError')
+  def testSignalSavesDeltasBeforeExit(self, mock_logerror_fn):
+    previous_handler = signal.getsignal(signal.SIGTERM)
+    tokens_checkpointer = self._NewTokensCheckpointer({})
+    tokens_checkpointer.CatchSignals()
+    tokens_checkpointer.Add(('larry@altostrat.com', [], ['scope1 twitter.com']))
+    os.kill(os.getpid(), signal.SIGTERM)
+    # Still running: the scan stops between users.
+    with patch('sys.stdout'):
+      self.assertRaises(SystemExit, tokens_checkpointer.ExitIfInterrupted)
+    self.assertEqual({'scope1 twitter.com': ['larry@altostrat.com']},
+                     self._ReadTokenStats())
+    self.assertTrue(mock_logerror_fn.called)
+    self.assertEqual(previous_handler, signal.getsignal(signal.SIGTERM))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,132 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test compiled request builders against the generated discovery methods."""
+
+import json
+import unittest
+
+# setup_path required to allow imports from component dirs (e.g. utils)
+# and lib (where the OAuth and Google API Python Client modules reside).
+import setup_path  # pylint: disable=unused-import,g-bad-import-order
+
+from apiary_mocks import MockDirectoryServiceObject
+from apiclient import discovery
+from utils import compiled_methods
+
+
+# A trimmed copy of the admin directory_v1 discovery document tokens methods.
+_DISCOVERY_DOC = {
+    'kind': 'discovery#restDescription',
+    'name': 'admin',
+    'version': 'directory_v1',
+    'rootUrl': 'https://www.googleapis.com/',
+    'servicePath': 'admin/directory/v1/',
+    'baseUrl': 'https://www.googleapis.com/admin/directory/v1/',
+    'parameters': {
+        'fields': {'type': 'string', 'location': 'query'},
+    },
+    'schemas': {
+        'Token': {'id': 'Token', 'type': 'object',
+                  'properties': {'clientId': {'type': 'string'}}},
+        'Tokens': {'id': 'Tokens', 'type': 'object',
+                   'properties': {'items': {'type': 'array',
+                                            'items': {'$ref': 'Token'}}}},
+    },
+    'resources': {
+        'tokens': {
+            'methods': {
+                'delete': {
+                    'id': 'directory.tokens.delete',
+                    'path': 'users/{userKey}/tokens/{clientId}',
+                    'httpMethod': 'DELETE',
+                    'parameters': {
+                        'clientId': {'type': 'string', 'required': True,
+                                     'location': 'path'},
+                        'userKey': {'type': 'string', 'required': True,
+                                    'location': 'path'},
+                    },
+                    'parameterOrder': ['userKey', 'clientId'],
+                },
+                'list': {
+                    'id': 'directory.tokens.list',
+                    'path': 'users/{userKey}/tokens',
+                    'httpMethod': 'GET',
+                    'parameters': {
+                        'userKey': {'type': 'string', 'required': True,
+                                    'location': 'path',
+                                    'pattern': '^[^/]+$'},
+                    },
+                    'parameterOrder': ['userKey'],
+                    'response': {'$ref': 'Tokens'},
+                },
+            },
+        },
+    },
+}
+
+
+class CompiledMethodsTest(unittest.TestCase):
+  """Tests compiled methods build the same requests as generated methods."""
+
+  def setUp(self):
+    self._tokens = discovery.build_from_document(
+        json.dumps(_DISCOVERY_DOC), http=object()).tokens()
+
+  def _AssertSameRequest(self, expected_request, request):
+    for attribute in ['uri', 'method', 'methodId', 'body', 'headers', 'http']:
+      self.assertEqual(getattr(expected_request, attribute),
+                       getattr(request, attribute), attribute)
+    # Response handling uses the same model method (maybe another instance).
+    self.assertEqual(expected_request.postproc.im_func,
+                     request.postproc.im_func)
+
+  def testListRequestMatchesGeneratedMethod(self):
+    list_tokens = compiled_methods.CompileMethod(self._tokens, 'list',
+                                                 ['userKey'])
+    self.assertTrue(isinstance(list_tokens, compiled_methods.CompiledMethod))
+    self._AssertSameRequest(
+        self._tokens.list(userKey=u'larry@altostrat.com'),
+        list_tokens(u'larry@altostrat.com'))
+
+  def testDeleteRequestQuotesPathValues(self):
+    delete_token = compiled_methods.CompileMethod(
+        self._tokens, 'delete', ['userKey', 'clientId'], trusted=True)
+    expected_request = self._tokens.delete(userKey='larry@altostrat.com',
+                                           clientId='my app/1.0')
+    request = delete_token('larry@altostrat.com', 'my app/1.0')
+    self._AssertSameRequest(expected_request, request)
+    self.assertTrue(request.uri.endswith('/tokens/my%20app%2F1.0'))
+
+  def testUntrustedCallsAreValidated(self):
+    list_tokens = compiled_methods.CompileMethod(self._tokens, 'list',
+                                                 ['userKey'])
+    self.assertRaises(TypeError, list_tokens, 'bad/user')
+    self.assertRaises(TypeError, list_tokens)
+
+  def testArgumentNamesCheckedWhenCompiled(self):
+    self.assertRaises(TypeError, compiled_methods.CompileMethod,
+                      self._tokens, 'list', ['userKey', 'maxResults'])
+    self.assertRaises(TypeError, compiled_methods.CompileMethod,
+                      self._tokens, 'delete', ['userKey'])
+
+  def testMockServiceFallsBackToGeneratedMethod(self):
+    get_user = compiled_methods.CompileMethod(
+        MockDirectoryServiceObject().users(), 'get', ['userKey'])
+    self.assertEqual('larry@altostrat.com',
+                     get_user('larry@altostrat.com')._user_key)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,108 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test saving the users lists of all the customer domains in one pass."""
+
+import argparse
+import shutil
+import tempfile
+import unittest
+
+# setup_path required to allow imports from component dirs (e.g. utils)
+# and lib (where the OAuth and Google API Python Client modules reside).
+import setup_path  # pylint: disable=unused-import,g-bad-import-order
+
+from mock import MagicMock
+from mock import patch
+from utils import admin_api_tool_errors
+from utils import customer_users
+from utils import file_manager
+from utils import user_iterator
+
+
+_CUSTOMER_USERS = [
+    ['larry@altostrat.com', '1', 'Larry Page'],
+    ['anna@Example.com', '2', 'Anna Lee'],
+    ['george@altostrat.com', '3', 'George Lasta'],
+    ]
+
+
+@patch('utils.log_utils.LogInfo')
+class CustomerUsersTest(unittest.TestCase):
+  """Tests one customer listing saves a users list for each domain."""
+
+  def setUp(self):
+    self._temp_dir = tempfile.mkdtemp()
+    self._file_manager = file_manager.FileManager()
+    self._file_manager._base_directory = self._temp_dir
+    self._file_manager._work_directory = self._temp_dir
+    for module in [customer_users, user_iterator]:
+      patcher = patch.object(module, 'FILE_MANAGER', self._file_manager)
+      patcher.start()
+      self.addCleanup(patcher.stop)
+    self._api = MagicMock()
+    self._api.GetDomainUsers.return_value = _CUSTOMER_USERS
+
+  def tearDown(self):
+    shutil.rmtree(self._temp_dir)
+
+  def _ReadUsersList(self, apps_domain):
+    return self._file_manager.NewDomainFileManager(apps_domain).ReadJsonFile(
+        'users.json')
+
+  def testUsersListOfEachDomainSaved(
+      self, mock_loginfo_fn):  # pylint: disable=unused-argument
+    self._file_manager.NewDomainFileManager('example.com').WriteJsonFile(
+        'users.json', [])
+    saved_paths = customer_users.SaveCustomerUsers(self._api, 'C01abcde9')
+    self._api.GetDomainUsers.assert_called_once_with(
+        None, max_page=500, customer='C01abcde9')
+    self.assertEqual(['altostrat.com'], saved_paths.keys())
+    self.assertEqual([_CUSTOMER_USERS[0], _CUSTOMER_USERS[2]],
+                     self._ReadUsersList('altostrat.com'))
+    self.assertEqual([], self._ReadUsersList('example.com'))  # Kept.
+
+    customer_users.SaveCustomerUsers(self._api, 'C01abcde9',
+                                     overwrite_ok=True)
+    self.assertEqual([_CUSTOMER_USERS[1]], self._ReadUsersList('example.com'))
+
+  @patch('admin_sdk_directory_api.users_api.UsersApiWrapper')
+  def testUserIteratorListsCustomerOnce(
+      self, mock_usersapiwrapper_fn,
+      mock_loginfo_fn):  # pylint: disable=unused-argument
+    mock_usersapiwrapper_fn.return_value = self._api
+    self._file_manager.WriteDefaults('altostrat.com', 'C01abcde9', False)
+    flags = argparse.Namespace(apps_domain='example.com', resume=False,
+                               first_n=0, shard=None, customer_listing=True)
+    users_checked = {}
+    with patch('sys.stdout'):
+      for apps_domain in ['example.com', 'altostrat.com', 'example.com']:
+        flags.apps_domain = apps_domain
+        self._file_manager.AddWorkDirectory(apps_domain)
+        users_checked[apps_domain] = [
+            u[0] for u in user_iterator.StartUserIterator(None, 'test', flags)]
+    self.assertEqual(
+        {'example.com': ['anna@Example.com'],
+         'altostrat.com': ['larry@altostrat.com', 'george@altostrat.com']},
+        users_checked)
+    self.assertEqual(1, self._api.GetDomainUsers.call_count)
+
+  def testMissingCustomerIdRaises(
+      self, mock_loginfo_fn):  # pylint: disable=unused-argument
+    self.assertRaises(admin_api_tool_errors.AdminAPIToolUserError,
+                      customer_users.GetDefaultCustomerId)
+
+
+if __name__ == '__main__':
+  unittest.main()
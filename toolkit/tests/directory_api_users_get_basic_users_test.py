@@ -48,6 +48,18 @@ class DirectoryApiGetBasicUsersTest(DirectoryApiUsersTestBase):
     self.assertEqual(
         self._api_wrapper.GetDomainUsers(self.unknown_domain, basic=True), [])
 
+  def testCanGetBasicCustomerUsersWithoutDomain(self):
+    self.assertEqual(
+        self._api_wrapper.GetDomainUsers(
+            None, basic=True, max_page=self._all_user_count/3,
+            customer=self.primary_customer_id),
+        self._all_users_basic)
+
+  def testCanGetBasicCustomerUsersWithUnknownCustomer(self):
+    self.assertEqual(
+        self._api_wrapper.GetDomainUsers(None, basic=True,
+                                         customer='C00unknown'), [])
+
 
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1,111 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test sorting within a memory budget and reports aggregated from it."""
+
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+# setup_path required to allow imports from component dirs (e.g. utils)
+# and lib (where the OAuth and Google API Python Client modules reside).
+import setup_path  # pylint: disable=unused-import,g-bad-import-order
+
+from mock import patch
+from utils import external_sort
+from utils import token_report_utils
+from utils import token_snapshots
+
+
+_SCOPE1 = 'https://www.google.com/m8/feeds'
+_SCOPE2 = 'https://mail.google.com/'
+
+_TOKEN_STATS = {
+    '%s twitter.com' % _SCOPE1: ['larry@altostrat.com', 'anna@altostrat.com'],
+    '%s twitter.com' % _SCOPE2: ['larry@altostrat.com', 'anna@altostrat.com'],
+    '%s my app.com' % _SCOPE1: ['george@altostrat.com', 'larry@altostrat.com'],
+    '%s my app.com' % _SCOPE2: ['george@altostrat.com'],
+    }
+
+
+@patch('utils.log_utils.LogInfo')
+class ExternalSortTest(unittest.TestCase):
+  """Tests sorted runs spilled to disk merge back in order."""
+
+  def setUp(self):
+    self._temp_dir = tempfile.mkdtemp()
+    random.seed(3)
+    self._items = [('user%03d' % random.randint(0, 300),
+                    'client%d' % random.randint(0, 9)) for _ in range(1000)]
+
+  def tearDown(self):
+    shutil.rmtree(self._temp_dir)
+
+  def testSortsInMemory(self, mock_loginfo_fn):
+    self.assertEqual(sorted(self._items), list(external_sort.ExternalSort(
+        self._items, 1024 * 1024, temp_dir=self._temp_dir)))
+    self.assertFalse(mock_loginfo_fn.called)
+
+  def testSpilledRunsMerged(self, mock_loginfo_fn):
+    sorted_items = list(external_sort.ExternalSort(
+        self._items, 4096, unique=True, temp_dir=self._temp_dir))
+    self.assertEqual(sorted(set(self._items)), sorted_items)
+    self.assertTrue(mock_loginfo_fn.called)
+    self.assertEqual([], os.listdir(self._temp_dir))  # Runs removed.
+
+  def testMergePasses(
+      self, mock_loginfo_fn):  # pylint: disable=unused-argument
+    with patch.object(external_sort, '_MAX_MERGE_FAN_IN', 3):
+      sorted_items = list(external_sort.ExternalSort(
+          self._items, 2048, temp_dir=self._temp_dir))
+    self.assertEqual(sorted(self._items), sorted_items)
+
+
+@patch('utils.log_utils.LogInfo')
+class SummarizeTokenTuplesTest(unittest.TestCase):
+  """Tests the budget summaries match the in-memory summaries."""
+
+  def _AssertSameSummary(self, expected_summary, summary, primaries):
+    self.assertEqual(expected_summary.CalculateRankings().data,
+                     summary.CalculateRankings().data)
+    for primary in primaries:
+      self.assertEqual(
+          sorted(expected_summary.GetTokenCounts(primary)),
+          sorted(summary.GetTokenCounts(primary)))
+
+  def testSameAsTokenStats(
+      self, mock_loginfo_fn):  # pylint: disable=unused-argument
+    token_tuples = list(token_snapshots.IterTokenTuples(_TOKEN_STATS))
+    temp_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, temp_dir)
+    client_id_summary, scope_summary = (
+        token_report_utils.SummarizeTokenTuples(
+            lambda: iter(token_tuples), 200, long_list=True,
+            temp_dir=temp_dir))
+    expected_client_id_summary, expected_scope_summary = (
+        token_report_utils.SummarizeTokenStats(_TOKEN_STATS))
+    self._AssertSameSummary(expected_client_id_summary, client_id_summary,
+                            ['twitter.com', 'my app.com'])
+    self._AssertSameSummary(
+        expected_scope_summary, scope_summary,
+        [token_report_utils.SCOPE_CATALOG.GetCode(scope)
+         for scope in [_SCOPE1, _SCOPE2]])
+    # Both scopes issued to the same users of twitter.com are grouped.
+    self.assertEqual(1, len(client_id_summary.GetTokenCounts('twitter.com')))
+
+
+if __name__ == '__main__':
+  unittest.main()
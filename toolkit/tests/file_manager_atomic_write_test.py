@@ -0,0 +1,131 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test working files are replaced atomically and checkpoints rotated."""
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+# setup_path required to allow imports from component dirs (e.g. utils)
+# and lib (where the OAuth and Google API Python Client modules reside).
+import setup_path  # pylint: disable=unused-import,g-bad-import-order
+
+from mock import patch
+from utils import file_manager
+
+
+class _Unserializable(object):
+  pass
+
+
+class FileManagerAtomicWriteTest(unittest.TestCase):
+  """Tests interrupted writes leave the previous version of a file."""
+
+  def setUp(self):
+    self._file_manager = file_manager.FileManager()
+    self._temp_dir = tempfile.mkdtemp()
+    self._file_manager._work_directory = self._temp_dir
+
+  def tearDown(self):
+    shutil.rmtree(self._temp_dir)
+
+  def testFailedWriteKeepsPreviousVersion(self):
+    self._file_manager.WriteJsonFile('tokens_issued.json', {'a': ['1']})
+    self.assertRaises(file_manager.admin_api_tool_errors.AdminAPIToolJsonError,
+                      self._file_manager.WriteJsonFile, 'tokens_issued.json',
+                      {'a': _Unserializable()}, overwrite_ok=True)
+    self.assertEqual({'a': ['1']},
+                     self._file_manager.ReadJsonFile('tokens_issued.json'))
+    self.assertEqual(['tokens_issued.json'], os.listdir(self._temp_dir))
+
+  def testInterruptedStreamIsNotVisible(self):
+    self._file_manager.WriteJsonFile('users.json', [])
+    f, filename_path = self._file_manager.OpenFileForWrite('users.json')
+    f.write('[["larry@altostrat.com", ')
+    # Nothing replaced before close(): the reader sees the old version.
+    self.assertEqual([], self._file_manager.ReadJsonFile('users.json'))
+    f.Discard()
+    self.assertEqual([], self._file_manager.ReadJsonFile('users.json'))
+    self.assertFalse(os.path.exists(filename_path + '.tmp'))
+
+  def testPreviousCheckpointsRotated(self):
+    for count in xrange(4):
+      self._file_manager.WriteJsonFile('tokens_issued.json', count,
+                                       overwrite_ok=True, keep_previous=2)
+    self.assertEqual(['tokens_issued.json', 'tokens_issued.json.1',
+                      'tokens_issued.json.2'],
+                     sorted(os.listdir(self._temp_dir)))
+    self.assertEqual([3, 2, 1], [
+        self._file_manager.ReadJsonFile(file_name)
+        for file_name in ['tokens_issued.json', 'tokens_issued.json.1',
+                          'tokens_issued.json.2']])
+
+  def testCompressedCheckpointsRotated(self):
+    self._file_manager.EnableCompression()
+    for count in xrange(2):
+      self._file_manager.WriteJsonFile('tokens_issued.json', count,
+                                       overwrite_ok=True, keep_previous=1)
+    self.assertEqual(['tokens_issued.json.1.gz', 'tokens_issued.json.gz'],
+                     sorted(os.listdir(self._temp_dir)))
+    self.assertEqual(0, self._file_manager.ReadJsonFile('tokens_issued.json.1'))
+
+  def testBackgroundWritesKeepTheirOrder(self):
+    release_event = threading.Event()
+    write_file = file_manager._ReplaceFile
+
+    def _SlowReplaceFile(source_path, target_path):
+      release_event.wait()
+      write_file(source_path, target_path)
+
+    token_stats = {'a': ['1']}
+    with patch.object(file_manager, '_ReplaceFile', _SlowReplaceFile):
+      self._file_manager.WriteJsonFileInBackground('tokens_issued.json',
+                                                   token_stats)
+      self._file_manager.WriteJsonFileInBackground('progress.json', [1])
+      token_stats['a'].append('2')  # Serialized when queued.
+      self.assertFalse(os.path.exists(
+          os.path.join(self._temp_dir, 'progress.json')))
+      release_event.set()
+      # Reads wait for the queued writes.
+      self.assertEqual([1], self._file_manager.ReadJsonFile('progress.json'))
+    with open(os.path.join(self._temp_dir, 'tokens_issued.json')) as f:
+      self.assertEqual({'a': ['1']}, json.load(f))
+
+  def testWritesAfterFailedBackgroundWriteAreDropped(self):
+    writer = file_manager._BackgroundWriter()
+    file_error = file_manager.admin_api_tool_errors.AdminAPIToolFileError
+    discarded = []
+
+    def _FailWrite():
+      raise IOError('No space left on device')
+
+    with patch.object(file_manager, '_BACKGROUND_WRITER', writer):
+      self._file_manager.QueueBackgroundWrite(_FailWrite, 'tokens_issued.json')
+      self._file_manager.QueueBackgroundWrite(
+          lambda: self._file_manager.WriteJsonFile('progress.json', [1]),
+          'progress.json', discard_fn=lambda: discarded.append(True))
+      self.assertRaises(file_error, self._file_manager.WaitForBackgroundWrites)
+      self.assertRaises(file_error, self._file_manager.QueueBackgroundWrite,
+                        _FailWrite, 'tokens_issued.json')
+    # The progress file is not written after the failed checkpoint.
+    self.assertEqual([True], discarded)
+    self.assertEqual([], os.listdir(self._temp_dir))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,118 @@
+#!/usr/bin/python
+#
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test deferred message formatting and the queued log file writer."""
+
+import logging
+import os
+import shutil
+from StringIO import StringIO
+import tempfile
+import time
+import unittest
+
+# setup_path required to allow imports from component dirs (e.g. utils)
+# and lib (where the OAuth and Google API Python Client modules reside).
+import setup_path  # pylint: disable=unused-import,g-bad-import-order
+
+from utils import log_utils
+
+
+class _FormatCounter(object):
+  """Counts the times it is formatted into a message."""
+
+  def __init__(self):
+    self.format_count = 0
+
+  def __str__(self):
+    self.format_count += 1
+    return 'formatted'
+
+
+class LogUtilsTest(unittest.TestCase):
+  """Tests deferred formatting, the log writer and the per-run file name."""
+
+  def setUp(self):
+    log_utils.SetupLogging(False)
+
+  def tearDown(self):
+    log_utils.SetupLogging(False)
+
+  def testDisabledDebugMessageIsNotFormatted(self):
+    format_counter = _FormatCounter()
+    log_utils.LogDebug('Got %s.', format_counter)
+    self.assertFalse(log_utils.IsDebugEnabled())
+    self.assertEqual(0, format_counter.format_count)
+
+  def testEnabledDebugMessageIsFormattedOnce(self):
+    format_counter = _FormatCounter()
+    log_utils.SetupLogging(True)
+    log_utils.LogDebug('Got %s.', format_counter)
+    log_utils.FlushLogFile()
+    self.assertTrue(log_utils.IsDebugEnabled())
+    self.assertEqual(1, format_counter.format_count)
+
+  def testMessageWithoutArgsKeepsPercentSigns(self):
+    stream = StringIO()
+    handler = logging.StreamHandler(stream)
+    logging.getLogger('').addHandler(handler)
+    try:
+      log_utils.LogInfo('100% done.')
+    finally:
+      logging.getLogger('').removeHandler(handler)
+    self.assertEqual('100% done.\n', stream.getvalue())
+
+  def testWriterKeepsArgsAsTheyWereWhenLogged(self):
+    stream = StringIO()
+    log_writer = log_utils._LogWriter(logging.StreamHandler(stream))
+    logger = logging.Logger('log_utils_test')
+    logger.addHandler(log_utils._QueueHandler(log_writer))
+    user_list = ['larry']
+    logger.error('Users: %s.', user_list)
+    user_list.append('george')
+    logger.error('Users: %s.', user_list)
+    log_writer.Wait()
+    self.assertEqual("Users: ['larry'].\nUsers: ['larry', 'george'].\n",
+                     stream.getvalue())
+
+  def testLogFileNameIsPerRun(self):
+    log_file_name = log_utils.GetLogFileName()
+    self.assertEqual(log_file_name, log_utils.GetLogFileName())
+    self.assertTrue(log_file_name.endswith('.%d.log' % os.getpid()))
+
+  def testOldRunLogsArePruned(self):
+    temp_dir = tempfile.mkdtemp()
+    try:
+      for run_index, file_name in enumerate([
+          'cse_api_tool.20141001-000000.1.log',
+          'cse_api_tool.20141001-000000.1.log.1',
+          'cse_api_tool.20141002-000000.2.log',
+          'cse_api_tool.20141003-000000.3.log',
+          'other.log']):
+        file_path = os.path.join(temp_dir, file_name)
+        open(file_path, 'w').close()
+        mtime = time.time() - 100 + run_index
+        os.utime(file_path, (mtime, mtime))
+      log_utils._PruneRunLogs(temp_dir, 2)
+      self.assertEqual(['cse_api_tool.20141002-000000.2.log',
+                        'cse_api_tool.20141003-000000.3.log', 'other.log'],
+                       sorted(os.listdir(temp_dir)))
+    finally:
+      shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+  unittest.main()
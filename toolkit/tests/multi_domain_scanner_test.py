@@ -0,0 +1,213 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test gathering the token stats of several domains concurrently."""
+
+import argparse
+import os
+import shutil
+import tempfile
+import unittest
+
+# setup_path required to allow imports from component dirs (e.g. utils)
+# and lib (where the OAuth and Google API Python Client modules reside).
+import setup_path  # pylint: disable=unused-import,g-bad-import-order
+
+from mock import MagicMock
+from mock import patch
+from utils import admin_api_tool_errors
+from utils import customer_users
+from utils import file_manager
+from utils import http_utils
+from utils import multi_domain_scanner
+
+
+_CUSTOMER_USERS = [
+    ['larry@altostrat.com', '1', 'Larry Page'],
+    ['anna@example.com', '2', 'Anna Lee'],
+    ['george@altostrat.com', '3', 'George Lasta'],
+    ]
+
+_TOKENS = {
+    '1': [{'clientId': 'twitter.com', 'scopes': ['scope1', 'scope2']}],
+    '2': [{'clientId': 'twitter.com', 'scopes': ['scope1']}],
+    '3': [],
+    }
+
+
+@patch('utils.log_utils.LogError')
+@patch('utils.log_utils.LogInfo')
+@patch('utils.auth_helper.GetAuthorizedHttp')
+class MultiDomainScannerTest(unittest.TestCase):
+  """Tests each domain is scanned into its own working directory."""
+
+  def setUp(self):
+    self._temp_dir = tempfile.mkdtemp()
+    self._file_manager = file_manager.FileManager()
+    self._file_manager._work_directory = self._temp_dir
+    for module in [customer_users, multi_domain_scanner]:
+      patcher = patch.object(module, 'FILE_MANAGER', self._file_manager)
+      patcher.start()
+      self.addCleanup(patcher.stop)
+    self._users_api = MagicMock()
+    self._tokens_api = MagicMock()
+    self._tokens_api.GetTokensForUser.side_effect = _TOKENS.get
+    for name, api in [('users_api.UsersApiWrapper', self._users_api),
+                      ('tokens_api.TokensApiWrapper', self._tokens_api)]:
+      patcher = patch('admin_sdk_directory_api.%s' % name, return_value=api)
+      patcher.start()
+      self.addCleanup(patcher.stop)
+    # The user pipelines show their progress.
+    patcher = patch('sys.stdout')
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def tearDown(self):
+    shutil.rmtree(self._temp_dir)
+
+  def _MakeFlags(self, apps_domains=None, customer_id=None, resume=False):
+    return argparse.Namespace(apps_domain='altostrat.com',
+                              apps_domains=apps_domains,
+                              customer_id=customer_id, threads=2, max_qps=0,
+                              first_n=0, refresh_users=False, resume=resume)
+
+  def _ReadDomainFile(self, apps_domain, file_name):
+    return self._file_manager.NewDomainFileManager(apps_domain).ReadJsonFile(
+        file_name)
+
+  def testCustomerUsersListedOnceAndSplitByDomain(
+      self, mock_getauthorizedhttp_fn,  # pylint: disable=unused-argument
+      mock_loginfo_fn,  # pylint: disable=unused-argument
+      mock_logerror_fn):  # pylint: disable=unused-argument
+    self._users_api.GetDomainUsers.return_value = _CUSTOMER_USERS
+    scanner = multi_domain_scanner.MultiDomainScanner(
+        self._MakeFlags(customer_id='C01abcde9'))
+    plans = scanner.PlanDomains()
+    self.assertEqual(['altostrat.com', 'example.com'], [p[0] for p in plans])
+    self._users_api.GetDomainUsers.assert_called_once_with(
+        None, max_page=500, customer='C01abcde9')
+    # Users lists are saved by the scans (after the command's --force check).
+    self.assertFalse(self._file_manager.NewDomainFileManager(
+        'example.com').FileExists('users.json'))
+
+    results = scanner.Run(plans)
+    self.assertEqual([('altostrat.com', 2, None), ('example.com', 1, None)],
+                     [(r[0], r[1], r[3]) for r in results])
+    self.assertEqual(
+        os.path.join(self._temp_dir, 'example.com', 'tokens_issued.json'),
+        results[1][2])
+    self.assertEqual(
+        {'scope1 twitter.com': ['larry@altostrat.com'],
+         'scope2 twitter.com': ['larry@altostrat.com']},
+        self._ReadDomainFile('altostrat.com', 'tokens_issued.json'))
+    self.assertEqual([_CUSTOMER_USERS[1]],
+                     self._ReadDomainFile('example.com', 'users.json'))
+    self.assertEqual(1, self._users_api.GetDomainUsers.call_count)
+
+  def testFailedDomainDoesNotStopOthers(
+      self, mock_getauthorizedhttp_fn,  # pylint: disable=unused-argument
+      mock_loginfo_fn,  # pylint: disable=unused-argument
+      mock_logerror_fn):
+    self._file_manager.NewDomainFileManager('example.com').WriteJsonFile(
+        'users.json', [_CUSTOMER_USERS[1]])
+
+    def _GetDomainUsers(apps_domain):
+      if apps_domain == 'unknown.com':
+        raise admin_api_tool_errors.AdminAPIToolUserError('Unknown domain.')
+      return [u for u in _CUSTOMER_USERS if u[0].endswith(apps_domain)]
+    self._users_api.GetDomainUsers.side_effect = _GetDomainUsers
+
+    scanner = multi_domain_scanner.MultiDomainScanner(
+        self._MakeFlags(apps_domains=['unknown.com', 'example.com',
+                                      'Altostrat.com']))
+    results = scanner.Run(scanner.PlanDomains())
+    self.assertEqual(['altostrat.com', 'example.com', 'unknown.com'],
+                     [r[0] for r in results])
+    self.assertEqual([2, 1, None], [r[1] for r in results])
+    self.assertTrue(isinstance(results[2][3],
+                               admin_api_tool_errors.AdminAPIToolUserError))
+    self.assertTrue(mock_logerror_fn.called)
+    # The saved users list of example.com was used.
+    self._users_api.GetDomainUsers.assert_any_call('altostrat.com')
+    self.assertEqual(2, self._users_api.GetDomainUsers.call_count)
+
+  def testFailedDomainResumedAfterLastSavedUser(
+      self, mock_getauthorizedhttp_fn,  # pylint: disable=unused-argument
+      mock_loginfo_fn,  # pylint: disable=unused-argument
+      mock_logerror_fn):  # pylint: disable=unused-argument
+    users_list = [['user%02d@example.com' % i, str(i), 'User %d' % i]
+                  for i in xrange(12)]
+    self._file_manager.NewDomainFileManager('example.com').WriteJsonFile(
+        'users.json', users_list)
+    request_error = admin_api_tool_errors.AdminAPIToolTokenRequestError(
+        'Backend error.')
+
+    def _GetTokensForUser(user_id):
+      if user_id == '10':
+        raise request_error
+      return [{'clientId': 'twitter.com', 'scopes': ['scope1']}]
+    self._tokens_api.GetTokensForUser.side_effect = _GetTokensForUser
+
+    scanner = multi_domain_scanner.MultiDomainScanner(
+        self._MakeFlags(apps_domains=['example.com']))
+    results = scanner.Run(scanner.PlanDomains())
+    self.assertEqual(request_error, results[0][3])
+    # The batch of users before the failed one was saved.
+    self.assertEqual(
+        10, len(self._ReadDomainFile('example.com', 'tokens_issued.json')[
+            'scope1 twitter.com']))
+
+    self._tokens_api.GetTokensForUser.side_effect = None
+    self._tokens_api.GetTokensForUser.return_value = []
+    scanner = multi_domain_scanner.MultiDomainScanner(
+        self._MakeFlags(apps_domains=['example.com'], resume=True))
+    results = scanner.Run(scanner.PlanDomains())
+    self.assertEqual([('example.com', 2, None)],
+                     [(r[0], r[1], r[3]) for r in results])
+    self.assertEqual(
+        ['10', '11'],
+        [c[0][0] for c in
+         self._tokens_api.GetTokensForUser.call_args_list[-2:]])
+    self.assertEqual(
+        10, len(self._ReadDomainFile('example.com', 'tokens_issued.json')[
+            'scope1 twitter.com']))
+
+
+class RateLimiterTest(unittest.TestCase):
+  """Tests requests of http objects sharing a limiter are spaced."""
+
+  @patch('time.sleep')
+  @patch('time.time', return_value=100.0)
+  def testRequestsWaitForTheirTurn(self, mock_time_fn, mock_sleep_fn):
+    rate_limiter = http_utils.RateLimiter(max_qps=4)
+    https = [rate_limiter.Attach(MagicMock()) for _ in xrange(2)]
+    https[0].request('https://www.googleapis.com/1')
+    https[1].request('https://www.googleapis.com/2')
+    https[0].request('https://www.googleapis.com/3')
+    self.assertEqual([0.25, 0.5],
+                     [c[0][0] for c in mock_sleep_fn.call_args_list])
+    mock_time_fn.return_value = 101.0  # Idle long enough: no wait.
+    https[1].request('https://www.googleapis.com/4')
+    self.assertEqual(2, mock_sleep_fn.call_count)
+
+  @patch('time.sleep')
+  def testZeroRateIsUnlimited(self, mock_sleep_fn):
+    http = http_utils.RateLimiter(max_qps=0).Attach(MagicMock())
+    for _ in xrange(5):
+      http.request('https://www.googleapis.com/')
+    self.assertFalse(mock_sleep_fn.called)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,78 @@
+#!/usr/bin/python
+#
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test rolling up user counts over the tree of organizational units."""
+
+import unittest
+
+# setup_path required to allow imports from component dirs (e.g. utils)
+# and lib (where the OAuth and Google API Python Client modules reside).
+import setup_path  # pylint: disable=unused-import,g-bad-import-order
+
+from utils import org_units
+
+
+_USER_LIST = [
+    ['larry@example.com', '1', 'Larry', '/', False],
+    ['george@example.com', '2', 'George', '/Sales/East', False],
+    ['paul@example.com', '3', 'Paul', '/Sales/East', True],
+    ['ringo@example.com', '4', 'Ringo', '/Sales/West/Coast', False],
+    ['john@example.com', '5', 'John', '/Legal/', False],
+]
+
+
+class OrgUnitRollupTest(unittest.TestCase):
+  """Tests self and subtree counts and their filters."""
+
+  def setUp(self):
+    self._rollup = org_units.OrgUnitRollup()
+    self._rollup.AddUsers(_USER_LIST)
+
+  def testSelfAndSubtreeCounts(self):
+    self.assertEqual([
+        ('/', 1, 0, 4, 1),
+        ('/Legal', 1, 0, 1, 0),
+        ('/Sales', 0, 0, 2, 1),
+        ('/Sales/East', 1, 1, 1, 1),
+        ('/Sales/West', 0, 0, 1, 0),
+        ('/Sales/West/Coast', 1, 0, 1, 0),
+    ], self._rollup.GetRows())
+
+  def testRootFilterKeepsTheSubtree(self):
+    self.assertEqual(
+        ['/Sales', '/Sales/East', '/Sales/West', '/Sales/West/Coast'],
+        [row[0] for row in self._rollup.GetRows(root='/Sales/')])
+
+  def testDepthFilterCountsLevelsBelowRoot(self):
+    self.assertEqual(['/', '/Legal', '/Sales'],
+                     [row[0] for row in self._rollup.GetRows(depth=1)])
+    self.assertEqual(['/Sales/West'],
+                     [row[0] for row in
+                      self._rollup.GetRows(root='/Sales/West', depth=0)])
+
+  def testHasOrgUnits(self):
+    self.assertTrue(org_units.HasOrgUnits(_USER_LIST))
+    self.assertFalse(org_units.HasOrgUnits([u[:3] for u in _USER_LIST]))
+    self.assertFalse(org_units.HasOrgUnits([]))
+
+  def testParentOrgUnits(self):
+    self.assertEqual('/Sales', org_units.GetParentOrgUnit('/Sales/East'))
+    self.assertEqual('/', org_units.GetParentOrgUnit('/Sales'))
+    self.assertEqual(None, org_units.GetParentOrgUnit('/'))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,97 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test listing the users of a domain with concurrent partition queries."""
+
+import unittest
+
+from directory_api_users_test_base import DirectoryApiUsersTestBase
+from mock import MagicMock
+from mock import patch
+from utils import admin_api_tool_errors
+from utils import partitioned_listing
+
+
+class PartitionedListingTest(DirectoryApiUsersTestBase):
+  """Tests partitions cover all users once whatever the splits."""
+
+  def setUp(self):
+    super(PartitionedListingTest, self).setUp()
+    all_user_count = self.test_users_manager.user_count
+    self._all_users_basic = sorted(
+        self.test_users_manager.GetTestUsers(
+            self.primary_domain, max_page=all_user_count, basic=True).get(
+                'users'))
+    self._page_requests = []
+    get_page_fn = self._api_wrapper.GetDomainUsersPage
+
+    def _GetDomainUsersPage(*args, **kwargs):
+      self._page_requests.append(kwargs.get('query_filter'))
+      return get_page_fn(*args, **kwargs)
+    self._api_wrapper.GetDomainUsersPage = _GetDomainUsersPage
+
+  def _ListDomainUsers(self, max_page, previous_users_list=None):
+    lister = partitioned_listing.PartitionedUserLister(
+        lambda: self._api_wrapper, thread_count=4, max_page=max_page)
+    return lister.ListDomainUsers(self.primary_domain,
+                                  previous_users_list=previous_users_list)
+
+  @patch('utils.log_utils.LogInfo')
+  def testSkewedPrefixIsSplit(self, mock_loginfo_fn):
+    # 9 of the 10 test users start with 'usertest': 'u' is split twice.
+    users_list = self._ListDomainUsers(max_page=3)
+    self.assertEqual(self._all_users_basic,
+                     sorted(tuple(u) for u in users_list))
+    self.assertEqual(sorted(users_list, key=lambda u: u[0]), users_list)
+    self.assertIn('email:u*', self._page_requests)
+    self.assertIn('email:us*', self._page_requests)
+    self.assertIn('email:use*', self._page_requests)
+    self.assertNotIn('email:g@*', self._page_requests)
+    self.assertTrue(mock_loginfo_fn.called)
+
+  @patch('utils.log_utils.LogInfo')
+  def testPreviousListStartsSplit(
+      self, mock_loginfo_fn):  # pylint: disable=unused-argument
+    users_list = self._ListDomainUsers(
+        max_page=3, previous_users_list=self._all_users_basic)
+    self.assertEqual(self._all_users_basic,
+                     sorted(tuple(u) for u in users_list))
+    # Started at 'us*' so no request for the first page of 'u*'.
+    self.assertNotIn('email:u*', self._page_requests)
+    self.assertIn('email:use*', self._page_requests)
+
+  def testPlanPrefixesCoversUsernameChars(self):
+    prefixes = partitioned_listing.PlanPrefixes(
+        [['u%d@altostrat.com' % i, str(i), 'U'] for i in xrange(3)],
+        max_page=2)
+    self.assertIn('a', prefixes)
+    self.assertIn("'", prefixes)
+    self.assertNotIn('u', prefixes)
+    self.assertIn('u@', prefixes)
+    self.assertIn('u0', prefixes)
+
+  @patch('utils.log_utils.LogInfo')
+  def testFailedPartitionRaises(
+      self, mock_loginfo_fn):  # pylint: disable=unused-argument
+    api_wrapper = MagicMock()
+    api_wrapper.GetDomainUsersPage.side_effect = (
+        admin_api_tool_errors.AdminAPIToolUserError('quota'))
+    lister = partitioned_listing.PartitionedUserLister(
+        lambda: api_wrapper, thread_count=2)
+    self.assertRaises(admin_api_tool_errors.AdminAPIToolUserError,
+                      lister.ListDomainUsers, self.primary_domain)
+
+
+if __name__ == '__main__':
+  unittest.main()
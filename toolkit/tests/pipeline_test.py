@@ -0,0 +1,208 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the staged pipeline and resumable user pipelines."""
+
+import argparse
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+# setup_path required to allow imports from component dirs (e.g. utils)
+# and lib (where the OAuth and Google API Python Client modules reside).
+import setup_path  # pylint: disable=unused-import,g-bad-import-order
+
+from mock import patch
+from utils import file_manager
+from utils import pipeline
+from utils import user_iterator
+
+
+def _Square(unused_thread_state, item):
+  # Later items finish first.
+  time.sleep(0.001 * (item % 4))
+  return item * item
+
+
+class PipelineTest(unittest.TestCase):
+  """Tests ordering, progress, backpressure and errors."""
+
+  def _Run(self, test_pipeline, source, stop_fn=None):
+    self._progress = []
+    return test_pipeline.Run(source, progress_fn=self._progress.append,
+                             stop_fn=stop_fn)
+
+  def testOrderedInCallingThread(self):
+    sunk = []
+    test_pipeline = pipeline.Pipeline(
+        _Square, lambda item, value: sunk.append(value),
+        transform_fn=lambda item, result: result + 1)
+    self.assertTrue(self._Run(test_pipeline, range(5)))
+    self.assertEqual([1, 2, 5, 10, 17], sunk)
+    self.assertEqual([1, 2, 3, 4, 5], self._progress)
+    self.assertEqual(5, test_pipeline.transform_metrics.items)
+
+  def testOrderedInThreads(self):
+    sunk = []
+    test_pipeline = pipeline.Pipeline(
+        _Square, lambda item, value: sunk.append(item), thread_count=4)
+    self.assertTrue(self._Run(test_pipeline, range(50)))
+    self.assertEqual(range(50), sunk)
+    self.assertEqual(50, self._progress[-1])
+    self.assertEqual(sorted(self._progress), self._progress)
+    self.assertEqual(50, test_pipeline.fetch_metrics.items)
+
+  def testUnorderedProgressWaitsForFirstItem(self):
+    first_item_done = threading.Event()
+    sunk = []
+    progress_at_sink = []
+
+    def _Fetch(unused_thread_state, item):
+      if item == 0:
+        first_item_done.wait(5)
+      return item
+
+    def _Sink(item, unused_value):
+      sunk.append(item)
+      progress_at_sink.append(list(self._progress))
+      if item == 3:
+        first_item_done.set()
+
+    test_pipeline = pipeline.Pipeline(_Fetch, _Sink, thread_count=2,
+                                      ordered=False)
+    self.assertTrue(self._Run(test_pipeline, range(6)))
+    self.assertNotEqual(0, sunk[0])
+    self.assertEqual(range(6), sorted(sunk))
+    # Nothing is reported done while the first item is in flight.
+    self.assertEqual([], progress_at_sink[sunk.index(3)])
+    self.assertEqual(6, self._progress[-1])
+
+  def testSourceHeldBackBySlowSink(self):
+    produced = []
+    in_flight = []
+
+    def _Source():
+      for item in range(40):
+        produced.append(item)
+        yield item
+
+    def _Sink(item, unused_value):
+      in_flight.append(len(produced) - item)
+      time.sleep(0.001)
+
+    test_pipeline = pipeline.Pipeline(_Square, _Sink, thread_count=2,
+                                      queue_size=3)
+    self.assertTrue(self._Run(test_pipeline, _Source()))
+    # The window (queue_size + thread_count) plus the item waiting for it.
+    self.assertTrue(max(in_flight) <= 3 + 2 + 1)
+
+  def testErrorFnCalledInSinkOrder(self):
+    errors = []
+    sunk = []
+
+    def _Fetch(unused_thread_state, item):
+      if item == 2:
+        raise ValueError(item)
+      return item
+
+    test_pipeline = pipeline.Pipeline(
+        _Fetch, lambda item, value: sunk.append(item),
+        error_fn=lambda item, error: errors.append(item), thread_count=3)
+    self.assertTrue(self._Run(test_pipeline, range(5)))
+    self.assertEqual([2], errors)
+    self.assertEqual([0, 1, 3, 4], sunk)
+    self.assertEqual(5, self._progress[-1])
+    self.assertEqual(1, test_pipeline.fetch_metrics.errors)
+
+    test_pipeline = pipeline.Pipeline(_Fetch, lambda item, value: None,
+                                      thread_count=3)
+    self.assertRaises(ValueError, self._Run, test_pipeline, range(5))
+
+  def testStopFn(self):
+    sunk = []
+    test_pipeline = pipeline.Pipeline(
+        _Square, lambda item, value: sunk.append(item), thread_count=2)
+    self.assertFalse(self._Run(test_pipeline, range(100),
+                               stop_fn=lambda: len(sunk) == 7))
+    self.assertEqual(range(7), sunk)
+    self.assertEqual(7, self._progress[-1])
+
+  def testExitInFetchThreadRaisedInCallingThread(self):
+    def _Fetch(unused_thread_state, item):
+      if item == 3:
+        raise SystemExit(1)
+      return item
+
+    test_pipeline = pipeline.Pipeline(_Fetch, lambda item, value: None,
+                                      thread_count=3)
+    # Raised instead of waiting forever for the item.
+    self.assertRaises(SystemExit, self._Run, test_pipeline, range(20))
+    self.assertEqual(0, test_pipeline.fetch_metrics.errors)
+
+
+@patch('utils.log_utils.LogInfo')
+class UserPipelineResumeTest(unittest.TestCase):
+  """Tests a stopped user pipeline resumes after the last user saved."""
+
+  def setUp(self):
+    self._temp_dir = tempfile.mkdtemp()
+    self._file_manager = file_manager.FileManager()
+    self._file_manager._work_directory = self._temp_dir
+    patcher = patch.object(user_iterator, 'FILE_MANAGER', self._file_manager)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+    self._users = [['user%02d@altostrat.com' % i, str(i), 'User %d' % i]
+                   for i in range(30)]
+    self._file_manager.WriteJsonFile('users.json', self._users)
+
+  def tearDown(self):
+    shutil.rmtree(self._temp_dir)
+
+  def _RunUsers(self, resume, stop_after=None, thread_count=3):
+    flags = argparse.Namespace(apps_domain='altostrat.com', resume=resume,
+                               first_n=0, shard=None, customer_listing=False,
+                               listing_threads=1)
+    sunk = []
+    saved = []
+    with patch('sys.stdout'):
+      completed = user_iterator.RunUserPipeline(
+          None, 'test', flags, lambda unused_state, user: user[1],
+          lambda user, value: sunk.append(value),
+          checkpoint_fn=lambda: saved.append(len(sunk)),
+          stop_fn=lambda: len(sunk) == stop_after,
+          thread_count=thread_count)
+    self._file_manager.WaitForBackgroundWrites()
+    return completed, sunk, saved
+
+  def testResumeAfterLastSavedUser(
+      self, mock_loginfo_fn):  # pylint: disable=unused-argument
+    completed, sunk, saved = self._RunUsers(False, stop_after=13)
+    self.assertFalse(completed)
+    self.assertEqual([str(i) for i in range(13)], sunk)
+    self.assertEqual([10, 13], saved)
+    self.assertEqual(['user11@altostrat.com', 'user12@altostrat.com', 13,
+                      True],
+                     self._file_manager.ReadJsonFile('test_progress'))
+
+    completed, sunk, saved = self._RunUsers(True)
+    self.assertTrue(completed)
+    self.assertEqual([str(i) for i in range(13, 30)], sunk)
+    self.assertEqual([7, 17], saved)  # At users 20 and 30.
+    self.assertFalse(self._file_manager.FileExists('test_progress'))
+
+
+if __name__ == '__main__':
+  unittest.main()
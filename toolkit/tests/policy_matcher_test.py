@@ -0,0 +1,84 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test black list rules are compiled and matched."""
+
+import unittest
+
+# setup_path required to allow imports from component dirs (e.g. utils)
+# and lib (where the OAuth and Google API Python Client modules reside).
+import setup_path  # pylint: disable=unused-import,g-bad-import-order
+
+from utils import admin_api_tool_errors
+from utils import policy_matcher
+
+
+class PolicyMatcherTest(unittest.TestCase):
+  """Tests exact, prefix and regex rules."""
+
+  def setUp(self):
+    self._matcher = policy_matcher.PolicyMatcher([
+        'twitter.com', '', 'https://www.googleapis.com/auth/apps.*',
+        'https://www.googleapis.com/auth/drive*',
+        r're:\d+\.apps\.googleusercontent\.com'])
+
+  def testExactRules(self):
+    self.assertTrue(self._matcher.Matches('twitter.com'))
+    self.assertFalse(self._matcher.Matches('api.twitter.com'))
+    self.assertFalse(self._matcher.Matches(''))
+
+  def testPrefixRules(self):
+    self.assertTrue(self._matcher.Matches(
+        'https://www.googleapis.com/auth/apps.security.custom'))
+    self.assertTrue(self._matcher.Matches(
+        'https://www.googleapis.com/auth/drive'))
+    self.assertFalse(self._matcher.Matches(
+        'https://www.googleapis.com/auth/apps'))
+
+  def testRegexRulesMatchWholeValue(self):
+    self.assertTrue(self._matcher.Matches(
+        '130316539331.apps.googleusercontent.com'))
+    self.assertFalse(self._matcher.Matches(
+        '130316539331.apps.googleusercontent.com.evil.com'))
+    self.assertFalse(self._matcher.Matches('x.apps.googleusercontent.com'))
+
+  def testManyRegexRulesWithGroups(self):
+    matcher = policy_matcher.PolicyMatcher(
+        ['re:(client)(%d)' % i for i in xrange(60)])
+    self.assertTrue(matcher.Matches('client59'))
+    self.assertFalse(matcher.Matches('client60'))
+
+  def testRegexRulesWithNumberedBackreferences(self):
+    matcher = policy_matcher.PolicyMatcher(
+        [r're:(a)\1', r're:(b)\1', r're:(c)?(?(1)d|e)'])
+    self.assertTrue(matcher.Matches('aa'))
+    self.assertTrue(matcher.Matches('bb'))
+    self.assertTrue(matcher.Matches('cd'))
+    self.assertTrue(matcher.Matches('e'))
+    self.assertFalse(matcher.Matches('ab'))
+    self.assertFalse(matcher.Matches('ce'))
+
+  def testNormalizedExactRules(self):
+    matcher = policy_matcher.PolicyMatcher(
+        ['https://mail.google.com/'], normalize_fn=lambda s: s.rstrip('/'))
+    self.assertTrue(matcher.Matches('https://mail.google.com'))
+    self.assertTrue(matcher.Matches('https://mail.google.com/'))
+
+  def testInvalidRegexRaises(self):
+    self.assertRaises(admin_api_tool_errors.AdminAPIToolPolicyError,
+                      policy_matcher.PolicyMatcher, ['re:(twitter'])
+
+
+if __name__ == '__main__':
+  unittest.main()
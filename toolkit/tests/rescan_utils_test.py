@@ -0,0 +1,102 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test re-scanning token holders and rotating through other users."""
+
+import shutil
+import tempfile
+import unittest
+
+# setup_path required to allow imports from component dirs (e.g. utils)
+# and lib (where the OAuth and Google API Python Client modules reside).
+import setup_path  # pylint: disable=unused-import,g-bad-import-order
+
+from mock import patch
+from utils import file_manager
+from utils import rescan_utils
+from utils import token_report_utils
+
+
+class RescanRotationTest(unittest.TestCase):
+  """Tests choosing the users re-checked by successive runs."""
+
+  def setUp(self):
+    self._file_manager = file_manager.FileManager()
+    self._temp_dir = tempfile.mkdtemp()
+    self._file_manager._work_directory = self._temp_dir
+    patcher = patch.object(rescan_utils, 'FILE_MANAGER', self._file_manager)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+    self._holders = set(['anna@primarydomain.com'])
+    self._others = ['user%03d@primarydomain.com' % i for i in range(100)]
+
+  def tearDown(self):
+    shutil.rmtree(self._temp_dir)
+
+  def _RunOnce(self, rotation):
+    bucket = rescan_utils.GetRescanBucket(rotation)
+    user_filter = rescan_utils.MakeRescanFilter(self._holders, rotation,
+                                                bucket)
+    rescan_utils.AdvanceRescanBucket(rotation, bucket)
+    return [u for u in self._others if user_filter(u)], user_filter
+
+  def testRotationCoversEveryOtherUserOnce(self):
+    rechecked = []
+    for _ in range(7):
+      users, user_filter = self._RunOnce(7)
+      self.assertTrue(user_filter('anna@primarydomain.com'))
+      rechecked.extend(users)
+    self.assertEqual(self._others, sorted(rechecked))
+    # The eighth run starts the next sweep from the first bucket.
+    self.assertEqual(0, rescan_utils.GetRescanBucket(7))
+
+  def testChangedRotationStartsNewSweep(self):
+    self._RunOnce(7)
+    self.assertEqual(1, rescan_utils.GetRescanBucket(7))
+    self.assertEqual(0, rescan_utils.GetRescanBucket(5))
+
+  def testZeroRotationRechecksOnlyHolders(self):
+    users, user_filter = self._RunOnce(0)
+    self.assertEqual([], users)
+    self.assertTrue(user_filter('anna@primarydomain.com'))
+
+  def testResumeReusesHoldersFromRunStart(self):
+    rescan_utils.GetRescanHolders({'anna@primarydomain.com': []}, False)
+    self.assertEqual(set(['anna@primarydomain.com']),
+                     rescan_utils.GetRescanHolders({}, True))
+    rescan_utils.AdvanceRescanBucket(0, None)
+    self.assertEqual(set(), rescan_utils.GetRescanHolders({}, True))
+
+
+class RemoveUserTokensTest(unittest.TestCase):
+  """Tests replacing a re-checked user's tokens in the token stats."""
+
+  def testRemoveDropsUserAndEmptyKeys(self):
+    token_stats = {
+        'scope1 twitter.com': ['anna@primarydomain.com',
+                               'larry@primarydomain.com'],
+        'scope2 twitter.com': ['anna@primarydomain.com']}
+    token_holders = token_report_utils.GetTokenHolders(token_stats)
+    token_report_utils.RemoveUserTokens(token_stats, token_holders,
+                                        'anna@primarydomain.com')
+    self.assertEqual({'scope1 twitter.com': ['larry@primarydomain.com']},
+                     token_stats)
+    self.assertEqual(['larry@primarydomain.com'], token_holders.keys())
+    # Removing a user without tokens is harmless.
+    token_report_utils.RemoveUserTokens(token_stats, token_holders,
+                                        'anna@primarydomain.com')
+
+
+if __name__ == '__main__':
+  unittest.main()
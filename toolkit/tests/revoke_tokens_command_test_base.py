@@ -19,6 +19,8 @@ To see even more detail (output) during tests:
 """
 
 import argparse
+import shutil
+import tempfile
 import unittest
 
 # setup_path required to allow imports from component dirs (e.g. utils)
@@ -28,7 +30,9 @@ import setup_path  # pylint: disable=unused-import,g-bad-import-order
 from apiary_mocks import MockDirectoryServiceObject
 from mock import patch
 from test_utils import LoadTestJsonFile
+from utils import file_manager
 from utils import log_utils
+from utils import revocation_ledger
 from utils.token_revoker import TokenRevoker
 
 
@@ -48,6 +52,9 @@ def _SetupMockArgParseFlags():
   arg_parser.add_argument('--hide_timing', action='store_true', default=True,
                           help=('Stop logging the elapsed time of longer '
                                 'functions.'))
+  arg_parser.add_argument('--dry_run', action='store_true', default=False)
+  arg_parser.add_argument('--resume', action='store_true', default=False)
+  arg_parser.add_argument('--revoke_threads', type=int, default=1)
   return arg_parser.parse_args([])
 
 
@@ -70,6 +77,14 @@ class RevokeUnapprovedTokensCommandTestBase(unittest.TestCase):
       mock_ApiclientDiscoveryBuildFn: mock object to stub the build function.
     """
     log_utils.SetupLogging(verbose_flag=_ENABLE_VERBOSE_LOGGING)
+    # Keep the revocation ledger out of the real working directory.
+    self._file_manager = file_manager.FileManager()
+    self._file_manager._work_directory = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self._file_manager._work_directory)
+    ledger_patcher = patch.object(revocation_ledger, 'FILE_MANAGER',
+                                  self._file_manager)
+    ledger_patcher.start()
+    self.addCleanup(ledger_patcher.stop)
     mock_GetAuthorizedHttp_Fn.return_value = None
     mock_ApiclientDiscoveryBuildFn.return_value = (
         MockDirectoryServiceObject())
@@ -0,0 +1,146 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test concurrent, resumable and dry-run revocation of unapproved tokens."""
+
+from StringIO import StringIO
+import sys
+import unittest
+
+from mock import call
+from mock import MagicMock
+from mock import patch
+
+import revoke_tokens_command_test_base as test_base
+from utils import admin_api_tool_errors
+from utils import parallel_utils
+from utils import revocation_ledger
+
+
+_TWITTER_TOKENS = [(u'anna@primarydomain.com', u'twitter.com'),
+                   (u'george@primarydomain.com', u'twitter.com'),
+                   (u'larry@primarydomain.com', u'twitter.com')]
+
+
+class RunInParallelTest(unittest.TestCase):
+  """Tests the thread pool used to issue requests concurrently."""
+
+  def testEachItemProcessedOnceWithErrorsCaptured(self):
+    def _Work(thread_state, item):
+      if item == 3:
+        raise ValueError('bad item')
+      return (thread_state, item * 2)
+
+    thread_states = iter(['t1', 't2', 't3'])
+    results = list(parallel_utils.RunInParallel(
+        range(10), _Work, thread_count=3,
+        thread_init_fn=lambda: next(thread_states)))
+    self.assertEqual(range(10), sorted(item for item, _, _ in results))
+    errors = [(item, str(e)) for item, _, e in results if e]
+    self.assertEqual([(3, 'bad item')], errors)
+    self.assertTrue(set(r[0] for _, r, e in results if not e) <=
+                    set(['t1', 't2', 't3']))
+    self.assertRaises(StopIteration, next, thread_states)
+
+  def testSystemExitReportedAsItemError(self):
+    def _Work(unused_thread_state, item):
+      if item == 'b':
+        sys.exit(1)
+      return item.upper()
+
+    for thread_count in (1, 2):
+      results = list(parallel_utils.RunInParallel(
+          ['a', 'b', 'c'], _Work, thread_count=thread_count))
+      self.assertEqual(['A', 'C'], sorted(r for _, r, e in results if not e))
+      errors = [(item, type(e)) for item, _, e in results if e]
+      self.assertEqual([('b', SystemExit)], errors)
+
+  def testSingleThreadKeepsOrder(self):
+    results = list(parallel_utils.RunInParallel(
+        ['a', 'b', 'c'], lambda _, item: item.upper()))
+    self.assertEqual([('a', 'A', None), ('b', 'B', None), ('c', 'C', None)],
+                     results)
+
+
+@patch('utils.token_report_utils.GetTokenStats')
+@patch('utils.log_utils.LogError')
+@patch('utils.log_utils.LogInfo')
+class RevokeUnapprovedTokensExecutorTest(
+    test_base.RevokeUnapprovedTokensCommandTestBase):
+  """Test revoke_unapproved_tokens.py concurrency, ledger and dry run."""
+
+  def setUp(self):
+    super(RevokeUnapprovedTokensExecutorTest, self).setUp()
+    self._token_revoker._client_blacklist_set = set(['twitter.com'])
+    self._flags = self._token_revoker._flags
+
+  def _ReadLedger(self):
+    return revocation_ledger.RevocationLedger().GetRevokedTokens()
+
+  @patch('utils.token_revoker.TokenRevoker._RevokeToken')
+  def testDryRunReportsPlanWithoutRevoking(
+      self, mock_revoketoken_fn,
+      mock_loginfo_fn,  # pylint: disable=unused-argument
+      mock_logerror_fn,  # pylint: disable=unused-argument
+      mock_readtokensjson_fn):
+    mock_readtokensjson_fn.return_value = self._parsed_tokens
+    self._flags.dry_run = True
+    self._flags.revoke_threads = 2
+    with patch('sys.stdout', new_callable=StringIO) as mock_stdout:
+      self._token_revoker.RevokeUnapprovedTokens()
+    self.assertFalse(mock_revoketoken_fn.called)
+    output = mock_stdout.getvalue()
+    self.assertIn('3 token revocation requests planned', output)
+    self.assertIn('2 thread(s): 0h 00m 01s', output)
+
+  @patch('utils.token_revoker.TokenRevoker._RevokeToken')
+  def testFailuresAreRecordedAndRetriedOnResume(
+      self, mock_revoketoken_fn,
+      mock_loginfo_fn,  # pylint: disable=unused-argument
+      mock_logerror_fn, mock_readtokensjson_fn):
+    mock_readtokensjson_fn.return_value = self._parsed_tokens
+    mock_revoketoken_fn.side_effect = [
+        None, admin_api_tool_errors.AdminAPIToolUserError('quota'), None]
+    self._token_revoker.RevokeUnapprovedTokens()
+    self.assertEqual(3, mock_revoketoken_fn.call_count)
+    self.assertTrue(mock_logerror_fn.called)
+    self.assertEqual(set([_TWITTER_TOKENS[0], _TWITTER_TOKENS[2]]),
+                     self._ReadLedger())
+
+    mock_revoketoken_fn.reset_mock()
+    mock_revoketoken_fn.side_effect = None
+    self._flags.resume = True
+    self._token_revoker.RevokeUnapprovedTokens()
+    mock_revoketoken_fn.assert_has_calls([call(*_TWITTER_TOKENS[1])])
+    self.assertEqual(1, mock_revoketoken_fn.call_count)
+    self.assertEqual(set(_TWITTER_TOKENS), self._ReadLedger())
+
+  def testThreadsUseTheirOwnTokensApi(
+      self, mock_loginfo_fn,  # pylint: disable=unused-argument
+      mock_logerror_fn,  # pylint: disable=unused-argument
+      mock_readtokensjson_fn):
+    mock_readtokensjson_fn.return_value = self._parsed_tokens
+    self._flags.revoke_threads = 2
+    thread_apis = [MagicMock(), MagicMock()]
+    with patch('utils.token_revoker.TokenRevoker._NewTokensApi',
+               side_effect=thread_apis):
+      self._token_revoker.RevokeUnapprovedTokens()
+    revoked_tokens = sorted(c[0] for api in thread_apis
+                            for c in api.DeleteToken.call_args_list)
+    self.assertEqual(_TWITTER_TOKENS, revoked_tokens)
+    self.assertEqual(set(_TWITTER_TOKENS), self._ReadLedger())
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,169 @@
+#!/usr/bin/python
+#
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test stratified user samples and the counts estimated from them."""
+
+import argparse
+import shutil
+import tempfile
+import unittest
+
+# setup_path required to allow imports from component dirs (e.g. utils)
+# and lib (where the OAuth and Google API Python Client modules reside).
+import setup_path  # pylint: disable=unused-import,g-bad-import-order
+
+from mock import patch
+from utils import file_manager
+from utils import sampling
+from utils import token_report_utils
+from utils import validators
+
+
+def _MakeUsers(org_unit_sizes):
+  """Helper to make a users list with organizational units."""
+  user_list = []
+  for org_unit, size in sorted(org_unit_sizes.iteritems()):
+    for i in xrange(size):
+      user_list.append(['u%d%s@example.com' % (i, org_unit.replace('/', '.')),
+                        str(len(user_list)), 'User %d' % i, org_unit])
+  return user_list
+
+
+class UserSamplerTest(unittest.TestCase):
+  """Tests drawing seeded stratified samples of a users list."""
+
+  def setUp(self):
+    self._user_list = _MakeUsers({'/sales': 600, '/eng': 300, '/legal': 3})
+
+  def testSampleIsSeededAndInUsersListOrder(self):
+    sample = sampling.UserSampler(90, seed=7).Sample(self._user_list)
+    self.assertEqual(sample, sampling.UserSampler(90, seed=7).Sample(
+        self._user_list))
+    self.assertNotEqual(sample, sampling.UserSampler(90, seed=8).Sample(
+        self._user_list))
+    self.assertEqual([u for u in self._user_list if u in sample], sample)
+
+  def testSampleIsStratifiedByOrgUnit(self):
+    sampler = sampling.UserSampler(90)
+    sample = sampler.Sample(self._user_list)
+    self.assertEqual(90, len(sample))
+    # Proportional shares with the small stratum raised to 2 users.
+    self.assertEqual({'/eng': [300, 30], '/legal': [3, 2],
+                      '/sales': [600, 58]}, sampler.design.strata)
+
+  def testUsersWithoutOrgUnitFormOneStratum(self):
+    sampler = sampling.UserSampler(5)
+    sampler.Sample([u[:3] for u in self._user_list])
+    self.assertEqual({'': [903, 5]}, sampler.design.strata)
+
+  def testLargeSampleChecksEveryUser(self):
+    sampler = sampling.UserSampler(1000)
+    self.assertEqual(self._user_list, sampler.Sample(self._user_list))
+
+
+class SampleDesignTest(unittest.TestCase):
+  """Tests estimating domain counts from a sample design."""
+
+  def setUp(self):
+    self._user_list = _MakeUsers({'/sales': 600, '/eng': 300, '/legal': 3})
+    self._sampler = sampling.UserSampler(180, seed=3)
+    self._sample = self._sampler.Sample(self._user_list)
+
+  def testFullSampleEstimatesExactly(self):
+    sampler = sampling.UserSampler(len(self._user_list))
+    sampler.Sample(self._user_list)
+    eng_users = [u[0] for u in self._user_list if u[3] == '/eng']
+    self.assertEqual((300, 300, 300), sampler.design.Estimate(eng_users))
+
+  def testEstimateIntervalHoldsTheCount(self):
+    eng_users = [u[0] for u in self._sample if u[3] == '/eng']
+    estimate, low, high = self._sampler.design.Estimate(eng_users)
+    self.assertEqual(300, estimate)
+    self.assertTrue(low <= 300 <= high)
+    every_other = [u[0] for u in self._sample[::2]]
+    estimate, low, high = self._sampler.design.Estimate(every_other)
+    self.assertTrue(low < estimate < high)
+    self.assertTrue(low <= 451 <= high)
+
+  def testUnsampledUsersAreIgnored(self):
+    self.assertEqual((0, 0, 0), self._sampler.design.Estimate(
+        [u[0] for u in self._user_list if u not in self._sample]))
+
+  def testZScore(self):
+    self.assertAlmostEqual(1.96, sampling.GetZScore(0.95), places=2)
+    self.assertAlmostEqual(2.576, sampling.GetZScore(0.99), places=2)
+
+  def testEstimatedTokenStatsRankClientIds(self):
+    sampled_emails = [u[0] for u in self._sample]
+    token_stats = {
+        token_report_utils.PackStatKey('a.example.com', 'scope1'):
+            sampled_emails[:60],
+        token_report_utils.PackStatKey('b.example.com', 'scope1'):
+            sampled_emails[:6],
+    }
+    client_id_summary, _ = token_report_utils.SummarizeEstimatedTokenStats(
+        token_stats, self._sampler.design, 0.95)
+    rankings = client_id_summary.CalculateRankings().data
+    self.assertTrue(rankings['a.example.com'] > rankings['b.example.com'])
+    low, high = client_id_summary.GetInterval('a.example.com')
+    self.assertTrue(low <= rankings['a.example.com'] <= high)
+
+
+class SampledTokenStatsTest(unittest.TestCase):
+  """Tests the stats of a sample are kept apart from whole-domain stats."""
+
+  def setUp(self):
+    self._temp_dir = tempfile.mkdtemp()
+    self._file_manager = file_manager.FileManager()
+    self._file_manager._work_directory = self._temp_dir
+    for module in [sampling, token_report_utils]:
+      patcher = patch.object(module, 'FILE_MANAGER', self._file_manager)
+      patcher.start()
+      self.addCleanup(patcher.stop)
+
+  def tearDown(self):
+    shutil.rmtree(self._temp_dir)
+
+  def testSampleDoesNotReplaceDomainStats(self):
+    domain_stats = {'scope1 twitter.com': ['anna@example.com',
+                                           'larry@example.com']}
+    token_report_utils.WriteTokensIssuedJson(domain_stats)
+    sampler = sampling.UserSampler(1)
+    sampler.Sample([['larry@example.com', '1', 'Larry']])
+    sampling.WriteSampleDesign(
+        token_report_utils.TOKENS_SAMPLE_DESIGN_FILE_NAME, sampler.design)
+    sample_stats = {'scope1 twitter.com': ['larry@example.com']}
+    token_report_utils.WriteTokensIssuedJson(sample_stats, sample=True)
+    self.assertEqual(domain_stats, token_report_utils.GetTokenStats())
+    self.assertEqual(sample_stats,
+                     token_report_utils.GetTokenStats(sample=True))
+    self.assertEqual(1, token_report_utils.ReadTokensSampleDesign(
+        ).sample_count)
+
+
+class ConfidenceValidatorTypeTest(unittest.TestCase):
+  """Tests the --confidence command line flag validator."""
+
+  def testValidConfidenceIsParsed(self):
+    self.assertEqual(0.9, validators.ConfidenceValidatorType()('0.9'))
+
+  def testConfidenceOutOfRangeRaises(self):
+    self.assertRaises(argparse.ArgumentTypeError,
+                      validators.ConfidenceValidatorType(), '95')
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,146 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test scope codes, labels and the local scope map."""
+
+import shutil
+import tempfile
+import unittest
+
+# setup_path required to allow imports from component dirs (e.g. utils)
+# and lib (where the OAuth and Google API Python Client modules reside).
+import setup_path  # pylint: disable=unused-import,g-bad-import-order
+
+from mock import patch
+from utils import admin_api_tool_errors
+from utils import file_manager
+from utils import scope_catalog
+from utils import token_report_utils
+
+
+_MAIL_SCOPE = 'https://mail.google.com/'
+_DRIVE_SCOPE = 'https://www.googleapis.com/auth/drive'
+
+
+class ScopeCatalogTest(unittest.TestCase):
+  """Tests scopes are coded once and labelled from the scope maps."""
+
+  def setUp(self):
+    self._file_manager = file_manager.FileManager()
+    self._temp_dir = tempfile.mkdtemp()
+    self._file_manager._base_directory = self._temp_dir
+    patcher = patch.object(scope_catalog, 'FILE_MANAGER', self._file_manager)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+    self._catalog = scope_catalog.ScopeCatalog()
+
+  def tearDown(self):
+    shutil.rmtree(self._temp_dir)
+
+  def testScopesCodedOnceAndLabelled(self):
+    code = self._catalog.GetCode(_MAIL_SCOPE)
+    self.assertEqual(code, self._catalog.GetCode(_MAIL_SCOPE))
+    self.assertNotEqual(code, self._catalog.GetCode(_DRIVE_SCOPE))
+    self.assertEqual(_MAIL_SCOPE, self._catalog.GetScope(code))
+    self.assertEqual('Email (Read/Write/Send) [https://mail.google.com/]',
+                     self._catalog.GetLabel(code))
+    self.assertEqual(_DRIVE_SCOPE, self._catalog.Lookup(_DRIVE_SCOPE))
+    self.assertEqual(
+        [self._catalog.Lookup(_MAIL_SCOPE), _DRIVE_SCOPE],
+        self._catalog.GetSortedLabels(
+            [self._catalog.GetCode(_DRIVE_SCOPE), code]))
+
+  def testLocalScopeMapAddsLabels(self):
+    self._file_manager.WriteJsonFile(
+        scope_catalog.SCOPE_MAP_FILE_NAME, {_DRIVE_SCOPE + '/': 'Drive'},
+        work_dir=False)
+    self.assertEqual('Drive [%s]' % _DRIVE_SCOPE,
+                     self._catalog.Lookup(_DRIVE_SCOPE))
+    self._file_manager.WriteJsonFile(
+        scope_catalog.SCOPE_MAP_FILE_NAME, {_DRIVE_SCOPE: 'Drive (Read/Write)'},
+        work_dir=False, overwrite_ok=True)
+    self._catalog.Reload()
+    self.assertEqual('Drive (Read/Write) [%s]' % _DRIVE_SCOPE,
+                     self._catalog.Lookup(_DRIVE_SCOPE))
+
+  def testInvalidLocalScopeMapRaises(self):
+    self._file_manager.WriteJsonFile(
+        scope_catalog.SCOPE_MAP_FILE_NAME, [_DRIVE_SCOPE], work_dir=False)
+    self.assertRaises(admin_api_tool_errors.AdminAPIToolJsonError,
+                      self._catalog.Lookup, _DRIVE_SCOPE)
+
+  def testSummaryKeyedByScopeCodes(self):
+    token_stats = {
+        token_report_utils.PackStatKey('twitter.com', _MAIL_SCOPE): ['anna'],
+        token_report_utils.PackStatKey('twitter.com', _DRIVE_SCOPE): ['anna']}
+    with patch.object(token_report_utils, 'SCOPE_CATALOG', self._catalog):
+      client_id_summary, scope_summary = (
+          token_report_utils.SummarizeTokenStats(token_stats))
+    scope_set, user_set = client_id_summary.GetTokenList('twitter.com')[0]
+    self.assertEqual(set(['anna']), user_set)
+    self.assertEqual(set([self._catalog.GetCode(_MAIL_SCOPE),
+                          self._catalog.GetCode(_DRIVE_SCOPE)]), scope_set)
+    self.assertEqual(
+        {self._catalog.GetCode(_MAIL_SCOPE): 1,
+         self._catalog.GetCode(_DRIVE_SCOPE): 1},
+        scope_summary.CalculateRankings().data)
+
+
+class ScopeCodesTest(unittest.TestCase):
+  """Tests scope codes are saved and loaded with the token stats."""
+
+  def setUp(self):
+    self._file_manager = file_manager.FileManager()
+    self._temp_dir = tempfile.mkdtemp()
+    self._file_manager._base_directory = self._temp_dir
+    self._file_manager._work_directory = self._temp_dir
+    for module in [scope_catalog, token_report_utils]:
+      patcher = patch.object(module, 'FILE_MANAGER', self._file_manager)
+      patcher.start()
+      self.addCleanup(patcher.stop)
+
+  def tearDown(self):
+    shutil.rmtree(self._temp_dir)
+
+  def _NewCatalog(self):
+    catalog = scope_catalog.ScopeCatalog()
+    patcher = patch.object(token_report_utils, 'SCOPE_CATALOG', catalog)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+    return catalog
+
+  def testCodesKeptAcrossRunsAndShards(self):
+    catalog = self._NewCatalog()
+    catalog.GetCode(_MAIL_SCOPE)
+    drive_code = catalog.GetCode(_DRIVE_SCOPE)
+    token_report_utils.WriteTokensIssuedJson(
+        {token_report_utils.PackStatKey('twitter.com', _DRIVE_SCOPE): ['anna']})
+    # A later run codes the scopes of the saved stats the same way.
+    catalog = self._NewCatalog()
+    token_report_utils.GetTokenStats()
+    self.assertEqual(drive_code, catalog.GetCode(_DRIVE_SCOPE))
+    # A shard in another run adds its scopes to the saved codes.
+    catalog = self._NewCatalog()
+    calendar_scope = 'https://www.googleapis.com/auth/calendar'
+    token_report_utils.WriteTokensIssuedJson(
+        {token_report_utils.PackStatKey('twitter.com', calendar_scope):
+             ['anna']}, shard=(0, 1))
+    catalog = self._NewCatalog()
+    token_report_utils.GetTokenStats(shard=(0, 1))
+    self.assertEqual(drive_code, catalog.GetCode(_DRIVE_SCOPE))
+    self.assertEqual(2, catalog.GetCode(calendar_scope))
+
+
+if __name__ == '__main__':
+  unittest.main()
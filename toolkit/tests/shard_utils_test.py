@@ -0,0 +1,131 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test sharding of domain-wide scans and merging of sharded token stats."""
+
+import argparse
+import shutil
+import tempfile
+import unittest
+
+# setup_path required to allow imports from component dirs (e.g. utils)
+# and lib (where the OAuth and Google API Python Client modules reside).
+import setup_path  # pylint: disable=unused-import,g-bad-import-order
+
+from mock import patch
+from test_utils import TEST_USERS_MANAGER
+from utils import file_manager
+from utils import shard_utils
+from utils import token_report_utils
+from utils import token_snapshots
+from utils import validators
+
+
+class ShardUtilsTest(unittest.TestCase):
+  """Tests partitioning users between shards."""
+
+  def setUp(self):
+    self._user_list = TEST_USERS_MANAGER.GetTestUsers(
+        TEST_USERS_MANAGER.primary_domain, basic=True)['users']
+
+  def testUnshardedIncludesAllUsers(self):
+    self.assertEqual(self._user_list,
+                     shard_utils.FilterUsersForShard(self._user_list, None))
+
+  def testShardsPartitionUsersExactlyOnce(self):
+    shard_lists = [shard_utils.FilterUsersForShard(self._user_list, shard)
+                   for shard in shard_utils.GetAllShards(4)]
+    all_sharded_users = sorted(u for shard_list in shard_lists
+                               for u in shard_list)
+    self.assertEqual(sorted(self._user_list), all_sharded_users)
+
+  def testShardAssignmentIsDeterministicAndCaseInsensitive(self):
+    shard = (1, 3)
+    self.assertEqual(
+        shard_utils.IsUserInShard(u'George@primarydomain.com', shard),
+        shard_utils.IsUserInShard('george@primarydomain.com', shard))
+
+  def testShardFilterPreservesOrder(self):
+    shard_list = shard_utils.FilterUsersForShard(self._user_list, (0, 2))
+    self.assertEqual(
+        [u for u in self._user_list if u in shard_list], shard_list)
+
+  def testShardFileNameInsertsShardTag(self):
+    self.assertEqual('tokens_issued_shard2_of_4.json',
+                     shard_utils.GetShardFileName('tokens_issued.json', (2, 4)))
+    self.assertEqual('collection_shard0_of_1',
+                     shard_utils.GetShardFileName('collection', (0, 1)))
+    self.assertEqual('tokens_issued.json',
+                     shard_utils.GetShardFileName('tokens_issued.json', None))
+
+
+class ShardValidatorTypeTest(unittest.TestCase):
+  """Tests the --shard command line flag validator."""
+
+  def testValidShardIsParsed(self):
+    self.assertEqual((3, 8), validators.ShardValidatorType()(' 3/8 '))
+
+  def testShardIndexOutOfRangeRaises(self):
+    self.assertRaises(argparse.ArgumentTypeError,
+                      validators.ShardValidatorType(), '4/4')
+
+  def testMalformedShardRaises(self):
+    self.assertRaises(argparse.ArgumentTypeError,
+                      validators.ShardValidatorType(), '1-4')
+
+
+@patch('utils.log_utils.LogInfo')
+class MergeShardTokenStatsTest(unittest.TestCase):
+  """Tests merging token stats gathered by separate shards."""
+
+  def setUp(self):
+    self._temp_dir = tempfile.mkdtemp()
+    self._file_manager = file_manager.FileManager()
+    self._file_manager._work_directory = self._temp_dir
+    for module in [token_report_utils, token_snapshots]:
+      patcher = patch.object(module, 'FILE_MANAGER', self._file_manager)
+      patcher.start()
+      self.addCleanup(patcher.stop)
+    token_report_utils.WriteTokensIssuedJson(
+        {'scope1 twitter.com': ['anna@primarydomain.com'],
+         'scope2 twitter.com': ['anna@primarydomain.com']}, shard=(0, 2))
+    # anna is in both shard files (e.g. users.json changed between runs).
+    token_report_utils.WriteTokensIssuedJson(
+        {'scope1 twitter.com': ['larry@primarydomain.com',
+                                'anna@primarydomain.com']}, shard=(1, 2))
+
+  def tearDown(self):
+    shutil.rmtree(self._temp_dir)
+
+  def testMergeCombinesUsersOfSharedKeys(
+      self, mock_loginfo_fn):  # pylint: disable=unused-argument
+    # A tiny budget spills sorted runs to disk.
+    token_report_utils.WriteMergedShardTokenStats(2, 100)
+    self.assertEqual(
+        {'scope1 twitter.com': ['anna@primarydomain.com',
+                                'larry@primarydomain.com'],
+         'scope2 twitter.com': ['anna@primarydomain.com']},
+        token_report_utils.GetTokenStats())
+
+  def testSnapshotOfShards(
+      self, mock_loginfo_fn):  # pylint: disable=unused-argument
+    token_snapshots.WriteShardSnapshot(2, 100, timestamp='1')
+    self.assertEqual(
+        [('anna@primarydomain.com', 'twitter.com', 'scope1'),
+         ('anna@primarydomain.com', 'twitter.com', 'scope2'),
+         ('larry@primarydomain.com', 'twitter.com', 'scope1')],
+        list(token_snapshots.ReadSnapshot('1')))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,54 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the package checks and flags that keep command startup light."""
+
+import unittest
+
+from mock import patch
+
+# setup_path required to allow imports from component dirs (e.g. utils)
+# and lib (where the OAuth and Google API Python Client modules reside).
+import setup_path  # pylint: disable=g-bad-import-order
+
+from utils import common_flags
+
+
+class StartupImportsTest(unittest.TestCase):
+  """Tests required packages are located without importing them."""
+
+  def testRequiredModulesFoundWithoutImport(self):
+    self.assertTrue(setup_path._IsModuleAvailable('apiclient.discovery'))
+    self.assertTrue(setup_path._IsModuleAvailable('oauth2client.tools'))
+
+  def testMissingModulesNotFound(self):
+    self.assertFalse(setup_path._IsModuleAvailable('no_such_package'))
+    self.assertFalse(setup_path._IsModuleAvailable('apiclient.no_such_module'))
+
+  @patch('utils.log_utils.SetupLogging')
+  def testAuthFlagsOnlyAddedWhenRequested(
+      self, mock_setuplogging_fn):  # pylint: disable=unused-argument
+    flags = common_flags.ParseFlags(
+        ['--noauth_local_webserver'], 'Test command.',
+        common_flags.DefineVerboseFlagWithDefaultFalse)
+    self.assertTrue(flags.noauth_local_webserver)
+    with patch('sys.stderr'):
+      self.assertRaises(SystemExit, common_flags.ParseFlags,
+                        ['--noauth_local_webserver'], 'Test command.',
+                        common_flags.DefineVerboseFlagWithDefaultFalse,
+                        auth_flags=False)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -169,17 +169,23 @@ class TestUsersManager(object):
     filter_value = filter_value.rstrip('*')
     return [u for u in user_list if u.get(filter_key).startswith(filter_value)]
 
-  def _GetAllTestUsers(self, apps_domain):
+  def _GetAllTestUsers(self, apps_domain, customer=None):
     """Load all the test users once for the whole test.
 
     Allows safe access to test data.
 
     Args:
       apps_domain: Used to verify supplied domain matches test data apps domain.
+                   With a customer, may be None for all the customer users.
+      customer: If not None, only users with this customerId.
 
     Returns:
       List of all found test users or an empty list.
     """
+    if customer:
+      return [u for u in self.all_test_users
+              if u.get('customerId') == customer and
+              (not apps_domain or apps_domain == self.primary_domain)]
     if apps_domain == self.primary_domain:
       return self.all_test_users
     return []
@@ -241,7 +247,7 @@ class TestUsersManager(object):
     return user['primaryEmail'], user['id'], user['name']['fullName']
 
   def GetTestUsers(self, apps_domain, max_page=500, start_index=0,
-                   query=None, basic=False):
+                   query=None, basic=False, customer=None):
     """Helper to retrieve the test data from a very large json data file.
 
     This is how we simulate paging users similar to the service.  This
@@ -253,11 +259,12 @@ class TestUsersManager(object):
       start_index: Used for paging when start_index > 0.
       query: A String filter query. e.g. 'email:u*'.
       basic: Matches 'basic' arg in api - produces basic tuples not full dict.
+      customer: A String customer_id (list() customer=) or None.
 
     Returns:
       A list of user dictionaries.
     """
-    test_users = self._GetAllTestUsers(apps_domain)
+    test_users = self._GetAllTestUsers(apps_domain, customer=customer)
     if query:
       test_users = self._FilterTestUsers(query, test_users)
     test_user_count = len(test_users)
@@ -0,0 +1,175 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test token lookups are answered from the local token cache."""
+
+import shutil
+import tempfile
+import unittest
+
+# setup_path required to allow imports from component dirs (e.g. utils)
+# and lib (where the OAuth and Google API Python Client modules reside).
+import setup_path  # pylint: disable=unused-import,g-bad-import-order
+
+from admin_sdk_directory_api import tokens_api
+from mock import MagicMock
+from mock import patch
+from utils import checkpointer
+from utils import file_manager
+from utils import token_cache
+
+
+_TWITTER_TOKEN = {'clientId': 'twitter.com', 'displayText': 'Twitter',
+                  'scopes': ['https://mail.google.com/']}
+_MY_APP_TOKEN = {'clientId': 'my app.com', 'displayText': 'My App',
+                 'scopes': ['https://www.google.com/m8/feeds']}
+
+
+@patch('utils.log_utils.LogInfo')
+class TokenCacheTest(unittest.TestCase):
+  """Tests cached token lists expire and drop revoked tokens."""
+
+  def setUp(self):
+    self._temp_dir = tempfile.mkdtemp()
+    self._file_manager = file_manager.FileManager()
+    self._file_manager._work_directory = self._temp_dir
+    for module in [checkpointer, token_cache]:
+      patcher = patch.object(module, 'FILE_MANAGER', self._file_manager)
+      patcher.start()
+      self.addCleanup(patcher.stop)
+    self._time_patcher = patch('time.time', return_value=1000000.0)
+    self._time_patcher.start()
+    self.addCleanup(self._time_patcher.stop)
+    # As filled by gather_domain_token_stats.
+    cache_checkpointer = token_cache.NewTokenCacheCheckpointer(True)
+    cache_checkpointer.Add(('Larry@altostrat.com', 1000000.0 - 30 * 60,
+                            [_TWITTER_TOKEN, _MY_APP_TOKEN]))
+    cache_checkpointer.Add(('anna@altostrat.com', 1000000.0 - 90 * 60, []))
+    cache_checkpointer.Close()
+
+  def tearDown(self):
+    shutil.rmtree(self._temp_dir)
+
+  def testFreshTokensServed(
+      self, mock_loginfo_fn):  # pylint: disable=unused-argument
+    cache = token_cache.TokenCache(max_age_minutes=60)
+    self.assertEqual([_TWITTER_TOKEN, _MY_APP_TOKEN],
+                     cache.GetTokens('larry@altostrat.com'))
+    self.assertEqual(_MY_APP_TOKEN,
+                     cache.GetToken('larry@altostrat.com', 'my app.com'))
+    self.assertEqual({}, cache.GetToken('larry@altostrat.com', 'x.com'))
+    self.assertIsNone(cache.GetTokens('anna@altostrat.com'))
+    self.assertIsNone(cache.GetTokens('george@altostrat.com'))
+    self.assertEqual([], token_cache.TokenCache(max_age_minutes=120).GetTokens(
+        'anna@altostrat.com'))
+
+  def testRevokedTokensLeftOut(
+      self, mock_loginfo_fn):  # pylint: disable=unused-argument
+    token_cache.RecordRevocation('larry@altostrat.com', 'twitter.com')
+    cache = token_cache.TokenCache()
+    self.assertEqual([_MY_APP_TOKEN], cache.GetTokens('larry@altostrat.com'))
+    # Authorized again after the revocation.
+    self._time_patcher.stop()
+    with patch('time.time', return_value=1000001.0):
+      cache.Put('larry@altostrat.com', [_TWITTER_TOKEN])
+      self.assertEqual([_TWITTER_TOKEN],
+                       cache.GetTokens('larry@altostrat.com'))
+    self._time_patcher.start()
+
+  @patch('admin_sdk_directory_api.tokens_api.build', autospec=True)
+  def testTokensApiReadsThrough(
+      self, mock_ApiclientDiscoveryBuildFn,
+      mock_loginfo_fn):  # pylint: disable=unused-argument
+    mock_ApiclientDiscoveryBuildFn.return_value = MagicMock()
+    api_wrapper = tokens_api.TokensApiWrapper(http=None)
+    api_wrapper.ListTokens = MagicMock(return_value={'items': [_TWITTER_TOKEN]})
+    with patch.object(tokens_api, 'TOKEN_CACHE', token_cache.TokenCache()):
+      self.assertEqual([_MY_APP_TOKEN, _TWITTER_TOKEN],
+                       api_wrapper.GetTokensForUser('larry@altostrat.com'))
+      self.assertFalse(api_wrapper.ListTokens.called)
+      self.assertEqual([_TWITTER_TOKEN],
+                       api_wrapper.GetTokensForUser('anna@altostrat.com'))
+      tokens_api.TOKEN_CACHE.Save()
+    self.assertEqual(
+        [1000000.0, [_TWITTER_TOKEN]],
+        token_cache.ReadTokenCacheEntries()['anna@altostrat.com'])
+
+  @patch('admin_sdk_directory_api.tokens_api.build', autospec=True)
+  def testDeletedTokenDroppedFromCache(
+      self, mock_ApiclientDiscoveryBuildFn,
+      mock_loginfo_fn):  # pylint: disable=unused-argument
+    mock_ApiclientDiscoveryBuildFn.return_value = MagicMock()
+    api_wrapper = tokens_api.TokensApiWrapper(http=None)
+    api_wrapper._IssueTokensRequestForUser = MagicMock(return_value={})
+    with patch.object(tokens_api, 'TOKEN_CACHE', token_cache.TokenCache()):
+      api_wrapper.GetTokensForUser('larry@altostrat.com')
+      api_wrapper.DeleteToken('Larry@altostrat.com', 'twitter.com')
+      self.assertEqual([_MY_APP_TOKEN],
+                       api_wrapper.GetTokensForUser('larry@altostrat.com'))
+    self.assertEqual([_MY_APP_TOKEN], token_cache.TokenCache().GetTokens(
+        'larry@altostrat.com'))
+
+  def testCacheReplacedForEachCommand(
+      self, mock_loginfo_fn):  # pylint: disable=unused-argument
+    with patch.object(tokens_api, 'TOKEN_CACHE', None):
+      cache = tokens_api.EnableTokenCache(60)
+      self.assertIs(cache, tokens_api.EnableTokenCache(60))
+      self.assertIsNot(cache, tokens_api.EnableTokenCache(120))
+      # e.g. toolkitd: a revocation and a command of another domain.
+      token_cache.RecordRevocation('larry@altostrat.com', 'twitter.com')
+      tokens_api.EnableTokenCache(60).Put('george@altostrat.com', [])
+      self._file_manager.AddWorkDirectory('altostrat.com')
+      self.assertIsNone(tokens_api.EnableTokenCache(60).GetTokens(
+          'larry@altostrat.com'))
+      self.assertIsNone(tokens_api.DisableTokenCache())
+      self.assertIsNone(tokens_api.TOKEN_CACHE)
+    self._file_manager._work_directory = self._temp_dir
+    self.assertEqual([_MY_APP_TOKEN], token_cache.TokenCache().GetTokens(
+        'larry@altostrat.com'))
+    self.assertEqual([], token_cache.TokenCache().GetTokens(
+        'george@altostrat.com'))
+
+  def testLaterGathersAppendAndCompact(
+      self, mock_loginfo_fn):  # pylint: disable=unused-argument
+    cache_path = self._file_manager.BuildFullPathToFileName(
+        token_cache.TOKEN_CACHE_FILE_NAME)
+    # e.g. --rescan_holders: appended to the cache of the last gather.
+    cache_checkpointer = token_cache.NewTokenCacheCheckpointer(False)
+    for requested_time in [999000.0, 999500.0, 1000000.0]:
+      cache_checkpointer.Add(('larry@altostrat.com', requested_time,
+                              [_TWITTER_TOKEN]))
+      cache_checkpointer.Checkpoint()
+    self._file_manager.WaitForBackgroundWrites()
+    self.assertEqual(5, len(open(cache_path).readlines()))
+    cache_checkpointer.Close()
+    # Compacted once the cache had more than 2 lines per user.
+    self.assertEqual(2, len(open(cache_path).readlines()))
+    self.assertEqual(
+        {'larry@altostrat.com': [1000000.0, [_TWITTER_TOKEN]],
+         'anna@altostrat.com': [1000000.0 - 90 * 60, []]},
+        token_cache.ReadTokenCacheEntries())
+
+  def testRevocationsBatchedUntilRunEnds(
+      self, mock_loginfo_fn):  # pylint: disable=unused-argument
+    with token_cache.RevocationBatch():
+      token_cache.RecordRevocation('larry@altostrat.com', 'twitter.com')
+      self.assertEqual([_TWITTER_TOKEN, _MY_APP_TOKEN],
+                       token_cache.TokenCache().GetTokens(
+                           'larry@altostrat.com'))
+    self.assertEqual([_MY_APP_TOKEN], token_cache.TokenCache().GetTokens(
+        'larry@altostrat.com'))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,121 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test token stats snapshots and the streaming diff between them."""
+
+import shutil
+import tempfile
+import unittest
+
+# setup_path required to allow imports from component dirs (e.g. utils)
+# and lib (where the OAuth and Google API Python Client modules reside).
+import setup_path  # pylint: disable=unused-import,g-bad-import-order
+
+from mock import patch
+from utils import file_manager
+from utils import token_snapshots
+
+
+_OLD_TOKEN_STATS = {
+    'scope1 twitter.com': ['anna@primarydomain.com', 'larry@primarydomain.com'],
+    'scope2 twitter.com': ['anna@primarydomain.com'],
+    'scope1 facebook.com': ['george@primarydomain.com'],
+}
+
+_NEW_TOKEN_STATS = {
+    'scope1 twitter.com': ['larry@primarydomain.com'],
+    'scope2 twitter.com': ['anna@primarydomain.com'],
+    'scope1 facebook.com': ['george@primarydomain.com',
+                            'larry@primarydomain.com'],
+    'scope2 facebook.com': ['larry@primarydomain.com'],
+}
+
+
+class DiffTokenTuplesTest(unittest.TestCase):
+  """Tests the sorted merge of token tuple streams."""
+
+  def testDiffFindsGrantedAndRevoked(self):
+    changes = list(token_snapshots.DiffTokenTuples(
+        token_snapshots.IterTokenTuples(_OLD_TOKEN_STATS),
+        token_snapshots.IterTokenTuples(_NEW_TOKEN_STATS)))
+    self.assertEqual(
+        [(token_snapshots.REVOKED,
+          ('anna@primarydomain.com', 'twitter.com', 'scope1')),
+         (token_snapshots.GRANTED,
+          ('larry@primarydomain.com', 'facebook.com', 'scope1')),
+         (token_snapshots.GRANTED,
+          ('larry@primarydomain.com', 'facebook.com', 'scope2'))],
+        changes)
+
+  def testDiffConsumesIteratorsLazily(self):
+    def _Tuples(users):
+      for user in users:
+        yield (user, 'twitter.com', 'scope1')
+      raise AssertionError('Read past the first change.')
+
+    changes = token_snapshots.DiffTokenTuples(_Tuples(['a', 'b']),
+                                              _Tuples(['a', 'c']))
+    self.assertEqual((token_snapshots.REVOKED, ('b', 'twitter.com', 'scope1')),
+                     next(changes))
+
+  def testSummaryCountsUsersOncePerClient(self):
+    summary = token_snapshots.TokenChangeSummary()
+    for change, token_tuple in [
+        (token_snapshots.GRANTED, ('larry', 'facebook.com', 'scope1')),
+        (token_snapshots.REVOKED, ('larry', 'facebook.com', 'scope2')),
+        (token_snapshots.GRANTED, ('larry', 'facebook.com', 'scope3')),
+        (token_snapshots.REVOKED, ('anna', 'twitter.com', 'scope1'))]:
+      summary.AddChange(change, token_tuple)
+    self.assertEqual(2, summary.granted_count)
+    self.assertEqual(2, summary.revoked_count)
+    self.assertEqual([('facebook.com', 1, 1), ('twitter.com', 0, 1)],
+                     summary.GetClientChanges())
+
+
+class TokenSnapshotsFileTest(unittest.TestCase):
+  """Tests writing, listing, pruning and diffing snapshot files."""
+
+  def setUp(self):
+    self._file_manager = file_manager.FileManager()
+    self._temp_dir = tempfile.mkdtemp()
+    self._file_manager._work_directory = self._temp_dir
+    patcher = patch.object(token_snapshots, 'FILE_MANAGER', self._file_manager)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def tearDown(self):
+    shutil.rmtree(self._temp_dir)
+
+  def testSnapshotsAreListedOldestFirstAndPruned(self):
+    for timestamp in ['20141103T000000Z', '20141101T000000Z',
+                      '20141102T000000Z']:
+      token_snapshots.WriteSnapshot(_OLD_TOKEN_STATS, timestamp=timestamp)
+    self.assertEqual(['20141101T000000Z', '20141102T000000Z',
+                      '20141103T000000Z'], token_snapshots.ListSnapshots())
+    self.assertEqual(['20141101T000000Z'], token_snapshots.PruneSnapshots(2))
+    self.assertEqual(['20141102T000000Z', '20141103T000000Z'],
+                     token_snapshots.ListSnapshots())
+
+  def testDiffOfCompressedAndPlainSnapshots(self):
+    token_snapshots.WriteSnapshot(_OLD_TOKEN_STATS, timestamp='1')
+    self._file_manager.EnableCompression()
+    token_snapshots.WriteSnapshot(_NEW_TOKEN_STATS, timestamp='2')
+    self.assertEqual(['1', '2'], token_snapshots.ListSnapshots())
+    changes = list(token_snapshots.DiffSnapshots('1', '2'))
+    self.assertEqual(3, len(changes))
+    self.assertEqual([], list(token_snapshots.DiffSnapshots('2', '2')))
+
+
+if __name__ == '__main__':
+  unittest.main()
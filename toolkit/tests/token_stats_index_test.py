@@ -0,0 +1,118 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the inverted indexes of token stats."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+# setup_path required to allow imports from component dirs (e.g. utils)
+# and lib (where the OAuth and Google API Python Client modules reside).
+import setup_path  # pylint: disable=unused-import,g-bad-import-order
+
+from mock import patch
+from utils import file_manager
+from utils import token_report_utils
+
+
+_SCOPE1 = 'https://www.google.com/m8/feeds'
+_SCOPE2 = 'https://mail.google.com/'
+
+_TOKEN_STATS = {
+    '%s twitter.com' % _SCOPE1: ['larry@altostrat.com', 'anna@altostrat.com'],
+    '%s twitter.com' % _SCOPE2: ['larry@altostrat.com'],
+    '%s my app.com' % _SCOPE1: ['george@altostrat.com', 'larry@altostrat.com'],
+    }
+
+
+class TokenStatsIndexTest(unittest.TestCase):
+  """Tests client_id, scope and user lookups."""
+
+  def setUp(self):
+    self._index = token_report_utils.TokenStatsIndex(_TOKEN_STATS)
+
+  def testClientUsers(self):
+    self.assertEqual(['anna@altostrat.com', 'larry@altostrat.com'],
+                     self._index.GetClientUsers('twitter.com'))
+    self.assertEqual(['george@altostrat.com', 'larry@altostrat.com'],
+                     self._index.GetClientUsers('my app.com'))
+    self.assertEqual([], self._index.GetClientUsers('unknown.com'))
+    self.assertEqual(self._index.GetClientUsers('twitter.com'),
+                     token_report_utils.GetUsersInDomain(_TOKEN_STATS,
+                                                         'twitter.com'))
+
+  def testScopeUsers(self):
+    self.assertEqual(
+        ['anna@altostrat.com', 'george@altostrat.com', 'larry@altostrat.com'],
+        self._index.GetScopeUsers(_SCOPE1))
+    self.assertEqual(['larry@altostrat.com'],
+                     self._index.GetScopeUsers(_SCOPE2))
+
+  def testUserTokens(self):
+    self.assertEqual([('my app.com', _SCOPE1), ('twitter.com', _SCOPE2),
+                      ('twitter.com', _SCOPE1)],
+                     self._index.GetUserTokens('larry@altostrat.com'))
+    self.assertEqual([], self._index.GetUserTokens('nobody@altostrat.com'))
+
+
+class TokenStatsIndexFileTest(unittest.TestCase):
+  """Tests the user index is saved and rebuilt when outdated."""
+
+  def setUp(self):
+    self._temp_dir = tempfile.mkdtemp()
+    self._file_manager = file_manager.FileManager()
+    self._file_manager._work_directory = self._temp_dir
+    patcher = patch.object(token_report_utils, 'FILE_MANAGER',
+                           self._file_manager)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def tearDown(self):
+    shutil.rmtree(self._temp_dir)
+
+  def testSavedIndexUsedWithoutTokenStats(self):
+    token_report_utils.WriteTokensIssuedJson(_TOKEN_STATS)
+    token_report_utils.WriteTokenStatsIndex(_TOKEN_STATS)
+    with patch.object(token_report_utils, 'GetTokenStats') as mock_get_fn:
+      index = token_report_utils.ReadTokenStatsIndex()
+      self.assertEqual([('twitter.com', _SCOPE1)],
+                       index.GetUserTokens('anna@altostrat.com'))
+      self.assertFalse(mock_get_fn.called)
+
+  def testIndexWithoutTokenStatsIgnored(self):
+    tokens_path = token_report_utils.WriteTokensIssuedJson(_TOKEN_STATS)
+    token_report_utils.WriteTokenStatsIndex(_TOKEN_STATS)
+    os.remove(tokens_path)
+    self.assertEqual(None, token_report_utils.ReadTokenStatsIndex())
+
+  def testOutdatedIndexRebuilt(self):
+    token_report_utils.WriteTokensIssuedJson({})
+    token_report_utils.WriteTokenStatsIndex({})
+    tokens_path = token_report_utils.WriteTokensIssuedJson(_TOKEN_STATS,
+                                                           overwrite_ok=True)
+    os.utime(tokens_path, (0, 0))
+    index = token_report_utils.ReadTokenStatsIndex()
+    self.assertEqual([('my app.com', _SCOPE1)],
+                     index.GetUserTokens('george@altostrat.com'))
+    index_data = self._file_manager.ReadJsonFile('tokens_issued_index.json')
+    self.assertEqual(3, len(index_data['stat_keys']))
+    self.assertEqual(sorted(index_data['users']),
+                     ['anna@altostrat.com', 'george@altostrat.com',
+                      'larry@altostrat.com'])
+
+
+if __name__ == '__main__':
+  unittest.main()
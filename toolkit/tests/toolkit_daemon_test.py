@@ -0,0 +1,167 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test serving commands from the toolkitd daemon and its warm caches."""
+
+import os
+import shutil
+from StringIO import StringIO
+import sys
+import tempfile
+import threading
+import unittest
+
+# setup_path required to allow imports from component dirs (e.g. utils)
+# and lib (where the OAuth and Google API Python Client modules reside).
+import setup_path  # pylint: disable=unused-import,g-bad-import-order
+
+from mock import MagicMock
+from mock import patch
+from utils import admin_api_tool_errors
+from utils import auth_helper
+from utils import file_manager
+from utils import log_utils
+from utils import toolkit_daemon
+from utils import users_index
+
+
+def _FakeLsUser(argv):
+  print 'User %s' % argv[-1]
+  log_utils.LogError('Not really.')
+  sys.exit(3)
+
+
+@patch('utils.log_utils.LogInfo')
+@patch('cmds.ls_user.main', side_effect=_FakeLsUser)
+class ToolkitDaemonTest(unittest.TestCase):
+  """Tests commands run by the daemon and the client fallback."""
+
+  def setUp(self):
+    self._temp_dir = tempfile.mkdtemp()
+    self._socket_path = os.path.join(self._temp_dir, 'toolkitd.sock')
+    self._daemon = toolkit_daemon.ToolkitDaemon(self._socket_path)
+
+  def tearDown(self):
+    shutil.rmtree(self._temp_dir)
+
+  def testCommandOutputAndExitCodeReturned(
+      self, mock_main_fn,  # pylint: disable=unused-argument
+      mock_loginfo_fn):  # pylint: disable=unused-argument
+    response = self._daemon.HandleRequest(
+        {'command': 'ls_user', 'argv': ['-u', 'larry@altostrat.com']})
+    self.assertEqual(3, response['exit_code'])
+    self.assertEqual('User larry@altostrat.com\n', response['stdout'])
+    self.assertIn('Not really.', response['stderr'])
+
+  def testUnservedCommandsAndMissingCredentialsFallBack(
+      self, mock_main_fn,
+      mock_loginfo_fn):  # pylint: disable=unused-argument
+    self.assertIn('fallback', self._daemon.HandleRequest(
+        {'command': 'gather_domain_token_stats', 'argv': []}))
+    mock_main_fn.side_effect = (
+        admin_api_tool_errors.AdminAPIToolAuthorizationError('No creds.'))
+    self.assertEqual({'fallback': 'No creds.'}, self._daemon.HandleRequest(
+        {'command': 'ls_user', 'argv': []}))
+
+  def testClientRunsCommandDirectlyWithoutDaemon(
+      self, mock_main_fn,
+      mock_loginfo_fn):  # pylint: disable=unused-argument
+    with patch('sys.stdout', new_callable=StringIO):
+      self.assertEqual(3, toolkit_daemon.RunCommand(
+          'ls_user', ['-u', 'anna@altostrat.com'], self._socket_path))
+    mock_main_fn.assert_called_once_with(['-u', 'anna@altostrat.com'])
+
+  def testClientRunsCommandInDaemon(
+      self, mock_main_fn,
+      mock_loginfo_fn):  # pylint: disable=unused-argument
+    self._daemon.Listen()
+    self.assertTrue(toolkit_daemon.IsDaemonRunning(self._socket_path))
+    server_thread = threading.Thread(target=self._daemon.Serve)
+    server_thread.start()
+    try:
+      with patch('sys.stdout', new_callable=StringIO) as mock_stdout:
+        with patch('sys.stderr', new_callable=StringIO):
+          exit_code = toolkit_daemon.RunCommand(
+              'ls_user', ['-u', 'george@altostrat.com'], self._socket_path)
+    finally:
+      self.assertTrue(toolkit_daemon.StopDaemon(self._socket_path))
+      server_thread.join()
+    self.assertEqual(3, exit_code)
+    self.assertEqual('User george@altostrat.com\n', mock_stdout.getvalue())
+    mock_main_fn.assert_called_once_with([u'-u', u'george@altostrat.com'])
+    self.assertFalse(os.path.exists(self._socket_path))
+    self.assertFalse(toolkit_daemon.IsDaemonRunning(self._socket_path))
+
+
+class WarmStateTest(unittest.TestCase):
+  """Tests the state kept between commands run by one process."""
+
+  def setUp(self):
+    self._file_manager = file_manager.FileManager()
+    self._temp_dir = tempfile.mkdtemp()
+    self._file_manager._work_directory = self._temp_dir
+    patcher = patch.object(users_index, 'FILE_MANAGER', self._file_manager)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def tearDown(self):
+    shutil.rmtree(self._temp_dir)
+
+  def testWorkDirectoryLeafReplaced(self):
+    self._file_manager.AddWorkDirectory('altostrat.com')
+    self._file_manager.AddWorkDirectory('primarydomain.com')
+    self.assertEqual(
+        os.path.join(self._temp_dir, 'primarydomain.com', 'users.json'),
+        self._file_manager.BuildFullPathToFileName('users.json'))
+
+  def testUsersIndexReloadedWhenUsersListChanges(self):
+    index = users_index.UsersIndex()
+    self.assertFalse(index.Contains('larry@altostrat.com'))
+    self._file_manager.WriteJsonFile(
+        'users.json', [['Larry@altostrat.com', '1', 'Larry Page']])
+    self.assertTrue(index.Contains('larry@altostrat.com'))
+    filename_path = self._file_manager.WriteJsonFile(
+        'users.json', [['anna@altostrat.com', '2', 'Anna Lee']],
+        overwrite_ok=True)
+    os.utime(filename_path, (0, 0))  # A different time from the first write.
+    self.assertFalse(index.Contains('larry@altostrat.com'))
+    self.assertEqual(['anna@altostrat.com', '2', 'Anna Lee'],
+                     index.GetUser('ANNA@altostrat.com'))
+
+  @patch('utils.auth_helper._NewAuthorizedHttp')
+  def testHttpPoolReusedBetweenCommands(self, mock_newauthorizedhttp_fn):
+    mock_newauthorizedhttp_fn.side_effect = lambda flags: MagicMock()
+    with patch.object(auth_helper, '_http_pool', None):
+      auth_helper.EnableHttpPool()
+      first_http = auth_helper.GetAuthorizedHttp(None)
+      second_http = auth_helper.GetAuthorizedHttp(None)
+      self.assertNotEqual(first_http, second_http)  # e.g. one per thread.
+      auth_helper.ReleaseHttpPool()
+      self.assertEqual(first_http, auth_helper.GetAuthorizedHttp(None))
+    self.assertEqual(2, mock_newauthorizedhttp_fn.call_count)
+
+  def testRepeatedLoggingSetupKeepsOneConsoleHandler(self):
+    log_utils.SetupLogging(False)
+    handler_count = len(log_utils.logging.getLogger('').handlers)
+    with patch('sys.stderr', new_callable=StringIO) as mock_stderr:
+      log_utils.SetupLogging(False)
+      log_utils.LogInfo('Captured.')
+    log_utils.SetupLogging(False)
+    self.assertEqual(handler_count,
+                     len(log_utils.logging.getLogger('').handlers))
+    self.assertIn('Captured.', mock_stderr.getvalue())
+
+
+if __name__ == '__main__':
+  unittest.main()
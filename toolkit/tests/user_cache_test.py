@@ -0,0 +1,141 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test user documents are cached and revalidated with their etag."""
+
+import shutil
+import tempfile
+import unittest
+
+# setup_path required to allow imports from component dirs (e.g. utils)
+# and lib (where the OAuth and Google API Python Client modules reside).
+import setup_path  # pylint: disable=unused-import,g-bad-import-order
+
+from admin_sdk_directory_api import users_api
+from apiclient.errors import HttpError
+import httplib2
+from mock import MagicMock
+from mock import patch
+from utils import file_manager
+from utils import user_cache
+
+
+_LARRY = {'primaryEmail': 'larry@altostrat.com', 'id': '101',
+          'etag': '"larry-1"'}
+
+
+def _NewUser(user_number):
+  return {'primaryEmail': 'user%d@altostrat.com' % user_number,
+          'id': str(user_number), 'etag': '"%d"' % user_number}
+
+
+class UserCacheTest(unittest.TestCase):
+  """Tests lookups by email or id and the least recently used limit."""
+
+  def testLookupByEmailOrId(self):
+    cache = user_cache.UserCache()
+    cache.Put(_LARRY)
+    self.assertEqual((_LARRY, True), cache.Get('Larry@altostrat.com'))
+    self.assertEqual((_LARRY, True), cache.Get('101'))
+    cache.Invalidate('larry@altostrat.com')
+    self.assertEqual((None, False), cache.Get('101'))
+
+  def testLeastRecentlyUsedDropped(self):
+    cache = user_cache.UserCache(max_users=2)
+    cache.Put(_NewUser(1))
+    cache.Put(_NewUser(2))
+    cache.Get('user1@altostrat.com')
+    cache.Put(_NewUser(3))
+    self.assertIsNone(cache.Get('user2@altostrat.com')[0])
+    self.assertIsNotNone(cache.Get('user1@altostrat.com')[0])
+
+
+class UsersApiUserCacheTest(unittest.TestCase):
+  """Tests users.get() requests saved by the cache."""
+
+  @patch('admin_sdk_directory_api.users_api.build', autospec=True)
+  def setUp(self, mock_ApiclientDiscoveryBuildFn):
+    self._temp_dir = tempfile.mkdtemp()
+    self._file_manager = file_manager.FileManager()
+    self._file_manager._work_directory = self._temp_dir
+    for patcher in [
+        patch.object(user_cache, 'FILE_MANAGER', self._file_manager),
+        patch.object(users_api, 'USER_CACHE', None)]:
+      patcher.start()
+      self.addCleanup(patcher.stop)
+    users_api.EnableUserCache()
+    mock_ApiclientDiscoveryBuildFn.return_value = MagicMock()
+    self._api_wrapper = users_api.UsersApiWrapper(http=None)
+    self._users = self._api_wrapper._users
+    self._request = self._users.get.return_value
+    self._request.headers = {}
+
+  def tearDown(self):
+    shutil.rmtree(self._temp_dir)
+
+  def _StartNewCommand(self):
+    """Save the cache and start over as the next toolkitd command would."""
+    users_api.DisableUserCache()
+    users_api.EnableUserCache()
+    self._users.get.reset_mock()
+    self._request.headers = {}
+
+  def testRepeatedLookupsWithoutRequest(self):
+    self._request.execute.return_value = _LARRY
+    self.assertEqual(_LARRY,
+                     self._api_wrapper.GetDomainUser('larry@altostrat.com'))
+    self.assertTrue(self._api_wrapper.IsDomainUser('larry@altostrat.com'))
+    self.assertEqual(1, self._users.get.call_count)
+
+  def testSavedUserRevalidated(self):
+    self._request.execute.return_value = _LARRY
+    self._api_wrapper.GetDomainUser('larry@altostrat.com')
+    self._StartNewCommand()
+    self._request.execute.side_effect = HttpError(
+        httplib2.Response({'status': 304}), '')
+    self.assertEqual(_LARRY,
+                     self._api_wrapper.GetDomainUser('larry@altostrat.com'))
+    self.assertEqual({'If-None-Match': '"larry-1"'}, self._request.headers)
+    # Revalidated: no further request.
+    self._api_wrapper.GetDomainUser('larry@altostrat.com')
+    self.assertEqual(1, self._users.get.call_count)
+
+  def testCacheOfEachWorkDirectory(self):
+    self._request.execute.return_value = _LARRY
+    self._api_wrapper.GetDomainUser('larry@altostrat.com')
+    cache = users_api.USER_CACHE
+    users_api.EnableUserCache()
+    self.assertIs(cache, users_api.USER_CACHE)
+    self._file_manager.AddWorkDirectory('altostrat.com')
+    users_api.EnableUserCache()
+    self.assertEqual((None, False),
+                     users_api.USER_CACHE.Get('larry@altostrat.com'))
+    self.assertFalse(self._file_manager.FileExists(
+        user_cache.USER_CACHE_FILE_NAME))
+    self._file_manager._work_directory = self._temp_dir
+    self.assertEqual((_LARRY, False),
+                     user_cache.UserCache().Get('larry@altostrat.com'))
+
+  def testDeletedUserInvalidated(self):
+    self._request.execute.return_value = _LARRY
+    self._api_wrapper.DeleteDomainUser('larry@altostrat.com')
+    self.assertEqual((None, False),
+                     users_api.USER_CACHE.Get('larry@altostrat.com'))
+    self._StartNewCommand()
+    self.assertEqual((None, False),
+                     users_api.USER_CACHE.Get('larry@altostrat.com'))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,90 @@
+#!/usr/bin/python
+#
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test org unit and scope pair counts with and without NumPy."""
+
+import unittest
+
+# setup_path required to allow imports from component dirs (e.g. utils)
+# and lib (where the OAuth and Google API Python Client modules reside).
+import setup_path  # pylint: disable=unused-import,g-bad-import-order
+
+from utils import vector_aggregation
+
+
+_USER_ROWS = [
+    ('/', False),
+    ('/sales', False),
+    ('/sales', True),
+    ('/sales', False),
+    ('/legal', True),
+]
+
+_TOKEN_USERS = [
+    ('a.example.com', 'drive', ['larry', 'george', 'paul']),
+    ('a.example.com', 'mail', ['larry', 'george']),
+    ('b.example.com', 'drive', ['larry', 'ringo']),
+    ('b.example.com', 'calendar', ['larry', 'ringo']),
+    ('c.example.com', 'mail', []),
+]
+
+
+class VectorAggregationTest(unittest.TestCase):
+  """Tests counting with each backend."""
+
+  def _CheckOrgUnitUsers(self, use_numpy):
+    active, suspended = vector_aggregation.CountOrgUnitUsers(
+        _USER_ROWS, use_numpy=use_numpy)
+    self.assertEqual({'/': 1, '/sales': 2}, active.data)
+    self.assertEqual({'/sales': 1, '/legal': 1}, suspended.data)
+
+  def _CheckScopePairs(self, use_numpy):
+    self.assertEqual(
+        {('drive', 'mail'): 2, ('calendar', 'drive'): 2,
+         ('calendar', 'mail'): 1},
+        vector_aggregation.CountScopePairs(_TOKEN_USERS, use_numpy=use_numpy))
+
+  def testPythonOrgUnitUsers(self):
+    self._CheckOrgUnitUsers(False)
+
+  def testPythonScopePairs(self):
+    self._CheckScopePairs(False)
+
+  @unittest.skipUnless(vector_aggregation.IsAvailable(), 'needs NumPy')
+  def testNumpyOrgUnitUsers(self):
+    self._CheckOrgUnitUsers(True)
+
+  @unittest.skipUnless(vector_aggregation.IsAvailable(), 'needs NumPy')
+  def testNumpyScopePairs(self):
+    self._CheckScopePairs(True)
+
+  @unittest.skipUnless(vector_aggregation.IsAvailable(), 'needs NumPy')
+  def testNumpyScopePairsAcrossIncidenceBlocks(self):
+    saved_block_cells = vector_aggregation._INCIDENCE_BLOCK_CELLS
+    vector_aggregation._INCIDENCE_BLOCK_CELLS = 3  # One user per block.
+    try:
+      self._CheckScopePairs(True)
+    finally:
+      vector_aggregation._INCIDENCE_BLOCK_CELLS = saved_block_cells
+
+  def testEmptyInputs(self):
+    active, suspended = vector_aggregation.CountOrgUnitUsers([])
+    self.assertEqual(({}, {}), (active.data, suspended.data))
+    self.assertEqual({}, vector_aggregation.CountScopePairs([]))
+
+
+if __name__ == '__main__':
+  unittest.main()
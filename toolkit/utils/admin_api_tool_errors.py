@@ -63,3 +63,8 @@ class AdminAPIToolUserError(AdminAPIToolError):
 class AdminAPIToolInvalidUserEmailError(AdminAPIToolUserError):
   """Problem with user mail format: should be user@domain.com."""
   pass
+
+
+class AdminAPIToolPolicyError(AdminAPIToolError):
+  """Problem with a rule of a client or scope black list."""
+  pass
@@ -16,24 +16,27 @@
 
 Auth requests need to be serviceable from both command line clients
 and AppEngine clients (that cannot write files to save state).
+
+oauth2client, httplib2 and apiclient are imported when first needed rather
+than when this module is imported: together they take longer to import than
+the rest of a command's startup.
 """
 
 import argparse
 import sys
 
-from apiclient.http import set_user_agent
+import admin_api_tool_errors
 import file_manager
-import httplib2
 import log_utils
-from oauth2client.client import AccessTokenRefreshError
-from oauth2client.client import flow_from_clientsecrets
-from oauth2client.file import Storage
-from oauth2client.tools import argparser as oauth2client_argparser
-from oauth2client.tools import run_flow
 
 
-ARG_PARSER = argparse.ArgumentParser(add_help=False,
-                                     parents=[oauth2client_argparser])
+# Parent parser with the oauth2client flags; built by GetArgParser().
+_ARG_PARSER = None
+
+# Authorized http objects kept for reuse by the commands run in one process
+# (the toolkitd daemon).  None unless EnableHttpPool() has been called, else
+# a dictionary: credentials path -> [List of http objects, Int count in use].
+_http_pool = None
 
 # User agent token - pushed into headers for later tracking queries.
 _TOOL_USER_AGENT = 'cse-admin-api-tool/%s'
@@ -80,6 +83,21 @@ _SCOPES = [
 FILE_MANAGER = file_manager.FILE_MANAGER
 
 
+def GetArgParser():
+  """Parent argparse parser holding the oauth2client flags.
+
+  Returns:
+    argparse.ArgumentParser (add_help=False) to use in parents=[].
+  """
+  global _ARG_PARSER  # pylint: disable=global-statement
+  if _ARG_PARSER is None:
+    # pylint: disable=g-import-not-at-top
+    from oauth2client.tools import argparser as oauth2client_argparser
+    _ARG_PARSER = argparse.ArgumentParser(add_help=False,
+                                          parents=[oauth2client_argparser])
+  return _ARG_PARSER
+
+
 def GetCredentials(flags, scope_list):
   """Retrieve saved credentials or create and save credentials using flow.
 
@@ -90,10 +108,24 @@ def GetCredentials(flags, scope_list):
 
   Returns:
     An oauth2client Credentials() object.
+
+  Raises:
+    AdminAPIToolAuthorizationError: if there are no valid saved credentials
+                                    and the http pool is enabled (a daemon
+                                    cannot run the interactive flow).
   """
-  client_file_storage = Storage(
-      FILE_MANAGER.BuildFullPathToFileName(_CURRENT_ACCESS_FILE_NAME))
+  # pylint: disable=g-import-not-at-top
+  from oauth2client.client import flow_from_clientsecrets
+  from oauth2client.file import Storage
+  from oauth2client.tools import run_flow
+
+  current_access_path = FILE_MANAGER.BuildFullPathToFileName(
+      _CURRENT_ACCESS_FILE_NAME)
+  client_file_storage = Storage(current_access_path)
   credentials = client_file_storage.get()
+  if (credentials is None or credentials.invalid) and _http_pool is not None:
+    raise admin_api_tool_errors.AdminAPIToolAuthorizationError(
+        'No valid saved credentials in %s.' % current_access_path)
   if credentials is None or credentials.invalid:
     client_secrets_path = FILE_MANAGER.BuildFullPathToFileName(
         _CLIENT_SECRETS_FILE_NAME, work_dir=False)
@@ -108,12 +140,32 @@ def GetCredentials(flags, scope_list):
   return credentials
 
 
+def EnableHttpPool():
+  """Keep authorized http objects for reuse by later commands in this process.
+
+  Used by the toolkitd daemon so that repeated commands skip loading the
+  credentials and reuse open (TLS) connections.  Each call of
+  GetAuthorizedHttp() during one command still returns a different http
+  object; ReleaseHttpPool() makes them all available to the next command.
+  """
+  global _http_pool  # pylint: disable=global-statement
+  if _http_pool is None:
+    _http_pool = {}
+
+
+def ReleaseHttpPool():
+  """Make every pooled http object available again (e.g. after a command)."""
+  for pool_entry in (_http_pool or {}).itervalues():
+    pool_entry[1] = 0
+
+
 def GetAuthorizedHttp(flags):
   """Helper to create an http interface object and authorize it.
 
   Made simple by oauth2client library.  Because http object are NOT
   thread-safe, create a new one every time (assumes being created by multiple
-  threads).
+  threads).  With the http pool enabled, an http object is reused if one for
+  the same credentials is not already in use.
 
   Args:
     flags: argparse parsed flags object.
@@ -121,10 +173,28 @@ def GetAuthorizedHttp(flags):
   Returns:
     Authorized httplib2 http interface object.
   """
+  if _http_pool is None:
+    return _NewAuthorizedHttp(flags)
+  pool_entry = _http_pool.setdefault(
+      FILE_MANAGER.BuildFullPathToFileName(_CURRENT_ACCESS_FILE_NAME), [[], 0])
+  https, in_use_count = pool_entry
+  if in_use_count == len(https):
+    https.append(_NewAuthorizedHttp(flags))
+  pool_entry[1] += 1
+  return https[in_use_count]
+
+
+def _NewAuthorizedHttp(flags):
+  """Create an http interface object and authorize it."""
+  # pylint: disable=g-import-not-at-top
+  from apiclient.http import set_user_agent
+  import httplib2
+  from oauth2client.client import AccessTokenRefreshError
+
   credentials = GetCredentials(flags, _SCOPES)
   try:
     cse_tool_version = _TOOL_USER_AGENT % FILE_MANAGER.ReadAppVersion()
-    log_utils.LogDebug('user-agent: %s' % cse_tool_version)
+    log_utils.LogDebug('user-agent: %s', cse_tool_version)
     http = httplib2.Http(timeout=_EXTENDED_SOCKET_TIMEOUT_S)
     set_user_agent(http, cse_tool_version)
     http = credentials.authorize(http)
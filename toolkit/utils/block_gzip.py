@@ -0,0 +1,130 @@
+#!/usr/bin/python
+#
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Block-compressed file format used for large working files.
+
+Data is written as a series of independently compressed gzip members (blocks)
+of BLOCK_SIZE uncompressed bytes each.  Concatenated gzip members are still a
+valid gzip file so the files are read as one gzip stream (OpenForRead()) and
+may be inspected with zcat or the gzip module.
+"""
+
+import gzip
+import zlib
+
+
+BLOCK_SIZE = 64 * 1024  # Uncompressed bytes per independently gzip'd block.
+
+_COMPRESSION_LEVEL = 6  # Same default as gzip - good speed/size tradeoff.
+_GZIP_WBITS = 16 + zlib.MAX_WBITS  # Tells zlib to write/read gzip headers.
+
+
+def OpenForRead(filename_path):
+  """Open a block-compressed file for sequential reading.
+
+  Args:
+    filename_path: String full path of the compressed file to read.
+
+  Returns:
+    File-like object (gzip.GzipFile) of the uncompressed data.
+
+  Raises:
+    IOError: if the file cannot be opened for reading.
+  """
+  return gzip.open(filename_path, 'rb')
+
+
+def _CompressBlock(data):
+  """Compress one block of data as a complete gzip member.
+
+  Args:
+    data: String of uncompressed bytes.
+
+  Returns:
+    String of compressed bytes (a full gzip member with header and trailer).
+  """
+  compressor = zlib.compressobj(_COMPRESSION_LEVEL, zlib.DEFLATED, _GZIP_WBITS)
+  return compressor.compress(data) + compressor.flush()
+
+
+class BlockGzipWriter(object):
+  """File-like writer of block-compressed files.
+
+  Usable as a context manager:
+
+    with BlockGzipWriter('/tmp/users.json.gz') as f:
+      json.dump(users_list, f)
+  """
+
+  def __init__(self, filename_path, block_size=BLOCK_SIZE):
+    """Open the data file and prepare to accumulate blocks.
+
+    Args:
+      filename_path: String full path of the compressed file to write.
+      block_size: Uncompressed bytes per block.
+
+    Raises:
+      IOError: if the file cannot be opened for writing.
+    """
+    self._block_size = block_size
+    self._file = open(filename_path, 'wb')
+    self._pending = []  # Uncompressed strings not yet written as a block.
+    self._pending_size = 0
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+  def _WriteBlock(self, data):
+    """Compress and append one block."""
+    self._file.write(_CompressBlock(data))
+
+  def write(self, data):  # pylint: disable=g-bad-name
+    """Buffer data and write out any full blocks.
+
+    Args:
+      data: String of bytes to write.
+    """
+    if isinstance(data, unicode):
+      data = data.encode('utf-8')
+    self._pending.append(data)
+    self._pending_size += len(data)
+    if self._pending_size < self._block_size:
+      return
+    buffered = ''.join(self._pending)
+    full_size = len(buffered) - (len(buffered) % self._block_size)
+    for start in xrange(0, full_size, self._block_size):
+      self._WriteBlock(buffered[start:start + self._block_size])
+    remainder = buffered[full_size:]
+    self._pending = [remainder] if remainder else []
+    self._pending_size = len(remainder)
+
+  def flush(self):  # pylint: disable=g-bad-name
+    """Required by some file-like consumers; blocks are written on close."""
+    pass
+
+  def close(self):  # pylint: disable=g-bad-name
+    """Write the final partial block."""
+    if self._file.closed:
+      return
+    if self._pending_size:
+      self._WriteBlock(''.join(self._pending))
+      self._pending = []
+      self._pending_size = 0
+    self._file.close()
+
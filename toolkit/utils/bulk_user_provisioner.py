@@ -0,0 +1,288 @@
+#!/usr/bin/python
+#
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Class that holds the logic for adding or removing users listed in a csv.
+
+add_user.py and rm_user.py check that a user exists (a users.get() request)
+before the insert or delete and, to verify, wait 2s and check again.  For
+thousands of users that takes hours.  The bulk commands instead:
+
+  -check existence against a list of the domain users (the saved users
+   list or, with --refresh_users, one paged users.list() listing),
+  -issue the inserts or deletes concurrently (--threads),
+  -verify all of them with one paged users.list() listing after the work
+   (repeated a few times, with a short wait, for users not yet listed).
+
+The input csv has a header row; add_users.py needs the columns
+email,first_name,last_name,password and rm_users.py needs email.
+
+Each input row gets a line in the result csv (passwords are not copied):
+
+  row,email,result,verified,message
+  2,larry@altostrat.com,added,yes,
+  3,anna@altostrat.com,skipped,,User already exists.
+"""
+
+import csv
+import re
+import time
+
+# setup_path required to allow imports from component dirs (e.g. utils)
+# and lib (where the OAuth and Google API Python Client modules reside).
+import setup_path  # pylint: disable=unused-import,g-bad-import-order
+
+from admin_sdk_directory_api import users_api
+from utils import admin_api_tool_errors
+from utils import auth_helper
+from utils import file_manager
+from utils import log_utils
+from utils import parallel_utils
+from utils import users_index
+from utils import validators
+
+
+ADD_USERS_FIELDS = ['email', 'first_name', 'last_name', 'password']
+RM_USERS_FIELDS = ['email']
+
+RESULT_HEADER = ['row', 'email', 'result', 'verified', 'message']
+RESULT_ADDED = 'added'
+RESULT_REMOVED = 'removed'
+RESULT_SKIPPED = 'skipped'
+RESULT_FAILED = 'failed'
+RESULT_INVALID = 'invalid'
+
+# Verification listings: users may take a few seconds to be listed (or no
+# longer listed) after the requests complete.
+_VERIFY_ATTEMPTS = 3
+_VERIFY_WAIT_S = 5
+
+# Log progress after each multiple of this many requests.
+_PROGRESS_INTERVAL = 100
+
+
+FILE_MANAGER = file_manager.FILE_MANAGER
+
+
+def ReadUserRows(input_file, required_fields):
+  """Read the rows of a users csv one at a time.
+
+  Args:
+    input_file: String path of the csv file (relative to the working
+                directory if not absolute).
+    required_fields: List of String column names the header must include.
+
+  Yields:
+    Tuple of (Int row number counting the header as 1, dictionary of
+    column name -> stripped String value).
+
+  Raises:
+    AdminAPIToolFileError: if the header is missing a required column.
+  """
+  f = FILE_MANAGER.OpenFileForRead(input_file)
+  try:
+    reader = csv.DictReader(f)
+    missing_fields = [field for field in required_fields
+                      if field not in (reader.fieldnames or [])]
+    if missing_fields:
+      raise admin_api_tool_errors.AdminAPIToolFileError(
+          'File %s is missing the column(s): %s.' % (
+              input_file, ', '.join(missing_fields)))
+    for row in reader:
+      yield reader.line_num, dict(
+          (field, (row.get(field) or '').strip()) for field in required_fields)
+  finally:
+    f.close()
+
+
+class BulkUserProvisioner(object):
+  """Adds or removes the users of a csv file with concurrent requests."""
+
+  def __init__(self, flags, remove=False):
+    """Authorize and note the options of the run.
+
+    Args:
+      flags: Argparse flags object with apps_domain, input_file, threads,
+             refresh_users and skip_verify.
+      remove: If True remove the listed users else add them.
+    """
+    self._flags = flags
+    self._remove = remove
+    self._required_fields = RM_USERS_FIELDS if remove else ADD_USERS_FIELDS
+    self._api_wrapper = users_api.UsersApiWrapper(
+        auth_helper.GetAuthorizedHttp(flags))
+    self._results = {}  # Row number -> result row (see RESULT_HEADER).
+
+  def _GetDomainUserEmails(self, refresh):
+    """List the email addresses of the domain users.
+
+    Args:
+      refresh: If False and a saved users list exists, use it instead of
+               listing the domain users.
+
+    Returns:
+      Set of lower case String email addresses.
+    """
+    if not refresh and FILE_MANAGER.FileExists(FILE_MANAGER.USERS_FILE_NAME):
+      log_utils.LogInfo('Checking users against the users list last modified '
+                        'on %s.' % FILE_MANAGER.FileTime(
+                            FILE_MANAGER.USERS_FILE_NAME))
+      return set(users_index.UsersIndex().GetEmails())
+    users_list = self._api_wrapper.GetDomainUsers(self._flags.apps_domain)
+    return set(user[0].lower() for user in users_list)
+
+  def _SetResult(self, row_number, email, result, message=''):
+    self._results[row_number] = [row_number, email, result, '', message]
+
+  def _PlanRequests(self, domain_user_emails):
+    """Read the input rows and choose the ones that need a request.
+
+    Args:
+      domain_user_emails: Set of lower case emails of existing users.
+
+    Returns:
+      List of tuples (row number, dictionary of row values) to process.
+    """
+    work_items = []
+    seen_emails = set()
+    for row_number, row in ReadUserRows(self._flags.input_file,
+                                        self._required_fields):
+      email = row['email']
+      empty_fields = [field for field in self._required_fields
+                      if not row[field]]
+      if empty_fields:
+        self._SetResult(row_number, email, RESULT_INVALID,
+                        'Empty field(s): %s.' % ', '.join(empty_fields))
+      elif not re.match(validators.VALID_EMAIL_RE, email):
+        self._SetResult(row_number, email, RESULT_INVALID,
+                        'Not a valid email address.')
+      elif email.lower() in seen_emails:
+        self._SetResult(row_number, email, RESULT_SKIPPED,
+                        'Duplicate of an earlier row.')
+      elif self._remove and email.lower() not in domain_user_emails:
+        self._SetResult(row_number, email, RESULT_SKIPPED,
+                        'User is not a domain user.')
+      elif not self._remove and email.lower() in domain_user_emails:
+        self._SetResult(row_number, email, RESULT_SKIPPED,
+                        'User already exists.')
+      else:
+        work_items.append((row_number, row))
+      seen_emails.add(email.lower())
+    return work_items
+
+  def _ProcessRow(self, api_wrapper, work_item):
+    """Issue the insert or delete request of one row (in a worker thread)."""
+    _, row = work_item
+    if self._remove:
+      api_wrapper.DeleteDomainUser(row['email'], check_exists=False)
+    else:
+      api_wrapper.AddDomainUser(row['first_name'], row['last_name'],
+                                row['email'], row['password'],
+                                check_exists=False)
+
+  def _IssueRequests(self, work_items):
+    """Process the rows concurrently, recording the result of each."""
+    done_result = RESULT_REMOVED if self._remove else RESULT_ADDED
+    thread_init_fn = lambda: users_api.UsersApiWrapper(
+        auth_helper.GetAuthorizedHttp(self._flags))
+    for count, (work_item, _, error) in enumerate(
+        parallel_utils.RunInParallel(work_items, self._ProcessRow,
+                                     self._flags.threads,
+                                     thread_init_fn=thread_init_fn), 1):
+      row_number, row = work_item
+      if error:
+        log_utils.LogError('Unable to %s user %s.' % (
+            'remove' if self._remove else 'add', row['email']), error)
+        self._SetResult(row_number, row['email'], RESULT_FAILED, str(error))
+      else:
+        self._SetResult(row_number, row['email'], done_result)
+      if count % _PROGRESS_INTERVAL == 0:
+        log_utils.LogInfo('Processed %d of %d users.' % (count,
+                                                         len(work_items)))
+
+  def _VerifyResults(self):
+    """List the domain users to check the rows added or removed.
+
+    Returns:
+      Int count of rows that could not be verified.
+    """
+    done_result = RESULT_REMOVED if self._remove else RESULT_ADDED
+    unverified = [result for result in self._results.itervalues()
+                  if result[2] == done_result]
+    for attempt in xrange(_VERIFY_ATTEMPTS):
+      if not unverified:
+        break
+      if attempt:
+        time.sleep(_VERIFY_WAIT_S)
+      log_utils.LogInfo('Verifying %d users with a list of domain users.' %
+                        len(unverified))
+      domain_user_emails = self._GetDomainUserEmails(refresh=True)
+      still_unverified = []
+      for result in unverified:
+        listed = result[1].lower() in domain_user_emails
+        if listed != self._remove:
+          result[3] = 'yes'
+        else:
+          still_unverified.append(result)
+      unverified = still_unverified
+    for result in unverified:
+      result[3] = 'no'
+    return len(unverified)
+
+  def Run(self):
+    """Add or remove the users of the input file.
+
+    Returns:
+      List of result rows (see RESULT_HEADER) in input file order.
+    """
+    domain_user_emails = self._GetDomainUserEmails(self._flags.refresh_users)
+    work_items = self._PlanRequests(domain_user_emails)
+    log_utils.LogInfo('%d users to %s.' % (
+        len(work_items), 'remove' if self._remove else 'add'))
+    self._IssueRequests(work_items)
+    if not self._flags.skip_verify:
+      unverified_count = self._VerifyResults()
+      if unverified_count:
+        log_utils.LogWarning('%d users could not be verified.' %
+                             unverified_count)
+    return [self._results[row_number]
+            for row_number in sorted(self._results)]
+
+
+def ReportResults(output_file, results):
+  """Write the result csv and log a count of each result.
+
+  Args:
+    output_file: String name of the result csv in the working directory.
+    results: List of result rows (see RESULT_HEADER).
+
+  Returns:
+    Int count of rows that failed or could not be verified.
+  """
+  result_counts = {}
+  problem_count = 0
+  for result in results:
+    result_counts[result[2]] = result_counts.get(result[2], 0) + 1
+    if result[2] == RESULT_FAILED or result[3] == 'no':
+      problem_count += 1
+  filename_path = FILE_MANAGER.WriteCSVFile(output_file, results,
+                                            header=RESULT_HEADER,
+                                            overwrite_ok=True)
+  log_utils.LogInfo('Rows: %s.' % ', '.join(
+      '%d %s' % (count, result)
+      for result, count in sorted(result_counts.iteritems())))
+  if filename_path:
+    print 'Result of each row written to %s.' % filename_path
+  return problem_count
@@ -0,0 +1,177 @@
+#!/usr/bin/python
+#
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Checkpoint the results of a domain scan without stalling the scan.
+
+A scan (e.g. gather_domain_token_stats.py) saves its whole results dict
+every n users.  Serializing a large dict takes seconds during which no API
+request is made.  A Checkpointer instead:
+
+  -keeps its own copy of the results, owned by the FileManager background
+   writer thread,
+  -is given each change made by the scan as an immutable delta (e.g. the
+   tokens of one user) which is cheap to record,
+  -at a checkpoint, hands the deltas recorded since the last one to the
+   writer thread which applies them to its copy and writes the file,
+  -allows few checkpoints in flight (the scan waits only if the disk is that
+   far behind),
+  -on SIGINT/SIGTERM, lets the scan finish the user in progress then writes
+   all recorded deltas before exiting (ExitIfInterrupted()).
+
+Checkpoints are queued with the progress file of the user iterator so the
+progress file is never ahead of the results.  The copy doubles the memory
+used by the results.
+"""
+
+import copy
+import signal
+import sys
+import threading
+
+# setup_path required to allow imports from component dirs (e.g. utils)
+# and lib (where the OAuth and Google API Python Client modules reside).
+import setup_path  # pylint: disable=unused-import,g-bad-import-order
+
+from utils import admin_api_tool_errors
+from utils import file_manager
+from utils import log_utils
+
+
+# Checkpoints queued before the scan waits for the writer thread.
+_MAX_PENDING_CHECKPOINTS = 2
+_FLUSH_SIGNALS = [signal.SIGINT, signal.SIGTERM]
+
+
+FILE_MANAGER = file_manager.FILE_MANAGER
+
+
+class Checkpointer(object):
+  """Persists scan results from deltas on the background writer thread."""
+
+  def __init__(self, file_name, state, apply_delta_fn, keep_previous=0,
+               max_pending=_MAX_PENDING_CHECKPOINTS, domain_file_manager=None):
+    """Copy the results so far.
+
+    Args:
+      file_name: String name of the json results file (e.g.
+                 tokens_issued.json).
+      state: Json serializable results so far (e.g. read by --resume).
+      apply_delta_fn: Function taking (state, delta) that applies a delta to
+                      the results (in the writer thread).
+      keep_previous: Int count of previous checkpoints to keep.
+      max_pending: Int count of checkpoints queued before Checkpoint() waits.
+      domain_file_manager: If not None, the FileManager of the domain scanned
+                           (e.g. by multi_domain_scanner) else FILE_MANAGER.
+    """
+    self._file_manager = (FILE_MANAGER if domain_file_manager is None
+                          else domain_file_manager)
+    self._file_name = file_name
+    self._state = copy.deepcopy(state)  # Owned by the writer thread.
+    self._apply_delta_fn = apply_delta_fn
+    self._keep_previous = keep_previous
+    self._deltas = []
+    self._pending_checkpoints = threading.BoundedSemaphore(max_pending)
+    self._previous_handlers = {}
+    self._interrupt_signal = None
+    self._closed = False
+
+  def _Persist(self, deltas):
+    """Apply deltas to the results and write them (in the writer thread)."""
+    try:
+      for delta in deltas:
+        self._apply_delta_fn(self._state, delta)
+      self._file_manager.WriteJsonFile(self._file_name, self._state,
+                                       overwrite_ok=True,
+                                       keep_previous=self._keep_previous)
+    finally:
+      self._pending_checkpoints.release()
+
+  def Add(self, delta):
+    """Record a change of the results (e.g. the tokens of one user).
+
+    Args:
+      delta: Object passed to apply_delta_fn; must not be changed after.
+    """
+    self._deltas.append(delta)
+
+  def Checkpoint(self):
+    """Queue the write of the results with the deltas recorded so far.
+
+    Returns:
+      String full path of the results file.
+
+    Raises:
+      AdminAPIToolFileError: if an earlier checkpoint failed.
+    """
+    if self._deltas:
+      deltas = tuple(self._deltas)
+      self._deltas = []
+      self._pending_checkpoints.acquire()
+      try:
+        self._file_manager.QueueBackgroundWrite(
+            lambda: self._Persist(deltas), self._file_name,
+            discard_fn=self._pending_checkpoints.release)
+      except admin_api_tool_errors.AdminAPIToolFileError:
+        self._pending_checkpoints.release()
+        raise
+    return self._file_manager.BuildFullPathToFileName(self._file_name)
+
+  def _OnSignal(self, signum, unused_frame):
+    """Note the interrupt: the scan stops at the next user."""
+    self._interrupt_signal = signum
+    # A second signal is not deferred (e.g. a stuck request).
+    signal.signal(signum, self._previous_handlers[signum])
+
+  def CatchSignals(self):
+    """Defer SIGINT and SIGTERM to ExitIfInterrupted() (main thread only)."""
+    if threading.current_thread().name != 'MainThread':
+      return
+    for signum in _FLUSH_SIGNALS:
+      self._previous_handlers[signum] = signal.signal(signum, self._OnSignal)
+
+  def _RestoreSignals(self):
+    for signum, handler in self._previous_handlers.iteritems():
+      signal.signal(signum, handler)
+    self._previous_handlers = {}
+
+  def Close(self):
+    """Write the last deltas and wait until all checkpoints are written.
+
+    Returns:
+      String full path of the results file.
+
+    Raises:
+      AdminAPIToolFileError: if a checkpoint failed.
+    """
+    if not self._closed:
+      self._closed = True
+      self._RestoreSignals()
+      self.Checkpoint()
+      self._file_manager.WaitForBackgroundWrites()
+    return self._file_manager.BuildFullPathToFileName(self._file_name)
+
+  def IsInterrupted(self):
+    """Returns True if a signal was caught (e.g. to stop a pipeline)."""
+    return self._interrupt_signal is not None
+
+  def ExitIfInterrupted(self):
+    """Between users: save the results and exit if a signal was caught."""
+    if self._interrupt_signal is None:
+      return
+    sys.stdout.write('%80s\r' % '')  # Clear the previous entry.
+    log_utils.LogError('Interrupted. Results saved to %s: use --resume to '
+                       'continue.' % self.Close())
+    sys.exit(1)
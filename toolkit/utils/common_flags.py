@@ -32,6 +32,7 @@ import setup_path  # pylint: disable=unused-import,g-bad-import-order
 import auth_helper
 import file_manager
 import log_utils
+import sampling
 import validators
 
 
@@ -52,6 +53,43 @@ def DefineAppsDomainFlagWithDefault(arg_parser, required=False):
       help='Google Apps Domain Name (e.g. altostrat.com) [REQUIRED].')
 
 
+def DefineCustomerListingFlagWithDefaultFalse(arg_parser):
+  """Defines common --customer_listing flag used by commands listing users.
+
+  Args:
+    arg_parser: object from argparse.ArgumentParser() to accumulate flags.
+  """
+  arg_parser.add_argument(
+      '--customer_listing', action='store_true', default=False,
+      help=('List the users of all the domains of the customer saved by '
+            'set_default_domain.py in one pass and save the users list of '
+            'each domain.'))
+
+
+def DefineListingThreadsFlagWithDefaultOne(arg_parser):
+  """Defines common --listing_threads flag used by commands listing users.
+
+  Args:
+    arg_parser: object from argparse.ArgumentParser() to accumulate flags.
+  """
+  arg_parser.add_argument(
+      '--listing_threads', type=int, default=1,
+      help=('List the domain users with this many concurrent email prefix '
+            'queries instead of one paged listing (large domains).'))
+
+
+def DefineFetchThreadsFlagWithDefaultOne(arg_parser):
+  """Defines common --fetch_threads flag used by domain-wide user scans.
+
+  Args:
+    arg_parser: object from argparse.ArgumentParser() to accumulate flags.
+  """
+  arg_parser.add_argument(
+      '--fetch_threads', type=int, default=1,
+      help=('Issue the requests of this many users concurrently (each thread '
+            'authorizes its own connection).'))
+
+
 def DefineForceFlagWithDefaultFalse(arg_parser, required=False,
                                     help_string=None):
   """Defines common --force flag used on many command line commands.
@@ -68,6 +106,85 @@ def DefineForceFlagWithDefaultFalse(arg_parser, required=False,
       help=help_string)
 
 
+def DefineKeepCheckpointsFlagWithDefaultZero(arg_parser):
+  """Defines common --keep_checkpoints flag used by domain-wide scans.
+
+  Args:
+    arg_parser: object from argparse.ArgumentParser() to accumulate flags.
+  """
+  arg_parser.add_argument(
+      '--keep_checkpoints', type=int, default=0,
+      help=('Number of previous checkpoints of the results file to keep '
+            '(e.g. tokens_issued.json.1 is the newest).'))
+
+
+def DefineKeepSnapshotsFlagWithDefault(arg_parser):
+  """Defines common --keep_snapshots flag used by token stats commands.
+
+  Args:
+    arg_parser: object from argparse.ArgumentParser() to accumulate flags.
+  """
+  arg_parser.add_argument(
+      '--keep_snapshots', type=int, default=10,
+      help=('Number of timestamped token snapshots to keep for '
+            'diff_token_stats (0 keeps all).'))
+
+
+def DefineConfidenceFlagWithDefault(arg_parser):
+  """Defines common --confidence flag used by reports of sampled runs.
+
+  Args:
+    arg_parser: object from argparse.ArgumentParser() to accumulate flags.
+  """
+  arg_parser.add_argument(
+      '--confidence', type=validators.ConfidenceValidatorType(),
+      default=sampling.DEFAULT_CONFIDENCE,
+      help='Confidence level of the intervals of estimated counts.')
+
+
+def DefineSampleFlagsWithDefaults(arg_parser):
+  """Defines common --sample and --sample_seed flags.
+
+  Args:
+    arg_parser: object from argparse.ArgumentParser() to accumulate flags.
+  """
+  arg_parser.add_argument(
+      '--sample', type=int, default=0,
+      help=('Only check this many users drawn at random (by organizational '
+            'unit when the users list holds it) and report estimated counts '
+            'for the whole domain.'))
+  arg_parser.add_argument(
+      '--sample_seed', type=int, default=sampling.DEFAULT_SAMPLE_SEED,
+      help='Seed of the --sample draw (--resume requires the same seed).')
+
+
+def DefineShardFlagWithDefaultNone(arg_parser):
+  """Defines common --shard flag used by domain-wide scanning commands.
+
+  Args:
+    arg_parser: object from argparse.ArgumentParser() to accumulate flags.
+  """
+  arg_parser.add_argument(
+      '--shard', default=None, type=validators.ShardValidatorType(),
+      help=('Only process shard i of N (e.g. 0/4) of the domain users so that '
+            'N processes can split a scan. Requires an existing users list.'))
+
+
+def DefineTokenCacheFlagsWithDefaults(arg_parser):
+  """Defines common --max_age and --live flags used by token lookups.
+
+  Args:
+    arg_parser: object from argparse.ArgumentParser() to accumulate flags.
+  """
+  arg_parser.add_argument(
+      '--max_age', type=int, default=60,
+      help=('Show the tokens saved by gather_domain_token_stats (or by a '
+            'previous lookup) if requested less than this many minutes ago.'))
+  arg_parser.add_argument(
+      '--live', action='store_true', default=False,
+      help='Always request the tokens instead of using the local token cache.')
+
+
 def DefineVerboseFlagWithDefaultFalse(arg_parser):
   """Defines common --verbose flag used on many command line commands.
 
@@ -79,7 +196,7 @@ def DefineVerboseFlagWithDefaultFalse(arg_parser):
       help='Show expanded output.')
 
 
-def ParseFlags(argv, description, add_flags_fn=None):
+def ParseFlags(argv, description, add_flags_fn=None, auth_flags=True):
   """Common command-line flags parsing (e.g. for apps domain and verbose).
 
   Allows custom added flags using add_flags_fn and also initializes logging
@@ -89,17 +206,26 @@ def ParseFlags(argv, description, add_flags_fn=None):
     argv: List of strings passed from main().
     description: String passed to parser constructor for help.
     add_flags_fn: If present, function that adds custom flags.
+    auth_flags: If False, leave out the oauth2client flags.  For commands
+                that only read working files and never call an API, which
+                then start without importing oauth2client.
 
   Returns:
     Argparse parsed flags object with flag attributes.
   """
+  parents = [auth_helper.GetArgParser()] if auth_flags else []
   arg_parser = argparse.ArgumentParser(description=description,
-                                       parents=[auth_helper.ARG_PARSER])
+                                       parents=parents)
+  arg_parser.add_argument(
+      '--compress_working_files', action='store_true', default=False,
+      help=('Write working files (e.g. users.json) block-compressed to save '
+            'disk space. Compressed and plain files are both readable.'))
   if add_flags_fn:
     add_flags_fn(arg_parser)
   flags = arg_parser.parse_args(argv)
 
   log_utils.SetupLogging(flags.verbose)
+  FILE_MANAGER.EnableCompression(flags.compress_working_files)
   if hasattr(flags, 'apps_domain') and flags.apps_domain:
     FILE_MANAGER.AddWorkDirectory(flags.apps_domain)
   return flags
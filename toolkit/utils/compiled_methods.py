@@ -0,0 +1,242 @@
+#!/usr/bin/python
+#
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Fast request builders for the discovery methods used in long loops.
+
+The methods that apiclient.discovery generates (e.g. tokens().list()) work out
+on every call what a request looks like.  They check each keyword against the
+method parameters, match uncompiled regex patterns, cast values, build the
+headers and expand the URI template.  For hundreds of thousands of
+tokens.list() and tokens.delete() calls this overhead shows up in profiles.
+
+A compiled method does that work once for a fixed set of arguments:
+
+  list_tokens = CompileMethod(service.tokens(), 'list', ['userKey'])
+  request = list_tokens(user_mail)  # Same HttpRequest as list(userKey=...).
+
+The URI is built by formatting a pre-expanded template and the headers are
+copied from a prepared dictionary.  Arguments are validated with precompiled
+patterns unless the caller is trusted (our own API wrappers).
+
+Anything that is not a plain discovery method falls back to the generated
+method (e.g. methods with a body or media, and mock services in tests).
+
+apiclient is imported when a method is compiled rather than with this module
+(see http_utils.BuildService).
+"""
+
+import re
+import urllib
+import urlparse
+
+# setup_path required to allow imports from component dirs (e.g. utils)
+# and lib (where the OAuth and Google API Python Client modules reside).
+import setup_path  # pylint: disable=unused-import,g-bad-import-order
+
+
+# Only simple {name} template expressions are pre-expanded; reserved ({+x})
+# and other operators fall back to the generated method.
+_SIMPLE_TEMPLATE_VARIABLE_RE = re.compile(r'{([A-Za-z0-9_.-]+)}')
+_ANY_TEMPLATE_EXPRESSION_RE = re.compile(r'{[^}]*}')
+
+
+def _EncodeValue(value):
+  """Helper to convert a string argument to utf-8 bytes for quoting."""
+  if isinstance(value, unicode):
+    return value.encode('utf-8')
+  return value
+
+
+def _CastValue(value, param_type):
+  """Helper to convert a value to a string as the generated method does."""
+  if param_type == 'string' and isinstance(value, basestring):
+    return value  # By far the most common case; skip the general cast.
+  from apiclient import discovery  # pylint: disable=g-import-not-at-top
+  return discovery._cast(value, param_type)  # pylint: disable=protected-access
+
+
+def _MakeGenericMethod(resource, method_name, arg_names):
+  """Wrap the generated discovery method to take positional arguments.
+
+  Args:
+    resource: Discovery Resource (or mock) with the method.
+    method_name: String name of the method (e.g. 'list').
+    arg_names: List of String keyword names in positional order.
+
+  Returns:
+    Function taking values in arg_names order and returning a request.
+  """
+  def _GenericMethod(*values):
+    return getattr(resource, method_name)(**dict(zip(arg_names, values)))
+  return _GenericMethod
+
+
+class CompiledMethod(object):
+  """Builds the requests of one discovery method from positional arguments."""
+
+  def __init__(self, resource, method_desc, arg_names, trusted=False):
+    """Do the per-request work that depends only on the method and arguments.
+
+    Args:
+      resource: Discovery Resource holding the method.
+      method_desc: Dictionary of the method from the discovery document.
+      arg_names: List of String keyword names in positional order.
+      trusted: If True, skip argument validation (for internal callers).
+
+    Raises:
+      TypeError: if arg_names does not fit the method parameters.
+    """
+    # pylint: disable=g-import-not-at-top
+    from apiclient import discovery
+    from apiclient import model as apiclient_model
+
+    parameters = discovery.ResourceMethodParameters(method_desc)
+    for name in arg_names:
+      if name not in parameters.argmap:
+        raise TypeError('Got an unexpected keyword argument "%s"' % name)
+    for name in parameters.required_params:
+      if name not in arg_names:
+        raise TypeError('Missing required parameter "%s"' % name)
+
+    self._resource = resource
+    self._http_method = method_desc['httpMethod']
+    self._method_id = method_desc['id']
+    self._arg_names = list(arg_names)
+    self._trusted = trusted
+    self._pattern_checks = [
+        (i, name, re.compile(parameters.pattern_params[name]))
+        for i, name in enumerate(arg_names)
+        if name in parameters.pattern_params]
+    self._enum_checks = [
+        (i, name, frozenset(parameters.enum_params[name]))
+        for i, name in enumerate(arg_names)
+        if name in parameters.enum_params]
+    self._param_types = [parameters.param_types.get(name, 'string')
+                         for name in arg_names]
+    # Positions of arguments that fill the path and the query.
+    self._path_args = [(i, parameters.argmap[name])
+                       for i, name in enumerate(arg_names)
+                       if name in parameters.path_params]
+    self._query_args = [(i, parameters.argmap[name])
+                        for i, name in enumerate(arg_names)
+                        if name in parameters.query_params]
+
+    if 'response' in method_desc:
+      self._model = resource._model  # pylint: disable=protected-access
+    else:
+      self._model = apiclient_model.RawModel()
+    # The headers (accept, user-agent) do not depend on the arguments.
+    self._headers, _, _, _ = self._model.request({}, {}, {}, None)
+    fixed_query = []
+    if self._model.alt_param is not None:
+      fixed_query.append(('alt', self._model.alt_param))
+    developer_key = resource._developerKey  # pylint: disable=protected-access
+    if developer_key:
+      fixed_query.append(('key', developer_key))
+    self._fixed_query = fixed_query
+
+    # Pre-expand the URI: join with the base URL once and turn each {name}
+    # into a %(name)s format field filled with the quoted argument.
+    url_template = urlparse.urljoin(
+        resource._baseUrl,  # pylint: disable=protected-access
+        method_desc['path'])
+    self._url_format = _SIMPLE_TEMPLATE_VARIABLE_RE.sub(
+        r'%(\1)s', url_template.replace('%', '%%'))
+
+  def _Validate(self, values):
+    """Check argument values as the generated method would.
+
+    Args:
+      values: Tuple of argument values in arg_names order.
+
+    Raises:
+      TypeError: if a value does not match its pattern or enum.
+    """
+    if len(values) != len(self._arg_names):
+      raise TypeError('Expected %d arguments (%s), got %d.' % (
+          len(self._arg_names), ', '.join(self._arg_names), len(values)))
+    for i, name, regex in self._pattern_checks:
+      if values[i] is not None and regex.match(values[i]) is None:
+        raise TypeError(
+            'Parameter "%s" value "%s" does not match the pattern "%s"' %
+            (name, values[i], regex.pattern))
+    for i, name, enums in self._enum_checks:
+      if values[i] is not None and values[i] not in enums:
+        raise TypeError(
+            'Parameter "%s" value "%s" is not an allowed value in "%s"' %
+            (name, values[i], sorted(enums)))
+
+  def __call__(self, *values):
+    """Build the HttpRequest for the argument values.
+
+    Args:
+      *values: Argument values in the arg_names order given when compiled.
+
+    Returns:
+      apiclient HttpRequest object (not yet executed).
+    """
+    if not self._trusted:
+      self._Validate(values)
+    path_values = {}
+    for i, param in self._path_args:
+      value = _CastValue(values[i], self._param_types[i])
+      path_values[param] = urllib.quote(_EncodeValue(value), '')
+    query = list(self._fixed_query)
+    for i, param in self._query_args:
+      if values[i] is None:
+        continue
+      value = _CastValue(values[i], self._param_types[i])
+      query.append((param, _EncodeValue(value)))
+    url = self._url_format % path_values
+    if query:
+      url += '?' + urllib.urlencode(query)
+    resource = self._resource
+    return resource._requestBuilder(  # pylint: disable=protected-access
+        resource._http,  # pylint: disable=protected-access
+        self._model.response,
+        url,
+        method=self._http_method,
+        body=None,
+        headers=dict(self._headers),
+        methodId=self._method_id,
+        resumable=None)
+
+
+def CompileMethod(resource, method_name, arg_names, trusted=False):
+  """Build a fast request builder for a method and fixed argument names.
+
+  Args:
+    resource: Discovery Resource holding the method (e.g. service.tokens()).
+    method_name: String name of the method (e.g. 'list').
+    arg_names: List of String keyword names in positional order.
+    trusted: If True, skip argument validation (for internal callers).
+
+  Returns:
+    Function taking values in arg_names order and returning an HttpRequest.
+  """
+  from apiclient import discovery  # pylint: disable=g-import-not-at-top
+  if not isinstance(resource, discovery.Resource):
+    # e.g. a mock service object in tests.
+    return _MakeGenericMethod(resource, method_name, arg_names)
+  method_desc = (
+      resource._resourceDesc  # pylint: disable=protected-access
+      .get('methods', {}).get(method_name))
+  if (not method_desc or 'request' in method_desc or
+      method_desc.get('supportsMediaUpload') or
+      len(_ANY_TEMPLATE_EXPRESSION_RE.findall(method_desc['path'])) !=
+      len(_SIMPLE_TEMPLATE_VARIABLE_RE.findall(method_desc['path']))):
+    return _MakeGenericMethod(resource, method_name, arg_names)
+  return CompiledMethod(resource, method_desc, arg_names, trusted=trusted)
@@ -0,0 +1,126 @@
+#!/usr/bin/python
+#
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Save the users lists of all the domains of a customer in one pass.
+
+users.list(domain=...) lists one domain, so saving the users list of each
+of N secondary domains takes N paged listings.  users.list(customer=...)
+pages through the users of all the domains of the customer at once (500
+users per page).  The users are split by the domain of their email address
+and saved as the users list (users.json) of the working directory of each
+domain.  Each domain then has its own users list and index
+(users_index.UsersIndex), as if it had been listed on its own.
+
+The customer_id is the one saved by set_default_domain.py.
+"""
+
+# setup_path required to allow imports from component dirs (e.g. utils)
+# and lib (where the OAuth and Google API Python Client modules reside).
+import setup_path  # pylint: disable=unused-import,g-bad-import-order
+
+from utils import admin_api_tool_errors
+from utils import file_manager
+from utils import log_utils
+from utils import validators
+
+
+# users.list() maximum page size: fewest requests for one pass.
+_MAX_PAGE = 500
+
+
+FILE_MANAGER = file_manager.FILE_MANAGER
+
+
+def GetDefaultCustomerId():
+  """Read the customer_id saved by set_default_domain.py.
+
+  Returns:
+    String customer_id.
+
+  Raises:
+    AdminAPIToolUserError: if no customer_id has been saved.
+  """
+  customer_id = FILE_MANAGER.ReadDefaultCustomerId()
+  if not customer_id:
+    raise admin_api_tool_errors.AdminAPIToolUserError(
+        'No customer_id saved. Run set_default_domain.py first.')
+  return customer_id
+
+
+def GroupUsersByDomain(users_list):
+  """Split a list of users (e.g. of all the customer users) by domain.
+
+  Args:
+    users_list: List of user tuples (email, id, full_name).
+
+  Returns:
+    Dictionary of lower case domain -> List of the user tuples of the domain.
+  """
+  domain_users = {}
+  for user in users_list:
+    apps_domain = validators.GetEmailParts(user[0])[1].lower()
+    domain_users.setdefault(apps_domain, []).append(user)
+  return domain_users
+
+
+def ListCustomerUsers(api_wrapper, customer_id):
+  """List the users of a customer grouped by domain (nothing is saved).
+
+  Args:
+    api_wrapper: UsersApiWrapper object.
+    customer_id: String id of the customer (e.g. C01abcde9).
+
+  Returns:
+    Dictionary of lower case domain -> List of the user tuples of the domain.
+  """
+  log_utils.LogInfo('Retrieving list of users of customer %s...' %
+                    customer_id)
+  domain_users = GroupUsersByDomain(api_wrapper.GetDomainUsers(
+      None, max_page=_MAX_PAGE, customer=customer_id))
+  log_utils.LogInfo('Found %d users in %d domains.' % (
+      sum(len(u) for u in domain_users.itervalues()), len(domain_users)))
+  return domain_users
+
+
+def SaveCustomerUsers(api_wrapper, customer_id, apps_domains=None,
+                      overwrite_ok=False):
+  """List the users of a customer and save the users list of each domain.
+
+  Args:
+    api_wrapper: UsersApiWrapper object.
+    customer_id: String id of the customer (e.g. C01abcde9).
+    apps_domains: If not None, List of the domains to save (a domain without
+                  users gets an empty list) else all the domains found.
+    overwrite_ok: If False, the existing users list of a domain is kept.
+
+  Returns:
+    Dictionary of domain -> String path of each users list written.
+  """
+  domain_users = ListCustomerUsers(api_wrapper, customer_id)
+  if apps_domains is None:
+    apps_domains = domain_users.keys()
+  saved_paths = {}
+  for apps_domain in sorted(set(d.lower() for d in apps_domains)):
+    domain_file_manager = FILE_MANAGER.NewDomainFileManager(apps_domain)
+    if (not overwrite_ok and
+        domain_file_manager.FileExists(FILE_MANAGER.USERS_FILE_NAME)):
+      log_utils.LogInfo('Keeping the existing users list of %s.' %
+                        apps_domain)
+      continue
+    saved_paths[apps_domain] = domain_file_manager.WriteJsonFile(
+        FILE_MANAGER.USERS_FILE_NAME, domain_users.get(apps_domain, []),
+        overwrite_ok=True)
+  return saved_paths
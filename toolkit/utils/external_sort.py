@@ -0,0 +1,133 @@
+#!/usr/bin/python
+#
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Sort streams of string tuples within a memory budget.
+
+Reports of a large domain aggregate millions of (client_id, scope, user)
+tuples.  ExternalSort() holds tuples in memory until their estimated size
+reaches the budget, then writes them sorted to a temporary run file (one
+tab separated line per tuple) and starts a new run.  The runs are combined
+with a k-way merge (heapq.merge) that holds one line of each run, in passes
+of at most _MAX_MERGE_FAN_IN runs so open files stay bounded too.
+
+Fields must be byte strings without tabs or newlines (e.g. the fields of a
+token snapshot).
+"""
+
+import heapq
+import os
+import shutil
+import sys
+import tempfile
+
+# setup_path required to allow imports from component dirs (e.g. utils)
+# and lib (where the OAuth and Google API Python Client modules reside).
+import setup_path  # pylint: disable=unused-import,g-bad-import-order
+
+import log_utils
+
+
+_MAX_MERGE_FAN_IN = 64  # Runs merged (files open) at once.
+_LIST_SLOT_BYTES = 8  # Pointer held by the in-memory list for each tuple.
+
+
+def _EstimateSize(item):
+  """Bytes held by a tuple of strings (the tuple and its fields)."""
+  return (sys.getsizeof(item) + sum(sys.getsizeof(field) for field in item) +
+          _LIST_SLOT_BYTES)
+
+
+def _WriteRun(items, run_dir, run_number):
+  """Write sorted tuples to a run file; returns its path."""
+  run_path = os.path.join(run_dir, 'run.%d' % run_number)
+  with open(run_path, 'wb') as f:
+    for item in items:
+      f.write('%s\n' % '\t'.join(item))
+  return run_path
+
+
+def _ReadRun(run_path):
+  """Generate the tuples of a run file in order."""
+  with open(run_path, 'rb') as f:
+    for line in f:
+      yield tuple(line.rstrip('\n').split('\t'))
+
+
+def _Unique(items):
+  """Drop repeats of a sorted stream."""
+  previous = None
+  for item in items:
+    if item != previous:
+      yield item
+    previous = item
+
+
+def ExternalSort(items, memory_budget_bytes, unique=False, temp_dir=None):
+  """Sort tuples of strings, spilling sorted runs to disk beyond a budget.
+
+  Args:
+    items: Iterable of tuples of byte strings (same length) to sort.
+    memory_budget_bytes: Int estimated bytes of tuples held in memory before
+                         a run is written to disk.
+    unique: If True equal tuples are produced once.
+    temp_dir: String directory for the run files (removed when done) or None
+              for the system temporary directory.
+
+  Yields:
+    The tuples in sorted order.
+  """
+  run_dir = None
+  run_paths = []
+  buffered_items = []
+  buffered_bytes = 0
+  try:
+    for item in items:
+      buffered_items.append(item)
+      buffered_bytes += _EstimateSize(item)
+      if buffered_bytes < memory_budget_bytes:
+        continue
+      if run_dir is None:
+        run_dir = tempfile.mkdtemp(prefix='sort.', dir=temp_dir)
+      buffered_items.sort()
+      if unique:
+        buffered_items = _Unique(buffered_items)
+      run_paths.append(_WriteRun(buffered_items, run_dir, len(run_paths)))
+      buffered_items = []
+      buffered_bytes = 0
+    buffered_items.sort()
+    if run_paths:
+      log_utils.LogInfo('Sorting %d runs spilled to disk (memory budget of '
+                        '%d bytes).' % (len(run_paths), memory_budget_bytes))
+    run_count = len(run_paths)
+    while len(run_paths) >= _MAX_MERGE_FAN_IN:
+      # Merge the oldest runs into one until the rest can be opened at once.
+      merged_run = heapq.merge(*[_ReadRun(run_path) for run_path
+                                 in run_paths[:_MAX_MERGE_FAN_IN]])
+      merged_path = _WriteRun(_Unique(merged_run) if unique else merged_run,
+                              run_dir, run_count)
+      run_count += 1
+      for run_path in run_paths[:_MAX_MERGE_FAN_IN]:
+        os.remove(run_path)
+      run_paths = run_paths[_MAX_MERGE_FAN_IN:] + [merged_path]
+    sorted_items = heapq.merge(buffered_items,
+                               *[_ReadRun(run_path) for run_path in run_paths])
+    if unique:
+      sorted_items = _Unique(sorted_items)
+    for item in sorted_items:
+      yield item
+  finally:
+    if run_dir is not None:
+      shutil.rmtree(run_dir, ignore_errors=True)
@@ -46,12 +46,36 @@ The version file is never written (only read) while the defaults file
 Working files are generated (automatically) and updated during run-time
 operations.  When running on AppEngine, working files will need a backing store
 other than files.
+
+Working files may optionally be stored compressed (see EnableCompression()).
+A compressed file is stored under the requested name plus a .gz extension in
+the block format of block_gzip.  Callers continue to use the plain names
+(e.g. users.json); reads find whichever variant is present.
+
+Working files are replaced atomically: a file is written under a temporary
+name, flushed to disk (fsync) and renamed over the previous version when
+closed.  A run killed during a checkpoint (e.g. of tokens_issued.json or a
+progress file) leaves the previous checkpoint intact instead of a truncated
+file.  Previous versions may be kept as <name>.1 (newest) to <name>.<n>.
+
+Checkpoints may also be written by a background thread
+(WriteJsonFileInBackground()) so a long scan does not wait on the disk.
+Queued writes are done in order and every other read or write of a file
+waits for them first, so a progress file is never ahead of the data it
+vouches for.  Once a queued write fails the later ones are dropped (a
+progress file is never written after a failed checkpoint) and the error is
+raised by the next queued write or wait.
 """
 
+import atexit
 import csv
+import fnmatch
 import json
 import os
+import Queue
+import shutil
 import sys
+import threading
 import time
 
 # setup_path required to allow imports from component dirs (e.g. utils)
@@ -59,12 +83,196 @@ import time
 import setup_path  # pylint: disable=unused-import,g-bad-import-order
 
 import admin_api_tool_errors
+import block_gzip
 import log_utils
 
 
+# Suffix of the file written before it replaces the requested file.
+_TEMP_FILE_SUFFIX = '.tmp'
+
+
+def _Fsync(filename_path):
+  """Flush a closed file to disk (so a rename never exposes lost data)."""
+  fd = os.open(filename_path, os.O_RDONLY)
+  try:
+    os.fsync(fd)
+  finally:
+    os.close(fd)
+
+
+def _FsyncDirectory(directory_path):
+  """Flush a directory entry (rename) to disk where supported (not Windows)."""
+  try:
+    _Fsync(directory_path)
+  except OSError:
+    pass
+
+
+def _ReplaceFile(source_path, target_path):
+  """Rename a file over another (os.rename cannot replace on Windows)."""
+  try:
+    os.rename(source_path, target_path)
+  except OSError:
+    if not os.path.isfile(target_path):
+      raise
+    os.remove(target_path)
+    os.rename(source_path, target_path)
+
+
+class AtomicFileWriter(object):
+  """File-like writer that replaces the target file only when closed.
+
+  Data is written to <target>.tmp which is flushed to disk and renamed over
+  the target on close() so readers see the previous or the new version,
+  never a partial one.
+  """
+
+  def __init__(self, f, temp_path, filename_path, before_replace_fn=None,
+               after_replace_fn=None):
+    """Wrap a file open on the temporary path.
+
+    Args:
+      f: File-like object open for writing on temp_path.
+      temp_path: String full path of the temporary file.
+      filename_path: String full path of the file to replace.
+      before_replace_fn: If not None, function called before the rename
+                         (e.g. to keep the previous version).
+      after_replace_fn: If not None, function called after the rename
+                        (e.g. to remove a stale variant).
+    """
+    self._file = f
+    self._temp_path = temp_path
+    self._filename_path = filename_path
+    self._before_replace_fn = before_replace_fn
+    self._after_replace_fn = after_replace_fn
+    self._closed = False
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, *args):
+    if exc_type:
+      self.Discard()
+    else:
+      self.close()
+
+  def write(self, data):  # pylint: disable=g-bad-name
+    """Write data to the temporary file."""
+    self._file.write(data)
+
+  def flush(self):  # pylint: disable=g-bad-name
+    """Flush the temporary file."""
+    self._file.flush()
+
+  def Discard(self):
+    """Abandon the write: the target file is left unchanged."""
+    if self._closed:
+      return
+    self._closed = True
+    self._file.close()
+    if os.path.isfile(self._temp_path):
+      os.remove(self._temp_path)
+
+  def close(self):  # pylint: disable=g-bad-name
+    """Flush the temporary file to disk and rename it over the target."""
+    if self._closed:
+      return
+    self._closed = True
+    self._file.close()
+    _Fsync(self._temp_path)
+    if self._before_replace_fn:
+      self._before_replace_fn()
+    _ReplaceFile(self._temp_path, self._filename_path)
+    _FsyncDirectory(os.path.dirname(self._filename_path))
+    if self._after_replace_fn:
+      self._after_replace_fn()
+
+
+class _BackgroundWriter(object):
+  """Does queued writes in order in one daemon thread.
+
+  The first failed write stops the writes: the later ones are dropped and
+  Put() and Wait() raise its error.
+  """
+
+  def __init__(self):
+    self._queue = Queue.Queue()
+    self._thread = None
+    self._lock = threading.Lock()
+    self._error = None  # AdminAPIToolFileError of the first failed write.
+
+  def _Run(self):
+    while True:
+      write_fn, description, discard_fn = self._queue.get()
+      try:
+        if self._error:
+          log_utils.LogError('Not writing %s after a failed write.' %
+                             description)
+          if discard_fn:
+            discard_fn()
+        else:
+          write_fn()
+      except Exception as e:  # pylint: disable=broad-except
+        log_utils.LogError('Unable to write %s.' % description, e)
+        self._error = admin_api_tool_errors.AdminAPIToolFileError(
+            'Unable to write %s (%s).' % (description, e))
+      finally:
+        self._queue.task_done()
+
+  def _RaiseIfFailed(self):
+    """Helper to raise the error of the first failed write."""
+    if self._error:
+      raise self._error  # pylint: disable=raising-bad-type
+
+  def Put(self, write_fn, description, discard_fn=None):
+    """Queue a write.
+
+    Args:
+      write_fn: Function doing the write.
+      description: String naming the write in error messages.
+      discard_fn: If not None, Function called instead of write_fn when the
+                  write is dropped after a failed write.
+
+    Raises:
+      AdminAPIToolFileError: if a queued write failed.
+    """
+    self._RaiseIfFailed()
+    with self._lock:
+      if not self._thread:
+        self._thread = threading.Thread(target=self._Run)
+        # Daemon so a stuck disk cannot hang the exit: the queued writes are
+        # waited for at exit instead.
+        self._thread.daemon = True
+        self._thread.start()
+        atexit.register(self._WaitAtExit)
+    self._queue.put((write_fn, description, discard_fn))
+
+  def Wait(self):
+    """Wait until the queued writes are done (except in the writer thread).
+
+    Raises:
+      AdminAPIToolFileError: if a queued write failed.
+    """
+    if threading.current_thread() is not self._thread:
+      self._queue.join()
+      self._RaiseIfFailed()
+
+  def _WaitAtExit(self):
+    """Wait for the queued writes at exit (their errors are logged)."""
+    try:
+      self.Wait()
+    except admin_api_tool_errors.AdminAPIToolFileError:
+      pass
+
+
+# Shared by all FileManagers: one order for all the queued writes.
+_BACKGROUND_WRITER = _BackgroundWriter()
+
+
 class FileManager(object):
   """Manage local files and provide methods for reading/writing."""
   # Data store tag names:
+  COMPRESSED_FILE_EXTENSION = '.gz'  # Extension of block-compressed files.
   DEFAULT_DOMAIN_FILE_NAME = 'default_domain.json'  # Auto-fills common cmd arg.
   USERS_FILE_NAME = 'users.json'  # List of users in a domain.
   VERSION_FILE_NAME = 'VERSION'  # Contains application/tool version string.
@@ -75,6 +283,181 @@ class FileManager(object):
     self._base_directory = setup_path.APP_BASE_PATH
     self._work_directory = os.path.join(self._base_directory,
                                         FileManager.WORK_ROOT_DIR)
+    self._work_parent_directory = None  # Set by AddWorkDirectory().
+    self._compress_work_files = False
+
+  def EnableCompression(self, enable=True):
+    """Choose to write working files in the block-compressed format.
+
+    Existing files of either format remain readable.  Base files (e.g. the
+    defaults file) are never compressed.
+
+    Args:
+      enable: Boolean, if True subsequent working file writes are compressed.
+    """
+    self._compress_work_files = enable
+
+  def _GetCompressedFileName(self, file_name):
+    """Helper to name the compressed variant of a file."""
+    if file_name.endswith(self.COMPRESSED_FILE_EXTENSION):
+      return file_name
+    return file_name + self.COMPRESSED_FILE_EXTENSION
+
+  def _GetStoredFileName(self, file_name, work_dir=True):
+    """Find the variant (plain or compressed) of a file that is on disk.
+
+    Args:
+      file_name: String name of a file (e.g. users.json).
+      work_dir: Boolean, if True indicates to locate the file under a 'working'
+                folder else locates the file in the base application directory.
+
+    Returns:
+      String name of the stored file: the compressed name if only the
+      compressed variant exists, otherwise file_name.
+    """
+    _BACKGROUND_WRITER.Wait()
+    if os.path.isfile(self.BuildFullPathToFileName(file_name,
+                                                   work_dir=work_dir)):
+      return file_name
+    compressed_file_name = self._GetCompressedFileName(file_name)
+    if os.path.isfile(self.BuildFullPathToFileName(compressed_file_name,
+                                                   work_dir=work_dir)):
+      return compressed_file_name
+    return file_name
+
+  def _IsCompressedFileName(self, file_name):
+    """Helper to decide the format of a file from its extension."""
+    return file_name.endswith(self.COMPRESSED_FILE_EXTENSION)
+
+  def OpenFileForWrite(self, file_name, work_dir=True, keep_previous=0):
+    """Open a plain or compressed file for writing.
+
+    Used directly by callers that stream large files (e.g. line by line)
+    instead of serializing a whole object.  Callers must close() the file
+    which then replaces any previous version (see AtomicFileWriter); Discard()
+    abandons the write.
+
+    Writes compressed if the name has the compressed extension or if
+    compression is enabled for working files.  Any stale variant in the
+    other format is removed so readers never see out-of-date data.
+
+    Args:
+      file_name: String name of a file (e.g. users.json).
+      work_dir: Boolean, if True indicates to locate the file under a 'working'
+                folder else locates the file in the base application directory.
+      keep_previous: Int count of previous versions to keep (<name>.1 is the
+                     newest).  0 keeps none.
+
+    Returns:
+      Tuple of (AtomicFileWriter open for writing, String full path).
+
+    Raises:
+      AdminAPIToolFileError: if unable to open the file for writing.
+    """
+    _BACKGROUND_WRITER.Wait()
+    compressed_file_name = self._GetCompressedFileName(file_name)
+    if self._IsCompressedFileName(file_name) or (
+        work_dir and self._compress_work_files):
+      write_file_name, stale_file_name = compressed_file_name, file_name
+    else:
+      write_file_name, stale_file_name = file_name, compressed_file_name
+    filename_path = self.BuildFullPathToFileName(write_file_name,
+                                                 work_dir=work_dir,
+                                                 create_dir=True)
+    temp_path = filename_path + _TEMP_FILE_SUFFIX
+    try:
+      if self._IsCompressedFileName(write_file_name):
+        f = block_gzip.BlockGzipWriter(temp_path)
+      else:
+        f = open(temp_path, 'wb')
+    except IOError as e:
+      raise admin_api_tool_errors.AdminAPIToolFileError(
+          'Cannot open file %s (%s).' % (filename_path, e))
+
+    def _KeepPrevious():
+      self._RotateFile(file_name, keep_previous, work_dir=work_dir)
+
+    def _RemoveStale():
+      if stale_file_name != write_file_name:
+        self._RemoveStoredFile(stale_file_name, work_dir=work_dir)
+    return (AtomicFileWriter(
+        f, temp_path, filename_path,
+        before_replace_fn=_KeepPrevious if keep_previous > 0 else None,
+        after_replace_fn=_RemoveStale), filename_path)
+
+  def _RotateFile(self, file_name, keep_count, work_dir=True):
+    """Keep the current version of a file as <name>.1 and shift older ones.
+
+    The current version is copied (hard linked) rather than moved so that the
+    file is never missing.
+
+    Args:
+      file_name: String name of a file (e.g. tokens_issued.json).
+      keep_count: Int count of previous versions to keep.
+      work_dir: Boolean, if True indicates to locate the file under a 'working'
+                folder else locates the file in the base application directory.
+    """
+    if not self.FileExists(file_name, work_dir=work_dir):
+      return
+    self.RemoveFile('%s.%d' % (file_name, keep_count), work_dir=work_dir)
+    for generation in xrange(keep_count, 1, -1):
+      self._MoveFile('%s.%d' % (file_name, generation - 1),
+                     '%s.%d' % (file_name, generation), work_dir=work_dir)
+    self._MoveFile(file_name, '%s.1' % file_name, work_dir=work_dir,
+                   keep_source=True)
+
+  def _MoveFile(self, file_name, new_file_name, work_dir=True,
+                keep_source=False):
+    """Rename (or copy) a file in either format.
+
+    Args:
+      file_name: String name of a file (e.g. tokens_issued.json).
+      new_file_name: String new name in the same format.
+      work_dir: Boolean, if True indicates to locate the file under a 'working'
+                folder else locates the file in the base application directory.
+      keep_source: Boolean, if True the file is linked (or copied) instead.
+    """
+    stored_file_name = self._GetStoredFileName(file_name, work_dir=work_dir)
+    filename_path = self.BuildFullPathToFileName(stored_file_name,
+                                                 work_dir=work_dir)
+    if not os.path.isfile(filename_path):
+      return
+    if self._IsCompressedFileName(stored_file_name):
+      new_file_name = self._GetCompressedFileName(new_file_name)
+    new_filename_path = self.BuildFullPathToFileName(new_file_name,
+                                                     work_dir=work_dir)
+    if not keep_source:
+      _ReplaceFile(filename_path, new_filename_path)
+    elif hasattr(os, 'link'):
+      os.link(filename_path, new_filename_path)
+    else:
+      shutil.copyfile(filename_path, new_filename_path)
+
+  def OpenFileForRead(self, file_name, work_dir=True):
+    """Open a plain or compressed file for reading.
+
+    Compressed files are decompressed as they are read.
+
+    Args:
+      file_name: String name of a file (e.g. users.json).
+      work_dir: Boolean, if True indicates to locate the file under a 'working'
+                folder else locates the file in the base application directory.
+
+    Returns:
+      A file-like object open for reading.
+
+    Raises:
+      AdminAPIToolFileError: if unable to locate the file.
+    """
+    stored_file_name = self._GetStoredFileName(file_name, work_dir=work_dir)
+    filename_path = self.BuildFullPathToFileName(stored_file_name,
+                                                 work_dir=work_dir)
+    if not os.path.isfile(filename_path):
+      raise admin_api_tool_errors.AdminAPIToolFileError(
+          'Cannot locate file: %s.' % filename_path)
+    if self._IsCompressedFileName(stored_file_name):
+      return block_gzip.OpenForRead(filename_path)
+    return open(filename_path, 'rb')
 
   def BuildFullPathToFileName(self, file_name, work_dir=True, create_dir=False):
     """Build a full path to a 'base' file or 'work' file.
@@ -105,10 +488,26 @@ class FileManager(object):
                 folder else locates the file in the base application directory.
 
     Returns:
-      True if the file exists else False.
+      True if the file exists (plain or compressed) else False.
     """
-    return os.path.isfile(self.BuildFullPathToFileName(file_name,
-                                                       work_dir=work_dir))
+    return os.path.isfile(self.BuildFullPathToFileName(
+        self._GetStoredFileName(file_name, work_dir=work_dir),
+        work_dir=work_dir))
+
+  def GetStoredFilePath(self, file_name, work_dir=True):
+    """Helper method to locate the variant (plain or compressed) on disk.
+
+    Args:
+      file_name: String name of a file (e.g. users.json).
+      work_dir: Boolean, if True indicates to locate the file under a 'working'
+                folder else locates the file in the base application directory.
+
+    Returns:
+      String full path of the stored file (which may not exist).
+    """
+    return self.BuildFullPathToFileName(
+        self._GetStoredFileName(file_name, work_dir=work_dir),
+        work_dir=work_dir)
 
   def FileTime(self, file_name, work_dir=True):
     """Helper method to retrieve the last modified time of a file.
@@ -121,8 +520,9 @@ class FileManager(object):
     Returns:
       The last modified time of the file converted to a readable String.
     """
-    return time.ctime(os.path.getmtime(
-        self.BuildFullPathToFileName(file_name, work_dir=work_dir)))
+    return time.ctime(os.path.getmtime(self.BuildFullPathToFileName(
+        self._GetStoredFileName(file_name, work_dir=work_dir),
+        work_dir=work_dir)))
 
   def ExitIfCannotOverwriteFile(self, file_name, work_dir=True,
                                 overwrite_ok=False):
@@ -137,7 +537,9 @@ class FileManager(object):
     """
     if self.FileExists(file_name, work_dir=work_dir):
       not_writable_msg = None
-      filename_path = self.BuildFullPathToFileName(file_name, work_dir=work_dir)
+      filename_path = self.BuildFullPathToFileName(
+          self._GetStoredFileName(file_name, work_dir=work_dir),
+          work_dir=work_dir)
       exists_msg = 'Output file (%s) already exists.' % filename_path
       if not os.access(filename_path, os.W_OK):
         not_writable_msg = '%s %s' % (
@@ -156,13 +558,66 @@ class FileManager(object):
     example, work_dir will be set to an apps domain name to allow segregation
     of work files and credential tokens between multiple domains.
 
+    Calling again replaces the leaf rather than nesting another one (e.g. a
+    long-lived process running commands for several domains).
+
     Args:
       new_leaf_dir: String leaf path to locate work files (e.g. mybiz.com).
     """
-    self._work_directory = os.path.join(self._work_directory, new_leaf_dir)
+    if self._work_parent_directory is None:
+      self._work_parent_directory = self._work_directory
+    self._work_directory = os.path.join(self._work_parent_directory,
+                                        new_leaf_dir)
     if not os.path.isdir(self._work_directory):
       os.makedirs(self._work_directory)
 
+  def NewDomainFileManager(self, apps_domain):
+    """Create a FileManager for the working directory of another domain.
+
+    Used to work on several domains at once (each thread with its own
+    FileManager) instead of switching the working directory of one.
+
+    Args:
+      apps_domain: String leaf path to locate work files (e.g. mybiz.com).
+
+    Returns:
+      FileManager sharing the base directory, the working root and the
+      compression setting of this one.
+    """
+    domain_file_manager = FileManager()
+    domain_file_manager._base_directory = self._base_directory
+    domain_file_manager._work_directory = (self._work_parent_directory or
+                                           self._work_directory)
+    domain_file_manager._compress_work_files = self._compress_work_files
+    domain_file_manager.AddWorkDirectory(apps_domain)
+    return domain_file_manager
+
+  def ListFileNames(self, pattern, work_dir=True):
+    """List the names of files matching a shell-style wildcard pattern.
+
+    Compressed files are listed by their plain names (as accepted by the
+    read methods).
+
+    Args:
+      pattern: String pattern (e.g. token_snapshot.*.tsv).
+      work_dir: Boolean, if True indicates to locate the file under a 'working'
+                folder else locates the file in the base application directory.
+
+    Returns:
+      Sorted list of unique String file names.
+    """
+    _BACKGROUND_WRITER.Wait()
+    local_path = self._work_directory if work_dir else self._base_directory
+    if not os.path.isdir(local_path):
+      return []
+    file_names = set()
+    for file_name in os.listdir(local_path):
+      if self._IsCompressedFileName(file_name):
+        file_name = file_name[:-len(self.COMPRESSED_FILE_EXTENSION)]
+      if fnmatch.fnmatch(file_name, pattern):
+        file_names.add(file_name)
+    return sorted(file_names)
+
   def ReadTextFile(self, file_name, work_dir=True):
     """Reads from a text file into a String.
 
@@ -179,12 +634,15 @@ class FileManager(object):
     Raises:
       AdminAPIToolFileError: if unable to open the file for reading.
     """
-    filename_path = self.BuildFullPathToFileName(file_name, work_dir=work_dir)
     if not self.FileExists(file_name, work_dir=work_dir):
       raise admin_api_tool_errors.AdminAPIToolFileError(
-          'Cannot read file %s.' % filename_path)
-    with open(filename_path, 'r') as f:
+          'Cannot read file %s.' % self.BuildFullPathToFileName(
+              file_name, work_dir=work_dir))
+    f = self.OpenFileForRead(file_name, work_dir=work_dir)
+    try:
       return f.read()
+    finally:
+      f.close()
 
   def ReadTextFileToSet(self, file_name):
     """Reads text file lines into a set; each line is an entry.
@@ -219,19 +677,18 @@ class FileManager(object):
       AdminAPIToolFileError: if unable to open the file for reading.
     """
     filename_path = self.BuildFullPathToFileName(file_name, work_dir=work_dir)
-    if not self.FileExists(file_name, work_dir=work_dir):
-      raise admin_api_tool_errors.AdminAPIToolFileError(
-          'Cannot locate file: %s.' % filename_path)
-    with open(filename_path, 'r') as f:
-      try:
-        new_object = json.load(f)
-      except ValueError as e:
-        raise admin_api_tool_errors.AdminAPIToolJsonError(
-            'File (%s) is not valid json (%s).' % (filename_path, e))
-      return new_object
+    f = self.OpenFileForRead(file_name, work_dir=work_dir)
+    try:
+      new_object = json.load(f)
+    except ValueError as e:
+      raise admin_api_tool_errors.AdminAPIToolJsonError(
+          'File (%s) is not valid json (%s).' % (filename_path, e))
+    finally:
+      f.close()
+    return new_object
 
   def WriteJsonFile(self, file_name, content_object, work_dir=True,
-                    overwrite_ok=False):
+                    overwrite_ok=False, keep_previous=0):
     """Writes an object to a json file as a serial string.
 
     Args:
@@ -240,6 +697,8 @@ class FileManager(object):
       work_dir: Boolean, if True indicates to locate the file under a 'working'
                 folder else locates the file in the base application directory.
       overwrite_ok: Boolean that must be True to allow over write of data.
+      keep_previous: Int count of previous versions to keep (<name>.1 is the
+                     newest).  0 keeps none.
 
     Returns:
       String with the fully path'ed file name.
@@ -250,25 +709,79 @@ class FileManager(object):
     """
     self.ExitIfCannotOverwriteFile(file_name, work_dir=work_dir,
                                    overwrite_ok=overwrite_ok)
-    filename_path = self.BuildFullPathToFileName(file_name, work_dir=work_dir,
-                                                 create_dir=True)
-    try:
-      f = open(filename_path, 'w')
-    except IOError as e:
-      raise admin_api_tool_errors.AdminAPIToolFileError(
-          'Cannot open file %s (%s).' % (filename_path, e))
+    f, filename_path = self.OpenFileForWrite(file_name, work_dir=work_dir,
+                                             keep_previous=keep_previous)
+    with f:  # An error (or interrupt) discards the write.
+      try:
+        json.dump(content_object, f)
+      except TypeError as e:
+        raise admin_api_tool_errors.AdminAPIToolJsonError(
+            'Cannot create json file %s (%s).' % (filename_path, e))
+
+    log_utils.LogDebug('Wrote file %s', filename_path)
+    return filename_path
+
+  def WriteJsonFileInBackground(self, file_name, content_object,
+                                work_dir=True, keep_previous=0):
+    """Queue the write of an object to a json file (e.g. a checkpoint).
+
+    The object is serialized before returning (so the caller may keep
+    changing it) and written by a background thread.  An existing file is
+    always overwritten.  Write errors are logged and raised by the next
+    queued write or wait.
+
+    Args:
+      file_name: String name of a file (e.g. tokens_issued.json).
+      content_object: Valid object (usually a dict) to be serialized.
+      work_dir: Boolean, if True indicates to locate the file under a 'working'
+                folder else locates the file in the base application directory.
+      keep_previous: Int count of previous versions to keep (<name>.1 is the
+                     newest).  0 keeps none.
+
+    Returns:
+      String with the fully path'ed file name (written later).
 
+    Raises:
+      AdminAPIToolJsonError: if the object has un-serializable members.
+    """
+    filename_path = self.BuildFullPathToFileName(file_name, work_dir=work_dir)
     try:
-      json.dump(content_object, f)
+      content = json.dumps(content_object)
     except TypeError as e:
       raise admin_api_tool_errors.AdminAPIToolJsonError(
           'Cannot create json file %s (%s).' % (filename_path, e))
-    finally:
-      f.close()
 
-    log_utils.LogDebug('Wrote file %s' % filename_path)
+    def _Write():
+      f, _ = self.OpenFileForWrite(file_name, work_dir=work_dir,
+                                   keep_previous=keep_previous)
+      with f:
+        f.write(content)
+      log_utils.LogDebug('Wrote file %s', filename_path)
+    self.QueueBackgroundWrite(_Write, filename_path)
     return filename_path
 
+  def QueueBackgroundWrite(self, write_fn, description, discard_fn=None):
+    """Queue a write (e.g. of a checkpoint) for the background thread.
+
+    Args:
+      write_fn: Function doing the write with FileManager methods.
+      description: String naming the write in error messages.
+      discard_fn: If not None, Function called instead of write_fn when the
+                  write is dropped because an earlier write failed.
+
+    Raises:
+      AdminAPIToolFileError: if an earlier queued write failed.
+    """
+    _BACKGROUND_WRITER.Put(write_fn, description, discard_fn=discard_fn)
+
+  def WaitForBackgroundWrites(self):
+    """Wait until the queued writes (of all FileManagers) are done.
+
+    Raises:
+      AdminAPIToolFileError: if a queued write failed.
+    """
+    _BACKGROUND_WRITER.Wait()
+
   def ReadCsvFile(self, file_name, work_dir=True, dictreader=False):
     """Read an existing csv file into a list.
 
@@ -286,17 +799,15 @@ class FileManager(object):
     Raises:
       AdminAPIToolFileError: Unable to locate the expected file.
     """
-    filename_path = self.BuildFullPathToFileName(file_name, work_dir=work_dir)
-    if not self.FileExists(file_name, work_dir=work_dir):
-      raise admin_api_tool_errors.AdminAPIToolFileError(
-          'Cannot locate file: %s.' % filename_path)
-    csv_rows = []
-    with open(filename_path, 'rb') as f:
+    f = self.OpenFileForRead(file_name, work_dir=work_dir)
+    try:
       if dictreader:
         csv_reader = csv.DictReader(f)
       else:
         csv_reader = csv.reader(f)
       csv_rows = [csv_row for csv_row in csv_reader]
+    finally:
+      f.close()
     return csv_rows
 
   def WriteCSVFile(self, file_name, data_rows, header=None, work_dir=True,
@@ -319,18 +830,18 @@ class FileManager(object):
     """
     self.ExitIfCannotOverwriteFile(file_name, work_dir=work_dir,
                                    overwrite_ok=overwrite_ok)
-    filename_path = self.BuildFullPathToFileName(file_name, work_dir=work_dir,
-                                                 create_dir=True)
     if not data_rows:
       log_utils.LogWarning('Improperly formed csv rows. File not written: %s' %
-                           filename_path)
+                           self.BuildFullPathToFileName(file_name,
+                                                        work_dir=work_dir))
       return None
-    with open(filename_path, 'wb') as f:
+    f, filename_path = self.OpenFileForWrite(file_name, work_dir=work_dir)
+    with f:
       writer = csv.writer(f)
       if header:
         writer.writerows([header])
       writer.writerows(data_rows)
-    log_utils.LogDebug('Wrote %s' % filename_path)
+    log_utils.LogDebug('Wrote %s', filename_path)
     return filename_path
 
   def RemoveFile(self, file_name, work_dir=True):
@@ -341,11 +852,24 @@ class FileManager(object):
       work_dir: Boolean, if True indicates to locate the file under a 'working'
                 folder else locates the file in the base application directory.
     """
-    if self.FileExists(file_name, work_dir=work_dir):
-      filename_path = self.BuildFullPathToFileName(file_name, work_dir=work_dir)
-      os.remove(filename_path)
+    _BACKGROUND_WRITER.Wait()
+    self._RemoveStoredFile(file_name, work_dir=work_dir)
+    self._RemoveStoredFile(self._GetCompressedFileName(file_name),
+                           work_dir=work_dir)
 
-      log_utils.LogDebug('Removed file %s' % filename_path)
+  def _RemoveStoredFile(self, stored_file_name, work_dir=True):
+    """Removes one variant of a file if it exists.
+
+    Args:
+      stored_file_name: String name of the file as stored on disk.
+      work_dir: Boolean, if True indicates to locate the file under a 'working'
+                folder else locates the file in the base application directory.
+    """
+    filename_path = self.BuildFullPathToFileName(stored_file_name,
+                                                 work_dir=work_dir)
+    if os.path.isfile(filename_path):
+      os.remove(filename_path)
+      log_utils.LogDebug('Removed file %s', filename_path)
 
   def ReadAppVersion(self):
     """Read the application/tool version # from a file.
@@ -383,6 +907,23 @@ class FileManager(object):
       apps_domain = defaults_object.get('apps_domain')
     return apps_domain
 
+  def ReadDefaultCustomerId(self):
+    """Read customer_id from a local defaults data file.
+
+    Returns:
+      customer_id: String id of the owner of the default Apps Domain (and its
+                   secondary domains) or '' if no defaults were saved.
+    """
+    customer_id = ''
+    if self.FileExists(self.DEFAULT_DOMAIN_FILE_NAME, work_dir=False):
+      defaults_object = self.ReadJsonFile(self.DEFAULT_DOMAIN_FILE_NAME,
+                                          work_dir=False)
+      if not defaults_object or 'customer_id' not in defaults_object:
+        raise admin_api_tool_errors.AdminAPIToolJsonError(
+            'Unexpected defaults read!')
+      customer_id = defaults_object.get('customer_id')
+    return customer_id
+
   def WriteDefaults(self, apps_domain, customer_id, overwrite_ok):
     """Write apps_domain and customer_id to a file for later use.
 
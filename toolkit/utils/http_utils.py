@@ -19,6 +19,7 @@ Used for common cracking of the content document returned from a request.
 
 import json
 import random
+import threading
 import time
 import urllib
 
@@ -35,6 +36,47 @@ RETRY_RESPONSE_CODES = [402, 408, 503, 504]
 
 BACKOFF_MAX_RETRIES = 8  # Last retry is 2**8 = 256s
 
+# Services already built, kept by a long-lived process (the toolkitd daemon).
+# None unless EnableServiceCache() has been called, else a dictionary:
+# build arguments (including the http object) -> service object.
+_service_cache = None
+
+
+def EnableServiceCache():
+  """Reuse the services built with the same arguments and http object.
+
+  Building a service fetches and parses the API discovery document.  A
+  long-lived process that reuses its http objects (see
+  auth_helper.EnableHttpPool) can also reuse the services built on them.
+  """
+  global _service_cache  # pylint: disable=global-statement
+  if _service_cache is None:
+    _service_cache = {}
+
+
+def BuildService(*args, **kwargs):
+  """Build an API service object, importing apiclient.discovery on first use.
+
+  Importing discovery is most of a command's import time so the API wrappers
+  defer it until a service is built (commands exiting early on --help or a bad
+  flag never pay for it).
+
+  Args:
+    *args: Positional arguments of apiclient.discovery.build().
+    **kwargs: Keyword arguments of apiclient.discovery.build().
+
+  Returns:
+    apiclient Resource object for the service.
+  """
+  from apiclient import discovery  # pylint: disable=g-import-not-at-top
+  if _service_cache is None:
+    return discovery.build(*args, **kwargs)
+  # http objects hash by identity so each pooled http has its own services.
+  cache_key = (args, tuple(sorted(kwargs.iteritems())))
+  if cache_key not in _service_cache:
+    _service_cache[cache_key] = discovery.build(*args, **kwargs)
+  return _service_cache[cache_key]
+
 
 class Backoff(object):
   """Exponential Backoff class used in conjunction with requests.
@@ -59,6 +101,57 @@ class Backoff(object):
     time.sleep(delay_s)
 
 
+class RateLimiter(object):
+  """Spaces the requests of many threads to stay under one request rate.
+
+  Shared by the http objects of a run (e.g. one per domain scanned
+  concurrently) so that together they stay within the API quota instead of
+  each backing off after exceeding it.
+  """
+
+  def __init__(self, max_qps):
+    """Set the rate.
+
+    Args:
+      max_qps: Float maximum requests per second; 0 or less is no limit.
+    """
+    self._interval_s = 1.0 / max_qps if max_qps > 0 else 0
+    self._next_request_time = 0
+    self._lock = threading.Lock()
+
+  def Wait(self):
+    """Block until the calling thread may issue a request."""
+    if not self._interval_s:
+      return
+    with self._lock:
+      now = time.time()
+      wait_s = self._next_request_time - now
+      self._next_request_time = (max(now, self._next_request_time) +
+                                 self._interval_s)
+    if wait_s > 0:
+      time.sleep(wait_s)
+
+  def Attach(self, http):
+    """Make every request of an http object wait for the rate limiter.
+
+    Wraps http.request the same way oauth2client authorizes an http object.
+
+    Args:
+      http: An (authorized) http interface object.
+
+    Returns:
+      The same http object.
+    """
+    request_fn = http.request
+
+    def _RateLimitedRequest(*args, **kwargs):
+      self.Wait()
+      return request_fn(*args, **kwargs)
+
+    http.request = _RateLimitedRequest
+    return http
+
+
 def FromJsonString(json_string):
   """Helper to safely attempt a conversion from a json string to an object.
 
@@ -91,11 +184,12 @@ def ParseHttpResult(url, response, content):
     If error text is discovered, returns a string with the error text
     otherwise returns an object containing the content.
   """
-  log_utils.LogDebug('----------------------------------------')
-  log_utils.LogDebug('status=%d' % response.status)
-  log_utils.LogDebug('----------------------------------------')
-  log_utils.LogDebug('content=\n%s' % content)
-  log_utils.LogDebug('----------------------------------------')
+  if log_utils.IsDebugEnabled():
+    log_utils.LogDebug('----------------------------------------')
+    log_utils.LogDebug('status=%d', response.status)
+    log_utils.LogDebug('----------------------------------------')
+    log_utils.LogDebug('content=\n%s', content)
+    log_utils.LogDebug('----------------------------------------')
   content = FromJsonString(content)
   if 'error' in content:
     error_text = ['ERROR: status=%d.' % response.status]
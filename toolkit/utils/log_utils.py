@@ -14,11 +14,27 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-"""Common logging setup and utility functions."""
+"""Common logging setup and utility functions.
 
+Log messages take deferred arguments (LogDebug('Got %s.', user_mail)): the
+message is formatted only if its level is enabled, so hot paths pay nothing
+for DEBUG messages unless --verbose is set.
+
+The log file is written by one writer thread: logging calls only queue their
+record, so threads logging in parallel do not wait on file I/O.  Each run
+(process) writes its own rotating log file, named with its start time and
+pid, so parallel runs (e.g. shards) do not share a file.
+"""
+
+import atexit
+import glob
 import logging
+import logging.handlers
 import os
+import Queue
+import sys
 import tempfile
+import threading
 import time
 
 
@@ -28,10 +44,128 @@ import time
 APPINFO = 35  # Higher than WARNING but lower than ERROR.
 APPWARNING = 36  # Higher than APPINFO but lower than ERROR.
 
+# The log file of a run rotates when it reaches LOG_FILE_MAX_BYTES, keeping
+# LOG_FILE_BACKUP_COUNT older parts (.1 is the most recent).
+LOG_FILE_MAX_BYTES = 10 * 1024 * 1024
+LOG_FILE_BACKUP_COUNT = 5
+# Log files of the most recent runs kept: older runs' files are removed when
+# a run starts logging.
+KEPT_RUN_LOG_COUNT = 20
+
+# Console handler added by the first SetupLogging() call.
+_console_handler = None
+# Writer of the log file started by the first SetupLogging() call.
+_log_writer = None
+# Log file name of this run, set by the first GetLogFileName() call.
+_log_file_name = None
+
 
 def GetLogFileName():
-  """Helper to produce the log file name."""
-  return os.path.join(tempfile.gettempdir(), 'cse_api_tool.log')
+  """Helper to produce the log file name of this run.
+
+  Returns:
+    String path in the temp directory, e.g.
+    /tmp/cse_api_tool.20141018-093000.1234.log.
+  """
+  global _log_file_name  # pylint: disable=global-statement
+  if _log_file_name is None:
+    _log_file_name = os.path.join(
+        tempfile.gettempdir(), 'cse_api_tool.%s.%d.log' % (
+            time.strftime('%Y%m%d-%H%M%S'), os.getpid()))
+  return _log_file_name
+
+
+def _PruneRunLogs(log_dir, kept_run_count):
+  """Helper to remove the log files of all but the most recent runs.
+
+  Args:
+    log_dir: String path of the directory of the log files.
+    kept_run_count: Int count of runs (other than this one) whose log files
+                    (with their rotated parts) are kept.
+  """
+  run_log_mtimes = {}
+  for log_path in glob.glob(os.path.join(log_dir, 'cse_api_tool.*.log*')):
+    run_log_path = log_path[:log_path.rindex('.log') + len('.log')]
+    try:
+      mtime = os.path.getmtime(log_path)
+    except OSError:
+      continue  # Removed by another run.
+    run_log_mtimes[run_log_path] = max(mtime,
+                                       run_log_mtimes.get(run_log_path, 0))
+  run_log_mtimes.pop(GetLogFileName(), None)
+  old_run_log_paths = sorted(run_log_mtimes, key=run_log_mtimes.get,
+                             reverse=True)[kept_run_count:]
+  for run_log_path in old_run_log_paths:
+    for log_path in glob.glob(run_log_path + '*'):
+      try:
+        os.remove(log_path)
+      except OSError:
+        pass  # Removed by another run.
+
+
+class _QueueHandler(logging.Handler):
+  """Hands records to a _LogWriter instead of writing them."""
+
+  def __init__(self, log_writer):
+    logging.Handler.__init__(self)
+    self._log_writer = log_writer
+
+  def emit(self, record):
+    try:
+      # Format the message now: its arguments may change before it is written.
+      record.msg = record.getMessage()
+      record.args = None
+      if record.exc_info:
+        record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+      self._log_writer.Put(record)
+    except Exception:  # pylint: disable=broad-except
+      self.handleError(record)
+
+
+class _LogWriter(object):
+  """Writes queued log records in order in one daemon thread."""
+
+  def __init__(self, target_handler):
+    self._target_handler = target_handler
+    self._queue = Queue.Queue()
+    self._thread = threading.Thread(target=self._Run)
+    # Daemon so logging cannot hang the exit: Wait() is registered to run at
+    # exit instead.
+    self._thread.daemon = True
+    self._thread.start()
+    atexit.register(self.Wait)
+
+  def _Run(self):
+    while True:
+      record = self._queue.get()
+      try:
+        self._target_handler.handle(record)
+      finally:
+        self._queue.task_done()
+
+  def Put(self, record):
+    """Queue a record to write."""
+    self._queue.put(record)
+
+  def Wait(self):
+    """Wait until the queued records are written and flushed."""
+    if threading.current_thread() is not self._thread:
+      self._queue.join()
+      self._target_handler.flush()
+
+
+def _NewLogWriter():
+  """Helper to start the writer of the rotating log file of this run."""
+  _PruneRunLogs(os.path.dirname(GetLogFileName()), KEPT_RUN_LOG_COUNT)
+  # delay: runs that log nothing to the file do not create it.
+  file_handler = logging.handlers.RotatingFileHandler(
+      GetLogFileName(), maxBytes=LOG_FILE_MAX_BYTES,
+      backupCount=LOG_FILE_BACKUP_COUNT, delay=True)
+  # Messages include timestamp and messages append to the logfile.
+  file_handler.setFormatter(logging.Formatter(
+      '%(asctime)s %(levelname)-8s %(message)s', datefmt='%Y%m%d %H:%M:%S'))
+  return _LogWriter(file_handler)
 
 
 def SetupLogging(verbose_flag):
@@ -40,12 +174,14 @@ def SetupLogging(verbose_flag):
   Since apiclient discovery uses INFO level (20) for noisy logging of
   URLS, we define a level 35 APPINFO level for normal app info logging.
 
+  May be called again (e.g. for each command run by a long-lived process):
+  the level is updated and console messages go to the current sys.stderr
+  instead of adding another console or file handler.
+
   Args:
     verbose_flag: command line verbose flag.
-
-  Returns:
-    Initialized logger.
   """
+  global _console_handler, _log_writer  # pylint: disable=global-statement
   logging.addLevelName(APPINFO, 'APPINFO')
   logging.addLevelName(APPWARNING, 'APPWARNING')
   if verbose_flag:
@@ -54,64 +190,92 @@ def SetupLogging(verbose_flag):
   else:
     logging_level = APPINFO
 
-  # Setup logging handler to file of DEBUG+ messages. Messages include
-  # timestamp and messages append to the logfile.
-  logging.basicConfig(level=logging_level,
-                      format='%(asctime)s %(levelname)-8s %(message)s',
-                      datefmt='%Y%m%d %H:%M:%S',
-                      filename=GetLogFileName(),
-                      filemode='a')
-
-  # Setup logging handler to console of INFO+ messages.
-  # Use them as PRINT messages.
-  console_handler = logging.StreamHandler()
-  console_handler.setLevel(logging_level)
-  # Set a format which is simpler for console use (no time/date prefix).
-  # We do not use multiple-area logging so we do not:
-  # a) supply a area-string when acquiring a logger
-  # b) show an area-string %(name) in our formatters
-  # c) set a global logger since logging.getLogger('') retrieves the same
-  #    instance across modules.
-  console_formatter = logging.Formatter('%(levelname)-8s %(message)s')
-  # tell the handler to use this format
-  console_handler.setFormatter(console_formatter)
-  # add the handler to the root logger
   logger = logging.getLogger('')
-  logger.addHandler(console_handler)
+  logger.setLevel(logging_level)
+
+  if _log_writer is None:
+    # Setup logging handler to file of DEBUG+ messages, written by the log
+    # writer thread.
+    _log_writer = _NewLogWriter()
+    logger.addHandler(_QueueHandler(_log_writer))
+
+  if _console_handler is None:
+    # Setup logging handler to console of INFO+ messages.
+    # Use them as PRINT messages.
+    _console_handler = logging.StreamHandler()
+    # Set a format which is simpler for console use (no time/date prefix).
+    # We do not use multiple-area logging so we do not:
+    # a) supply a area-string when acquiring a logger
+    # b) show an area-string %(name) in our formatters
+    # c) set a global logger since logging.getLogger('') retrieves the same
+    #    instance across modules.
+    console_formatter = logging.Formatter('%(levelname)-8s %(message)s')
+    # tell the handler to use this format
+    _console_handler.setFormatter(console_formatter)
+    # add the handler to the root logger
+    logger.addHandler(_console_handler)
+  _console_handler.stream = sys.stderr
+  _console_handler.setLevel(logging_level)
+
+
+def FlushLogFile():
+  """Wait until the queued messages are written to the log file."""
+  if _log_writer is not None:
+    _log_writer.Wait()
+
+
+def IsDebugEnabled():
+  """Check if DEBUG messages are logged (e.g. before building a costly one).
+
+  Returns:
+    True if LogDebug() messages are logged (--verbose).
+  """
+  return logging.getLogger('').isEnabledFor(logging.DEBUG)
+
+
+def _Log(level, msg, args):
+  """Helper to log a message, formatting it only if its level is enabled."""
+  logger = logging.getLogger('')
+  if logger.isEnabledFor(level):
+    logger.log(level, msg, *args)
 
 
-def LogDebug(msg):
+def LogDebug(msg, *args):
   """Utility function to log debug messages to users.
 
   Should be used for detailed output that is only useful when working to
-  understand unexpected behaviors.
+  understand unexpected behaviors.  Pass the values as args so hot paths do
+  not format messages that are not logged: LogDebug('Got %s.', user_mail).
 
   Args:
-    msg: String with the message to print/log.
+    msg: String with the message to print/log (a format string if args).
+    *args: Values formatted into msg if the message is logged.
   """
-  logging.getLogger('').debug(msg)
+  _Log(logging.DEBUG, msg, args)
 
 
-def LogInfo(msg):
+def LogInfo(msg, *args):
   """Utility function to log normal messages to users.
 
   Should be used for normal output that will be shown and logged to file.
 
   Args:
-    msg: String with the message to print/log.
+    msg: String with the message to print/log (a format string if args).
+    *args: Values formatted into msg if the message is logged.
   """
-  logging.getLogger('').log(APPINFO, msg)
+  _Log(APPINFO, msg, args)
 
 
-def LogWarning(msg):
+def LogWarning(msg, *args):
   """Utility function to log warning messages to users.
 
   Should be used for warning output that will be shown and logged to file.
 
   Args:
-    msg: String with the message to print/log.
+    msg: String with the message to print/log (a format string if args).
+    *args: Values formatted into msg if the message is logged.
   """
-  logging.getLogger('').log(APPWARNING, msg)
+  _Log(APPWARNING, msg, args)
 
 
 def LogError(msg, error_exception=None):
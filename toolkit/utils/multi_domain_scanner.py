@@ -0,0 +1,217 @@
+#!/usr/bin/python
+#
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Gather the token stats of several domains of a customer in one run.
+
+gather_domain_token_stats.py scans one domain per process: the working
+directory of the domain is held by the FILE_MANAGER singleton.  A customer
+with many secondary domains would run it once per domain, one after the
+other.  The multi-domain scanner instead:
+
+  -gives each domain its own FileManager (working/<domain>) so each domain
+   gets the same users.json and tokens_issued.json as a single-domain run
+   (report_domain_token_status.py -a <domain> reads them),
+  -scans the domains concurrently (--threads),
+  -spaces the requests of all the domains with one shared
+   http_utils.RateLimiter (--max_qps) to stay within the API quota.
+
+Each domain is gathered by user_iterator.RunUserPipeline with its own
+token_report_utils checkpointer, as in a single-domain run: the token stats
+and progress file of a domain are saved every batch of users.  A domain that
+fails (e.g. a token request error) keeps what it saved and --resume
+continues each unfinished domain after its last saved user.
+
+The domains are listed on the command line or, with a customer_id, found by
+one listing of all the customer users (users.list(customer=...)) which are
+grouped by the domain of their email address.  The users list of a domain
+is saved when its scan starts (after the --force checks of the command).
+
+All domains use the credentials of the --apps_domain working directory: one
+admin authorizes for all the domains of the customer.
+"""
+
+import copy
+
+# setup_path required to allow imports from component dirs (e.g. utils)
+# and lib (where the OAuth and Google API Python Client modules reside).
+import setup_path  # pylint: disable=unused-import,g-bad-import-order
+
+from admin_sdk_directory_api import tokens_api
+from admin_sdk_directory_api import users_api
+from utils import auth_helper
+from utils import customer_users
+from utils import file_manager
+from utils import http_utils
+from utils import log_utils
+from utils import parallel_utils
+from utils import token_report_utils
+from utils import user_iterator
+
+
+FILE_MANAGER = file_manager.FILE_MANAGER
+
+
+class MultiDomainScanner(object):
+  """Gathers the token stats of several domains concurrently."""
+
+  def __init__(self, flags):
+    """Note the options of the run.
+
+    Args:
+      flags: Argparse flags object with apps_domain, apps_domains,
+             customer_id, threads, max_qps, first_n, refresh_users and resume.
+    """
+    self._flags = flags
+    self._rate_limiter = http_utils.RateLimiter(flags.max_qps)
+    self._domain_users = None  # Users of the customer_id by domain.
+
+  def _NewApiWrappers(self):
+    """Build the API wrappers of a thread on its own rate limited http."""
+    http = self._rate_limiter.Attach(
+        auth_helper.GetAuthorizedHttp(self._flags))
+    return users_api.UsersApiWrapper(http), tokens_api.TokensApiWrapper(http)
+
+  def PlanDomains(self):
+    """Choose the domains to scan and give each its own FileManager.
+
+    With a customer_id, lists all the customer users once; nothing is saved
+    until the domains are scanned.
+
+    Returns:
+      List of 2-tuples (String domain, FileManager) sorted by domain.
+    """
+    apps_domains = [d.lower() for d in self._flags.apps_domains or []]
+    if self._flags.customer_id:
+      users_wrapper, _ = self._NewApiWrappers()
+      self._domain_users = customer_users.ListCustomerUsers(
+          users_wrapper, self._flags.customer_id)
+      # Requested domains without users get an empty users list.
+      apps_domains = apps_domains or self._domain_users.keys()
+    return [(d, FILE_MANAGER.NewDomainFileManager(d))
+            for d in sorted(set(apps_domains))]
+
+  def _SaveUsersList(self, users_wrapper, apps_domain, domain_file_manager):
+    """Save the users list of a domain unless the saved one is used."""
+    users_file_name = FILE_MANAGER.USERS_FILE_NAME
+    if self._domain_users is not None:
+      users_list = self._domain_users.get(apps_domain, [])
+    elif (self._flags.refresh_users or
+          not domain_file_manager.FileExists(users_file_name)):
+      users_list = users_wrapper.GetDomainUsers(apps_domain)
+    else:
+      return
+    domain_file_manager.WriteJsonFile(users_file_name, users_list,
+                                      overwrite_ok=True)
+
+  def _GetDomainFlags(self, apps_domain, resume):
+    """Copy the flags for the user pipeline of one domain."""
+    domain_flags = copy.copy(self._flags)
+    domain_flags.apps_domain = apps_domain
+    domain_flags.resume = resume
+    domain_flags.shard = None
+    domain_flags.customer_listing = False
+    domain_flags.listing_threads = 1
+    return domain_flags
+
+  def _ScanDomain(self, api_wrappers, plan):
+    """Gather the token stats of one domain (in a worker thread).
+
+    Args:
+      api_wrappers: 2-tuple (UsersApiWrapper, TokensApiWrapper) of the thread.
+      plan: 2-tuple (String domain, FileManager) from PlanDomains().
+
+    Returns:
+      2-tuple (Int count of users checked by this run, String path of the
+      token stats).
+
+    Raises:
+      AdminAPIToolResumeError: if the domain cannot be resumed.
+    """
+    users_wrapper, tokens_wrapper = api_wrappers
+    apps_domain, domain_file_manager = plan
+    prefix = token_report_utils.TOKEN_COLLECTION_PREFIX
+    tokens_file_name = token_report_utils.TOKENS_ISSUED_FILE_NAME
+    resume = self._flags.resume and user_iterator.IsIterationInProgress(
+        prefix, domain_file_manager=domain_file_manager)
+    if resume:
+      # The saved users list is kept: the progress file refers to it.
+      users_list = domain_file_manager.ReadJsonFile(
+          FILE_MANAGER.USERS_FILE_NAME)
+      domain_flags = self._GetDomainFlags(apps_domain, resume)
+      # Raised here: the pipeline would exit the whole run.
+      user_iterator.CheckResumable(users_list, len(users_list), prefix,
+                                   domain_flags,
+                                   domain_file_manager=domain_file_manager)
+      token_stats = domain_file_manager.ReadJsonFile(tokens_file_name)
+      log_utils.LogInfo('%s: resuming.' % apps_domain)
+    elif self._flags.resume and domain_file_manager.FileExists(
+        tokens_file_name):
+      log_utils.LogInfo('%s: already gathered.' % apps_domain)
+      return 0, domain_file_manager.BuildFullPathToFileName(tokens_file_name)
+    else:
+      self._SaveUsersList(users_wrapper, apps_domain, domain_file_manager)
+      domain_flags = self._GetDomainFlags(apps_domain, resume)
+      token_stats = {}
+      domain_file_manager.WriteJsonFile(tokens_file_name, token_stats,
+                                        overwrite_ok=True)
+    tokens_checkpointer = token_report_utils.NewTokensIssuedCheckpointer(
+        token_stats, domain_file_manager=domain_file_manager)
+    counts = {'users': 0}
+
+    def _FetchUserTokens(unused_thread_state, user):
+      return tokens_wrapper.GetTokensForUser(user[1])
+
+    def _SinkUserTokens(user, token_list):
+      tokens_checkpointer.Add(
+          (user[0], [],
+           [token_report_utils.PackStatKey(token['clientId'], scope)
+            for token in token_list for scope in token['scopes']]))
+      counts['users'] += 1
+
+    try:
+      # The users list is saved: the pipeline only reads it (no http).
+      user_iterator.RunUserPipeline(
+          None, prefix, domain_flags, _FetchUserTokens, _SinkUserTokens,
+          checkpoint_fn=tokens_checkpointer.Checkpoint,
+          domain_file_manager=domain_file_manager)
+    finally:
+      filename_path = tokens_checkpointer.Close()
+    return counts['users'], filename_path
+
+  def Run(self, plans):
+    """Scan the planned domains concurrently.
+
+    Args:
+      plans: List of 2-tuples (String domain, FileManager) from PlanDomains().
+
+    Returns:
+      List of 4-tuples (String domain, Int count of users checked or None,
+      String path of the token stats or None, Exception or None) sorted by
+      domain.
+    """
+    results = []
+    for plan, result, error in parallel_utils.RunInParallel(
+        plans, self._ScanDomain, self._flags.threads,
+        thread_init_fn=self._NewApiWrappers):
+      apps_domain = plan[0]
+      if error:
+        log_utils.LogError('Unable to gather the tokens of %s.' % apps_domain,
+                           error)
+        results.append((apps_domain, None, None, error))
+      else:
+        log_utils.LogInfo('%s: done.' % apps_domain)
+        results.append((apps_domain, result[0], result[1], None))
+    return sorted(results, key=lambda r: r[0])
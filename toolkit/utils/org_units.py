@@ -0,0 +1,148 @@
+#!/usr/bin/python
+#
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Roll up user counts over the tree of organizational units.
+
+The users of an org unit are counted once (self counts, one pass over the
+users list) and then added to the org unit and each of its parents (subtree
+counts): /Sales/East counts towards /Sales/East, /Sales and /.  The rollup
+costs one walk up the tree per org unit, not per user, and parents without
+users of their own (e.g. /Sales with only sub-units) are still reported.
+"""
+
+# setup_path required to allow imports from component dirs (e.g. utils)
+# and lib (where the OAuth and Google API Python Client modules reside).
+import setup_path  # pylint: disable=unused-import,g-bad-import-order
+
+import vector_aggregation
+
+
+ORG_UNIT_FIELD_INDEX = 3  # (email, id, full_name, orgUnitPath, suspended).
+SUSPENDED_FIELD_INDEX = 4
+ROOT_ORG_UNIT = '/'
+
+
+def NormalizeOrgUnitPath(org_unit_path):
+  """Helper to spell an org unit path the same way (e.g. /Sales/ -> /Sales).
+
+  Args:
+    org_unit_path: String org unit path (a missing path is the root).
+
+  Returns:
+    String path starting with / and without a trailing /.
+  """
+  return '/' + (org_unit_path or '').strip('/')
+
+
+def GetParentOrgUnit(org_unit_path):
+  """Helper to find the parent of a normalized org unit path.
+
+  Args:
+    org_unit_path: String normalized path (e.g. /Sales/East).
+
+  Returns:
+    String path of the parent (e.g. /Sales) or None for the root.
+  """
+  if org_unit_path == ROOT_ORG_UNIT:
+    return None
+  return org_unit_path.rsplit('/', 1)[0] or ROOT_ORG_UNIT
+
+
+def GetOrgUnitDepth(org_unit_path):
+  """Helper to count the levels of a normalized path below the root (0)."""
+  if org_unit_path == ROOT_ORG_UNIT:
+    return 0
+  return org_unit_path.count('/')
+
+
+def HasOrgUnits(user_list):
+  """Check that a users list holds the org unit and state of its users.
+
+  Args:
+    user_list: List of user tuples of the users list.
+
+  Returns:
+    True if the users were saved with ls_users.py --json --org_units.
+  """
+  return bool(user_list) and len(user_list[0]) > SUSPENDED_FIELD_INDEX
+
+
+class OrgUnitRollup(object):
+  """Self and subtree counts of active and suspended users per org unit."""
+
+  def __init__(self):
+    # Org unit path -> [self active, self suspended, subtree active,
+    #                   subtree suspended].
+    self._counts = {}
+
+  def AddCounts(self, org_unit_path, active, suspended):
+    """Add the users of an org unit to it and to its parents.
+
+    Args:
+      org_unit_path: String org unit path.
+      active: Int count of active users in the org unit itself.
+      suspended: Int count of suspended users in the org unit itself.
+    """
+    org_unit_path = NormalizeOrgUnitPath(org_unit_path)
+    counts = self._counts.setdefault(org_unit_path, [0, 0, 0, 0])
+    counts[0] += active
+    counts[1] += suspended
+    while org_unit_path is not None:
+      counts = self._counts.setdefault(org_unit_path, [0, 0, 0, 0])
+      counts[2] += active
+      counts[3] += suspended
+      org_unit_path = GetParentOrgUnit(org_unit_path)
+
+  def AddUsers(self, user_list):
+    """Count the users of a users list saved with their org units.
+
+    Args:
+      user_list: List of user tuples (email, id, full_name, orgUnitPath,
+                 suspended).
+    """
+    active_counter, suspended_counter = vector_aggregation.CountOrgUnitUsers(
+        [(NormalizeOrgUnitPath(user[ORG_UNIT_FIELD_INDEX]),
+          user[SUSPENDED_FIELD_INDEX] is True) for user in user_list])
+    for org_unit_path in (set(active_counter.data) |
+                          set(suspended_counter.data)):
+      self.AddCounts(org_unit_path,
+                     active_counter.data.get(org_unit_path, 0),
+                     suspended_counter.data.get(org_unit_path, 0))
+
+  def GetRows(self, root=ROOT_ORG_UNIT, depth=None):
+    """List the counts of the org units of a subtree.
+
+    Args:
+      root: String path of the org unit at the top of the subtree.
+      depth: If not None, Int count of levels below the root to include
+             (0 lists only the root).
+
+    Returns:
+      List of tuples (org unit path, #active, #suspended, #subtree active,
+      #subtree suspended) ordered by path.
+    """
+    root = NormalizeOrgUnitPath(root)
+    root_depth = GetOrgUnitDepth(root)
+    rows = []
+    for org_unit_path, counts in self._counts.iteritems():
+      if root != ROOT_ORG_UNIT and not (
+          org_unit_path == root or org_unit_path.startswith(root + '/')):
+        continue
+      if (depth is not None and
+          GetOrgUnitDepth(org_unit_path) - root_depth > depth):
+        continue
+      rows.append((org_unit_path,) + tuple(counts))
+    return sorted(rows)
@@ -0,0 +1,228 @@
+#!/usr/bin/python
+#
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""List the users of a domain by paging email prefix partitions concurrently.
+
+users.list() pages through nextPageToken: page n+1 cannot be requested before
+page n returns, so listing 300k users (600 pages) takes 600 round trips one
+after the other.  Instead the domain is split into partitions that are
+listed independently and concurrently:
+
+  -each partition is an email prefix query (query='email:ab*'),
+  -the first partitions are the first characters of a username; a partition
+   whose first page is full is split into one partition per next character
+   (so a skewed domain, e.g. 80% of users starting with 'u', is split where
+   its users are), down to _MAX_PREFIX_LENGTH characters after which the
+   partition is paged normally,
+  -with a previous users list (users.json), prefixes that held more than a
+   page of users start split, which saves the first page of each split,
+  -the users of all partitions are merged, deduplicated by user id (a user
+   is listed once per matching partition, e.g. by an alias) and sorted by
+   email.
+
+Partitions cover all users because Google Apps usernames only use the
+characters of _USERNAME_CHARS.  orgUnitPath partitions were not used because
+orgUnitPath queries match a whole subtree: users of the root org unit cannot
+be listed without listing everyone.
+"""
+
+# setup_path required to allow imports from component dirs (e.g. utils)
+# and lib (where the OAuth and Google API Python Client modules reside).
+import setup_path  # pylint: disable=unused-import,g-bad-import-order
+
+from admin_sdk_directory_api import users_api
+from utils import auth_helper
+from utils import log_utils
+from utils import parallel_utils
+
+
+# The characters of Google Apps usernames (email addresses are lower case).
+_USERNAME_CHARS = "'-._0123456789abcdefghijklmnopqrstuvwxyz"
+# Matches the user whose username is the prefix itself (e.g. 'ab@*').
+_END_OF_USERNAME = '@'
+# Longer prefixes are paged: further splits would cost more than they save.
+_MAX_PREFIX_LENGTH = 3
+# users.list() maximum page size: a partition of one page is one request.
+_MAX_PAGE = 500
+
+
+def _CanSplit(prefix):
+  """True if the partition of prefix may be split into longer prefixes."""
+  return (len(prefix) < _MAX_PREFIX_LENGTH and
+          not prefix.endswith(_END_OF_USERNAME))
+
+
+def _ChildPrefixes(prefix):
+  """List the prefixes partitioning the users of prefix.
+
+  Args:
+    prefix: String email prefix ('' for the whole domain).
+
+  Returns:
+    List of String prefixes one character longer.
+  """
+  next_chars = _USERNAME_CHARS
+  if prefix:
+    next_chars = _END_OF_USERNAME + next_chars
+  return [prefix + next_char for next_char in next_chars]
+
+
+def PlanPrefixes(previous_users_list=None, max_page=_MAX_PAGE):
+  """Choose the first partitions from the sizes seen in a previous list.
+
+  Args:
+    previous_users_list: If not None, List of user tuples (email, id, name)
+                         e.g. an earlier users.json.
+    max_page: Int users per page: larger prefixes start split.
+
+  Returns:
+    List of String email prefixes covering all the users.
+  """
+  prefix_counts = {}
+  for user in previous_users_list or []:
+    email = user[0].lower()
+    for prefix_length in xrange(1, _MAX_PREFIX_LENGTH):
+      prefix = email[:prefix_length]
+      prefix_counts[prefix] = prefix_counts.get(prefix, 0) + 1
+
+  def _Plan(prefix):
+    prefixes = []
+    for child in _ChildPrefixes(prefix):
+      if _CanSplit(child) and prefix_counts.get(child, 0) > max_page:
+        prefixes.extend(_Plan(child))
+      else:
+        prefixes.append(child)
+    return prefixes
+  return _Plan('')
+
+
+class PartitionedUserLister(object):
+  """Lists the users of a domain with concurrent partition queries."""
+
+  def __init__(self, new_api_wrapper_fn, thread_count, max_page=_MAX_PAGE):
+    """Note the options of the listing.
+
+    Args:
+      new_api_wrapper_fn: Function returning a UsersApiWrapper with its own
+                          http object (one per thread).
+      thread_count: Int count of partitions listed at once.
+      max_page: Int users per page (1-500).
+    """
+    self._new_api_wrapper_fn = new_api_wrapper_fn
+    self._thread_count = thread_count
+    self._max_page = max_page
+    # Wrappers are reused by the threads of each round of partitions.
+    self._api_wrappers = []
+
+  def _GetApiWrapper(self):
+    """Reuse an idle wrapper of a previous round or build a new one."""
+    if self._api_wrappers:
+      return self._api_wrappers.pop()
+    return self._new_api_wrapper_fn()
+
+  def _ListPartition(self, api_wrapper, apps_domain, prefix):
+    """List the users of one partition (in a worker thread).
+
+    Args:
+      api_wrapper: UsersApiWrapper of the thread.
+      apps_domain: Users apps domain e.g. mybiz.com.
+      prefix: String email prefix of the partition.
+
+    Returns:
+      2-tuple (List of user tuples, Boolean True if the partition has more
+      users than listed and must be split).
+    """
+    query_filter = 'email:%s*' % prefix
+    users_list, page_token = api_wrapper.GetDomainUsersPage(
+        apps_domain, max_page=self._max_page, query_filter=query_filter)
+    if page_token and _CanSplit(prefix):
+      return users_list, True
+    while page_token:
+      users_page, page_token = api_wrapper.GetDomainUsersPage(
+          apps_domain, max_page=self._max_page, query_filter=query_filter,
+          page_token=page_token)
+      users_list.extend(users_page)
+    return users_list, False
+
+  def ListDomainUsers(self, apps_domain, previous_users_list=None):
+    """List all the users of a domain.
+
+    Args:
+      apps_domain: Users apps domain e.g. mybiz.com.
+      previous_users_list: If not None, List of user tuples of an earlier
+                           listing used to plan the partitions.
+
+    Returns:
+      List of user tuples (email, id, full_name) sorted by email.
+
+    Raises:
+      AdminAPIToolUserError (or the error of any failed partition): the
+      listing would be incomplete.
+    """
+    prefixes = PlanPrefixes(previous_users_list, max_page=self._max_page)
+    users_by_id = {}
+    partition_count = 0
+    while prefixes:
+      partition_count += len(prefixes)
+      thread_states = []
+
+      def _NewThreadState():
+        api_wrapper = self._GetApiWrapper()
+        thread_states.append(api_wrapper)
+        return api_wrapper
+
+      split_prefixes = []
+      first_error = None
+      for prefix, result, error in parallel_utils.RunInParallel(
+          prefixes,
+          lambda api_wrapper, p: self._ListPartition(api_wrapper,
+                                                     apps_domain, p),
+          self._thread_count, thread_init_fn=_NewThreadState):
+        if error:
+          first_error = first_error or error
+          continue
+        users_list, must_split = result
+        for user in users_list:
+          users_by_id[user[1]] = user
+        if must_split:
+          split_prefixes.extend(_ChildPrefixes(prefix))
+      self._api_wrappers.extend(thread_states)
+      if first_error:
+        raise first_error  # pylint: disable=raising-bad-type
+      log_utils.LogDebug('Listed %d partitions, %d users so far.',
+                         partition_count, len(users_by_id))
+      prefixes = split_prefixes
+    log_utils.LogInfo('Found %d users in %d partitions.' % (
+        len(users_by_id), partition_count))
+    return sorted(users_by_id.itervalues(), key=lambda u: u[0].lower())
+
+
+def ListDomainUsers(flags, previous_users_list=None):
+  """List the users of flags.apps_domain with flags.listing_threads threads.
+
+  Args:
+    flags: Argparse flags object with apps_domain and listing_threads.
+    previous_users_list: If not None, List of user tuples of an earlier
+                         listing used to plan the partitions.
+
+  Returns:
+    List of user tuples (email, id, full_name) sorted by email.
+  """
+  def _NewApiWrapper():
+    return users_api.UsersApiWrapper(auth_helper.GetAuthorizedHttp(flags))
+  lister = PartitionedUserLister(_NewApiWrapper, flags.listing_threads)
+  return lister.ListDomainUsers(flags.apps_domain,
+                                previous_users_list=previous_users_list)
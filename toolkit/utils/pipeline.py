@@ -0,0 +1,294 @@
+#!/usr/bin/python
+#
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Staged pipeline for commands that issue one API request per item.
+
+Domain-wide commands (gather_domain_token_stats.py,
+revoke_tokens_for_domain_clientid.py, report_plus_domains_users.py) all:
+
+  source     ->  fetch          ->  transform     ->  sink
+  (users)        (API request,      (e.g. build       (e.g. update the
+                 concurrent)        stat keys)        results, checkpoint)
+
+A Pipeline runs the source in a feeder thread and the fetches in worker
+threads, connected by bounded queues: at most a window of items is in flight
+so a fast source (or a slow sink) holds the other stages back instead of
+filling memory.  The transform and sink run in the calling thread: they
+usually update results that are not shared between threads and may handle
+signals (checkpointer.Checkpointer).
+
+  -ordered (default): items reach the sink in source order (completed
+   fetches wait in a reorder buffer),
+  -unordered: items reach the sink as their fetch completes (for sinks that
+   may safely see an item again after a --resume, e.g. revocations).
+
+Either way progress_fn is given the count of source items whose sink has
+completed with no gap: a resumable run saves that count (never an item still
+in flight).  With one thread everything runs in the calling thread.
+
+Each stage keeps metrics (StageMetrics) to show where a long run spends its
+time.
+"""
+
+import Queue
+import sys
+import threading
+import time
+
+
+_DEFAULT_QUEUE_ITEMS_PER_THREAD = 2
+_QUEUE_POLL_S = 1  # Keeps waits interruptible by KeyboardInterrupt.
+_SOURCE_DONE = object()  # Queued after the last item of the source.
+# Queued by a thread stopped by an exception fetch_fn does not return as an
+# error (e.g. SystemExit): re-raised in the calling thread.
+_THREAD_FAILED = object()
+
+
+class StageMetrics(object):
+  """Counts and times of one stage."""
+
+  def __init__(self, name, thread_count=1):
+    self.name = name
+    self.thread_count = thread_count
+    self.items = 0
+    self.errors = 0
+    self.busy_s = 0.0  # Time spent in the stage function (all threads).
+    self.blocked_s = 0.0  # Time waiting for downstream stages (backpressure).
+    self.max_queued = 0  # Largest count of items waiting for the stage.
+
+  def Format(self):
+    """Returns a one line summary of the metrics."""
+    return ('%-9s %2d thread(s) %7d items %5d errors  busy %8.1fs  '
+            'blocked %7.1fs  max queued %d' % (
+                self.name, self.thread_count, self.items, self.errors,
+                self.busy_s, self.blocked_s, self.max_queued))
+
+
+class Pipeline(object):
+  """Source -> concurrent fetch -> transform -> sink over bounded queues."""
+
+  def __init__(self, fetch_fn, sink_fn, transform_fn=None, error_fn=None,
+               thread_count=1, thread_init_fn=None, ordered=True,
+               queue_size=None):
+    """Set up the stages.
+
+    Args:
+      fetch_fn: Function taking (thread_state, item) returning a result (e.g.
+                an API request).  Runs in the worker threads.
+      sink_fn: Function taking (item, value) (e.g. update the results).
+      transform_fn: If not None, function taking (item, result) returning the
+                    value given to sink_fn (else the result is).
+      error_fn: If not None, function taking (item, error) called (in the
+                calling thread, in sink order) for a failed fetch; it may
+                raise or exit to stop the run.  If None the error is raised.
+      thread_count: Int count of fetch threads.
+      thread_init_fn: If not None, function returning the state passed to
+                      fetch_fn for each thread (e.g. an API wrapper with its
+                      own http object).  Called once per thread.
+      ordered: If True items reach the sink in source order else in order of
+               completion.
+      queue_size: Int count of items queued for the fetch threads (default 2
+                  per thread).  At most queue_size + thread_count items are
+                  in flight.
+    """
+    self._fetch_fn = fetch_fn
+    self._sink_fn = sink_fn
+    self._transform_fn = transform_fn
+    self._error_fn = error_fn
+    self._thread_count = max(1, thread_count)
+    self._thread_init_fn = thread_init_fn
+    self._ordered = ordered
+    self._queue_size = queue_size or (self._thread_count *
+                                      _DEFAULT_QUEUE_ITEMS_PER_THREAD)
+    self.source_metrics = StageMetrics('source')
+    self.fetch_metrics = StageMetrics('fetch', self._thread_count)
+    self.transform_metrics = StageMetrics('transform')
+    self.sink_metrics = StageMetrics('sink')
+    self._metrics_lock = threading.Lock()  # Fetch metrics of all threads.
+
+  def GetMetrics(self):
+    """Returns the StageMetrics of each stage in pipeline order."""
+    return [self.source_metrics, self.fetch_metrics, self.transform_metrics,
+            self.sink_metrics]
+
+  def _Fetch(self, thread_state, item):
+    """Returns (result, error) of fetch_fn; updates the fetch metrics."""
+    start_time = time.time()
+    result, error = None, None
+    try:
+      result = self._fetch_fn(thread_state, item)
+    except Exception as e:  # pylint: disable=broad-except
+      error = e
+    with self._metrics_lock:
+      self.fetch_metrics.items += 1
+      self.fetch_metrics.busy_s += time.time() - start_time
+      if error:
+        self.fetch_metrics.errors += 1
+    return result, error
+
+  def _Sink(self, item, result, error):
+    """Run transform and sink (or error_fn) for a fetched item."""
+    if error:
+      if not self._error_fn:
+        raise error
+      self._error_fn(item, error)
+      return
+    if self._transform_fn:
+      start_time = time.time()
+      result = self._transform_fn(item, result)
+      self.transform_metrics.items += 1
+      self.transform_metrics.busy_s += time.time() - start_time
+    start_time = time.time()
+    self._sink_fn(item, result)
+    self.sink_metrics.items += 1
+    self.sink_metrics.busy_s += time.time() - start_time
+
+  def Run(self, source, progress_fn=None, stop_fn=None):
+    """Process every item of the source.
+
+    Args:
+      source: Iterable of items (read from a feeder thread).
+      progress_fn: If not None, function taking the Int count of source items
+                   sunk with no gap from the first one.  Called in the
+                   calling thread each time that count grows (after the
+                   sink, before stop_fn).
+      stop_fn: If not None, function returning True to stop the run early
+               (e.g. a signal was caught).  Checked after each sink.
+
+    Returns:
+      True if all items were processed, False if stopped by stop_fn.
+    """
+    if self._thread_count == 1:
+      return self._RunInCallingThread(source, progress_fn, stop_fn)
+    return self._RunInThreads(source, progress_fn, stop_fn)
+
+  def _RunInCallingThread(self, source, progress_fn, stop_fn):
+    thread_state = self._thread_init_fn() if self._thread_init_fn else None
+    count_done = 0
+    for item in source:
+      self.source_metrics.items += 1
+      result, error = self._Fetch(thread_state, item)
+      self._Sink(item, result, error)
+      count_done += 1
+      if progress_fn:
+        progress_fn(count_done)
+      if stop_fn and stop_fn():
+        return False
+    return True
+
+  def _RunInThreads(self, source, progress_fn, stop_fn):
+    # States are built before the threads start (see parallel_utils).
+    thread_states = [self._thread_init_fn() if self._thread_init_fn else None
+                     for _ in xrange(self._thread_count)]
+    fetch_queue = Queue.Queue(maxsize=self._queue_size)
+    result_queue = Queue.Queue()  # Bounded by the window.
+    # One slot per item in flight: released when the item is sunk.
+    window = threading.Semaphore(self._queue_size + self._thread_count)
+    stop_event = threading.Event()
+
+    def _PutUnlessStopped(item):
+      """Queue an item for the workers; returns False if the run stopped."""
+      while not stop_event.is_set():
+        try:
+          fetch_queue.put(item, timeout=_QUEUE_POLL_S)
+          return True
+        except Queue.Full:
+          continue
+      return False
+
+    def _Feeder():
+      count = 0
+      try:
+        for item in source:
+          start_time = time.time()
+          window.acquire()
+          if not _PutUnlessStopped((count, item)):
+            return
+          self.source_metrics.blocked_s += time.time() - start_time
+          self.source_metrics.items += 1
+          self.fetch_metrics.max_queued = max(self.fetch_metrics.max_queued,
+                                              fetch_queue.qsize())
+          count += 1
+      except BaseException:  # pylint: disable=broad-except
+        result_queue.put((_THREAD_FAILED, None, sys.exc_info()))
+        return
+      result_queue.put((_SOURCE_DONE, count, None))
+
+    def _Worker(thread_state):
+      while not stop_event.is_set():
+        try:
+          sequence, item = fetch_queue.get(timeout=_QUEUE_POLL_S)
+        except Queue.Empty:
+          continue
+        try:
+          result, error = self._Fetch(thread_state, item)
+        except BaseException:  # pylint: disable=broad-except
+          # Not an error of the item (e.g. sys.exit() in fetch_fn): stop.
+          result_queue.put((_THREAD_FAILED, item, sys.exc_info()))
+          return
+        result_queue.put((sequence, item, (result, error)))
+
+    threads = [threading.Thread(target=_Feeder)]
+    threads.extend(threading.Thread(target=_Worker, args=(thread_state,))
+                   for thread_state in thread_states)
+    for thread in threads:
+      # Daemon threads so that an interrupted run (Ctrl-C) exits promptly.
+      thread.daemon = True
+      thread.start()
+
+    source_count = None
+    count_done = 0
+    pending = {}  # Sequence -> (item, (result, error)) waiting for the sink.
+    sunk_sequences = set()  # Sunk after a sequence still in flight.
+    try:
+      while source_count is None or count_done < source_count:
+        try:
+          sequence, item, outcome = result_queue.get(timeout=_QUEUE_POLL_S)
+        except Queue.Empty:
+          continue
+        if sequence is _THREAD_FAILED:
+          # Re-raised with the traceback of the failed thread.
+          raise outcome[0], outcome[1], outcome[2]
+        if sequence is _SOURCE_DONE:
+          source_count = item
+          continue
+        pending[sequence] = (item, outcome)
+        self.sink_metrics.max_queued = max(self.sink_metrics.max_queued,
+                                           len(pending))
+        if self._ordered:
+          ready_sequences = []
+          while count_done + len(ready_sequences) in pending:
+            ready_sequences.append(count_done + len(ready_sequences))
+        else:
+          ready_sequences = [sequence]
+        for ready_sequence in ready_sequences:
+          ready_item, (result, error) = pending.pop(ready_sequence)
+          self._Sink(ready_item, result, error)
+          window.release()
+          # The low watermark: every item before count_done is sunk.
+          previous_count_done = count_done
+          sunk_sequences.add(ready_sequence)
+          while count_done in sunk_sequences:
+            sunk_sequences.remove(count_done)
+            count_done += 1
+          if progress_fn and count_done > previous_count_done:
+            progress_fn(count_done)
+          if stop_fn and stop_fn():
+            return False
+      return True
+    finally:
+      stop_event.set()
+      window.release()  # Wake the feeder if it waits for a slot.
@@ -0,0 +1,161 @@
+#!/usr/bin/python
+#
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Match client_ids or scopes against the rules of a black list file.
+
+Each line of a black list file is one rule:
+
+  twitter.com                         exact: the whole value.
+  https://www.googleapis.com/auth/*   prefix: values starting with the text
+                                      before the trailing '*'.
+  re:\\d+\\.apps\\.googleusercontent\\.com
+                                      regex: the whole value (re.match with
+                                      an implied $).
+
+Blank lines are ignored.  Rules are compiled once:
+  -exact rules into a set,
+  -prefix rules into a character trie so a value is checked against all of
+   them in one walk of its characters,
+  -regex rules into a single alternation.
+A verdict is cached for each distinct value: a token snapshot repeats the
+same few clients and scopes over many stat keys.
+"""
+
+import re
+
+# setup_path required to allow imports from component dirs (e.g. utils)
+# and lib (where the OAuth and Google API Python Client modules reside).
+import setup_path  # pylint: disable=unused-import,g-bad-import-order
+
+from utils import admin_api_tool_errors
+
+
+_PREFIX_RULE_SUFFIX = '*'
+_REGEX_RULE_PREFIX = 're:'
+_END_OF_PREFIX = None  # Trie key marking the end of a prefix rule.
+# Numbered backreference or group condition (e.g. \1 or (?(1)...)): joined
+# into one alternation its group number would point at another rule's group.
+# An escaped backslash followed by a digit also matches, which is harmless.
+_GROUP_NUMBER_REFERENCE_RE = re.compile(r'\\[1-9]|\(\?\(')
+
+
+class PolicyMatcher(object):
+  """Compiled exact, prefix and regex rules with cached verdicts."""
+
+  def __init__(self, rules, normalize_fn=None):
+    """Compile the rules.
+
+    Args:
+      rules: Iterable of rule strings (e.g. lines of a black list file).
+      normalize_fn: Function applied to values and to exact rules before
+                    comparing them (e.g. strip a trailing slash) or None.
+                    Prefix and regex rules match the value as issued.
+
+    Raises:
+      AdminAPIToolPolicyError: A regex rule is not a valid regex.
+    """
+    self._normalize_fn = normalize_fn or (lambda value: value)
+    self._exact_values = set()
+    self._prefix_trie = {}
+    self._regex = None
+    self._verdicts = {}
+    regex_patterns = []
+    for rule in rules:
+      rule = rule.strip()
+      if not rule:
+        continue
+      if rule.startswith(_REGEX_RULE_PREFIX):
+        regex_patterns.append(
+            self._CheckRegex(rule[len(_REGEX_RULE_PREFIX):]))
+      elif rule.endswith(_PREFIX_RULE_SUFFIX):
+        self._AddPrefix(rule[:-len(_PREFIX_RULE_SUFFIX)])
+      else:
+        self._exact_values.add(self._normalize_fn(rule))
+    if regex_patterns:
+      self._regex = self._CompileRegexes(regex_patterns)
+
+  @staticmethod
+  def _CheckRegex(pattern):
+    """Returns pattern if it compiles else raises AdminAPIToolPolicyError."""
+    try:
+      re.compile(pattern)
+    except re.error as e:
+      raise admin_api_tool_errors.AdminAPIToolPolicyError(
+          'Invalid regex rule %s%s: %s.' % (_REGEX_RULE_PREFIX, pattern, e))
+    return pattern
+
+  @staticmethod
+  def _CompileRegexes(patterns):
+    """Compile regex rules into one alternation matching whole values.
+
+    Args:
+      patterns: List of valid regex strings.
+
+    Returns:
+      Compiled regex or, if the rules do not combine (e.g. too many groups or
+      a rule referring to a group by number), a list of compiled regexes.
+    """
+    if any(_GROUP_NUMBER_REFERENCE_RE.search(pattern) for pattern in patterns):
+      return [re.compile('(?:%s)\\Z' % pattern) for pattern in patterns]
+    try:
+      return re.compile('(?:%s)\\Z' % '|'.join(
+          '(?:%s)' % pattern for pattern in patterns))
+    except (re.error, AssertionError):
+      # Python 2.7 re raises AssertionError beyond 100 groups.
+      return [re.compile('(?:%s)\\Z' % pattern) for pattern in patterns]
+
+  def _AddPrefix(self, prefix):
+    """Add a prefix rule to the character trie."""
+    node = self._prefix_trie
+    for char in prefix:
+      node = node.setdefault(char, {})
+    node[_END_OF_PREFIX] = True
+
+  def _MatchesPrefix(self, value):
+    """Walk the trie along the value: True at the end of any prefix rule."""
+    node = self._prefix_trie
+    if _END_OF_PREFIX in node:
+      return True
+    for char in value:
+      node = node.get(char)
+      if node is None:
+        return False
+      if _END_OF_PREFIX in node:
+        return True
+    return False
+
+  def _MatchesRegex(self, value):
+    if self._regex is None:
+      return False
+    if isinstance(self._regex, list):
+      return any(regex.match(value) for regex in self._regex)
+    return bool(self._regex.match(value))
+
+  def Matches(self, value):
+    """Checks if any rule matches a value (e.g. a client_id).
+
+    Args:
+      value: String to match (e.g. twitter.com).
+
+    Returns:
+      True if an exact, prefix or regex rule matches the value else False.
+    """
+    verdict = self._verdicts.get(value)
+    if verdict is None:
+      verdict = (self._normalize_fn(value) in self._exact_values or
+                 self._MatchesPrefix(value) or self._MatchesRegex(value))
+      self._verdicts[value] = verdict
+    return verdict
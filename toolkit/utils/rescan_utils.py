@@ -0,0 +1,120 @@
+#!/usr/bin/python
+#
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Helpers to re-scan token holders and a rotating slice of other users.
+
+After a full gather_domain_token_stats run most users hold no tokens.  A
+--rescan_holders run re-checks every user that held a token last time plus
+one bucket of the remaining users.  Non-holders are split into N buckets by
+hashing their email (as with --shard) and each completed run advances to the
+next bucket so that N runs (e.g. a week of daily runs) re-check every user.
+
+The next bucket is saved in the working directory so that it survives
+between runs:
+
+  {"rotation": 7, "next_bucket": 3}
+"""
+
+# setup_path required to allow imports from component dirs (e.g. utils)
+# and lib (where the OAuth and Google API Python Client modules reside).
+import setup_path  # pylint: disable=unused-import,g-bad-import-order
+
+import file_manager
+import shard_utils
+
+
+RESCAN_ROTATION_FILE_NAME = 'rescan_rotation.json'
+# Holders chosen when a run started; re-used by --resume so the list of users
+# to re-check (and the resume position in it) does not change mid-run.
+_RESCAN_HOLDERS_FILE_NAME = 'rescan_holders.json'
+
+
+FILE_MANAGER = file_manager.FILE_MANAGER
+
+
+def GetRescanBucket(rotation):
+  """Determine which bucket of non-holders the current run re-checks.
+
+  Args:
+    rotation: Int count of runs over which non-holders are re-checked.
+              0 means that only holders are re-checked.
+
+  Returns:
+    Int bucket index (0 <= bucket < rotation) or None if rotation is 0.
+  """
+  if rotation <= 0:
+    return None
+  if not FILE_MANAGER.FileExists(RESCAN_ROTATION_FILE_NAME):
+    return 0
+  rotation_state = FILE_MANAGER.ReadJsonFile(RESCAN_ROTATION_FILE_NAME)
+  if rotation_state.get('rotation') != rotation:
+    # A changed rotation re-buckets every user so start a new sweep.
+    return 0
+  return rotation_state.get('next_bucket', 0) % rotation
+
+
+def GetRescanHolders(token_holders, resume):
+  """Fix the set of token holders re-checked by a run.
+
+  Args:
+    token_holders: Dictionary from token_report_utils.GetTokenHolders().
+    resume: If True, re-use the holders saved when the run started.
+
+  Returns:
+    Set of String user emails to re-check.
+  """
+  if resume and FILE_MANAGER.FileExists(_RESCAN_HOLDERS_FILE_NAME):
+    return set(FILE_MANAGER.ReadJsonFile(_RESCAN_HOLDERS_FILE_NAME))
+  holders = sorted(token_holders)
+  FILE_MANAGER.WriteJsonFile(_RESCAN_HOLDERS_FILE_NAME, holders,
+                             overwrite_ok=True)
+  return set(holders)
+
+
+def AdvanceRescanBucket(rotation, bucket):
+  """Save the bucket to re-check next run after a run completes.
+
+  Args:
+    rotation: Int count of runs over which non-holders are re-checked.
+    bucket: Int bucket index re-checked by the completed run or None.
+  """
+  FILE_MANAGER.RemoveFile(_RESCAN_HOLDERS_FILE_NAME)
+  if bucket is None:
+    return
+  FILE_MANAGER.WriteJsonFile(
+      RESCAN_ROTATION_FILE_NAME,
+      {'rotation': rotation, 'next_bucket': (bucket + 1) % rotation},
+      overwrite_ok=True)
+
+
+def MakeRescanFilter(holders, rotation, bucket):
+  """Build a user filter for StartUserIterator() selecting users to re-check.
+
+  Args:
+    holders: Set of String user emails that held tokens in the last run.
+    rotation: Int count of buckets of non-holders.
+    bucket: Int bucket index of non-holders to include or None for none.
+
+  Returns:
+    Function taking a String user email returning True to re-check the user.
+  """
+  def _IsRescanUser(user_email):
+    if user_email in holders:
+      return True
+    if bucket is None:
+      return False
+    return shard_utils.IsUserInShard(user_email, (bucket, rotation))
+  return _IsRescanUser
@@ -0,0 +1,113 @@
+#!/usr/bin/python
+#
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Record of each token revocation attempted so an interrupted run can resume.
+
+The ledger is a tab separated text file in the working directory with one
+line appended (and flushed) per revocation attempt:
+
+  revoked<TAB>larry@altostrat.com<TAB>twitter.com<TAB>
+  failed<TAB>anna@altostrat.com<TAB>twitter.com<TAB><error message>
+
+Lines are appended as results arrive so the ledger is accurate up to the
+moment a run is interrupted.  A resumed run skips tokens already revoked and
+retries the ones that failed.
+"""
+
+import os
+
+# setup_path required to allow imports from component dirs (e.g. utils)
+# and lib (where the OAuth and Google API Python Client modules reside).
+import setup_path  # pylint: disable=unused-import,g-bad-import-order
+
+import file_manager
+
+
+REVOCATION_LEDGER_FILE_NAME = 'revocation_ledger.tsv'
+
+STATUS_REVOKED = 'revoked'
+STATUS_FAILED = 'failed'
+
+
+FILE_MANAGER = file_manager.FILE_MANAGER
+
+
+def _EncodeField(field):
+  """Tabs and newlines delimit the ledger format so keep them out."""
+  if isinstance(field, unicode):
+    field = field.encode('utf-8')
+  return str(field).replace('\t', ' ').replace('\n', ' ')
+
+
+class RevocationLedger(object):
+  """Appends revocation results to the ledger file and reads them back."""
+
+  def __init__(self, file_name=REVOCATION_LEDGER_FILE_NAME):
+    """Locate the ledger file in the working directory.
+
+    Args:
+      file_name: String name of the ledger file.
+    """
+    self._filename_path = FILE_MANAGER.BuildFullPathToFileName(file_name)
+    self._file = None
+
+  @property
+  def filename_path(self):
+    return self._filename_path
+
+  def Reset(self):
+    """Start a new ledger, discarding the record of any previous run."""
+    self.Close()
+    self._file = open(self._filename_path, 'w')
+
+  def GetRevokedTokens(self):
+    """Read the tokens revoked by previous (possibly interrupted) runs.
+
+    Returns:
+      Set of tuples: (user_mail, client_id) as unicode strings.
+    """
+    revoked_tokens = set()
+    if not os.path.isfile(self._filename_path):
+      return revoked_tokens
+    with open(self._filename_path, 'r') as f:
+      for line in f:
+        fields = line.rstrip('\n').split('\t')
+        if len(fields) >= 3 and fields[0] == STATUS_REVOKED:
+          revoked_tokens.add((fields[1].decode('utf-8'),
+                              fields[2].decode('utf-8')))
+    return revoked_tokens
+
+  def Record(self, user_mail, client_id, error=None):
+    """Append the result of one revocation attempt.
+
+    Args:
+      user_mail: String email address of the user that authorized the token.
+      client_id: String of the client domain issued the token.
+      error: None if the token was revoked else an error message or object.
+    """
+    if not self._file:
+      self._file = open(self._filename_path, 'a')
+    status = STATUS_FAILED if error else STATUS_REVOKED
+    self._file.write('%s\n' % '\t'.join(
+        [status, _EncodeField(user_mail), _EncodeField(client_id),
+         _EncodeField(error or '')]))
+    # Flush each line: the ledger must survive an interrupted run.
+    self._file.flush()
+
+  def Close(self):
+    if self._file:
+      self._file.close()
+      self._file = None
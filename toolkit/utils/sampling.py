@@ -0,0 +1,263 @@
+#!/usr/bin/python
+#
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Estimate domain-wide user counts from a stratified sample of the users.
+
+gather_domain_token_stats.py and report_plus_domains_users.py --sample N
+check only N users drawn at random from the users list (users.json):
+
+  -the users are stratified by organizational unit when the users list holds
+   it (ls_users.py --json --org_units) else form a single stratum,
+  -each stratum gets a share of the sample proportional to its size (at
+   least 2 users when the sample allows, to estimate its variance),
+  -the draw is seeded (--sample_seed) so a --resume checks the same users.
+
+A count of the users with some property (e.g. granted a client_id) is then
+estimated as the sum over strata of N_h * p_h (N_h users in the stratum, p_h
+the share of its sampled users with the property) with a confidence interval
+from the stratified variance with finite population correction:
+
+  sum over strata of N_h^2 * (1 - n_h / N_h) * p_h * (1 - p_h) / (n_h - 1)
+"""
+
+import math
+import random
+
+# setup_path required to allow imports from component dirs (e.g. utils)
+# and lib (where the OAuth and Google API Python Client modules reside).
+import setup_path  # pylint: disable=unused-import,g-bad-import-order
+
+import file_manager
+
+
+DEFAULT_CONFIDENCE = 0.95
+DEFAULT_SAMPLE_SEED = 1
+_MIN_STRATUM_SAMPLE = 2  # Fewer sampled users cannot estimate a variance.
+_NO_STRATUM = ''  # Users without an organizational unit.
+_ORG_UNIT_FIELD_INDEX = 3  # (email, id, full_name, orgUnitPath, ...).
+
+FILE_MANAGER = file_manager.FILE_MANAGER
+
+
+def GetUserStratum(user):
+  """Helper to find the stratum of a user tuple of the users list.
+
+  Args:
+    user: List or tuple (email, id, full_name[, orgUnitPath, suspended]).
+
+  Returns:
+    String orgUnitPath of the user or '' if the users list does not hold it.
+  """
+  if len(user) > _ORG_UNIT_FIELD_INDEX:
+    return user[_ORG_UNIT_FIELD_INDEX] or _NO_STRATUM
+  return _NO_STRATUM
+
+
+def GetZScore(confidence):
+  """Find z such that a standard normal falls within +/- z at a confidence.
+
+  Args:
+    confidence: Float confidence level strictly between 0 and 1 (e.g. 0.95).
+
+  Returns:
+    Float z score (e.g. 1.96 for 0.95).
+  """
+  low, high = 0.0, 10.0
+  for _ in xrange(60):  # Bisection of erf(z / sqrt(2)) = confidence.
+    middle = (low + high) / 2
+    if math.erf(middle / math.sqrt(2)) < confidence:
+      low = middle
+    else:
+      high = middle
+  return (low + high) / 2
+
+
+def _AllocateSample(stratum_sizes, sample_size):
+  """Share a sample among strata in proportion to their sizes.
+
+  Args:
+    stratum_sizes: Dictionary of stratum -> Int count of users.
+    sample_size: Int count of users to sample (below the total).
+
+  Returns:
+    Dictionary of stratum -> Int count of users to sample.
+  """
+  total_size = sum(stratum_sizes.itervalues())
+  allocation = {}
+  remainders = []
+  for stratum, stratum_size in stratum_sizes.iteritems():
+    share = float(sample_size) * stratum_size / total_size
+    allocation[stratum] = int(share)
+    remainders.append((share - int(share), stratum))
+  # Largest remainders first; ties in stratum order for a stable draw.
+  remainders.sort(key=lambda r: (-r[0], r[1]))
+  for _, stratum in remainders[:sample_size - sum(allocation.itervalues())]:
+    allocation[stratum] += 1
+  # Raise small strata to the minimum, taken from the largest allocations.
+  for stratum in sorted(stratum_sizes):
+    wanted = min(_MIN_STRATUM_SAMPLE, stratum_sizes[stratum])
+    while allocation[stratum] < wanted:
+      donor = max(sorted(allocation), key=allocation.get)
+      if allocation[donor] <= _MIN_STRATUM_SAMPLE:
+        return allocation  # The sample is too small for every stratum.
+      allocation[donor] -= 1
+      allocation[stratum] += 1
+  return allocation
+
+
+class SampleDesign(object):
+  """Strata sizes of a sample and the stratum of each sampled user."""
+
+  def __init__(self, strata, user_strata):
+    """Note the design.
+
+    Args:
+      strata: Dictionary of stratum -> [Int users, Int sampled users].
+      user_strata: Dictionary of lower case sampled user email -> stratum.
+    """
+    self.strata = strata
+    self.user_strata = user_strata
+
+  @property
+  def population_count(self):
+    return sum(users for users, _ in self.strata.itervalues())
+
+  @property
+  def sample_count(self):
+    return len(self.user_strata)
+
+  def Estimate(self, users, confidence=DEFAULT_CONFIDENCE):
+    """Estimate the count of the domain users like the sampled users given.
+
+    Args:
+      users: Iterable of sampled user emails with some property (e.g. those
+             who granted a client_id).  Unsampled users are ignored.
+      confidence: Float confidence level of the interval.
+
+    Returns:
+      3-tuple of Ints (estimate, low, high) where [low, high] is the
+      confidence interval.
+    """
+    stratum_hits = {}
+    for user_email in set(user.lower() for user in users):
+      stratum = self.user_strata.get(user_email)
+      if stratum is not None:
+        stratum_hits[stratum] = stratum_hits.get(stratum, 0) + 1
+    estimate = 0.0
+    variance = 0.0
+    for stratum, (stratum_users, stratum_sampled) in self.strata.iteritems():
+      if not stratum_sampled:
+        continue
+      share = float(stratum_hits.get(stratum, 0)) / stratum_sampled
+      estimate += stratum_users * share
+      if stratum_sampled > 1:
+        variance += (stratum_users ** 2 *
+                     (1 - float(stratum_sampled) / stratum_users) *
+                     share * (1 - share) / (stratum_sampled - 1))
+    margin = GetZScore(confidence) * math.sqrt(variance)
+    return (int(round(estimate)), max(0, int(math.floor(estimate - margin))),
+            min(self.population_count, int(math.ceil(estimate + margin))))
+
+  def EstimateCounts(self, key_users, confidence=DEFAULT_CONFIDENCE):
+    """Estimate the domain user count of each key (e.g. of each client_id).
+
+    Args:
+      key_users: Dictionary of key -> iterable of sampled user emails.
+      confidence: Float confidence level of the intervals.
+
+    Returns:
+      Dictionary of key -> (estimate, low, high) as Estimate().
+    """
+    return dict((key, self.Estimate(users, confidence))
+                for key, users in key_users.iteritems())
+
+
+class UserSampler(object):
+  """Draws a seeded stratified sample of a users list."""
+
+  def __init__(self, sample_size, seed=DEFAULT_SAMPLE_SEED):
+    """Note the sample options; the design is set by Sample().
+
+    Args:
+      sample_size: Int count of users to sample.
+      seed: Int seed of the draw (the same users list gives the same sample).
+    """
+    self._sample_size = sample_size
+    self._seed = seed
+    self.design = None
+
+  def Sample(self, user_list):
+    """Draw the sample.
+
+    Args:
+      user_list: List of user tuples (email, id, full_name[, orgUnitPath,
+                 suspended]).
+
+    Returns:
+      List of the sampled user tuples in users list order.
+    """
+    stratum_indexes = {}
+    for user_index, user in enumerate(user_list):
+      stratum_indexes.setdefault(GetUserStratum(user), []).append(user_index)
+    stratum_sizes = dict((stratum, len(indexes))
+                         for stratum, indexes in stratum_indexes.iteritems())
+    if self._sample_size >= len(user_list):
+      allocation = stratum_sizes
+    else:
+      allocation = _AllocateSample(stratum_sizes, self._sample_size)
+    random_generator = random.Random(self._seed)
+    sampled_indexes = []
+    for stratum in sorted(stratum_indexes):
+      sampled_indexes.extend(random_generator.sample(stratum_indexes[stratum],
+                                                     allocation[stratum]))
+    sampled_users = [user_list[i] for i in sorted(sampled_indexes)]
+    self.design = SampleDesign(
+        dict((stratum, [stratum_sizes[stratum], allocation[stratum]])
+             for stratum in stratum_sizes),
+        dict((user[0].lower(), GetUserStratum(user))
+             for user in sampled_users))
+    return sampled_users
+
+
+def WriteSampleDesign(file_name, design):
+  """Save the design of a sampled run for its reports.
+
+  Args:
+    file_name: String name of the json file (e.g.
+               tokens_issued_sample_design.json).
+    design: SampleDesign object.
+
+  Returns:
+    String full path of the file written.
+  """
+  return FILE_MANAGER.WriteJsonFile(
+      file_name, {'strata': design.strata, 'users': design.user_strata},
+      overwrite_ok=True)
+
+
+def ReadSampleDesign(file_name):
+  """Read the design saved by WriteSampleDesign().
+
+  Args:
+    file_name: String name of the json file.
+
+  Returns:
+    SampleDesign object or None if the file does not exist.
+  """
+  if not FILE_MANAGER.FileExists(file_name):
+    return None
+  design_data = FILE_MANAGER.ReadJsonFile(file_name)
+  return SampleDesign(design_data['strata'], design_data['users'])
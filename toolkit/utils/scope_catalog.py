@@ -0,0 +1,248 @@
+#!/usr/bin/python
+#
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Catalog of the scopes seen in tokens with their readable labels.
+
+Reports print the same few dozen scopes thousands of times.  The catalog
+gives each distinct scope an Int code the first time it is seen and renders
+its label once; after that a scope line is a list index.  TokenStats
+summaries (token_report_utils.SummarizeTokenStats) key scopes by these
+codes so reports look labels up by code.  The codes are saved beside the
+token stats (token_report_utils.WriteScopeCodes) and loaded with them, so a
+scope keeps its code across runs, shards and merges.
+
+Labels for scopes not listed below (or better labels for listed ones) may
+be added without code changes in scope_map.json in the base application
+directory (next to default_domain.json):
+
+  {"https://www.googleapis.com/auth/drive": "Drive (Read/Write)"}
+"""
+
+import threading
+
+# setup_path required to allow imports from component dirs (e.g. utils)
+# and lib (where the OAuth and Google API Python Client modules reside).
+import setup_path  # pylint: disable=unused-import,g-bad-import-order
+
+import admin_api_tool_errors
+import file_manager
+
+
+SCOPE_MAP_FILE_NAME = 'scope_map.json'
+
+FILE_MANAGER = file_manager.FILE_MANAGER
+
+
+_SCOPE_MAP = {
+    'http://docs.google.com/feeds': (
+        'Docs (Read/Write, does not require SSL)'),
+    'http://docs.googleusercontent.com': (
+        'Download PDF and arbitrary files from Docs (Read only, does not '
+        'require SSL)'),
+    'http://mail.google.com/mail/feed/atom': (
+        'Email, new messages (Read only, does not require SSL)'),
+    'http://sites.google.com/feeds': (
+        'Sites (Read/Write, does not require SSL)'),
+    'http://spreadsheets.google.com/feeds': (
+        'Spreadsheets (Read/Write, does not require SSL)'),
+    'http://www.google.com/calendar/feeds': (
+        'Calendar (Read/Write, does not require SSL)'),
+    'http://www.google.com/finance/feeds': (
+        'Finance (Read Only, does not require SSL)'),
+    'http://www.google.com/m8/feeds': (
+        'Contacts (Read/Write, does not require SSL)'),
+    'https://apps-apis.google.com/a/feeds/calendar/resource': (
+        'Calendar Resources (Read/Write)'),
+    'https://apps-apis.google.com/a/feeds/calendar/resource/#readonly': (
+        'Calendar Resources (Read only)'),
+    'https://apps-apis.google.com/a/feeds/emailsettings/2.0': (
+        'Email Settings (Read/Write)'),
+    'https://apps-apis.google.com/a/feeds/group/#readonly': (
+        'Groups Provisioning (Read only)'),
+    'https://apps-apis.google.com/a/feeds/groups': (
+        'Groups Provisioning'),
+    'https://apps-apis.google.com/a/feeds/migration': (
+        'Email Migration (Write only)'),
+    'https://apps-apis.google.com/a/feeds/nickname/#readonly': (
+        'User Nicknames (Read only)'),
+    'https://apps-apis.google.com/a/feeds/user': (
+        'User Provisioning'),
+    'https://apps-apis.google.com/a/feeds/user/#readonly': (
+        'User Provisioning (Read only)'),
+    'https://docs.google.com/feeds': (
+        'Docs (Read/Write)'),
+    'https://docs.googleusercontent.com': (
+        'Download PDF and arbitrary files from Docs (Read only)'),
+    'https://mail.google.com': (
+        'Email (Read/Write/Send)'),
+    'https://mail.google.com/mail/feed/atom': (
+        'Email, new messages (Read only)'),
+    'https://sites.google.com/feeds': (
+        'Sites  (Read/Write)'),
+    'https://spreadsheets.google.com/feeds': (
+        'Spreadsheets (Read/Write)'),
+    'https://www.google.com/calendar/feeds': (
+        'Calendar (Read/Write)'),
+    'https://www.google.com/finance/feeds': (
+        'Finance (Read Only)'),
+    'https://www.google.com/m8/feeds': (
+        'Contacts (Read/Write)'),
+    'https://www.googleapis.com/auth/apps.groups.migration': (
+        'Groups Mail Migration'),
+    'https://www.googleapis.com/auth/apps.groups.settings': (
+        'Groups Settings'),
+    'https://www.googleapis.com/auth/apps.security': (
+        '3LO Tokens (read-write)'),
+    'https://www.googleapis.com/auth/calendar': (
+        'Calendar (Read-Write)'),
+    'https://www.googleapis.com/auth/directory.user': (
+        'User Provisioning'),
+    'https://www.googleapis.com/auth/directory.user.readonly': (
+        'User Provisioning (Read only)'),
+    'https://www.googleapis.com/auth/tasks': (
+        'Tasks (Read/Write)'),
+    'https://www.googleapis.com/auth/tasks.readonly': (
+        'Tasks (Read Only)'),
+    'https://www.googleapis.com/doclist.createnew': (
+        'Docs created with this application'),
+    'https://www.googleapis.com/doclist.openwith': (
+        'Docs opened with this application'),
+    }
+
+
+def NormalizeScope(scope):
+  """Strip the trailing slash some tokens carry to match the scope map."""
+  return scope.rstrip('/')
+
+
+class ScopeCatalog(object):
+  """Assigns Int codes to scopes and holds the label line of each."""
+
+  def __init__(self, scope_map_file_name=SCOPE_MAP_FILE_NAME):
+    """Set up an empty catalog (the scope map is read on first use).
+
+    Args:
+      scope_map_file_name: String name of the local scope map file in the
+                           base application directory.
+    """
+    self._scope_map_file_name = scope_map_file_name
+    self._scope_map = None
+    self._codes = {}  # Scope -> Int code.
+    self._scopes = []  # Code -> scope.
+    self._labels = []  # Code -> label line.
+    self._lock = threading.Lock()
+
+  def _ReadScopeMap(self):
+    """Combine the built-in scope map with the local scope map file.
+
+    Returns:
+      Dictionary of normalized scope -> readable description.
+
+    Raises:
+      AdminAPIToolJsonError: if the local file is not a json object of
+                             strings.
+    """
+    scope_map = dict(_SCOPE_MAP)
+    if FILE_MANAGER.FileExists(self._scope_map_file_name, work_dir=False):
+      local_map = FILE_MANAGER.ReadJsonFile(self._scope_map_file_name,
+                                            work_dir=False)
+      if not isinstance(local_map, dict) or not all(
+          isinstance(v, basestring) for v in local_map.itervalues()):
+        raise admin_api_tool_errors.AdminAPIToolJsonError(
+            'File (%s) must map each scope to a description.' %
+            self._scope_map_file_name)
+      for scope, description in local_map.iteritems():
+        scope_map[NormalizeScope(scope)] = description
+    return scope_map
+
+  def _RenderLabel(self, scope):
+    readable_scope = self._scope_map.get(NormalizeScope(scope))
+    if readable_scope:
+      return '%s [%s]' % (readable_scope, scope)
+    return scope
+
+  def Reload(self):
+    """Read the scope map again (e.g. after scope_map.json changed)."""
+    with self._lock:
+      self._scope_map = self._ReadScopeMap()
+      self._labels = [self._RenderLabel(scope) for scope in self._scopes]
+
+  def GetCode(self, scope):
+    """Find the code of a scope, adding the scope if not yet seen.
+
+    Args:
+      scope: String url that reflects the authorized scope of access.
+
+    Returns:
+      Int code of the scope.
+    """
+    code = self._codes.get(scope)
+    if code is None:
+      with self._lock:
+        code = self._codes.get(scope)
+        if code is None:
+          if self._scope_map is None:
+            self._scope_map = self._ReadScopeMap()
+          code = len(self._scopes)
+          self._scopes.append(scope)
+          self._labels.append(self._RenderLabel(scope))
+          self._codes[scope] = code
+    return code
+
+  def LoadScopes(self, scopes):
+    """Code scopes in the order of a saved code table.
+
+    Loaded into an empty catalog the scopes get the codes of the table;
+    scopes already coded keep their codes.
+
+    Args:
+      scopes: List of scope strings, the scope of each code.
+    """
+    for scope in scopes:
+      self.GetCode(scope)
+
+  def GetScopes(self):
+    """Return the list of coded scopes (the scope of each code)."""
+    with self._lock:
+      return list(self._scopes)
+
+  def GetScope(self, code):
+    """Return the scope string of a code."""
+    return self._scopes[code]
+
+  def GetLabel(self, code):
+    """Return the readable label line of a code."""
+    return self._labels[code]
+
+  def GetSortedLabels(self, codes):
+    """Return the label lines of some codes ordered by their scopes."""
+    return [self._labels[code]
+            for code in sorted(codes, key=self._scopes.__getitem__)]
+
+  def Lookup(self, scope):
+    """Produce the readable label line of a scope.
+
+    Args:
+      scope: String url that reflects the authorized scope of access.
+
+    Returns:
+      Line of text with the readable explanation of the scope (if known)
+      followed by the scope.
+    """
+    return self._labels[self.GetCode(scope)]
+
+
+SCOPE_CATALOG = ScopeCatalog()
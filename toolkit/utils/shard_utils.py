@@ -0,0 +1,126 @@
+#!/usr/bin/python
+#
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Helpers to split a domain-wide scan across multiple processes (shards).
+
+A shard is expressed as a 2-tuple (shard_index, shard_count) and is usually
+supplied on the command line as --shard=i/N (e.g. --shard=0/4).  Users are
+assigned to shards by hashing their email address so that every process (or
+every machine sharing the working directory) deterministically takes the same
+slice of users.json without coordinating with the others.
+
+Each shard keeps its own progress and output files.  The file names are built
+by inserting a shard tag before the file extension:
+
+  tokens_issued.json -> tokens_issued_shard0_of_4.json
+"""
+
+import hashlib
+import os
+
+
+def _HashUserEmail(user_email):
+  """Helper to produce a stable, platform-independent hash of an email.
+
+  The builtin hash() is not used because it differs between 32 and 64 bit
+  platforms and N machines must agree on the partition.
+
+  Args:
+    user_email: String email address (str or unicode).
+
+  Returns:
+    Long integer hash of the lower-cased email address.
+  """
+  if isinstance(user_email, unicode):
+    user_email = user_email.encode('utf-8')
+  return long(hashlib.md5(user_email.lower()).hexdigest()[:16], 16)
+
+
+def IsUserInShard(user_email, shard):
+  """Determine if a user belongs to a shard.
+
+  Args:
+    user_email: String email address of the user (e.g. larry@altostrat.com).
+    shard: 2-tuple (shard_index, shard_count) or None.  None means unsharded
+           so every user is included.
+
+  Returns:
+    True if the user should be processed by this shard else False.
+  """
+  if not shard:
+    return True
+  shard_index, shard_count = shard
+  return _HashUserEmail(user_email) % shard_count == shard_index
+
+
+def FilterUsersForShard(user_list, shard):
+  """Select the slice of the domain users that belong to a shard.
+
+  Preserves the order of the supplied list so that resume checks continue to
+  work against the filtered list.
+
+  Args:
+    user_list: List of user tuples: (email, user_id, full_name).
+    shard: 2-tuple (shard_index, shard_count) or None.
+
+  Returns:
+    List of the user tuples belonging to the shard.
+  """
+  if not shard:
+    return user_list
+  return [user for user in user_list if IsUserInShard(user[0], shard)]
+
+
+def GetShardFileName(file_name, shard):
+  """Build a shard-specific name for a working file.
+
+  Args:
+    file_name: String name of a file (e.g. tokens_issued.json).
+    shard: 2-tuple (shard_index, shard_count) or None.
+
+  Returns:
+    String file name; unchanged if shard is None.
+  """
+  if not shard:
+    return file_name
+  root, extension = os.path.splitext(file_name)
+  return '%s_shard%d_of_%d%s' % (root, shard[0], shard[1], extension)
+
+
+def GetAllShards(shard_count):
+  """List every shard of a partition.
+
+  Args:
+    shard_count: Int count of shards (N in --shard=i/N).
+
+  Returns:
+    List of shard 2-tuples [(0, N), (1, N), ... (N-1, N)].
+  """
+  return [(shard_index, shard_count) for shard_index in xrange(shard_count)]
+
+
+def FormatShard(shard):
+  """Helper to show a shard in messages in the same form it is supplied.
+
+  Args:
+    shard: 2-tuple (shard_index, shard_count) or None.
+
+  Returns:
+    String e.g. '0/4' or 'all' if not sharded.
+  """
+  if not shard:
+    return 'all'
+  return '%d/%d' % shard
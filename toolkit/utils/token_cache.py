@@ -0,0 +1,416 @@
+#!/usr/bin/python
+#
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Local cache of the tokens of each user, filled by domain token gathers.
+
+gather_domain_token_stats.py requests the tokens of every user of the domain.
+Besides the token stats it appends each user's token list with the time it
+was requested to token_cache.jsonl, one json list per line:
+
+  ["larry@altostrat.com", 1400000000.0, [{"clientId": "twitter.com", ...}]]
+  ["anna@altostrat.com", 1400000000.0, []]
+
+The users of each checkpoint are appended (the whole cache is never
+rewritten during a scan); the last line of a user wins.
+
+ls_tokens_for_user.py and ls_tokens_for_user_clientid.py then answer from
+the cache (without authorizing or building the API service) if the user's
+tokens were requested less than --max_age minutes ago, else they request
+them (--live always does) and append them to the cache.
+
+Tokens revoked by any command after they were cached are appended to
+token_cache_revoked.tsv and left out of the cached lists.
+"""
+
+import json
+import os
+import threading
+import time
+
+# setup_path required to allow imports from component dirs (e.g. utils)
+# and lib (where the OAuth and Google API Python Client modules reside).
+import setup_path  # pylint: disable=unused-import,g-bad-import-order
+
+from utils import admin_api_tool_errors
+from utils import file_manager
+from utils import log_utils
+
+
+TOKEN_CACHE_FILE_NAME = 'token_cache.jsonl'
+# Tokens revoked since cached: user<TAB>client_id<TAB>time lines.
+TOKEN_CACHE_REVOKED_FILE_NAME = 'token_cache_revoked.tsv'
+DEFAULT_MAX_AGE_MINUTES = 60
+# A cache with more lines than this many per user is rewritten compacted.
+_MAX_LINES_PER_USER = 2
+
+FILE_MANAGER = file_manager.FILE_MANAGER
+
+# Revocation lines held by a RevocationBatch (None if not batching).
+_revocation_batch = None
+_revocation_lock = threading.Lock()
+
+
+def ApplyUserTokenList(cache_entries, user_token_list):
+  """Apply the tokens requested for a user to the cache entries.
+
+  Args:
+    cache_entries: Dictionary of lower case email -> [time, token list].
+    user_token_list: 3-tuple (String user email, Float time requested, List
+                     of token documents).
+  """
+  user_email, requested_time, token_list = user_token_list
+  cache_entries[user_email.lower()] = [requested_time, token_list]
+
+
+def _GetCachePath(file_name, create_dir=False):
+  """Helper to locate a cache file (always plain: it is appended to)."""
+  return FILE_MANAGER.BuildFullPathToFileName(file_name,
+                                              create_dir=create_dir)
+
+
+def _AppendUserTokenLists(user_token_lists, filename_path=None):
+  """Append the token lists of some users to the cache file.
+
+  Args:
+    user_token_lists: Iterable of user_token_list tuples (see
+                      ApplyUserTokenList()).
+    filename_path: String full path of the cache file (defaults to the cache
+                   of the working directory).
+
+  Raises:
+    AdminAPIToolFileError: if unable to write the file.
+  """
+  lines = [json.dumps(list(user_token_list)) + '\n'
+           for user_token_list in user_token_lists]
+  if not lines:
+    return
+  if filename_path is None:
+    filename_path = _GetCachePath(TOKEN_CACHE_FILE_NAME, create_dir=True)
+  try:
+    with open(filename_path, 'a') as f:
+      f.write(''.join(lines))
+  except IOError as e:
+    raise admin_api_tool_errors.AdminAPIToolFileError(
+        'Unable to write file %s: %s.' % (filename_path, e))
+
+
+def _ReadCacheLines(filename_path=None):
+  """Read the cached token lists with the count of lines read.
+
+  Args:
+    filename_path: String full path of the cache file (defaults to the cache
+                   of the working directory).
+
+  Returns:
+    Tuple of (Dictionary of lower case email -> [time, token list], Int
+    count of lines).  A last line cut short by a crash is ignored.
+  """
+  cache_entries = {}
+  line_count = 0
+  if filename_path is None:
+    filename_path = _GetCachePath(TOKEN_CACHE_FILE_NAME)
+  if not os.path.isfile(filename_path):
+    return cache_entries, line_count
+  with open(filename_path, 'r') as f:
+    for line in f:
+      try:
+        user_token_list = json.loads(line)
+      except ValueError:
+        continue
+      ApplyUserTokenList(cache_entries, user_token_list)
+      line_count += 1
+  return cache_entries, line_count
+
+
+def ReadTokenCacheEntries():
+  """Read the cached token lists of the working directory.
+
+  Returns:
+    Dictionary of lower case email -> [time, token list]; empty if there is
+    no cache.
+  """
+  return _ReadCacheLines()[0]
+
+
+def _CompactTokenCache():
+  """Rewrite the cache with one line per user if it grew too long."""
+  cache_entries, line_count = _ReadCacheLines()
+  if line_count <= _MAX_LINES_PER_USER * len(cache_entries):
+    return
+  filename_path = _GetCachePath(TOKEN_CACHE_FILE_NAME)
+  temp_filename_path = filename_path + '.tmp'
+  try:
+    with open(temp_filename_path, 'w') as f:
+      for user_email, (requested_time, token_list) in (
+          cache_entries.iteritems()):
+        f.write(json.dumps([user_email, requested_time, token_list]) + '\n')
+    os.rename(temp_filename_path, filename_path)
+  except (IOError, OSError) as e:
+    raise admin_api_tool_errors.AdminAPIToolFileError(
+        'Unable to write file %s: %s.' % (filename_path, e))
+
+
+class TokenCacheAppender(object):
+  """Appends the token lists requested by a gather in the background.
+
+  Has the Add()/Checkpoint()/Close() calls of checkpointer.Checkpointer: the
+  token lists of each checkpoint are appended by the FileManager background
+  writer thread (ahead of the user progress file) and then released.
+  """
+
+  def __init__(self, compact_on_close):
+    """Start with no token lists recorded.
+
+    Args:
+      compact_on_close: If True (adding to the cache of previous gathers)
+                        rewrite the cache once on Close() if it holds many
+                        old lines of users.
+    """
+    self._compact_on_close = compact_on_close
+    self._user_token_lists = []
+
+  def Add(self, user_token_list):
+    """Record the tokens requested for a user.
+
+    Args:
+      user_token_list: 3-tuple (String user email, Float time requested, List
+                       of token documents); must not be changed after.
+    """
+    self._user_token_lists.append(user_token_list)
+
+  def Checkpoint(self):
+    """Queue the append of the token lists recorded so far.
+
+    Raises:
+      AdminAPIToolFileError: if an earlier background write failed.
+    """
+    if self._user_token_lists:
+      user_token_lists = tuple(self._user_token_lists)
+      self._user_token_lists = []
+      FILE_MANAGER.QueueBackgroundWrite(
+          lambda: _AppendUserTokenLists(user_token_lists),
+          TOKEN_CACHE_FILE_NAME)
+
+  def Close(self):
+    """Append the last token lists and compact the cache if needed.
+
+    Returns:
+      String full path of the cache file.
+
+    Raises:
+      AdminAPIToolFileError: if a write failed.
+    """
+    self.Checkpoint()
+    FILE_MANAGER.WaitForBackgroundWrites()
+    if self._compact_on_close:
+      self._compact_on_close = False
+      _CompactTokenCache()
+    return _GetCachePath(TOKEN_CACHE_FILE_NAME)
+
+
+def NewTokenCacheCheckpointer(new_cache):
+  """Append the token lists requested by a gather to the cache.
+
+  Args:
+    new_cache: If True start a new cache (a whole domain gather) else add to
+               the cache of previous gathers.
+
+  Returns:
+    TokenCacheAppender taking user_token_list tuples.
+  """
+  if new_cache:
+    # Lookups wait for the new cache: it holds no token revoked before it was
+    # requested.
+    FILE_MANAGER.RemoveFile(TOKEN_CACHE_FILE_NAME)
+    FILE_MANAGER.RemoveFile(TOKEN_CACHE_REVOKED_FILE_NAME)
+  return TokenCacheAppender(compact_on_close=not new_cache)
+
+
+def _AppendRevocationLines(lines):
+  """Helper to append revocation lines if there is a cache to correct."""
+  if not lines or not os.path.isfile(_GetCachePath(TOKEN_CACHE_FILE_NAME)):
+    return
+  with open(_GetCachePath(TOKEN_CACHE_REVOKED_FILE_NAME), 'a') as f:
+    f.write(u''.join(lines).encode('utf-8'))
+
+
+def RecordRevocation(user_mail, client_id):
+  """Note a revoked token so the cache stops showing it.
+
+  Appends one line (safe from concurrent threads).  Within a
+  RevocationBatch the line is held and appended when the batch ends.
+
+  Args:
+    user_mail: String email address of the user that authorized the token.
+    client_id: String of the client domain issued the token.
+  """
+  line = u'%s\t%s\t%f\n' % (user_mail.lower(), client_id, time.time())
+  with _revocation_lock:
+    if _revocation_batch is not None:
+      _revocation_batch.append(line)
+      return
+  _AppendRevocationLines([line])
+
+
+class RevocationBatch(object):
+  """Records the revocations of a revoke run once the run ends.
+
+  The revoke threads of a large run then append to a list instead of each
+  opening the revoked file:
+
+    with token_cache.RevocationBatch():
+      ...revoke tokens...
+  """
+
+  def __enter__(self):
+    global _revocation_batch  # pylint: disable=global-statement
+    with _revocation_lock:
+      _revocation_batch = []
+    return self
+
+  def __exit__(self, unused_type, unused_value, unused_traceback):
+    global _revocation_batch  # pylint: disable=global-statement
+    with _revocation_lock:
+      lines, _revocation_batch = _revocation_batch, None
+    # Also reached when the run fails or is interrupted.
+    _AppendRevocationLines(lines)
+
+
+class TokenCache(object):
+  """Token lists of the users requested less than max_age minutes ago.
+
+  Bound to the working directory current when created: the cache files of
+  that directory are read once (on first use) and appended to by Save().
+  """
+
+  def __init__(self, max_age_minutes=DEFAULT_MAX_AGE_MINUTES):
+    """Set the age limit; the cache files are read on first use.
+
+    Args:
+      max_age_minutes: Int age in minutes beyond which cached token lists
+                       are requested again.
+    """
+    self._max_age_minutes = max_age_minutes
+    self._max_age_s = max_age_minutes * 60
+    self._cache_path = _GetCachePath(TOKEN_CACHE_FILE_NAME)
+    self._revoked_path = _GetCachePath(TOKEN_CACHE_REVOKED_FILE_NAME)
+    self._entries = None
+    self._revocations = None  # (lower case email, client_id) -> time.
+    self._new_user_token_lists = []  # Put() since Save().
+
+  def _Load(self):
+    if self._entries is not None:
+      return
+    self._entries = _ReadCacheLines(self._cache_path)[0]
+    self._revocations = {}
+    if not os.path.isfile(self._revoked_path):
+      return
+    with open(self._revoked_path, 'r') as f:
+      for line in f:
+        fields = line.decode('utf-8').rstrip('\n').split('\t')
+        if len(fields) == 3:
+          self._revocations[(fields[0], fields[1])] = float(fields[2])
+
+  def IsFor(self, max_age_minutes):
+    """Check the cache suits a command.
+
+    Args:
+      max_age_minutes: Int --max_age of the command.
+
+    Returns:
+      True if the cache has that age limit and is of the current working
+      directory.
+    """
+    return (max_age_minutes == self._max_age_minutes and
+            _GetCachePath(TOKEN_CACHE_FILE_NAME) == self._cache_path)
+
+  def GetTokens(self, user_mail):
+    """Look up the cached tokens of a user.
+
+    Args:
+      user_mail: String email address of the user.
+
+    Returns:
+      List of token documents (without tokens revoked since) or None if the
+      user's tokens are not cached or are older than max_age.
+    """
+    self._Load()
+    entry = self._entries.get(user_mail.lower())
+    if not entry:
+      return None
+    requested_time, token_list = entry
+    age_s = time.time() - requested_time
+    if age_s > self._max_age_s:
+      return None
+    log_utils.LogInfo('Tokens of %s requested %d minutes ago (use --live to '
+                      'request them now).' % (user_mail, age_s / 60))
+    return [token for token in token_list
+            if self._revocations.get((user_mail.lower(), token['clientId']),
+                                     0) < requested_time]
+
+  def GetToken(self, user_mail, client_id):
+    """Look up the cached token of a user for a client.
+
+    Args:
+      user_mail: String email address of the user.
+      client_id: String of the client domain issued the token.
+
+    Returns:
+      Token document, {} if the user had no token for the client or None if
+      the user's tokens are not cached or are older than max_age.
+    """
+    token_list = self.GetTokens(user_mail)
+    if token_list is None:
+      return None
+    for token in token_list:
+      if token['clientId'] == client_id:
+        return token
+    return {}
+
+  def Put(self, user_mail, token_list):
+    """Cache the tokens just requested for a user.
+
+    Args:
+      user_mail: String email address of the user.
+      token_list: List of token documents.
+    """
+    self._Load()
+    user_token_list = (user_mail, time.time(), token_list)
+    ApplyUserTokenList(self._entries, user_token_list)
+    self._new_user_token_lists.append(user_token_list)
+
+  def Revoke(self, user_mail, client_id):
+    """Leave out a token just revoked (RecordRevocation() notes it on disk).
+
+    Args:
+      user_mail: String email address of the user that authorized the token.
+      client_id: String of the client domain issued the token.
+    """
+    self._Load()
+    self._revocations[(user_mail.lower(), client_id)] = time.time()
+
+  def Save(self):
+    """Append the token lists cached since the last save to the cache file.
+
+    Returns:
+      String full path of the cache file or None if unchanged.
+    """
+    if not self._new_user_token_lists:
+      return None
+    user_token_lists = self._new_user_token_lists
+    self._new_user_token_lists = []
+    _AppendUserTokenLists(user_token_lists, self._cache_path)
+    return self._cache_path
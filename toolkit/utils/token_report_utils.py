@@ -19,6 +19,10 @@
 Used by both command line tools and ui tools.
 """
 
+import hashlib
+import itertools
+import json
+import os
 import pprint
 import sys
 
@@ -26,91 +30,34 @@ import sys
 # and lib (where the OAuth and Google API Python Client modules reside).
 import setup_path  # pylint: disable=unused-import,g-bad-import-order
 
+import checkpointer
+import external_sort
 import file_manager
 import log_utils
 import report_utils
-
-
-_TOKENS_ISSUED_FILE_NAME = 'tokens_issued.json'
+import sampling
+import scope_catalog
+import shard_utils
+
+
+TOKENS_ISSUED_FILE_NAME = 'tokens_issued.json'
+# Users -> stat keys of tokens_issued.json for lookups of one user.
+TOKENS_INDEX_FILE_NAME = 'tokens_issued_index.json'
+# Scope of each scope code (scope_catalog.ScopeCatalog) of the token stats.
+TOKENS_SCOPE_CODES_FILE_NAME = 'tokens_issued_scope_codes.json'
+# Token stats of the sampled users of a --sample run (never mixed with the
+# whole domain stats of tokens_issued.json) and the strata of the sample.
+TOKENS_SAMPLE_FILE_NAME = 'tokens_issued_sample.json'
+TOKENS_SAMPLE_DESIGN_FILE_NAME = 'tokens_issued_sample_design.json'
+# Used to tag user iterator progress data while gathering token stats.
+TOKEN_COLLECTION_PREFIX = 'collection'
+# Used to tag progress of --sample runs (kept apart from full runs).
+TOKEN_SAMPLE_PREFIX = 'sample'
+# Used to tag progress of --rescan_holders runs (kept apart from full runs).
+TOKEN_RESCAN_PREFIX = 'rescan'
 
 FILE_MANAGER = file_manager.FILE_MANAGER
-
-
-_SCOPE_MAP = {
-    'http://docs.google.com/feeds': (
-        'Docs (Read/Write, does not require SSL)'),
-    'http://docs.googleusercontent.com': (
-        'Download PDF and arbitrary files from Docs (Read only, does not '
-        'require SSL)'),
-    'http://mail.google.com/mail/feed/atom': (
-        'Email, new messages (Read only, does not require SSL)'),
-    'http://sites.google.com/feeds': (
-        'Sites (Read/Write, does not require SSL)'),
-    'http://spreadsheets.google.com/feeds': (
-        'Spreadsheets (Read/Write, does not require SSL)'),
-    'http://www.google.com/calendar/feeds': (
-        'Calendar (Read/Write, does not require SSL)'),
-    'http://www.google.com/finance/feeds': (
-        'Finance (Read Only, does not require SSL)'),
-    'http://www.google.com/m8/feeds': (
-        'Contacts (Read/Write, does not require SSL)'),
-    'https://apps-apis.google.com/a/feeds/calendar/resource': (
-        'Calendar Resources (Read/Write)'),
-    'https://apps-apis.google.com/a/feeds/calendar/resource/#readonly': (
-        'Calendar Resources (Read only)'),
-    'https://apps-apis.google.com/a/feeds/emailsettings/2.0': (
-        'Email Settings (Read/Write)'),
-    'https://apps-apis.google.com/a/feeds/group/#readonly': (
-        'Groups Provisioning (Read only)'),
-    'https://apps-apis.google.com/a/feeds/groups': (
-        'Groups Provisioning'),
-    'https://apps-apis.google.com/a/feeds/migration': (
-        'Email Migration (Write only)'),
-    'https://apps-apis.google.com/a/feeds/nickname/#readonly': (
-        'User Nicknames (Read only)'),
-    'https://apps-apis.google.com/a/feeds/user': (
-        'User Provisioning'),
-    'https://apps-apis.google.com/a/feeds/user/#readonly': (
-        'User Provisioning (Read only)'),
-    'https://docs.google.com/feeds': (
-        'Docs (Read/Write)'),
-    'https://docs.googleusercontent.com': (
-        'Download PDF and arbitrary files from Docs (Read only)'),
-    'https://mail.google.com': (
-        'Email (Read/Write/Send)'),
-    'https://mail.google.com/mail/feed/atom': (
-        'Email, new messages (Read only)'),
-    'https://sites.google.com/feeds': (
-        'Sites  (Read/Write)'),
-    'https://spreadsheets.google.com/feeds': (
-        'Spreadsheets (Read/Write)'),
-    'https://www.google.com/calendar/feeds': (
-        'Calendar (Read/Write)'),
-    'https://www.google.com/finance/feeds': (
-        'Finance (Read Only)'),
-    'https://www.google.com/m8/feeds': (
-        'Contacts (Read/Write)'),
-    'https://www.googleapis.com/auth/apps.groups.migration': (
-        'Groups Mail Migration'),
-    'https://www.googleapis.com/auth/apps.groups.settings': (
-        'Groups Settings'),
-    'https://www.googleapis.com/auth/apps.security': (
-        '3LO Tokens (read-write)'),
-    'https://www.googleapis.com/auth/calendar': (
-        'Calendar (Read-Write)'),
-    'https://www.googleapis.com/auth/directory.user': (
-        'User Provisioning'),
-    'https://www.googleapis.com/auth/directory.user.readonly': (
-        'User Provisioning (Read only)'),
-    'https://www.googleapis.com/auth/tasks': (
-        'Tasks (Read/Write)'),
-    'https://www.googleapis.com/auth/tasks.readonly': (
-        'Tasks (Read Only)'),
-    'https://www.googleapis.com/doclist.createnew': (
-        'Docs created with this application'),
-    'https://www.googleapis.com/doclist.openwith': (
-        'Docs opened with this application'),
-    }
+SCOPE_CATALOG = scope_catalog.SCOPE_CATALOG
 
 
 def LookupScope(scope):
@@ -122,10 +69,7 @@ def LookupScope(scope):
   Returns:
     Line of text with more readable explanation of the scope with the scope.
   """
-  readable_scope = _SCOPE_MAP.get(scope.rstrip('/'))
-  if readable_scope:
-    return '%s [%s]' % (readable_scope, scope)
-  return scope
+  return SCOPE_CATALOG.Lookup(scope)
 
 
 def PackStatKey(client_id, scope):
@@ -220,13 +164,24 @@ class TokenStats(object):
       in each.
     """
     results = report_utils.Counter()
-    for primary_key, token_list in self._access_token_map.iteritems():
-      primary_user_set = set()
-      for _, secondary_user_set in token_list:
-        primary_user_set |= secondary_user_set
-      results.Increment(primary_key, len(primary_user_set))
+    for primary_key in self._access_token_map:
+      results.Increment(primary_key, len(self.GetPrimaryUsers(primary_key)))
     return results
 
+  def GetPrimaryUsers(self, primary):
+    """Retrieve the users issued any token for the primary key.
+
+    Args:
+      primary: String describing the client_id or scope url.
+
+    Returns:
+      Set of user emails.
+    """
+    primary_user_set = set()
+    for _, secondary_user_set in self._access_token_map.get(primary, []):
+      primary_user_set |= secondary_user_set
+    return primary_user_set
+
   def GetTokenList(self, primary):
     """Retrieve the token list (value) for the primary key.
 
@@ -243,6 +198,18 @@ class TokenStats(object):
       token_list = sorted(token_list, key=lambda x: len(x[1]), reverse=True)
     return token_list
 
+  def GetTokenCounts(self, primary):
+    """Retrieve the token list for the primary key with user counts.
+
+    Args:
+      primary: String describing the client_id or scope url.
+
+    Returns:
+      List of 2-tuples (secondary_set, user count), most users first.
+    """
+    return [(secondary_set, len(user_set))
+            for secondary_set, user_set in self.GetTokenList(primary)]
+
 
 def SummarizeTokenStats(token_data):
   """Helper to populate summary data for client_ids and scopes.
@@ -252,21 +219,364 @@ def SummarizeTokenStats(token_data):
            gather_domain_token_stats().
 
   Returns:
-    Tuple of TokenStats objects:
+    Tuple of TokenStats objects (scopes are SCOPE_CATALOG codes):
     -A TokenStats with client_id as primary and scope as secondary.
     -A TokenStats with scope as primary and client_id as secondary.
   """
   client_id_summary_data = TokenStats()
   scope_summary_data = TokenStats()
 
+  for client_id, scope_code, user_list in GetTokenUsers(token_data):
+    client_id_summary_data.AddToken(client_id, scope_code, user_list)
+    scope_summary_data.AddToken(scope_code, client_id, user_list)
+
+  return client_id_summary_data, scope_summary_data
+
+
+def GetTokenUsers(token_data):
+  """Generate the users of each token of the token stats.
+
+  Args:
+    token_data: Dictionary deserialized from a json file created by
+                gather_domain_token_stats().
+
+  Yields:
+    3-tuples (client_id, scope code of SCOPE_CATALOG, user_list).
+  """
   for stat_key, user_list in token_data.iteritems():
     scope, client_id = UnpackStatKey(stat_key)
-    client_id_summary_data.AddToken(client_id, scope, user_list)
-    scope_summary_data.AddToken(scope, client_id, user_list)
+    yield client_id, SCOPE_CATALOG.GetCode(scope), user_list
+
+
+class EstimatedTokenStats(object):
+  """TokenStats rankings and token counts estimated from a sampled run.
+
+  Counts are estimated for the whole domain (see sampling.SampleDesign) from
+  the TokenStats of the sampled users; GetInterval() gives the confidence
+  interval of the count of a primary key.
+  """
+
+  def __init__(self, token_stats, design, confidence):
+    """Estimate the count of each primary key.
+
+    Args:
+      token_stats: TokenStats object of the sampled users.
+      design: sampling.SampleDesign object of the sampled run.
+      confidence: Float confidence level of the intervals.
+    """
+    self._token_stats = token_stats
+    self._design = design
+    self._confidence = confidence
+    self._estimates = {}
+    self._counter = report_utils.Counter()
+    for primary in token_stats.CalculateRankings().data:
+      estimate = design.Estimate(token_stats.GetPrimaryUsers(primary),
+                                 confidence)
+      self._estimates[primary] = estimate
+      self._counter.Increment(primary, estimate[0])
+
+  def CalculateRankings(self):
+    """Returns a Counter of estimated user counts on the primary key."""
+    return self._counter
+
+  def GetInterval(self, primary):
+    """Returns the (low, high) confidence interval of a primary key count."""
+    return self._estimates[primary][1:]
+
+  def GetTokenCounts(self, primary):
+    """Retrieve the token list for the primary key with estimated counts.
+
+    Args:
+      primary: String describing the client_id or scope url.
+
+    Returns:
+      List of 2-tuples (secondary_set, estimated user count), most users
+      first.
+    """
+    return sorted([(secondary_set,
+                    self._design.Estimate(user_set, self._confidence)[0])
+                   for secondary_set, user_set
+                   in self._token_stats.GetTokenList(primary)],
+                  key=lambda x: x[1], reverse=True)
+
+
+def SummarizeEstimatedTokenStats(token_data, design, confidence):
+  """Helper to populate estimated summary data for client_ids and scopes.
+
+  Args:
+    token_data: Dictionary deserialized from a json file created by a
+                gather_domain_token_stats --sample run.
+    design: sampling.SampleDesign object of that run.
+    confidence: Float confidence level of the intervals.
+
+  Returns:
+    Tuple of EstimatedTokenStats objects as SummarizeTokenStats().
+  """
+  return tuple(EstimatedTokenStats(summary, design, confidence)
+               for summary in SummarizeTokenStats(token_data))
 
+
+class SortedTokenStats(object):
+  """TokenStats rankings and token counts aggregated from sorted tuples.
+
+  Holds a count per primary key and, for --long_list, a (digest of the user
+  set -> secondaries, user count) group per primary key: never the users.
+  """
+
+  def __init__(self):
+    self._counter = report_utils.Counter()
+    self._token_groups = {}  # primary -> {digest: [secondary_set, count]}
+
+  def AddPrimaryUsers(self, sorted_pairs):
+    """Count the users of each primary key.
+
+    Args:
+      sorted_pairs: Iterable of unique (primary, user) tuples sorted by
+                    primary.
+    """
+    for primary, pairs in itertools.groupby(sorted_pairs, lambda p: p[0]):
+      self._counter.Increment(primary, sum(1 for _ in pairs))
+
+  def AddTokenGroups(self, sorted_triples):
+    """Group the secondaries of each primary key issued to the same users.
+
+    Args:
+      sorted_triples: Iterable of unique (primary, secondary, user) tuples
+                      sorted (so the users of a token are consecutive).
+    """
+    for (primary, secondary), triples in itertools.groupby(
+        sorted_triples, lambda t: t[:2]):
+      user_digest = hashlib.sha1()
+      user_count = 0
+      for _, _, user_email in triples:
+        user_digest.update('%s\n' % user_email)
+        user_count += 1
+      group = self._token_groups.setdefault(primary, {}).setdefault(
+          user_digest.digest(), [set(), user_count])
+      group[0].add(secondary)
+
+  def CalculateRankings(self):
+    """Returns a Counter of user counts on the primary key."""
+    return self._counter
+
+  def GetTokenCounts(self, primary):
+    """Retrieve the token list for the primary key with user counts.
+
+    Args:
+      primary: String describing the client_id or scope url.
+
+    Returns:
+      List of 2-tuples (secondary_set, user count), most users first.
+    """
+    return sorted([tuple(group) for group
+                   in self._token_groups.get(primary, {}).itervalues()],
+                  key=lambda x: x[1], reverse=True)
+
+
+def SummarizeTokenTuples(read_token_tuples_fn, memory_budget_bytes,
+                         long_list=False, temp_dir=None):
+  """Summarize streamed token tuples for client_ids and scopes.
+
+  The counterpart of SummarizeTokenStats() for domains whose token stats do
+  not fit in memory: each summary reads the tuples again through an
+  external_sort.ExternalSort() held to the memory budget.
+
+  Args:
+    read_token_tuples_fn: Function returning an iterable of (user_email,
+                          client_id, scope) tuples of byte strings (e.g.
+                          token_snapshots.ReadSnapshot of a snapshot).
+    memory_budget_bytes: Int estimated bytes of tuples held by each sort.
+    long_list: If True also group the tokens of each client_id and scope
+               (GetTokenCounts()).
+    temp_dir: String directory for the sorted runs or None.
+
+  Returns:
+    Tuple of SortedTokenStats objects (scopes are SCOPE_CATALOG codes):
+    -A SortedTokenStats with client_id as primary and scope as secondary.
+    -A SortedTokenStats with scope as primary and client_id as secondary.
+  """
+  def _Sort(reorder_fn):
+    return external_sort.ExternalSort(
+        (reorder_fn(*token_tuple) for token_tuple in read_token_tuples_fn()),
+        memory_budget_bytes, unique=True, temp_dir=temp_dir)
+
+  def _ScopeCodes(sorted_tuples):
+    # Scopes sort as urls; summaries key them by catalog code.
+    for scope_tuple in sorted_tuples:
+      yield (SCOPE_CATALOG.GetCode(scope_tuple[0]),) + scope_tuple[1:]
+
+  client_id_summary_data = SortedTokenStats()
+  scope_summary_data = SortedTokenStats()
+  client_id_summary_data.AddPrimaryUsers(
+      _Sort(lambda user, client_id, scope: (client_id, user)))
+  scope_summary_data.AddPrimaryUsers(
+      _ScopeCodes(_Sort(lambda user, client_id, scope: (scope, user))))
+  if long_list:
+    client_id_summary_data.AddTokenGroups(
+        (client_id, SCOPE_CATALOG.GetCode(scope), user)
+        for client_id, scope, user in _Sort(
+            lambda user, client_id, scope: (client_id, scope, user)))
+    scope_summary_data.AddTokenGroups(_ScopeCodes(_Sort(
+        lambda user, client_id, scope: (scope, client_id, user))))
   return client_id_summary_data, scope_summary_data
 
 
+class TokenStatsIndex(object):
+  """Inverted indexes of token stats for client_id, scope and user lookups.
+
+  Token stats are keyed by 'scope client_id' with the users of each key.
+  The indexes map each client_id and each scope to its stat keys (a few
+  thousand keys: built on first use) and each user to the stat keys of the
+  user (one pass over all the users: built on first use or read from
+  tokens_issued_index.json, see ReadTokenStatsIndex()).
+  """
+
+  def __init__(self, token_stats, user_stat_keys=None):
+    """Note the token stats; the indexes are built when first needed.
+
+    Args:
+      token_stats: Dictionary of token stats as written to tokens_issued.json
+                   (None if only user lookups are made).
+      user_stat_keys: If not None, Dictionary from GetTokenHolders() (e.g.
+                      read with the token stats index file).
+    """
+    self._token_stats = token_stats
+    self._client_stat_keys = None
+    self._scope_stat_keys = None
+    self._user_stat_keys = user_stat_keys
+
+  def _IndexStatKeys(self):
+    """Build the client_id and scope indexes from the stat keys."""
+    self._client_stat_keys = {}
+    self._scope_stat_keys = {}
+    for stat_key in self._token_stats:
+      scope, client_id = UnpackStatKey(stat_key)
+      self._client_stat_keys.setdefault(client_id, []).append(stat_key)
+      self._scope_stat_keys.setdefault(scope, []).append(stat_key)
+
+  def _GetUsers(self, stat_keys):
+    """Helper to collect the sorted unique users of stat keys."""
+    user_set = set()
+    for stat_key in stat_keys:
+      user_set.update(self._token_stats[stat_key])
+    return sorted(user_set)
+
+  def GetClientUsers(self, client_id):
+    """Retrieve the users who authorized tokens to a client_id.
+
+    Args:
+      client_id: String, possibly with spaces, of the domain issued a token.
+
+    Returns:
+      Sorted list of String user emails.
+    """
+    if self._client_stat_keys is None:
+      self._IndexStatKeys()
+    return self._GetUsers(self._client_stat_keys.get(client_id, []))
+
+  def GetScopeUsers(self, scope):
+    """Retrieve the users who authorized a scope to any client_id.
+
+    Args:
+      scope: String url reflecting the scope of access granted.
+
+    Returns:
+      Sorted list of String user emails.
+    """
+    if self._scope_stat_keys is None:
+      self._IndexStatKeys()
+    return self._GetUsers(self._scope_stat_keys.get(scope, []))
+
+  def GetUserStatKeys(self):
+    """Retrieve the user index (built on first use).
+
+    Returns:
+      Dictionary of user email to a list of the user's stat keys.
+    """
+    if self._user_stat_keys is None:
+      self._user_stat_keys = GetTokenHolders(self._token_stats)
+    return self._user_stat_keys
+
+  def GetUserTokens(self, user_email):
+    """Retrieve the tokens authorized by a user.
+
+    Args:
+      user_email: String email of the user.
+
+    Returns:
+      Sorted list of 2-tuples (String client_id, String scope).
+    """
+    return sorted((client_id, scope) for scope, client_id in [
+        UnpackStatKey(stat_key)
+        for stat_key in self.GetUserStatKeys().get(user_email, [])])
+
+
+def _GetTokenStatsFingerprint():
+  """Helper to identify the version of tokens_issued.json on disk.
+
+  Returns:
+    List of [size, modified time] of the file or None if it does not exist.
+  """
+  filename_path = FILE_MANAGER.GetStoredFilePath(TOKENS_ISSUED_FILE_NAME)
+  try:
+    return [os.path.getsize(filename_path), os.path.getmtime(filename_path)]
+  except OSError:
+    return None
+
+
+def WriteTokenStatsIndex(token_stats):
+  """Save the user index of the token stats just written.
+
+  Stat keys are stored once and referred to by position to keep the file
+  small.
+
+  Args:
+    token_stats: Dictionary of token stats as written to tokens_issued.json.
+
+  Returns:
+    String full path of the index file written.
+  """
+  stat_keys = sorted(token_stats)
+  stat_key_positions = dict((k, i) for i, k in enumerate(stat_keys))
+  user_positions = {}
+  for user_email, user_stat_keys in GetTokenHolders(token_stats).iteritems():
+    user_positions[user_email] = [stat_key_positions[k]
+                                  for k in user_stat_keys]
+  return FILE_MANAGER.WriteJsonFile(
+      TOKENS_INDEX_FILE_NAME,
+      {'source': _GetTokenStatsFingerprint(), 'stat_keys': stat_keys,
+       'users': user_positions},
+      overwrite_ok=True)
+
+
+def ReadTokenStatsIndex():
+  """Read the index of the last token stats for user lookups.
+
+  The index saved with the token stats is used unless tokens_issued.json
+  changed since (e.g. merged shards): it is then rebuilt and saved.
+
+  Returns:
+    TokenStatsIndex for user lookups (client_id and scope lookups also read
+    the token stats) or None if there are no token stats.
+  """
+  token_stats_fingerprint = _GetTokenStatsFingerprint()
+  if token_stats_fingerprint is None:
+    # An index left without its token stats is outdated.
+    return None
+  if FILE_MANAGER.FileExists(TOKENS_INDEX_FILE_NAME):
+    index_data = FILE_MANAGER.ReadJsonFile(TOKENS_INDEX_FILE_NAME)
+    if index_data.get('source') == token_stats_fingerprint:
+      stat_keys = index_data['stat_keys']
+      user_stat_keys = dict(
+          (user_email, [stat_keys[i] for i in positions])
+          for user_email, positions in index_data['users'].iteritems())
+      return TokenStatsIndex(None, user_stat_keys=user_stat_keys)
+    log_utils.LogDebug('Rebuilding the outdated token stats index.')
+  token_stats = GetTokenStats()
+  WriteTokenStatsIndex(token_stats)
+  return TokenStatsIndex(token_stats)
+
+
 def GetUsersInDomain(token_data, target_client_id):
   """Helper to retrieve the users who authorized tokens to an client_id.
 
@@ -276,56 +586,272 @@ def GetUsersInDomain(token_data, target_client_id):
     target_client_id: String, possibly with spaces, a domain issued a token.
 
   Returns:
-    A counter that includes the list of domains and #users authorizing to each.
+    Sorted list of the users authorizing tokens to the client_id.
   """
-  user_list = set()
-
+  # One lookup: a scan of the stat keys costs less than building an index.
+  user_set = set()
   for stat_key, stat_user_list in token_data.iteritems():
     _, client_id = UnpackStatKey(stat_key)
     if client_id == target_client_id:
-      user_list |= set(stat_user_list)
+      user_set.update(stat_user_list)
+  return sorted(user_set)
+
+
+def GetTokenHolders(token_stats):
+  """Index the stat keys held by each user.
+
+  Args:
+    token_stats: Dictionary of token stats as written to tokens_issued.json.
+
+  Returns:
+    Dictionary of user email to a list of the user's stat keys.
+  """
+  token_holders = {}
+  for stat_key, user_list in token_stats.iteritems():
+    for user_email in user_list:
+      token_holders.setdefault(user_email, []).append(stat_key)
+  return token_holders
+
+
+def RemoveUserTokens(token_stats, token_holders, user_email):
+  """Remove a user's tokens from token stats before re-checking the user.
+
+  Args:
+    token_stats: Dictionary of token stats to update.
+    token_holders: Dictionary from GetTokenHolders() to update.
+    user_email: String email of the user to remove.
+  """
+  for stat_key in token_holders.pop(user_email, []):
+    user_list = token_stats.get(stat_key)
+    if not user_list:
+      continue
+    user_list.remove(user_email)
+    if not user_list:
+      del token_stats[stat_key]
 
-  return sorted(user_list)
 
+def ApplyUserTokens(token_stats, user_tokens):
+  """Apply the tokens found for a user to token stats (or a checkpoint).
+
+  Args:
+    token_stats: Dictionary of token stats to update.
+    user_tokens: 3-tuple (String user email, List of stat keys to remove
+                 (re-checked user), List of stat keys to add).
+  """
+  user_email, removed_stat_keys, added_stat_keys = user_tokens
+  for stat_key in removed_stat_keys:
+    user_list = token_stats.get(stat_key)
+    if not user_list:
+      continue
+    user_list.remove(user_email)
+    if not user_list:
+      del token_stats[stat_key]
+  for stat_key in added_stat_keys:
+    token_stats.setdefault(stat_key, []).append(user_email)
+
+
+def NewTokensIssuedCheckpointer(token_stats, shard=None, keep_previous=0,
+                                domain_file_manager=None, sample=False):
+  """Checkpoint token stats gathered by ApplyUserTokens() in the background.
 
-def GetTokenStats(exit_on_fail=True):
+  Args:
+    token_stats: Dictionary of token stats so far.
+    shard: If not None, a 2-tuple (shard_index, shard_count) to write the
+           stats of one shard to its own file.
+    keep_previous: Int count of previous checkpoints to keep.
+    domain_file_manager: If not None, the FileManager of the domain scanned
+                         (e.g. by multi_domain_scanner) else FILE_MANAGER.
+    sample: If True write the stats of a --sample run to their own file.
+
+  Returns:
+    checkpointer.Checkpointer taking user_tokens tuples as deltas.
+  """
+  return checkpointer.Checkpointer(
+      _GetTokenStatsFileName(shard, sample), token_stats, ApplyUserTokens,
+      keep_previous=keep_previous, domain_file_manager=domain_file_manager)
+
+
+def _GetTokenStatsFileName(shard=None, sample=False):
+  """Helper to name the token stats file of a shard or of a --sample run."""
+  if sample:
+    return TOKENS_SAMPLE_FILE_NAME
+  return shard_utils.GetShardFileName(TOKENS_ISSUED_FILE_NAME, shard)
+
+
+def GetTokenStats(exit_on_fail=True, shard=None, sample=False):
   """Reads the snapshot of the token stats from the Json file.
 
   Args:
     exit_on_fail: Alternately return the message instead of failing
                   if token file not found.  Used for ui reporting.
+    shard: If not None, a 2-tuple (shard_index, shard_count) to read the
+           stats gathered by one shard of a --shard run.
+    sample: If True read the stats of the sampled users of a --sample run.
 
   Returns:
     Token stats in an object (a dictionary).  If cannot find the file
     return a message to show.
   """
-  if not FILE_MANAGER.FileExists(_TOKENS_ISSUED_FILE_NAME):
-    message = 'No token data. You must run gather_domain_token_stats first.'
+  file_name = _GetTokenStatsFileName(shard, sample)
+  if not FILE_MANAGER.FileExists(file_name):
+    if sample:
+      message = ('No sampled token data. You must run '
+                 'gather_domain_token_stats --sample first.')
+    else:
+      message = ('No token data. You must run gather_domain_token_stats '
+                 'first.')
     log_utils.LogError(message)
     if exit_on_fail:
       sys.exit(1)
     else:
       return message
-  return FILE_MANAGER.ReadJsonFile(_TOKENS_ISSUED_FILE_NAME)
+  ReadScopeCodes(shard=shard)
+  return FILE_MANAGER.ReadJsonFile(file_name)
 
 
-def WriteTokensIssuedJson(token_stats, overwrite_ok=False):
+def WriteTokensIssuedJson(token_stats, overwrite_ok=False, shard=None,
+                          keep_previous=0, sample=False):
   """Writes the snapshot of the token stats to Json file in progress.
 
   Args:
     token_stats: An object with the collected token stats.
     overwrite_ok: If True don't check if file exists - else fail if file exists.
+    shard: If not None, a 2-tuple (shard_index, shard_count) to write the
+           stats of one shard to its own file.
+    keep_previous: Int count of previous versions of the file to keep.
+    sample: If True write the stats of the sampled users of a --sample run.
 
   Returns:
     String reflecting the full path of the file created/written.
   """
-  filename_path = FILE_MANAGER.BuildFullPathToFileName(_TOKENS_ISSUED_FILE_NAME)
-  if FILE_MANAGER.FileExists(_TOKENS_ISSUED_FILE_NAME) and not overwrite_ok:
+  file_name = _GetTokenStatsFileName(shard, sample)
+  filename_path = FILE_MANAGER.BuildFullPathToFileName(file_name)
+  if FILE_MANAGER.FileExists(file_name) and not overwrite_ok:
     log_utils.LogError('Output file (%s) already exists. Use --force to '
                        'overwrite or --resume to continue an interrupted '
                        'run.' % filename_path)
     sys.exit(1)
-  filename_path = FILE_MANAGER.WriteJsonFile(_TOKENS_ISSUED_FILE_NAME,
-                                             token_stats,
-                                             overwrite_ok=overwrite_ok)
+  filename_path = FILE_MANAGER.WriteJsonFile(file_name, token_stats,
+                                             overwrite_ok=overwrite_ok,
+                                             keep_previous=keep_previous)
+  WriteScopeCodes(token_stats, shard=shard)
+  return filename_path
+
+
+def ReadScopeCodes(shard=None):
+  """Load the scope codes saved with the token stats into SCOPE_CATALOG.
+
+  Args:
+    shard: If not None, a 2-tuple (shard_index, shard_count) to load the
+           codes saved with the stats of one shard.
+  """
+  file_name = shard_utils.GetShardFileName(TOKENS_SCOPE_CODES_FILE_NAME, shard)
+  if FILE_MANAGER.FileExists(file_name):
+    SCOPE_CATALOG.LoadScopes(FILE_MANAGER.ReadJsonFile(file_name))
+
+
+def WriteScopeCodes(token_stats, shard=None):
+  """Save the scope codes beside the token stats.
+
+  The saved codes are loaded first so codes are only ever added: a scope
+  keeps its code across runs, and the codes of a shard start from those of
+  tokens_issued.json.
+
+  Args:
+    token_stats: Dictionary of token stats (or an iterable of stat keys).
+    shard: If not None, a 2-tuple (shard_index, shard_count) to save the
+           codes with the stats of one shard.
+
+  Returns:
+    String full path of the file written.
+  """
+  ReadScopeCodes()
+  if shard:
+    ReadScopeCodes(shard=shard)
+  for scope in sorted(set(UnpackStatKey(stat_key)[0]
+                          for stat_key in token_stats)):
+    SCOPE_CATALOG.GetCode(scope)
+  return FILE_MANAGER.WriteJsonFile(
+      shard_utils.GetShardFileName(TOKENS_SCOPE_CODES_FILE_NAME, shard),
+      SCOPE_CATALOG.GetScopes(), overwrite_ok=True)
+
+
+def ReadTokensSampleDesign():
+  """Read the design of the last --sample run (beside its token stats).
+
+  Returns:
+    sampling.SampleDesign object or None if no sample was drawn.
+  """
+  return sampling.ReadSampleDesign(TOKENS_SAMPLE_DESIGN_FILE_NAME)
+
+
+def RemoveTokensSampleDesign():
+  """Note that the sampled token stats are being replaced by a new sample."""
+  FILE_MANAGER.RemoveFile(TOKENS_SAMPLE_DESIGN_FILE_NAME)
+
+
+def IterShardTokenStats(shard_count):
+  """Read the per-shard stats files one at a time.
+
+  Args:
+    shard_count: Int count of shards (N in --shard=i/N).
+
+  Yields:
+    Dictionary of the token stats of each shard (the previous one is
+    released before the next file is read).
+  """
+  for shard in shard_utils.GetAllShards(shard_count):
+    yield GetTokenStats(shard=shard)
+
+
+def _EncodeField(field):
+  """Helper to encode a field for external_sort (no tabs or newlines)."""
+  if isinstance(field, unicode):
+    field = field.encode('utf-8')
+  return field.replace('\t', ' ').replace('\n', ' ')
+
+
+def _IterShardStatKeyUsers(shard_count):
+  """Helper to generate the (stat key, user email) pairs of every shard."""
+  for shard_token_stats in IterShardTokenStats(shard_count):
+    for stat_key, user_list in shard_token_stats.iteritems():
+      SCOPE_CATALOG.GetCode(UnpackStatKey(stat_key)[0])
+      stat_key = _EncodeField(stat_key)
+      for user_email in user_list:
+        yield stat_key, _EncodeField(user_email)
+
+
+def WriteMergedShardTokenStats(shard_count, memory_budget_bytes):
+  """Merge the per-shard stats files into tokens_issued.json.
+
+  The merged stats are never held in memory: the (stat key, user) pairs of
+  the shards (one shard file read at a time) are sorted within the memory
+  budget by external_sort and written one stat key at a time.  Users found
+  in 2 shard files (e.g. after users.json changed) are written once.  The
+  scope codes of tokens_issued.json are kept and those of the shards are
+  added to them.
+
+  Args:
+    shard_count: Int count of shards (N in --shard=i/N).
+    memory_budget_bytes: Int estimated bytes of pairs held in memory before
+                         sorted runs spill to disk.
+
+  Returns:
+    String full path of the file written.
+  """
+  ReadScopeCodes()
+  stat_key_users = external_sort.ExternalSort(
+      _IterShardStatKeyUsers(shard_count), memory_budget_bytes, unique=True)
+  f, filename_path = FILE_MANAGER.OpenFileForWrite(TOKENS_ISSUED_FILE_NAME)
+  with f:
+    f.write('{')
+    separator = ''
+    for stat_key, key_users in itertools.groupby(stat_key_users,
+                                                 key=lambda pair: pair[0]):
+      f.write('%s%s: %s' % (separator, json.dumps(stat_key),
+                            json.dumps([user for _, user in key_users])))
+      separator = ', '
+    f.write('}')
+  FILE_MANAGER.WriteJsonFile(TOKENS_SCOPE_CODES_FILE_NAME,
+                             SCOPE_CATALOG.GetScopes(), overwrite_ok=True)
   return filename_path
@@ -16,7 +16,9 @@
 
 """Class that holds the logic for revoking unapproved tokens based on lists.
 
-Uses black-lists of clients and/or scopes to determine 'unapproved'.
+Uses black-lists of clients and/or scopes to determine 'unapproved'.  Each
+line of a black-list is an exact, prefix ('*' suffix) or regex ('re:' prefix)
+rule (see policy_matcher.py).
 Relies on RefreshTokenStats() to retrieve actual token stats; they are
 retrieved with a series of requests and cached in a local file.
 
@@ -44,6 +46,10 @@ A recommended pattern of usage is:
 
   # Determine and revoke the unapproved tokens.
   token_revoker.RevokeUnapprovedTokens()
+
+Revocations may be issued concurrently (--revoke_threads) and each result is
+appended to a revocation ledger so an interrupted run can --resume.  With
+--dry_run only the planned request count and estimated time are reported.
 """
 
 import sys
@@ -57,11 +63,18 @@ from utils import admin_api_tool_errors
 from utils import auth_helper
 from utils import file_manager
 from utils import log_utils
+from utils import parallel_utils
+from utils import policy_matcher
+from utils import revocation_ledger
+from utils import token_cache
 from utils import token_report_utils
 
 
 FILE_MANAGER = file_manager.FILE_MANAGER
 
+# Each token delete request takes ~0.6s.  Used to estimate --dry_run time.
+_ESTIMATED_SECONDS_PER_REQUEST = 0.6
+
 
 class TokenRevoker(object):
   """Manages the complexity of the token revocation agasint multiple lists."""
@@ -70,7 +83,8 @@ class TokenRevoker(object):
     """Initialize sets which are udpated based on flags.
 
     Args:
-      flags: Argparse flags object with apps_domain, force, hide_timing.
+      flags: Argparse flags object with apps_domain, force, hide_timing,
+             dry_run, resume and revoke_threads.
     """
     self._flags = flags
     # Need to store the revocation data in a dictionary because the data
@@ -79,6 +93,8 @@ class TokenRevoker(object):
     self._token_data = None  # Read from the token json file.
     self._client_blacklist_set = set()  # Read from file.
     self._scope_blacklist_set = set()  # Read from file.
+    self._client_matcher = None  # Compiled from the client black list.
+    self._scope_matcher = None  # Compiled from the scope black list.
 
     self._http = auth_helper.GetAuthorizedHttp(flags)
     self._tokens_api = tokens_api.TokensApiWrapper(self._http)
@@ -97,6 +113,7 @@ class TokenRevoker(object):
     """
     self._client_blacklist_set = (
         FILE_MANAGER.ReadTextFileToSet(client_blacklist_file))
+    self._CompileBlacklists()
 
   def LoadScopeBlacklist(self, scope_blacklist_file):
     """If supplied, read the scope black list file into a set.
@@ -109,9 +126,7 @@ class TokenRevoker(object):
     """
     self._scope_blacklist_set = (
         FILE_MANAGER.ReadTextFileToSet(scope_blacklist_file))
-    # Scopes inconsistently add / - so strip them for our purposes.
-    self._scope_blacklist_set = set([s.rstrip('/')
-                                     for s in self._scope_blacklist_set])
+    self._CompileBlacklists()
 
   def ExitIfBothBlackListsEmptys(self):
     """Look through the lists supplied by command line for the unexpected."""
@@ -119,51 +134,24 @@ class TokenRevoker(object):
       log_utils.LogError('All black lists empty. There is nothing to revoke.')
       sys.exit(1)
 
-  def _IsRevokedByClientBlacklist(self,
-                                  scope,  # pylint: disable=unused-argument
-                                  client_id):
-    """Checks if issued tokens match client_ids listed in client black list.
-
-    By making this a method, this can be expanded to support more complex
-    matching such as regex client strings.
-
-    Args:
-      scope: String of the scope URI for an issued token - unused.
-      client_id: String of the client domain issued the token.
-                 May include spaces.
-
-    Returns:
-      True if the token is to be revoked by the client black list else False.
-    """
-    return (self._client_blacklist_set and
-            client_id in self._client_blacklist_set)
-
-  def _IsRevokedByScopeBlacklist(self,
-                                 scope,
-                                 client_id):  # pylint: disable=unused-argument
-    """Checks if issued tokens match scopes listed in scope black list.
-
-    By making this a method, this can be expanded to support more complex
-    matching such as regex scope strings.
-
-    Args:
-      scope: String of the scope URI for an issued token - unused.
-      client_id: String of the client domain issued the token.
-                 May include spaces.
-
-    Returns:
-      True if the token is to be revoked by the scope black list else False.
-    """
-    if not scope:
-      return False
-    # Scopes can arbitrarily include a trailing slash so we need to check
-    # for both slash-persent and no-slash-present cases.
-    candidate_scopes = set([scope.rstrip('/'), scope.rstrip('/') + '/'])
-    return self._scope_blacklist_set & candidate_scopes
+  def _CompileBlacklists(self):
+    """Compile the black lists into matchers; exits on an invalid rule."""
+    try:
+      self._client_matcher = policy_matcher.PolicyMatcher(
+          self._client_blacklist_set)
+      # Scopes inconsistently add / - so strip them for our purposes.
+      self._scope_matcher = policy_matcher.PolicyMatcher(
+          self._scope_blacklist_set, normalize_fn=lambda s: s.rstrip('/'))
+    except admin_api_tool_errors.AdminAPIToolPolicyError as e:
+      log_utils.LogError('Unable to load the black lists.', e)
+      sys.exit(1)
 
   def _IdentifyTokensToRevoke(self):
     """Enumerate known tokens and match against revoked clients/scopes.
 
+    Each distinct client_id and scope is matched once (verdicts are cached by
+    the matchers) however many stat keys share it.
+
     Sets self._tokens_to_revoke to a dictionary of the token data to revoke:
       e.g. {u'130316539331.apps.googleusercontent.com':
                 set([u'larry@altostrat.com']),
@@ -172,33 +160,80 @@ class TokenRevoker(object):
     """
     with log_utils.Timer(
         'Identify tokens', hide_timing=self._flags.hide_timing):
+      # The black lists may have been set without Load*Blacklist().
+      self._CompileBlacklists()
       self._token_data = token_report_utils.GetTokenStats()
       for stat_key, user_list in self._token_data.iteritems():
         scope, client_id = token_report_utils.UnpackStatKey(stat_key)
-        for blacklist_filter in [self._IsRevokedByClientBlacklist,
-                                 self._IsRevokedByScopeBlacklist]:
-          client_ids_revoked = blacklist_filter(scope, client_id)
-          if client_ids_revoked:
-            user_set = self._tokens_to_revoke.setdefault(client_id, set())
-            user_set.update(set(user_list))
-
-  def _RevokeToken(self, user_mail, client_id):
+        if (self._client_matcher.Matches(client_id) or
+            (scope and self._scope_matcher.Matches(scope))):
+          self._tokens_to_revoke.setdefault(client_id, set()).update(
+              user_list)
+
+  def _RevokeToken(self, user_mail, client_id, tokens_api=None):
     """Revoke a single token based on client_id and user.
 
-    Failures are logged but execution continues.
+    Failures are raised to RevokeUnapprovedTokens() which logs and records
+    them in the ledger and continues with the other tokens.
 
     Args:
       user_mail: String email address of the user that authorized the token.
       client_id: String of the client domain issued the token.
                  May include spaces.
+      tokens_api: TokensApiWrapper of the calling thread (http objects are not
+                  thread-safe) or None to use the one built in __init__.
     """
     log_utils.LogInfo('Revoking: %s, %s.' % (user_mail, client_id))
-    try:
-      self._tokens_api.DeleteToken(user_mail, client_id)
-    except admin_api_tool_errors.AdminAPIToolTokenRequestError as e:
-      log_utils.LogError(
-          'Unable to revoke token for user %s and client_id %s.'
-          % (user_mail, client_id), e)
+    (tokens_api or self._tokens_api).DeleteToken(user_mail, client_id)
+
+  def _NewTokensApi(self):
+    """Build a TokensApiWrapper with its own http object for one thread."""
+    return tokens_api.TokensApiWrapper(auth_helper.GetAuthorizedHttp(
+        self._flags))
+
+  def _GetPlannedRevocations(self, ledger):
+    """List the (user, client_id) tokens to revoke in a stable order.
+
+    Args:
+      ledger: RevocationLedger of previous runs (used with --resume).
+
+    Returns:
+      Tuple of (revocation_list, skipped_count) where skipped_count tokens
+      were already revoked by an interrupted run.
+    """
+    revoked_tokens = ledger.GetRevokedTokens() if self._flags.resume else set()
+    revocation_list = []
+    skipped_count = 0
+    for client_id in sorted(self._tokens_to_revoke):
+      for user_mail in sorted(self._tokens_to_revoke[client_id]):
+        if (user_mail, client_id) in revoked_tokens:
+          skipped_count += 1
+        else:
+          revocation_list.append((user_mail, client_id))
+    return revocation_list, skipped_count
+
+  def _ReportRevocationPlan(self, revocation_list, skipped_count):
+    """Show the requests a run would issue without issuing them.
+
+    Args:
+      revocation_list: List of (user_mail, client_id) tuples to revoke.
+      skipped_count: Int count of tokens revoked by an interrupted run.
+    """
+    thread_count = max(1, min(self._flags.revoke_threads,
+                              len(revocation_list)))
+    estimated_seconds = int(round(len(revocation_list) *
+                                  _ESTIMATED_SECONDS_PER_REQUEST /
+                                  thread_count))
+    for user_mail, client_id in revocation_list:
+      log_utils.LogInfo('Would revoke: %s, %s.' % (user_mail, client_id))
+    print 'Dry run: %d token revocation requests planned.' % len(
+        revocation_list)
+    if skipped_count:
+      print '  (%d tokens skipped: already revoked by a previous run.)' % (
+          skipped_count)
+    print 'Estimated time with %d thread(s): %dh %02dm %02ds.' % (
+        thread_count, estimated_seconds / 3600,
+        (estimated_seconds % 3600) / 60, estimated_seconds % 60)
 
   def RevokeUnapprovedTokens(self):
     """Examine each token and match it against rules to determine revocation.
@@ -210,9 +245,42 @@ class TokenRevoker(object):
     if not self._tokens_to_revoke:
       log_utils.LogInfo('No tokens found to revoke')
       return
+    ledger = revocation_ledger.RevocationLedger()
+    revocation_list, skipped_count = self._GetPlannedRevocations(ledger)
+    if self._flags.dry_run:
+      self._ReportRevocationPlan(revocation_list, skipped_count)
+      return
+    if skipped_count:
+      log_utils.LogInfo('Skipping %d tokens revoked by a previous run.' %
+                        skipped_count)
+    else:
+      ledger.Reset()
     log_utils.LogInfo('Tokens found to revoke.  Revoking now...')
-    with log_utils.Timer(
-        'All _RevokeToken() calls', hide_timing=self._flags.hide_timing):
-      for client_id in sorted(self._tokens_to_revoke):
-        for user_mail in sorted(self._tokens_to_revoke[client_id]):
-          self._RevokeToken(user_mail, client_id)
+
+    if self._flags.revoke_threads > 1:
+      thread_init_fn = self._NewTokensApi
+      revoke_fn = lambda api, token: self._RevokeToken(*token, tokens_api=api)
+    else:
+      thread_init_fn = None
+      revoke_fn = lambda _, token: self._RevokeToken(*token)
+    failed_count = 0
+    try:
+      # The token cache learns of the revocations once the run ends.
+      with token_cache.RevocationBatch(), log_utils.Timer(
+          'All _RevokeToken() calls', hide_timing=self._flags.hide_timing):
+        for token, _, error in parallel_utils.RunInParallel(
+            revocation_list, revoke_fn, self._flags.revoke_threads,
+            thread_init_fn=thread_init_fn):
+          if error:
+            # Includes api errors and unexpected (e.g. socket) errors.
+            log_utils.LogError('Unable to revoke token for user %s and '
+                               'client_id %s.' % token, error)
+            failed_count += 1
+          ledger.Record(token[0], token[1], error=error)
+    finally:
+      ledger.Close()
+    if failed_count:
+      log_utils.LogError('%d of %d token revocations failed. Use --resume to '
+                         'retry them (ledger: %s).' % (
+                             failed_count, len(revocation_list),
+                             ledger.filename_path))
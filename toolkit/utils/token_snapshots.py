@@ -0,0 +1,280 @@
+#!/usr/bin/python
+#
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Timestamped snapshots of domain token stats and diffs between them.
+
+Each completed gather run saves a snapshot of the tokens issued in the domain
+to the working directory as:
+
+  token_snapshot.<YYYYmmddTHHMMSSZ>.tsv
+
+Each line of a snapshot holds one (user, client_id, scope) tuple separated by
+tabs and the lines are sorted.  Because both snapshots are sorted, the changes
+between two runs are found by streaming through both files in step (a sorted
+merge) so memory use does not grow with the size of the domain.
+"""
+
+import time
+
+# setup_path required to allow imports from component dirs (e.g. utils)
+# and lib (where the OAuth and Google API Python Client modules reside).
+import setup_path  # pylint: disable=unused-import,g-bad-import-order
+
+import external_sort
+import file_manager
+import token_report_utils
+
+
+FILE_MANAGER = file_manager.FILE_MANAGER
+
+SNAPSHOT_FILE_PREFIX = 'token_snapshot.'
+SNAPSHOT_FILE_SUFFIX = '.tsv'
+_SNAPSHOT_FILE_PATTERN = '%s*%s' % (SNAPSHOT_FILE_PREFIX, SNAPSHOT_FILE_SUFFIX)
+_SNAPSHOT_TIME_FORMAT = '%Y%m%dT%H%M%SZ'  # Sorts in time order; always UTC.
+
+GRANTED = '+'
+REVOKED = '-'
+
+
+def GetSnapshotFileName(timestamp):
+  """Helper to name the snapshot file of a timestamp string."""
+  return '%s%s%s' % (SNAPSHOT_FILE_PREFIX, timestamp, SNAPSHOT_FILE_SUFFIX)
+
+
+def GetSnapshotTimestamp(file_name):
+  """Helper to extract the timestamp string from a snapshot file name."""
+  return file_name[len(SNAPSHOT_FILE_PREFIX):-len(SNAPSHOT_FILE_SUFFIX)]
+
+
+def ListSnapshots():
+  """List the timestamps of saved snapshots, oldest first.
+
+  Returns:
+    List of timestamp Strings (e.g. ['20141102T173502Z', ...]).
+  """
+  return [GetSnapshotTimestamp(file_name) for file_name in
+          FILE_MANAGER.ListFileNames(_SNAPSHOT_FILE_PATTERN)]
+
+
+def _EncodeField(field):
+  """Tabs and newlines delimit the snapshot format so keep them out."""
+  if isinstance(field, unicode):
+    field = field.encode('utf-8')
+  return field.replace('\t', ' ').replace('\n', ' ')
+
+
+def _IterUnsortedTokenTuples(token_stats):
+  """Helper to generate the (user, client_id, scope) tuples of token stats."""
+  for stat_key, user_list in token_stats.iteritems():
+    scope, client_id = token_report_utils.UnpackStatKey(stat_key)
+    scope = _EncodeField(scope)
+    client_id = _EncodeField(client_id)
+    for user_email in user_list:
+      yield _EncodeField(user_email), client_id, scope
+
+
+def IterTokenTuples(token_stats):
+  """Generate sorted (user, client_id, scope) tuples from token stats.
+
+  Args:
+    token_stats: Dictionary of token stats as written to tokens_issued.json.
+
+  Yields:
+    Tuple of utf-8 encoded Strings (user_email, client_id, scope).
+  """
+  for token_tuple in sorted(set(_IterUnsortedTokenTuples(token_stats))):
+    yield token_tuple
+
+
+def _WriteSnapshotTuples(token_tuples, timestamp):
+  """Helper to save sorted (user, client_id, scope) tuples as a snapshot."""
+  if not timestamp:
+    timestamp = time.strftime(_SNAPSHOT_TIME_FORMAT, time.gmtime())
+  f, filename_path = FILE_MANAGER.OpenFileForWrite(
+      GetSnapshotFileName(timestamp))
+  with f:
+    for token_tuple in token_tuples:
+      f.write('%s\n' % '\t'.join(token_tuple))
+  return filename_path
+
+
+def WriteSnapshot(token_stats, timestamp=None):
+  """Save the token stats as a new timestamped snapshot.
+
+  Args:
+    token_stats: Dictionary of token stats as written to tokens_issued.json.
+    timestamp: Optional String timestamp; defaults to the current UTC time.
+
+  Returns:
+    String full path of the file written.
+  """
+  return _WriteSnapshotTuples(IterTokenTuples(token_stats), timestamp)
+
+
+def WriteShardSnapshot(shard_count, memory_budget_bytes, timestamp=None):
+  """Save the token stats of all the shards of a --shard run as a snapshot.
+
+  The tuples of the shards (one shard file read at a time) are sorted within
+  the memory budget by external_sort instead of merging the stats first.
+
+  Args:
+    shard_count: Int count of shards (N in --shard=i/N).
+    memory_budget_bytes: Int estimated bytes of tuples held in memory before
+                         sorted runs spill to disk.
+    timestamp: Optional String timestamp; defaults to the current UTC time.
+
+  Returns:
+    String full path of the file written.
+  """
+  token_tuples = (
+      token_tuple
+      for shard_token_stats in token_report_utils.IterShardTokenStats(
+          shard_count)
+      for token_tuple in _IterUnsortedTokenTuples(shard_token_stats))
+  return _WriteSnapshotTuples(
+      external_sort.ExternalSort(token_tuples, memory_budget_bytes,
+                                 unique=True), timestamp)
+
+
+def PruneSnapshots(keep_count):
+  """Remove the oldest snapshots leaving only the newest keep_count.
+
+  Args:
+    keep_count: Int count of snapshots to keep.  0 keeps all snapshots.
+
+  Returns:
+    List of timestamp Strings of the snapshots removed.
+  """
+  if keep_count <= 0:
+    return []
+  removed = ListSnapshots()[:-keep_count]
+  for timestamp in removed:
+    FILE_MANAGER.RemoveFile(GetSnapshotFileName(timestamp))
+  return removed
+
+
+def ReadSnapshot(timestamp):
+  """Generate the (user, client_id, scope) tuples of a snapshot in order.
+
+  Lines are read one at a time so the snapshot is never held in memory.
+
+  Args:
+    timestamp: String timestamp of the snapshot.
+
+  Yields:
+    Tuple of utf-8 encoded Strings (user_email, client_id, scope).
+  """
+  f = FILE_MANAGER.OpenFileForRead(GetSnapshotFileName(timestamp),
+                                   work_dir=True)
+  try:
+    for line in f:
+      line = line.rstrip('\n')
+      if line:
+        yield tuple(line.split('\t'))
+  finally:
+    f.close()
+
+
+def DiffTokenTuples(old_tuples, new_tuples):
+  """Compare two sorted streams of token tuples with a sorted merge.
+
+  Args:
+    old_tuples: Iterable of sorted (user, client_id, scope) tuples.
+    new_tuples: Iterable of sorted (user, client_id, scope) tuples.
+
+  Yields:
+    Tuple of (change, token_tuple) where change is GRANTED for tuples only in
+    new_tuples or REVOKED for tuples only in old_tuples.  Changes are produced
+    in sorted token_tuple order.
+  """
+  old_iter = iter(old_tuples)
+  new_iter = iter(new_tuples)
+  old_tuple = next(old_iter, None)
+  new_tuple = next(new_iter, None)
+  while old_tuple is not None or new_tuple is not None:
+    if new_tuple is None or (old_tuple is not None and old_tuple < new_tuple):
+      yield REVOKED, old_tuple
+      old_tuple = next(old_iter, None)
+    elif old_tuple is None or new_tuple < old_tuple:
+      yield GRANTED, new_tuple
+      new_tuple = next(new_iter, None)
+    else:
+      old_tuple = next(old_iter, None)
+      new_tuple = next(new_iter, None)
+
+
+def DiffSnapshots(old_timestamp, new_timestamp):
+  """Stream the changes between two saved snapshots.
+
+  Args:
+    old_timestamp: String timestamp of the earlier snapshot.
+    new_timestamp: String timestamp of the later snapshot.
+
+  Returns:
+    Generator of (change, token_tuple) as described in DiffTokenTuples().
+  """
+  return DiffTokenTuples(ReadSnapshot(old_timestamp),
+                         ReadSnapshot(new_timestamp))
+
+
+class TokenChangeSummary(object):
+  """Compact per-client summary of granted and revoked tokens.
+
+  Only counts are kept (per client_id, not per user) so the summary stays
+  small however many changes stream through it.
+  """
+
+  def __init__(self):
+    self.granted_count = 0
+    self.revoked_count = 0
+    self._client_changes = {}  # client_id: [granted_users, revoked_users]
+    self._last_user_changes = {}  # client_id: (user, set of changes counted)
+
+  def AddChange(self, change, token_tuple):
+    """Count one change; a user is counted once per client and change type.
+
+    Args:
+      change: GRANTED or REVOKED.
+      token_tuple: Tuple of (user_email, client_id, scope).
+    """
+    user_email, client_id, _ = token_tuple
+    if change == GRANTED:
+      self.granted_count += 1
+    else:
+      self.revoked_count += 1
+    # Changes arrive sorted by user so all scopes of one user and client
+    # arrive together; only the most recent user per client is remembered.
+    last_user, changes_counted = self._last_user_changes.get(client_id,
+                                                             (None, None))
+    if last_user != user_email:
+      changes_counted = set()
+      self._last_user_changes[client_id] = (user_email, changes_counted)
+    if change in changes_counted:
+      return
+    changes_counted.add(change)
+    counts = self._client_changes.setdefault(client_id, [0, 0])
+    counts[0 if change == GRANTED else 1] += 1
+
+  def GetClientChanges(self):
+    """List per-client user counts, most changed client first.
+
+    Returns:
+      List of tuples: (client_id, granted_user_count, revoked_user_count).
+    """
+    return sorted(
+        ((client_id, counts[0], counts[1])
+         for client_id, counts in self._client_changes.iteritems()),
+        key=lambda c: (-(c[1] + c[2]), c[0]))
@@ -0,0 +1,391 @@
+#!/usr/bin/python
+#
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Serve per-user commands from a long-lived process over a Unix socket.
+
+Automation that runs ls_user.py or ls_tokens_for_user.py once per ticket
+pays, on every run, for interpreter startup, loading the credentials,
+fetching the API discovery documents and a TLS handshake.  The toolkitd
+daemon (cmds/toolkitd.py) keeps all of that warm:
+
+  -authorized http objects (auth_helper.EnableHttpPool),
+  -the services built on them (http_utils.EnableServiceCache),
+  -an index of the users list used to check that users exist
+   (users_index.UsersIndex).
+
+The client (cmds/toolkit_client.py) sends a command and its arguments and
+prints the output and returns the exit code of the command run by the
+daemon.  When the daemon is not running, does not serve the command or
+cannot run it (e.g. a domain without saved credentials) the client runs the
+command directly.
+
+Each message is one line of json.  A request:
+  {"command": "ls_user", "argv": ["-u", "larry@altostrat.com"]}
+and its response:
+  {"exit_code": 0, "stdout": "...", "stderr": "..."}
+or, if the client should run the command itself:
+  {"fallback": "reason"}
+
+Commands share process state (e.g. the working directory and sys.stdout)
+so the daemon runs one command at a time.  The socket is only accessible
+by the user running the daemon since commands run with their credentials.
+"""
+
+import errno
+import importlib
+import json
+import os
+import socket
+import sys
+import traceback
+
+# setup_path required to allow imports from component dirs (e.g. utils)
+# and lib (where the OAuth and Google API Python Client modules reside).
+import setup_path  # pylint: disable=unused-import,g-bad-import-order
+
+import admin_api_tool_errors
+import auth_helper
+import file_manager
+import http_utils
+import log_utils
+import users_index
+
+
+SOCKET_FILE_NAME = 'toolkitd.sock'
+
+# Quick per-user commands without prompts.  Long runs (e.g. gathering token
+# stats) would hold up every other client so they always run directly.
+SERVED_COMMANDS = frozenset([
+    'ls_tokens_for_user',
+    'ls_tokens_for_user_clientid',
+    'ls_user',
+    'revoke_tokens_for_user_clientid',
+    ])
+
+# Seconds for a client to connect; a daemon that does not accept by then is
+# treated as not running.
+_CONNECT_TIMEOUT_S = 2
+
+
+FILE_MANAGER = file_manager.FILE_MANAGER
+
+
+def GetSocketPath():
+  """Locate the daemon socket: in the working directory shared by domains."""
+  return FILE_MANAGER.BuildFullPathToFileName(
+      os.path.join(FILE_MANAGER.WORK_ROOT_DIR, SOCKET_FILE_NAME),
+      work_dir=False, create_dir=True)
+
+
+def _ImportCommand(command_name):
+  """Import the module of a command (e.g. 'ls_user') from cmds."""
+  return importlib.import_module('cmds.%s' % command_name)
+
+
+def _GetExitCode(exit_arg):
+  """Convert a sys.exit() argument to an exit code as the interpreter does."""
+  if exit_arg is None:
+    return 0
+  if isinstance(exit_arg, int):
+    return exit_arg
+  sys.stderr.write('%s\n' % exit_arg)
+  return 1
+
+
+def _RunCommandMain(command_name, argv):
+  """Run the main() of a command in this process.
+
+  Args:
+    command_name: String name of a command in cmds (e.g. 'ls_user').
+    argv: List of String command line arguments for the command.
+
+  Returns:
+    Int exit code of the command.
+  """
+  saved_argv = sys.argv
+  sys.argv = ['%s.py' % command_name] + list(argv)  # Names the usage output.
+  try:
+    _ImportCommand(command_name).main(list(argv))
+  except SystemExit as e:
+    return _GetExitCode(e.code)
+  finally:
+    sys.argv = saved_argv
+  return 0
+
+
+def _ResetCommandCaches():
+  """Save and drop the caches enabled by a command for its working directory.
+
+  The next command (maybe of another domain) then reads the cache files
+  again, with the gathers and revocations made since.
+  """
+  # Imported here to keep the client (which shares this module) light.
+  # pylint: disable=g-import-not-at-top
+  from admin_sdk_directory_api import tokens_api
+  from admin_sdk_directory_api import users_api
+
+  for cache_name, disable_fn in [('token', tokens_api.DisableTokenCache),
+                                 ('user', users_api.DisableUserCache)]:
+    try:
+      disable_fn()
+    except (admin_api_tool_errors.AdminAPIToolFileError,
+            admin_api_tool_errors.AdminAPIToolJsonError) as e:
+      log_utils.LogError('Unable to save the %s cache.' % cache_name, e)
+
+
+def _SendMessage(connection, message):
+  """Send a message object as a line of json."""
+  connection.sendall(json.dumps(message) + '\n')
+
+
+def _ReceiveMessage(connection):
+  """Read a line of json from a socket.
+
+  Args:
+    connection: Connected socket object.
+
+  Returns:
+    The message object or None if the connection closed without a message.
+  """
+  f = connection.makefile('rb')
+  try:
+    line = f.readline()
+  finally:
+    f.close()
+  return json.loads(line) if line else None
+
+
+class _CapturedOutput(object):
+  """File-like object holding the output of a command as utf-8 bytes."""
+
+  encoding = 'utf-8'
+
+  def __init__(self):
+    self._chunks = []
+
+  def write(self, text):  # pylint: disable=invalid-name
+    if isinstance(text, unicode):
+      text = text.encode('utf-8')
+    self._chunks.append(text)
+
+  def flush(self):  # pylint: disable=invalid-name
+    pass
+
+  def isatty(self):  # pylint: disable=invalid-name
+    return False
+
+  def GetText(self):
+    """Return the output as unicode for the json response."""
+    return ''.join(self._chunks).decode('utf-8', 'replace')
+
+
+class ToolkitDaemon(object):
+  """Runs the commands received on a Unix socket in this process."""
+
+  def __init__(self, socket_path, verbose=False):
+    """Set up the daemon (call Warm() and Serve() to start it).
+
+    Args:
+      socket_path: String path of the Unix socket to listen on.
+      verbose: Boolean, the --verbose flag of the daemon itself.
+    """
+    self._socket_path = socket_path
+    self._verbose = verbose
+    self._server = None
+
+  def Warm(self, flags):
+    """Authorize and build the services for a domain before serving.
+
+    Authorization runs first (and may run the interactive OAuth flow) since
+    the daemon cannot run the flow for a client.
+
+    Args:
+      flags: Argparse flags object of the daemon (with apps_domain and the
+             oauth2client flags).
+    """
+    # Imported here to keep the client (which shares this module) light.
+    # pylint: disable=g-import-not-at-top
+    from admin_sdk_directory_api import tokens_api
+    from admin_sdk_directory_api import users_api
+
+    auth_helper.GetAuthorizedHttp(flags)
+    auth_helper.EnableHttpPool()
+    http_utils.EnableServiceCache()
+    users_api.USERS_INDEX = users_index.UsersIndex()
+    http = auth_helper.GetAuthorizedHttp(flags)
+    users_api.UsersApiWrapper(http)
+    tokens_api.TokensApiWrapper(http)
+    users_api.USERS_INDEX.Load()
+    auth_helper.ReleaseHttpPool()
+
+  def HandleRequest(self, request):
+    """Run one command and capture its output.
+
+    Args:
+      request: Dictionary with the command name and argv (List of strings).
+
+    Returns:
+      Response dictionary (see the module docstring).
+    """
+    command_name = request.get('command')
+    if command_name not in SERVED_COMMANDS:
+      return {'fallback': 'Command %s is not served by toolkitd.' %
+                          command_name}
+    log_utils.LogInfo('Running %s %s' % (command_name,
+                                         ' '.join(request.get('argv', []))))
+    saved_stdout, saved_stderr = sys.stdout, sys.stderr
+    sys.stdout, sys.stderr = _CapturedOutput(), _CapturedOutput()
+    # Console logging to the captured stderr (the command sets the level).
+    log_utils.SetupLogging(False)
+    try:
+      try:
+        exit_code = _RunCommandMain(command_name, request.get('argv', []))
+      except admin_api_tool_errors.AdminAPIToolAuthorizationError as e:
+        return {'fallback': str(e)}
+      except Exception:  # pylint: disable=broad-except
+        # Report the failure to the client; the daemon keeps serving.
+        traceback.print_exc()
+        exit_code = 1
+      return {'exit_code': exit_code,
+              'stdout': sys.stdout.GetText(),
+              'stderr': sys.stderr.GetText()}
+    finally:
+      sys.stdout, sys.stderr = saved_stdout, saved_stderr
+      auth_helper.ReleaseHttpPool()
+      # Console logging back to the daemon stderr.
+      log_utils.SetupLogging(self._verbose)
+      _ResetCommandCaches()
+
+  def Listen(self):
+    """Create the socket and start accepting connections."""
+    self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # Only the user running the daemon may connect.
+    saved_umask = os.umask(0177)
+    try:
+      self._server.bind(self._socket_path)
+    finally:
+      os.umask(saved_umask)
+    self._server.listen(5)
+    log_utils.LogInfo('toolkitd listening on %s.' % self._socket_path)
+
+  def Serve(self):
+    """Serve requests until a stop request is received."""
+    if not self._server:
+      self.Listen()
+    try:
+      while True:
+        connection, _ = self._server.accept()
+        try:
+          request = _ReceiveMessage(connection)
+          if not request:
+            continue  # e.g. IsDaemonRunning() checking the socket.
+          if request.get('stop'):
+            _SendMessage(connection, {'stopped': True})
+            break
+          _SendMessage(connection, self.HandleRequest(request))
+        except (socket.error, ValueError) as e:
+          log_utils.LogError('Unable to serve a toolkitd request.', e)
+        finally:
+          connection.close()
+    finally:
+      self._server.close()
+      self._server = None
+      os.remove(self._socket_path)
+    log_utils.LogInfo('toolkitd stopped.')
+
+
+def _SendRequest(socket_path, request):
+  """Send a request to the daemon and wait for the response.
+
+  Args:
+    socket_path: String path of the daemon Unix socket.
+    request: Request dictionary.
+
+  Returns:
+    Response dictionary or None if the daemon is not running.
+  """
+  if not os.path.exists(socket_path):
+    return None
+  client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  try:
+    client.settimeout(_CONNECT_TIMEOUT_S)
+    try:
+      client.connect(socket_path)
+    except socket.error:
+      return None
+    client.settimeout(None)  # Commands may take a while.
+    _SendMessage(client, request)
+    return _ReceiveMessage(client)
+  finally:
+    client.close()
+
+
+def IsDaemonRunning(socket_path):
+  """Check for a daemon accepting connections, removing a stale socket file.
+
+  Args:
+    socket_path: String path of the daemon Unix socket.
+
+  Returns:
+    True if a daemon is listening on the socket else False.
+  """
+  if not os.path.exists(socket_path):
+    return False
+  client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  try:
+    client.connect(socket_path)
+    return True
+  except socket.error as e:
+    if e.errno in (errno.ECONNREFUSED, errno.ENOENT):
+      os.remove(socket_path)  # Left behind by a daemon that was killed.
+      return False
+    raise
+  finally:
+    client.close()
+
+
+def StopDaemon(socket_path):
+  """Ask a running daemon to stop.
+
+  Args:
+    socket_path: String path of the daemon Unix socket.
+
+  Returns:
+    True if a daemon was asked to stop, False if none was running.
+  """
+  return _SendRequest(socket_path, {'stop': True}) is not None
+
+
+def RunCommand(command_name, argv, socket_path=None):
+  """Run a command in the daemon if possible else directly in this process.
+
+  Args:
+    command_name: String name of a command in cmds (e.g. 'ls_user').
+    argv: List of String command line arguments for the command.
+    socket_path: String path of the daemon Unix socket (defaults to
+                 GetSocketPath()).
+
+  Returns:
+    Int exit code of the command.
+  """
+  if command_name in SERVED_COMMANDS:
+    response = _SendRequest(socket_path or GetSocketPath(),
+                            {'command': command_name, 'argv': argv})
+    if response and 'fallback' not in response:
+      sys.stdout.write(response['stdout'].encode('utf-8'))
+      sys.stderr.write(response['stderr'].encode('utf-8'))
+      return response['exit_code']
+  return _RunCommandMain(command_name, argv)
@@ -0,0 +1,175 @@
+#!/usr/bin/python
+#
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Cache of user documents returned by users.get() requests.
+
+Commands like ls_user.py, add_user.py and rm_user.py look up the same users
+again and again (add and delete check the user exists before and after the
+change).  The cache keeps the most recently used user documents, by email and
+by id, in memory and in a file of the working directory (user_cache.json):
+
+  -a document retrieved (or revalidated) by this command is returned without
+   a request,
+  -a document read from the file may be outdated: it is revalidated with an
+   If-None-Match request on its etag which costs a 304 (not modified) response
+   without a body when it is unchanged,
+  -the documents of users added or deleted by this command are dropped.
+
+Missing users are not cached.  The toolkitd daemon saves and drops the cache
+after each command (see users_api.DisableUserCache()) so a later command
+revalidates the documents again.
+"""
+
+import collections
+import threading
+
+# setup_path required to allow imports from component dirs (e.g. utils)
+# and lib (where the OAuth and Google API Python Client modules reside).
+import setup_path  # pylint: disable=unused-import,g-bad-import-order
+
+from utils import admin_api_tool_errors
+from utils import file_manager
+from utils import log_utils
+
+
+USER_CACHE_FILE_NAME = 'user_cache.json'
+_MAX_CACHED_USERS = 1000
+
+FILE_MANAGER = file_manager.FILE_MANAGER
+
+
+class UserCache(object):
+  """LRU cache of user documents saved in the working directory.
+
+  Bound to the working directory current when created: Save() writes there
+  even if a later command of the process works on another domain.
+  """
+
+  def __init__(self, max_users=_MAX_CACHED_USERS):
+    """Set the size; the cache file is read on first use.
+
+    Args:
+      max_users: Int count of user documents kept (least recently used are
+                 dropped first).
+    """
+    self._max_users = max_users
+    # A full path: FILE_MANAGER leaves it as is whatever its working directory.
+    self._cache_path = FILE_MANAGER.BuildFullPathToFileName(
+        USER_CACHE_FILE_NAME)
+    self._users = collections.OrderedDict()  # id -> user, oldest first.
+    self._user_ids = {}  # Lower case email or id -> id.
+    self._fresh_ids = set()  # Retrieved or revalidated by this command.
+    self._loaded = False
+    self._changed = False
+    self._lock = threading.Lock()  # Shared by the threads of a command.
+
+  def _Load(self):
+    """Read the cache file of the working directory (if any)."""
+    if self._loaded:
+      return
+    self._loaded = True
+    if not FILE_MANAGER.FileExists(self._cache_path):
+      return
+    try:
+      users = FILE_MANAGER.ReadJsonFile(self._cache_path)
+    except admin_api_tool_errors.AdminAPIToolJsonError as e:
+      log_utils.LogInfo('Ignoring unreadable user cache: %s' % e)
+      return
+    for user in users:
+      self._Add(user)
+
+  def _Add(self, user):
+    """Add or refresh a user document as the most recently used."""
+    self._Remove(user['id'])
+    self._users[user['id']] = user
+    self._user_ids[user['id']] = user['id']
+    self._user_ids[user['primaryEmail'].lower()] = user['id']
+    while len(self._users) > self._max_users:
+      self._Remove(next(iter(self._users)))
+
+  def _Remove(self, user_key):
+    """Drop a user document and its keys; returns True if it was cached."""
+    user_id = self._user_ids.get(user_key.lower(), user_key)
+    user = self._users.pop(user_id, None)
+    if not user:
+      return False
+    self._fresh_ids.discard(user_id)
+    for key in [user_id, user['primaryEmail'].lower()]:
+      if self._user_ids.get(key) == user_id:
+        del self._user_ids[key]
+    return True
+
+  def IsForWorkDirectory(self):
+    """Check the cache is of the current working directory."""
+    return (FILE_MANAGER.BuildFullPathToFileName(USER_CACHE_FILE_NAME) ==
+            self._cache_path)
+
+  def Get(self, user_key):
+    """Look up a user document.
+
+    Args:
+      user_key: String email address or id of the user.
+
+    Returns:
+      Tuple of (user, fresh): user is the cached document or None and fresh
+      is True if it was retrieved by this command (no request needed) or
+      False if it must be revalidated.
+    """
+    with self._lock:
+      self._Load()
+      user_id = self._user_ids.get(user_key.lower())
+      if user_id is None:
+        return None, False
+      user = self._users.pop(user_id)
+      self._users[user_id] = user  # Most recently used.
+      return user, user_id in self._fresh_ids
+
+  def Put(self, user):
+    """Cache a user document just retrieved or revalidated.
+
+    Args:
+      user: Dictionary user document (with primaryEmail, id and etag).
+    """
+    with self._lock:
+      self._Load()
+      self._Add(user)
+      self._fresh_ids.add(user['id'])
+      self._changed = True
+
+  def Invalidate(self, user_key):
+    """Drop a user document (e.g. the user was added, deleted or not found).
+
+    Args:
+      user_key: String email address or id of the user.
+    """
+    with self._lock:
+      self._Load()
+      if self._Remove(user_key):
+        self._changed = True
+
+  def Save(self):
+    """Write the cached documents to their working directory if changed.
+
+    Returns:
+      String full path of the cache file or None if unchanged.
+    """
+    with self._lock:
+      if not self._changed:
+        return None
+      self._changed = False
+      return FILE_MANAGER.WriteJsonFile(self._cache_path,
+                                        self._users.values(),
+                                        overwrite_ok=True)
@@ -19,6 +19,11 @@ operation on a set of users, get interrupted, and then resume.
 
 This is needed for working with large sets of users (e.g.> 20k users)
 efficiently.
+
+StartUserIterator() yields the users one at a time.  RunUserPipeline() runs
+a pipeline.Pipeline over them (concurrent requests with --fetch_threads) and
+writes the progress cookie only when the results are checkpointed, so a
+--resume restarts exactly after the last user saved.
 """
 
 import sys
@@ -28,9 +33,11 @@ import sys
 import setup_path  # pylint: disable=unused-import,g-bad-import-order
 
 import admin_api_tool_errors
-from admin_sdk_directory_api import users_api
 import file_manager
 import log_utils
+from utils import customer_users
+from utils import pipeline
+from utils import shard_utils
 from utils import validators
 
 
@@ -42,30 +49,46 @@ _BASE_USER_PROGRESS_FILE_NAME = '%s_progress'  # Name of progress file.
 FILE_MANAGER = file_manager.FILE_MANAGER
 
 
-def _ReadLastUserProgress(prefix):
+def _GetFileManager(domain_file_manager):
+  """Helper to pick the FileManager of a domain (multi-domain scans)."""
+  if domain_file_manager is None:
+    return FILE_MANAGER
+  return domain_file_manager
+
+
+def _ReadLastUserProgress(prefix, domain_file_manager=None):
   """Helper for collection process to possibly resume if interrupted.
 
   Retrieves previous user and user to make a guess of the sort order.
 
   Args:
     prefix: custom prefix to identify progress file e.g. 'collect' or 'revoke'.
+    domain_file_manager: If not None, the FileManager of the domain scanned
+                         (else FILE_MANAGER).
 
   Returns:
     Tuple of:
       -prev_user: user_email of the user previous to the next arg.
       -user_email: user_email after which the process was interrupted.
       -count_done: another indicator of progress.
+      -saved: True if the results of all count_done users were saved (else
+       only up to the last full batch).
   """
   prev_user = ''
   user_email = ''
   count_done = 0
+  saved = False
   file_name = _BASE_USER_PROGRESS_FILE_NAME % prefix
-  if FILE_MANAGER.FileExists(file_name):
-    prev_user, user_email, count_done = FILE_MANAGER.ReadJsonFile(file_name)
-  return prev_user, user_email, count_done
+  files = _GetFileManager(domain_file_manager)
+  if files.FileExists(file_name):
+    progress = files.ReadJsonFile(file_name)
+    prev_user, user_email, count_done = progress[:3]
+    saved = len(progress) > 3 and progress[3]
+  return prev_user, user_email, count_done, saved
 
 
-def _WriteLastUserProgress(prefix, prev_user, user_email, count_done):
+def _WriteLastUserProgress(prefix, prev_user, user_email, count_done,
+                           saved=False, domain_file_manager=None):
   """Helper for revocation process to possibly resume if interrupted.
 
   Track previous user and user to make a guess of the sort order.
@@ -75,24 +98,51 @@ def _WriteLastUserProgress(prefix, prev_user, user_email, count_done):
     prev_user: user_email of the user previous to the next arg.
     user_email: user_email after which the process was interrupted.
     count_done: another indicator of progress.
+    saved: True if the results of all count_done users are checkpointed.
+    domain_file_manager: If not None, the FileManager of the domain scanned
+                         (else FILE_MANAGER).
   """
-  FILE_MANAGER.WriteJsonFile(_BASE_USER_PROGRESS_FILE_NAME % prefix,
-                             (prev_user, user_email, count_done),
-                             overwrite_ok=True)
+  progress = (prev_user, user_email, count_done)
+  if saved:
+    progress += (True,)
+  # Queued after any checkpoint of the results: never ahead of them.
+  _GetFileManager(domain_file_manager).WriteJsonFileInBackground(
+      _BASE_USER_PROGRESS_FILE_NAME % prefix, progress)
 
 
-def _RemoveLastUserProgress(prefix):
+def _RemoveLastUserProgress(prefix, domain_file_manager=None):
   """Helper to remove progress file when completed.
 
   If the file is removed, --resume will not function.
 
   Args:
     prefix: custom prefix to identify progress file e.g. 'collect' or 'revoke'.
+    domain_file_manager: If not None, the FileManager of the domain scanned
+                         (else FILE_MANAGER).
+  """
+  _GetFileManager(domain_file_manager).RemoveFile(
+      _BASE_USER_PROGRESS_FILE_NAME % prefix)
+
+
+def IsIterationInProgress(prefix, shard=None, domain_file_manager=None):
+  """Check if an iteration left a progress file (was interrupted or running).
+
+  Args:
+    prefix: custom prefix to identify progress file e.g. 'collect' or 'revoke'.
+    shard: If not None, a 2-tuple (shard_index, shard_count) of a --shard run.
+    domain_file_manager: If not None, the FileManager of the domain scanned
+                         (else FILE_MANAGER).
+
+  Returns:
+    True if a progress file exists else False.
   """
-  FILE_MANAGER.RemoveFile(_BASE_USER_PROGRESS_FILE_NAME % prefix)
+  return _GetFileManager(domain_file_manager).FileExists(
+      _BASE_USER_PROGRESS_FILE_NAME %
+      shard_utils.GetShardFileName(prefix, shard))
 
 
-def CheckResumable(user_list, user_count, prefix, flags):
+def CheckResumable(user_list, user_count, prefix, flags,
+                   domain_file_manager=None):
   """Helper to verify a few conditions for resume from file cookies.
 
   Resuming is tricky.  Try to check as many things as possible and give
@@ -104,6 +154,8 @@ def CheckResumable(user_list, user_count, prefix, flags):
     user_count: Count of users available for resume process.
     prefix: custom prefix to identify progress file e.g. 'collect' or 'revoke'.
     flags: Argparse flags object with apps_domain, resume and first_n.
+    domain_file_manager: If not None, the FileManager of the domain scanned
+                         (else FILE_MANAGER).
 
   Returns:
     Count of users successfully processed so far.
@@ -115,7 +167,8 @@ def CheckResumable(user_list, user_count, prefix, flags):
     raise admin_api_tool_errors.AdminAPIToolResumeError(
         'Cannot supply --resume and --first_n at the same time.')
 
-  prev_user, user_email, users_checked = _ReadLastUserProgress(prefix)
+  prev_user, user_email, users_checked, saved = _ReadLastUserProgress(
+      prefix, domain_file_manager=domain_file_manager)
   if not prev_user or not user_email:
     raise admin_api_tool_errors.AdminAPIToolResumeError(
         'Did not find 2 previous users collected. Either progress was not '
@@ -136,12 +189,14 @@ def CheckResumable(user_list, user_count, prefix, flags):
     raise admin_api_tool_errors.AdminAPIToolResumeError(
         'Prev user mismatch: %s != %s.' % (prev_user, active_prev_user))
 
+  if saved:
+    return users_checked
   # Skip back to the user after the last-checkpointed user.
   not_saved_users = users_checked % _USER_PROGRESS_CHECKPOINT_BATCH
   return users_checked - not_saved_users
 
 
-def _GetUserList(http, flags):
+def _GetUserList(http, flags, domain_file_manager=None):
   """Helper to retrieve the user list from local file or request.
 
   The list may be 10's of thousands of users so we prefer to keep a
@@ -149,7 +204,10 @@ def _GetUserList(http, flags):
 
   Args:
     http: An authorized http interface object.
-    flags: Argparse flags object with apps_domain, resume and first_n.
+    flags: Argparse flags object with apps_domain, resume, first_n, shard,
+           customer_listing and listing_threads.
+    domain_file_manager: If not None, the FileManager of the domain scanned
+                         (else FILE_MANAGER).
 
   Returns:
     A list of user tuples. For example:
@@ -158,40 +216,66 @@ def _GetUserList(http, flags):
       userlast"], ["usertest100@altostrat.com", "000000000766612723480",
       "usertest100 userlast"]]
   """
+  files = _GetFileManager(domain_file_manager)
   # Need a list of users in the domain.
-  if FILE_MANAGER.FileExists(FILE_MANAGER.USERS_FILE_NAME):
+  if files.FileExists(FILE_MANAGER.USERS_FILE_NAME):
     log_utils.LogInfo('Using existing users list last modified on %s.' %
-                      FILE_MANAGER.FileTime(FILE_MANAGER.USERS_FILE_NAME))
-    users_list = FILE_MANAGER.ReadJsonFile(FILE_MANAGER.USERS_FILE_NAME)
+                      files.FileTime(FILE_MANAGER.USERS_FILE_NAME))
+    users_list = files.ReadJsonFile(FILE_MANAGER.USERS_FILE_NAME)
     # Verify that the domain has not changed
     if users_list:
       domain = validators.GetEmailParts(users_list[0][0])[1]
-      if domain != flags.apps_domain:
+      if domain.lower() != flags.apps_domain.lower():
         log_utils.LogError(
             'You have requested to use domain %s, but your existing users '
             'file \n(%s) was generated using\n%s. Please remove the file or '
             'specify %s as your apps_domain.' % (
                 flags.apps_domain,
-                FILE_MANAGER.BuildFullPathToFileName(
+                files.BuildFullPathToFileName(
                     FILE_MANAGER.USERS_FILE_NAME),
                 domain, domain))
         sys.exit(1)
+  elif flags.shard:
+    # Each shard process would otherwise race to write the same users file.
+    log_utils.LogError(
+        'Sharded runs (--shard) require an existing users list (%s). Run '
+        'ls_users.py --json first so that all shards share the same list.'
+        % files.BuildFullPathToFileName(FILE_MANAGER.USERS_FILE_NAME))
+    sys.exit(1)
   else:
-    log_utils.LogInfo('Retrieving list of users...')
+    # Imported here: only needed (with apiclient) when listing via the API.
+    # pylint: disable=g-import-not-at-top
+    from admin_sdk_directory_api import users_api
     api_wrapper = users_api.UsersApiWrapper(http)
-    users_list = api_wrapper.GetDomainUsers(flags.apps_domain)
-    FILE_MANAGER.WriteJsonFile(FILE_MANAGER.USERS_FILE_NAME, users_list)
+    if flags.customer_listing:
+      # One pass saves the users list of every domain of the customer
+      # (keeping those that exist); later runs on the other domains read them.
+      customer_users.SaveCustomerUsers(api_wrapper,
+                                       customer_users.GetDefaultCustomerId())
+    if files.FileExists(FILE_MANAGER.USERS_FILE_NAME):
+      users_list = files.ReadJsonFile(FILE_MANAGER.USERS_FILE_NAME)
+    else:
+      log_utils.LogInfo('Retrieving list of users...')
+      if flags.listing_threads > 1:
+        # pylint: disable=g-import-not-at-top
+        from utils import partitioned_listing
+        users_list = partitioned_listing.ListDomainUsers(flags)
+      else:
+        users_list = api_wrapper.GetDomainUsers(flags.apps_domain)
+      files.WriteJsonFile(FILE_MANAGER.USERS_FILE_NAME, users_list)
   user_count = len(users_list)
   log_utils.LogInfo('Found %d users to check.' % user_count)
   return users_list, user_count
 
 
-def _GetDomainUsersData(http, flags):
+def _GetDomainUsersData(http, flags, domain_file_manager=None):
   """Helper to get the user data for a domain that will be used in the queries.
 
   Args:
     http: Authorized http interface.
     flags: Argparse flags object with apps_domain, resume and first_n.
+    domain_file_manager: If not None, the FileManager of the domain scanned
+                         (else FILE_MANAGER).
 
   Returns:
     Tuple of:
@@ -199,37 +283,62 @@ def _GetDomainUsersData(http, flags):
       user_count: count of users so others can avoid len(user_list).
   """
   try:
-    user_list, user_count = _GetUserList(http, flags)
+    user_list, user_count = _GetUserList(
+        http, flags, domain_file_manager=domain_file_manager)
   except admin_api_tool_errors.AdminAPIToolUserError as e:
     log_utils.LogError('Unable to retrieve required users data.', e)
     sys.exit(1)
   return user_list, user_count
 
 
-def StartUserIterator(http, prefix, flags):
-  """Domain user iterator for resumably looping through all domain users.
-
-  Handles the acquisition of the users list and checking of resume which
-  makes the code to collect and revoke domain users much easier to read.
+def _PrepareUserList(http, prefix, flags, user_filter, sample_fn=None,
+                     domain_file_manager=None):
+  """Helper to select the users to check and where to start (--resume).
 
   Args:
     http: authorized http interface.
     prefix: custom prefix to identify progress file e.g. 'collect' or 'revoke'.
-    flags: Argparse flags object with apps_domain, resume and first_n.
+    flags: Argparse flags object with apps_domain, resume, first_n, shard,
+           customer_listing and listing_threads.
+    user_filter: If not None, function taking a user email that returns True
+                 for the users to include.
+    sample_fn: If not None, function taking the users list that returns the
+               users to check (e.g. sampling.UserSampler.Sample).
+    domain_file_manager: If not None, the FileManager of the domain scanned
+                         (else FILE_MANAGER).
 
-  Yields:
-    A 3-Tuple of user data:
-    -user email: String e.g. 'larry@domain.com'
-    -user id: String of ints e.g. '112351558298938768732'
-    -checkpoint: True if batch full or on the last user.
+  Returns:
+    Tuple of:
+      prefix: prefix of the progress file (of the shard if --shard).
+      user_list: list of user tuples.
+      users_checked: count of users checked by the run being resumed.
+      user_count: count of users to check (including users_checked).
+      prev_user: user_email before the first user to check or None.
   """
-  user_list, user_count = _GetDomainUsersData(http, flags)
+  user_list, user_count = _GetDomainUsersData(
+      http, flags, domain_file_manager=domain_file_manager)
+  if flags.shard:
+    # Each shard tracks its own progress so shards may be resumed separately.
+    prefix = shard_utils.GetShardFileName(prefix, flags.shard)
+    user_list = shard_utils.FilterUsersForShard(user_list, flags.shard)
+    user_count = len(user_list)
+    log_utils.LogInfo('Shard %s holds %d users to check.' % (
+        shard_utils.FormatShard(flags.shard), user_count))
+  if user_filter:
+    user_list = [u for u in user_list if user_filter(u[0])]
+    user_count = len(user_list)
+    log_utils.LogInfo('Selected %d users to check.' % user_count)
+  if sample_fn:
+    user_list = sample_fn(user_list)
+    user_count = len(user_list)
+    log_utils.LogInfo('Sampled %d users to check.' % user_count)
 
   if flags.resume:
     # Resume: check that current users.json file still matches where we
     #         left off and adjust the users list to skip previously checked.
     try:
-      users_checked = CheckResumable(user_list, user_count, prefix, flags)
+      users_checked = CheckResumable(user_list, user_count, prefix, flags,
+                                     domain_file_manager=domain_file_manager)
     except admin_api_tool_errors.AdminAPIToolResumeError as e:
       log_utils.LogError(
           'Cannot --resume %s. You must retry without --resume.' % prefix, e)
@@ -245,7 +354,34 @@ def StartUserIterator(http, prefix, flags):
     if flags.first_n:
       user_count = flags.first_n
 
-  for user_email, user_id, _ in user_list[users_checked:user_count]:
+  return prefix, user_list, users_checked, user_count, prev_user
+
+
+def StartUserIterator(http, prefix, flags, user_filter=None):
+  """Domain user iterator for resumably looping through all domain users.
+
+  Handles the acquisition of the users list and checking of resume which
+  makes the code to collect and revoke domain users much easier to read.
+
+  Args:
+    http: authorized http interface.
+    prefix: custom prefix to identify progress file e.g. 'collect' or 'revoke'.
+    flags: Argparse flags object with apps_domain, resume, first_n, shard,
+           customer_listing and listing_threads.
+    user_filter: If not None, function taking a user email that returns True
+                 for the users to include (must not change across --resume).
+
+  Yields:
+    A 3-Tuple of user data:
+    -user email: String e.g. 'larry@domain.com'
+    -user id: String of ints e.g. '112351558298938768732'
+    -checkpoint: True if batch full or on the last user.
+  """
+  prefix, user_list, users_checked, user_count, prev_user = _PrepareUserList(
+      http, prefix, flags, user_filter)
+
+  for user in user_list[users_checked:user_count]:
+    user_email, user_id = user[:2]
     users_checked += 1
     checkpoint = (users_checked % _USER_PROGRESS_CHECKPOINT_BATCH == 0 or
                   users_checked == user_count)
@@ -271,3 +407,103 @@ def StartUserIterator(http, prefix, flags):
 
   # Cleanup progress file to inhibit resuming completed tasks.
   _RemoveLastUserProgress(prefix)
+
+
+def RunUserPipeline(http, prefix, flags, fetch_fn, sink_fn,
+                    checkpoint_fn=None, stop_fn=None, transform_fn=None,
+                    error_fn=None, thread_count=1, thread_init_fn=None,
+                    ordered=True, user_filter=None, sample_fn=None,
+                    domain_file_manager=None):
+  """Resumably run a pipeline.Pipeline over the domain users.
+
+  Results are checkpointed (checkpoint_fn) every batch of users done in
+  order, when stopped and at the end; the progress cookie is written just
+  after so it always names the last user saved.  In unordered mode users
+  after that one may be done again by a --resume (sinks must allow it).
+
+  Args:
+    http: authorized http interface.
+    prefix: custom prefix to identify progress file e.g. 'collect' or 'revoke'.
+    flags: Argparse flags object with apps_domain, resume, first_n, shard,
+           customer_listing and listing_threads.
+    fetch_fn: Function taking (thread_state, (user email, user id)) that
+              returns the result of the user's requests.
+    sink_fn: Function taking ((user email, user id), value) that records the
+             result of a user (in the calling thread).
+    checkpoint_fn: If not None, function (e.g. Checkpointer.Checkpoint) that
+                   saves the results recorded so far.
+    stop_fn: If not None, function returning True to stop after the current
+             user (e.g. Checkpointer.IsInterrupted).
+    transform_fn: See pipeline.Pipeline.
+    error_fn: See pipeline.Pipeline.
+    thread_count: Int count of concurrent fetch threads.
+    thread_init_fn: See pipeline.Pipeline.
+    ordered: If True users are sunk in the users list order.
+    user_filter: If not None, function taking a user email that returns True
+                 for the users to include (must not change across --resume).
+    sample_fn: If not None, function taking the users list that returns the
+               users to check (must not change across --resume).
+    domain_file_manager: If not None, the FileManager of the domain scanned
+                         (e.g. by multi_domain_scanner) for its users list and
+                         progress file (else FILE_MANAGER).
+
+  Returns:
+    True if all users were checked, False if stopped by stop_fn (results and
+    progress are saved for --resume).
+  """
+  prefix, user_list, users_checked, user_count, prev_user = _PrepareUserList(
+      http, prefix, flags, user_filter, sample_fn=sample_fn,
+      domain_file_manager=domain_file_manager)
+  first_user = users_checked
+  users = [tuple(user[:2]) for user in user_list[users_checked:user_count]]
+  progress = {'count_saved': users_checked}
+
+  def _SaveProgress(count_done):
+    """Checkpoint the results then the cookie of the first count_done users."""
+    if count_done <= progress['count_saved']:
+      return
+    if checkpoint_fn:
+      checkpoint_fn()
+    progress['count_saved'] = count_done
+    _WriteLastUserProgress(
+        prefix, user_list[count_done - 2][0] if count_done > 1 else prev_user,
+        user_list[count_done - 1][0], count_done, saved=True,
+        domain_file_manager=domain_file_manager)
+
+  def _OnProgress(count_sunk):
+    count_done = first_user + count_sunk
+    progress['count_done'] = count_done
+    if (count_done / _USER_PROGRESS_CHECKPOINT_BATCH >
+        progress['count_saved'] / _USER_PROGRESS_CHECKPOINT_BATCH or
+        count_done == user_count):
+      _SaveProgress(count_done)
+      sys.stdout.write('%80s\r' % '')  # Clear the previous entry.
+      sys.stdout.write('Checked %d of %d users.\n' % (count_done, user_count))
+
+  def _Sink(user, value):
+    # Show some screen output during a longish, tedious process.
+    sys.stdout.write('%80s\r' % '')  # Clear the previous entry.
+    sys.stdout.write('%s\r' % user[0])
+    sys.stdout.flush()
+    sink_fn(user, value)
+
+  user_pipeline = pipeline.Pipeline(
+      fetch_fn, _Sink, transform_fn=transform_fn, error_fn=error_fn,
+      thread_count=thread_count, thread_init_fn=thread_init_fn,
+      ordered=ordered)
+  completed = False
+  try:
+    completed = user_pipeline.Run(users, progress_fn=_OnProgress,
+                                  stop_fn=stop_fn)
+    # Stopped after the last user: nothing left to resume.
+    completed = completed or progress.get('count_done') == user_count
+  finally:
+    if completed:
+      # Cleanup progress file to inhibit resuming completed tasks.
+      _RemoveLastUserProgress(prefix, domain_file_manager=domain_file_manager)
+    else:
+      # Stopped or failed: save exactly what was done.
+      _SaveProgress(progress.get('count_done', first_user))
+    for metrics in user_pipeline.GetMetrics():
+      log_utils.LogInfo('Pipeline %s' % metrics.Format())
+  return completed
@@ -0,0 +1,109 @@
+#!/usr/bin/python
+#
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""In-memory index of the users list file (users.json) of a domain.
+
+Checking that a user exists costs a users.get() request.  When a users list
+has been saved (by ls_users.py --json or gather_domain_token_stats.py) the
+index answers from memory instead.  The file is read again only after it
+changes, and each domain (working directory) has its own entry.
+
+The users list is a snapshot: a user added since it was saved is not in the
+index (callers fall back to the API) and a user deleted since is still in it.
+"""
+
+import os
+
+# setup_path required to allow imports from component dirs (e.g. utils)
+# and lib (where the OAuth and Google API Python Client modules reside).
+import setup_path  # pylint: disable=unused-import,g-bad-import-order
+
+import file_manager
+
+
+FILE_MANAGER = file_manager.FILE_MANAGER
+
+
+class UsersIndex(object):
+  """Looks up users by email in the users list of the working directory."""
+
+  def __init__(self):
+    # Path of users list -> (modified time, dictionary: email -> user tuple).
+    self._indexes = {}
+
+  def _GetIndex(self):
+    """Load (or reload if changed) the index of the current users list.
+
+    Returns:
+      Dictionary of lower case email -> user tuple [email, id, name]; empty
+      if there is no users list.
+    """
+    filename_path = FILE_MANAGER.GetStoredFilePath(FILE_MANAGER.USERS_FILE_NAME)
+    if not os.path.isfile(filename_path):
+      self._indexes.pop(filename_path, None)
+      return {}
+    modified_time = os.path.getmtime(filename_path)
+    cached = self._indexes.get(filename_path)
+    if not cached or cached[0] != modified_time:
+      users_list = FILE_MANAGER.ReadJsonFile(FILE_MANAGER.USERS_FILE_NAME)
+      cached = (modified_time,
+                dict((user[0].lower(), user) for user in users_list))
+      self._indexes[filename_path] = cached
+    return cached[1]
+
+  def Load(self):
+    """Read the users list now (e.g. to warm a long-lived process).
+
+    Returns:
+      Int count of users in the users list.
+    """
+    return len(self._GetIndex())
+
+  def GetUsers(self):
+    """List the user tuples in the saved users list.
+
+    Returns:
+      List of [email, id, full name] (with orgUnitPath and suspended when
+      saved by ls_users.py --json --org_units); empty if there is no users
+      list.
+    """
+    return self._GetIndex().values()
+
+  def GetEmails(self):
+    """List the (lower case) email addresses in the saved users list."""
+    return self._GetIndex().keys()
+
+  def Contains(self, user_mail):
+    """Check if a user is in the saved users list.
+
+    Args:
+      user_mail: String email address of the user.
+
+    Returns:
+      True if the user is in the users list else False.
+    """
+    return user_mail.lower() in self._GetIndex()
+
+  def GetUser(self, user_mail):
+    """Find a user in the saved users list.
+
+    Args:
+      user_mail: String email address of the user.
+
+    Returns:
+      List of [email, id, full name] or None if the user is not listed.
+    """
+    return self._GetIndex().get(user_mail.lower())
@@ -28,6 +28,7 @@ import admin_api_tool_errors
 VALID_APPS_DOMAIN_RE = r'^[\w.-]+\.[\w]+$'
 VALID_EMAIL_RE = r'^([\w.-]+)@([\w.-]+\.[\w]+)$'
 VALID_NOWHITESPACE_RE = r'^[\S]+$'
+VALID_SHARD_RE = r'^(\d+)/(\d+)$'
 
 
 class ListValidatorType(object):
@@ -40,6 +41,44 @@ class ListValidatorType(object):
     return arg_string.split(',')
 
 
+class ShardValidatorType(object):
+  """Converts a command line shard string (e.g. 0/4) to a 2-tuple of ints.
+
+  Raises:
+    argparse.ArgumentTypeError() if the string is not of the form i/N with
+    0 <= i < N.
+  """
+
+  def __call__(self, arg_string):
+    error_message = ('Must be a shard of form i/N where 0 <= i < N '
+                     '(e.g. 0/4).')
+    match = re.match(VALID_SHARD_RE, arg_string.strip())
+    if not match:
+      raise argparse.ArgumentTypeError(error_message)
+    shard_index, shard_count = int(match.group(1)), int(match.group(2))
+    if shard_count < 1 or shard_index >= shard_count:
+      raise argparse.ArgumentTypeError(error_message)
+    return shard_index, shard_count
+
+
+class ConfidenceValidatorType(object):
+  """Converts a command line confidence level (e.g. 0.95) to a float.
+
+  Raises:
+    argparse.ArgumentTypeError() if the level is not strictly between 0 and 1.
+  """
+
+  def __call__(self, arg_string):
+    error_message = 'Must be a confidence level between 0 and 1 (e.g. 0.95).'
+    try:
+      confidence = float(arg_string)
+    except ValueError:
+      raise argparse.ArgumentTypeError(error_message)
+    if not 0 < confidence < 1:
+      raise argparse.ArgumentTypeError(error_message)
+    return confidence
+
+
 class RegexValidatorType(object):
   """Performs regular expression match on value.
 
@@ -70,6 +109,15 @@ class AppsDomainValidatorType(RegexValidatorType):
         error_message='Must be a non-empty string of form: altostrat.com.')
 
 
+class AppsDomainListValidatorType(ListValidatorType):
+  """Splits a comma separated list of apps domains, validating each."""
+
+  def __call__(self, arg_string):
+    apps_domain_validator = AppsDomainValidatorType()
+    return [apps_domain_validator(apps_domain) for apps_domain in
+            super(AppsDomainListValidatorType, self).__call__(arg_string)]
+
+
 class EmailValidatorType(RegexValidatorType):
   """Ensures a command-line flag is a valid apps domain string."""
 
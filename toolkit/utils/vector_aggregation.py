@@ -0,0 +1,201 @@
+#!/usr/bin/python
+#
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Count users of org units and of scope pairs with NumPy when present.
+
+Reports of a large domain count hundreds of thousands of users one at a
+time.  When NumPy is installed these counts are computed on arrays instead:
+
+  -users, org units and scopes are encoded as Int codes (a dictionary
+   filled by the C loop of map(), cheaper than sorting the strings),
+  -org unit x suspended counts are numpy.bincount() of the org unit codes,
+  -scope co-occurrence is the product M.T * M of the user x scope incidence
+   matrix M, taken over blocks of users so a block stays small.
+
+Without NumPy the same counts are computed in pure Python (the results are
+identical; see benchmark_aggregation.py for the speedup).  The users of each
+client_id and scope (TokenStats.CalculateRankings()) are still counted by set
+unions: encoding the users costs more than the unions themselves.
+
+NumPy is imported on the first count rather than with this module: reports
+importing this module without counting do not pay for the import.
+"""
+
+import collections
+import itertools
+
+# setup_path required to allow imports from component dirs (e.g. utils)
+# and lib (where the OAuth and Google API Python Client modules reside).
+import setup_path  # pylint: disable=unused-import,g-bad-import-order
+
+import report_utils
+
+
+# Cells of a block of the user x scope incidence matrix (8 bytes each).
+_INCIDENCE_BLOCK_CELLS = 1 << 22
+
+# The numpy module (None if not installed), set by the first _GetNumpy().
+_numpy = None
+_numpy_imported = False
+
+
+def _GetNumpy():
+  """Helper to import NumPy on first use.
+
+  Returns:
+    The numpy module or None if it is not installed.
+  """
+  global _numpy, _numpy_imported  # pylint: disable=global-statement
+  if not _numpy_imported:
+    try:
+      import numpy  # pylint: disable=g-import-not-at-top
+      _numpy = numpy
+    except ImportError:
+      _numpy = None
+    _numpy_imported = True
+  return _numpy
+
+
+def IsAvailable():
+  """Returns True if NumPy is installed (else pure Python is used)."""
+  return _GetNumpy() is not None
+
+
+def _UseNumpy(use_numpy):
+  """Helper to pick the backend: NumPy when present unless told otherwise."""
+  if use_numpy is None:
+    return IsAvailable()
+  return use_numpy and IsAvailable()
+
+
+def _Encode(values, count):
+  """Helper to encode values as Int codes in order of first appearance.
+
+  Args:
+    values: Iterable of hashable values.
+    count: Int count of values.
+
+  Returns:
+    Tuple of (List of the distinct values by code, numpy array of the code
+    of each value).
+  """
+  numpy = _GetNumpy()
+  value_codes = collections.defaultdict(itertools.count().next)
+  codes = numpy.fromiter(itertools.imap(value_codes.__getitem__, values),
+                         dtype=numpy.int64, count=count)
+  names = [None] * len(value_codes)
+  for value, code in value_codes.iteritems():
+    names[code] = value
+  return names, codes
+
+
+def _NewCounter(keys, counts):
+  """Helper to fill a report_utils.Counter with the non-zero counts."""
+  counter = report_utils.Counter()
+  for key, count in itertools.izip(keys, counts):
+    if count:
+      counter.Increment(key, int(count))
+  return counter
+
+
+def CountOrgUnitUsers(user_rows, use_numpy=None):
+  """Count the active and suspended users of each org unit.
+
+  Args:
+    user_rows: List of (String orgUnitPath, Boolean suspended) tuples.
+    use_numpy: If False count in pure Python; by default NumPy when present.
+
+  Returns:
+    Tuple of 2 report_utils.Counter objects keyed by org unit:
+    (#active_users, #suspended_users).  Org units without such users are
+    not keys.
+  """
+  if not user_rows:
+    return report_utils.Counter(), report_utils.Counter()
+  if not _UseNumpy(use_numpy):
+    active_user_count = report_utils.Counter()
+    suspended_user_count = report_utils.Counter()
+    for org, suspended in user_rows:
+      if suspended:
+        suspended_user_count.Increment(org)
+      else:
+        active_user_count.Increment(org)
+    return active_user_count, suspended_user_count
+
+  numpy = _GetNumpy()
+  org_names, org_codes = _Encode((row[0] for row in user_rows),
+                                 len(user_rows))
+  is_suspended = numpy.fromiter((row[1] for row in user_rows),
+                                dtype=bool, count=len(user_rows))
+  user_counts = numpy.bincount(org_codes, minlength=len(org_names))
+  suspended_counts = numpy.bincount(org_codes[is_suspended],
+                                    minlength=len(org_names))
+  return (_NewCounter(org_names, user_counts - suspended_counts),
+          _NewCounter(org_names, suspended_counts))
+
+
+def CountScopePairs(token_users, use_numpy=None):
+  """Count the users who granted each pair of scopes (to any client_ids).
+
+  Args:
+    token_users: Iterable of (client_id, scope, user_list) tuples.
+    use_numpy: If False count in pure Python; by default NumPy when present.
+
+  Returns:
+    Dictionary of (scope, other_scope) -> Int count of users, scope <
+    other_scope, for the pairs granted by at least one user.
+  """
+  token_users = list(token_users)
+  if not token_users:
+    return {}
+  if not _UseNumpy(use_numpy):
+    user_scopes = {}
+    for _, scope, user_list in token_users:
+      for user_email in user_list:
+        user_scopes.setdefault(user_email, set()).add(scope)
+    scope_pairs = {}
+    for scopes in user_scopes.itervalues():
+      for scope_pair in itertools.combinations(sorted(scopes), 2):
+        scope_pairs[scope_pair] = scope_pairs.get(scope_pair, 0) + 1
+    return scope_pairs
+
+  numpy = _GetNumpy()
+  token_user_counts = [len(user_list) for _, _, user_list in token_users]
+  user_names, user_codes = _Encode(
+      itertools.chain.from_iterable(u for _, _, u in token_users),
+      sum(token_user_counts))
+  user_count = len(user_names)
+  if not user_count:
+    return {}
+  scope_names, scope_codes = _Encode((scope for _, scope, _ in token_users),
+                                     len(token_users))
+  scope_count = len(scope_names)
+  token_scope_codes = numpy.repeat(scope_codes, token_user_counts)
+  block_users = max(1, _INCIDENCE_BLOCK_CELLS // scope_count)
+  cooccurrences = numpy.zeros((scope_count, scope_count))
+  for first_user in xrange(0, user_count, block_users):
+    in_block = ((user_codes >= first_user) &
+                (user_codes < first_user + block_users))
+    block = numpy.zeros((min(block_users, user_count - first_user),
+                         scope_count))
+    # Repeated (user, scope) incidences set the same cell once.
+    block[user_codes[in_block] - first_user, token_scope_codes[in_block]] = 1
+    cooccurrences += block.T.dot(block)
+  scope_pairs = {}
+  for i, j in zip(*numpy.nonzero(numpy.triu(cooccurrences, 1))):
+    scope_pair = tuple(sorted((scope_names[i], scope_names[j])))
+    scope_pairs[scope_pair] = int(cooccurrences[i, j])
+  return scope_pairs